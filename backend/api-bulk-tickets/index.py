@@ -1,18 +1,33 @@
 """
 API для массовых операций с заявками
+
+POST / {action, ticket_ids, ...}                 — выполнить сразу, в одном вызове
+POST / {action, ticket_ids, ..., mode: "async"}  — поставить задание в bulk_jobs (202, id задания)
+GET  /?job_id=N                                  — прогресс задания; без job_id — последние задания
+POST /?endpoint=worker                           — обработать пачки заданий (automation-dispatcher)
 """
 import json
 import os
 import sys
+import time
 import jwt
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, Any, Optional
+from psycopg2.extras import execute_values
+from typing import Dict, Any, List, Optional
+from notification_outbox import enqueue_notifications
 
 def log(msg):
     print(msg, file=sys.stderr, flush=True)
 
 SCHEMA = os.environ.get('MAIN_DB_SCHEMA', 't_p67567221_one_file_page_projec')
+# Строк истории в одном INSERT ... VALUES
+BULK_PAGE_SIZE = 1000
+# mode=async: заявок в одной пачке воркера и время одного запуска воркера
+BULK_JOB_CHUNK = 500
+BULK_WORKER_TIME_BUDGET_SECONDS = 25
+# Воркер без токена администратора должен передать его в X-Bulk-Worker-Secret;
+# не задан — воркер запускает только администратор
+BULK_WORKER_SECRET = os.environ.get('BULK_WORKER_SECRET', '')
 
 def response(status_code: int, body: Any) -> Dict[str, Any]:
     return {
@@ -20,8 +35,8 @@ def response(status_code: int, body: Any) -> Dict[str, Any]:
         'headers': {
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, Authorization',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, Authorization, X-Bulk-Worker-Secret',
             'Access-Control-Max-Age': '86400',
         },
         'body': json.dumps(body, ensure_ascii=False, default=str),
@@ -34,76 +49,440 @@ def get_db_connection():
         raise Exception('DATABASE_URL not found')
     return psycopg2.connect(dsn, options=f'-c search_path={SCHEMA},public')
 
-def get_name_by_id(cur, table: str, id_val) -> Optional[str]:
-    """Получить name по id из справочной таблицы (ticket_statuses, ticket_priorities, executor_groups)"""
-    if id_val is None:
-        return None
-    try:
-        cur.execute(f"SELECT name FROM {SCHEMA}.{table} WHERE id = %s", (id_val,))
-        row = cur.fetchone()
-        if not row:
-            return str(id_val)
-        return row[0] if not isinstance(row, dict) else row['name']
-    except Exception:
-        return str(id_val)
-
-
-def get_user_full_name(cur, user_id) -> Optional[str]:
-    """Получить full_name пользователя по id"""
-    if user_id is None:
-        return None
-    try:
-        cur.execute(f"SELECT full_name FROM {SCHEMA}.users WHERE id = %s", (user_id,))
-        row = cur.fetchone()
-        if not row:
-            return str(user_id)
-        return row[0] if not isinstance(row, dict) else row['full_name']
-    except Exception:
-        return str(user_id)
+def fetch_names(cur, table: str, ids, column: str = 'name') -> Dict[int, str]:
+    """Названия для набора id одним запросом: {id: name}. Ненайденный id — строкой."""
+    ids = sorted({int(x) for x in ids if x is not None})
+    if not ids:
+        return {}
+    cur.execute(f"SELECT id, {column} FROM {SCHEMA}.{table} WHERE id = ANY(%s)", (ids,))
+    names = {i: str(i) for i in ids}
+    names.update({r[0]: r[1] for r in cur.fetchall()})
+    return names
 
 
 def log_bulk_history(cur, ticket_ids: list, user_id: int, field_name: str,
                      old_values_by_ticket: Dict[int, Optional[str]],
                      new_value: Optional[str]) -> None:
-    """Записать одинаковое изменение поля для группы заявок в ticket_history.
+    """Записать одинаковое изменение поля для группы заявок в ticket_history одним INSERT.
 
     old_values_by_ticket: {ticket_id: старое_значение_строкой}
     new_value: новое значение строкой (одинаковое для всех)
     """
-    if not ticket_ids:
+    rows = [
+        (tid, user_id, field_name, old_values_by_ticket.get(tid), new_value)
+        for tid in ticket_ids
+        if old_values_by_ticket.get(tid) != new_value
+    ]
+    if not rows:
         return
     try:
-        for tid in ticket_ids:
-            old_val = old_values_by_ticket.get(tid)
-            if old_val == new_value:
-                continue
-            cur.execute(
-                f"""INSERT INTO {SCHEMA}.ticket_history
-                    (ticket_id, user_id, field_name, old_value, new_value, created_at)
-                    VALUES (%s, %s, %s, %s, %s, NOW())""",
-                (tid, user_id, field_name, old_val, new_value)
-            )
+        cur.execute("SAVEPOINT bulk_history")
+        execute_values(
+            cur,
+            f"""INSERT INTO {SCHEMA}.ticket_history
+                (ticket_id, user_id, field_name, old_value, new_value, created_at)
+                VALUES %s""",
+            rows,
+            template='(%s, %s, %s, %s, %s, NOW())',
+            page_size=BULK_PAGE_SIZE,
+        )
+        cur.execute("RELEASE SAVEPOINT bulk_history")
     except Exception as e:
         log(f"[BULK-TICKETS] history insert error: {e}")
+        try:
+            cur.execute("ROLLBACK TO SAVEPOINT bulk_history")
+        except Exception:
+            pass
+
 
+def bulk_update_column(cur, ticket_ids: List[int], column: str, value,
+                       extra_set: str = '', extra_params: tuple = ()) -> Dict[int, Any]:
+    """Меняет column у пачки заявок одним UPDATE ... FROM unnest.
 
-def fetch_old_values(cur, ticket_ids: list, column: str) -> Dict[int, Any]:
-    """Получить старые значения поля для пакета заявок: {ticket_id: value}"""
+    Строки блокируются в порядке id до изменения, старое значение возвращается
+    из того же запроса: {ticket_id: старое значение} только по найденным заявкам.
+    """
     if not ticket_ids:
         return {}
-    placeholders = ','.join(['%s'] * len(ticket_ids))
-    cur.execute(
-        f"SELECT id, {column} FROM {SCHEMA}.tickets WHERE id IN ({placeholders})",
-        ticket_ids
-    )
-    rows = cur.fetchall()
-    result = {}
-    for r in rows:
-        if isinstance(r, dict):
-            result[r['id']] = r.get(column)
-        else:
-            result[r[0]] = r[1]
-    return result
+    cur.execute(f"""
+        UPDATE {SCHEMA}.tickets t
+        SET {column} = %s{extra_set}, updated_at = NOW()
+        FROM (
+            SELECT tk.id, tk.{column} AS old_value
+            FROM unnest(%s::int[]) AS u(id)
+            JOIN {SCHEMA}.tickets tk ON tk.id = u.id
+            ORDER BY tk.id
+            FOR UPDATE OF tk
+        ) o
+        WHERE t.id = o.id
+        RETURNING t.id, o.old_value
+    """, (value, *extra_params, ticket_ids))
+    return {r[0]: r[1] for r in cur.fetchall()}
+
+
+def refresh_ticket_list_rows(cur, ticket_ids: list) -> None:
+    """Пересчитать строки проекции списка заявок (ticket_list_rows) в текущей транзакции.
+
+    Ошибка проекции не откатывает массовую операцию — расхождение исправит
+    задача сверки ticket_list_rows_repair.
+    """
+    ids = sorted({int(x) for x in ticket_ids if x})
+    if not ids:
+        return
+    try:
+        cur.execute("SAVEPOINT ticket_list_rows_refresh")
+        cur.execute(f"SELECT {SCHEMA}.refresh_ticket_list_rows(%s::int[])", (ids,))
+        cur.execute("RELEASE SAVEPOINT ticket_list_rows_refresh")
+    except Exception as e:
+        log(f"[BULK-TICKETS] ticket_list_rows refresh error: {e}")
+        try:
+            cur.execute("ROLLBACK TO SAVEPOINT ticket_list_rows_refresh")
+        except Exception:
+            pass
+
+
+# Связанные с заявкой таблицы, которые чистятся перед удалением самих заявок
+_DELETE_CASCADE = [
+    ('notifications', f"DELETE FROM {SCHEMA}.notifications WHERE ticket_id = ANY(%s)"),
+    ('history', f"DELETE FROM {SCHEMA}.ticket_history WHERE ticket_id = ANY(%s)"),
+    ('comment attachments', f"""
+        DELETE FROM {SCHEMA}.comment_attachments
+        WHERE comment_id IN (SELECT id FROM {SCHEMA}.ticket_comments WHERE ticket_id = ANY(%s))
+    """),
+    ('comment reactions', f"""
+        DELETE FROM {SCHEMA}.comment_reactions
+        WHERE comment_id IN (SELECT id FROM {SCHEMA}.ticket_comments WHERE ticket_id = ANY(%s))
+    """),
+    ('comments', f"DELETE FROM {SCHEMA}.ticket_comments WHERE ticket_id = ANY(%s)"),
+    ('service mappings', f"DELETE FROM {SCHEMA}.ticket_to_service_mappings WHERE ticket_id = ANY(%s)"),
+    ('custom fields', f"DELETE FROM {SCHEMA}.ticket_custom_field_values WHERE ticket_id = ANY(%s)"),
+    ('approvals', f"DELETE FROM {SCHEMA}.ticket_approvals WHERE ticket_id = ANY(%s)"),
+    ('watchers', f"DELETE FROM {SCHEMA}.ticket_watchers WHERE ticket_id = ANY(%s)"),
+    ('group log', f"DELETE FROM {SCHEMA}.ticket_group_log WHERE ticket_id = ANY(%s)"),
+    ('SLA violations', f"DELETE FROM {SCHEMA}.sla_violations WHERE ticket_id = ANY(%s)"),
+    ('service mappings (old)', f"DELETE FROM {SCHEMA}.ticket_service_mappings WHERE ticket_id = ANY(%s)"),
+]
+
+FK_ERRORS = {
+    'change_status': 'Невозможно применить статус: связанные данные некорректны. Обновите страницу.',
+    'change_priority': 'Невозможно применить приоритет: связанные данные некорректны.',
+    'change_executor': 'Невозможно назначить исполнителя.',
+    'change_executor_group': 'Невозможно назначить группу.',
+}
+
+
+def prepare_action(cur, action: str, body: Dict[str, Any]):
+    """Проверяет параметры действия до изменения заявок. Возвращает (params, текст ошибки)."""
+    if action == 'delete':
+        return {}, None
+
+    if action == 'change_status':
+        status_id = body.get('status_id')
+        if not status_id:
+            return None, 'Не указан status_id'
+        try:
+            status_id_int = int(status_id)
+        except (TypeError, ValueError):
+            return None, 'status_id должен быть числом'
+        cur.execute(f"SELECT id, is_closed FROM {SCHEMA}.ticket_statuses WHERE id = %s", (status_id_int,))
+        status_row = cur.fetchone()
+        if not status_row:
+            log(f"[BULK-TICKETS] Status {status_id_int} not found in ticket_statuses")
+            return None, f'Статус #{status_id_int} не существует. Обновите страницу и выберите статус заново.'
+        return {'status_id': status_id_int, 'is_archived': bool(status_row[1])}, None
+
+    if action == 'change_priority':
+        priority_id = body.get('priority_id')
+        if not priority_id:
+            return None, 'Не указан priority_id'
+        try:
+            priority_id_int = int(priority_id)
+        except (TypeError, ValueError):
+            return None, 'priority_id и ticket_ids должны быть числами'
+        cur.execute(f"SELECT 1 FROM {SCHEMA}.ticket_priorities WHERE id = %s", (priority_id_int,))
+        if not cur.fetchone():
+            return None, f'Приоритет #{priority_id_int} не существует. Обновите страницу.'
+        return {'priority_id': priority_id_int}, None
+
+    if action == 'change_executor':
+        user_id = body.get('user_id')
+        try:
+            user_id_int = int(user_id) if user_id else None
+        except (TypeError, ValueError):
+            return None, 'user_id и ticket_ids должны быть числами'
+        if user_id_int is not None:
+            cur.execute(f"SELECT 1 FROM {SCHEMA}.users WHERE id = %s", (user_id_int,))
+            if not cur.fetchone():
+                return None, f'Пользователь #{user_id_int} не найден.'
+        return {'user_id': user_id_int}, None
+
+    if action == 'change_executor_group':
+        group_id = body.get('group_id')
+        try:
+            group_id_int = int(group_id) if group_id else None
+        except (TypeError, ValueError):
+            return None, 'group_id и ticket_ids должны быть числами'
+        if group_id_int is not None:
+            cur.execute(f"SELECT 1 FROM {SCHEMA}.executor_groups WHERE id = %s", (group_id_int,))
+            if not cur.fetchone():
+                return None, f'Группа #{group_id_int} не существует.'
+        return {'group_id': group_id_int}, None
+
+    if action == 'add_watchers':
+        user_ids = body.get('user_ids', [])
+        if not user_ids:
+            return None, 'Не указаны пользователи-наблюдатели'
+        try:
+            return {'user_ids': sorted({int(x) for x in user_ids})}, None
+        except (TypeError, ValueError):
+            return None, 'user_ids и ticket_ids должны быть числами'
+
+    return None, f'Неизвестное действие: {action}'
+
+
+def _delete_tickets(cur, ticket_ids: List[int], params: Dict[str, Any]) -> Dict[str, int]:
+    log(f"[BULK-TICKETS] Deleting tickets: {ticket_ids}")
+    for label, sql in _DELETE_CASCADE:
+        # Отсутствующая таблица не должна обрывать удаление остальных
+        try:
+            cur.execute("SAVEPOINT bulk_delete_related")
+            cur.execute(sql, (ticket_ids,))
+            log(f"[BULK-TICKETS] Deleted {label}: {cur.rowcount}")
+            cur.execute("RELEASE SAVEPOINT bulk_delete_related")
+        except Exception as e:
+            log(f"[BULK-TICKETS] Error deleting {label}: {e}")
+            cur.execute("ROLLBACK TO SAVEPOINT bulk_delete_related")
+
+    cur.execute(f"DELETE FROM {SCHEMA}.tickets WHERE id = ANY(%s)", (ticket_ids,))
+    successful = cur.rowcount
+    refresh_ticket_list_rows(cur, ticket_ids)
+    return {'successful': successful}
+
+
+def _change_status(cur, ticket_ids: List[int], params: Dict[str, Any]) -> Dict[str, int]:
+    status_id = params['status_id']
+    old_ids = bulk_update_column(cur, ticket_ids, 'status_id', status_id,
+                                 ', is_archived = %s', (params['is_archived'],))
+    names = fetch_names(cur, 'ticket_statuses', [status_id, *old_ids.values()])
+    old_names = {tid: names.get(old_id) if old_id else None for tid, old_id in old_ids.items()}
+    log_bulk_history(cur, list(old_ids), params['actor_id'], 'status_id', old_names, names[status_id])
+    refresh_ticket_list_rows(cur, list(old_ids))
+    return {'successful': len(old_ids)}
+
+
+def _change_priority(cur, ticket_ids: List[int], params: Dict[str, Any]) -> Dict[str, int]:
+    priority_id = params['priority_id']
+    old_ids = bulk_update_column(cur, ticket_ids, 'priority_id', priority_id)
+    names = fetch_names(cur, 'ticket_priorities', [priority_id, *old_ids.values()])
+    old_names = {tid: names.get(old_id) if old_id else None for tid, old_id in old_ids.items()}
+    log_bulk_history(cur, list(old_ids), params['actor_id'], 'priority_id', old_names, names[priority_id])
+    refresh_ticket_list_rows(cur, list(old_ids))
+    return {'successful': len(old_ids)}
+
+
+def _change_executor(cur, ticket_ids: List[int], params: Dict[str, Any]) -> Dict[str, int]:
+    user_id = params['user_id']
+    old_ids = bulk_update_column(cur, ticket_ids, 'assigned_to', user_id)
+    names = fetch_names(cur, 'users', [user_id, *old_ids.values()], 'full_name')
+    new_name = names[user_id] if user_id else 'Снят с назначения'
+    old_names = {tid: (names.get(old_id) if old_id else 'Не назначен') for tid, old_id in old_ids.items()}
+    log_bulk_history(cur, list(old_ids), params['actor_id'], 'assigned_to', old_names, new_name)
+    refresh_ticket_list_rows(cur, list(old_ids))
+    return {'successful': len(old_ids)}
+
+
+def _change_executor_group(cur, ticket_ids: List[int], params: Dict[str, Any]) -> Dict[str, int]:
+    group_id = params['group_id']
+    old_ids = bulk_update_column(cur, ticket_ids, 'executor_group_id', group_id)
+    names = fetch_names(cur, 'executor_groups', [group_id, *old_ids.values()])
+    new_name = names[group_id] if group_id else 'Снята'
+    old_names = {tid: (names.get(old_id) if old_id else 'Не назначена') for tid, old_id in old_ids.items()}
+    log_bulk_history(cur, list(old_ids), params['actor_id'], 'executor_group_id', old_names, new_name)
+    refresh_ticket_list_rows(cur, list(old_ids))
+    return {'successful': len(old_ids)}
+
+
+def _add_watchers(cur, ticket_ids: List[int], params: Dict[str, Any]) -> Dict[str, int]:
+    # Все пары заявка × пользователь одной вставкой; несуществующие id отбрасываются
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.ticket_watchers (ticket_id, user_id)
+        SELECT t.id, u.id
+        FROM {SCHEMA}.tickets t
+        CROSS JOIN {SCHEMA}.users u
+        WHERE t.id = ANY(%s) AND u.id = ANY(%s)
+        ON CONFLICT (ticket_id, user_id) DO NOTHING
+        RETURNING ticket_id, user_id
+    """, (ticket_ids, params['user_ids']))
+    actually_added = cur.fetchall()
+
+    cur.execute(f"UPDATE {SCHEMA}.tickets SET updated_at = NOW() WHERE id = ANY(%s)", (ticket_ids,))
+
+    # Уведомления реально добавленным наблюдателям — в очередь, в той же транзакции
+    actor_id = params['actor_id']
+    enqueue_notifications(cur, 'watcher_added', [
+        (t_id, {'user_id': u_id, 'actor_user_id': actor_id, 'app_origin': params.get('app_origin') or ''})
+        for t_id, u_id in actually_added
+        if u_id != actor_id
+    ])
+
+    refresh_ticket_list_rows(cur, ticket_ids)
+    return {'successful': len(ticket_ids), 'inserted': len(actually_added)}
+
+
+ACTION_HANDLERS = {
+    'delete': _delete_tickets,
+    'change_status': _change_status,
+    'change_priority': _change_priority,
+    'change_executor': _change_executor,
+    'change_executor_group': _change_executor_group,
+    'add_watchers': _add_watchers,
+}
+
+
+def run_action(cur, action: str, ticket_ids: List[int], params: Dict[str, Any]) -> Dict[str, int]:
+    """Применяет проверенное действие к заявкам в текущей транзакции (без commit)"""
+    return ACTION_HANDLERS[action](cur, ticket_ids, params)
+
+
+_BULK_JOB_FIELDS = """
+    id, action, status, total, cursor_pos, processed, successful, failed, failed_ticket_ids,
+    last_error, created_by, created_at, updated_at, started_at, finished_at
+"""
+
+
+def _bulk_job_view(row) -> Dict[str, Any]:
+    keys = [k.strip() for k in _BULK_JOB_FIELDS.split(',')]
+    job = dict(zip(keys, row))
+    job['progress_percent'] = round(100.0 * job['processed'] / job['total'], 1) if job['total'] else 100.0
+    return job
+
+
+def create_bulk_job(conn, action: str, params: Dict[str, Any], ticket_ids: List[int],
+                    user_id: Optional[int]) -> Dict[str, Any]:
+    """mode=async: записывает задание в bulk_jobs и сразу отвечает 202 с его id"""
+    cur = conn.cursor()
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.bulk_jobs (action, params, ticket_ids, total, created_by)
+        VALUES (%s, %s::jsonb, %s::int[], %s, %s)
+        RETURNING {_BULK_JOB_FIELDS}
+    """, (action, json.dumps(params, ensure_ascii=False), ticket_ids, len(ticket_ids), user_id))
+    job = _bulk_job_view(cur.fetchone())
+    conn.commit()
+    log(f"[BULK-TICKETS] Queued job #{job['id']}: {action}, {len(ticket_ids)} tickets")
+    return response(202, job)
+
+
+def get_bulk_jobs(conn, user_id: Optional[int], job_id) -> Dict[str, Any]:
+    """Прогресс задания (?job_id=N) или 20 последних заданий пользователя"""
+    cur = conn.cursor()
+    if job_id:
+        try:
+            job_id_int = int(job_id)
+        except (TypeError, ValueError):
+            return response(400, {'error': 'job_id должен быть числом'})
+        cur.execute(f"""
+            SELECT {_BULK_JOB_FIELDS} FROM {SCHEMA}.bulk_jobs
+            WHERE id = %s AND created_by = %s
+        """, (job_id_int, user_id))
+        row = cur.fetchone()
+        if not row:
+            return response(404, {'error': 'Задание не найдено'})
+        return response(200, _bulk_job_view(row))
+    cur.execute(f"""
+        SELECT {_BULK_JOB_FIELDS} FROM {SCHEMA}.bulk_jobs
+        WHERE created_by = %s
+        ORDER BY created_at DESC
+        LIMIT 20
+    """, (user_id,))
+    return response(200, {'jobs': [_bulk_job_view(r) for r in cur.fetchall()]})
+
+
+def _run_chunk(cur, action: str, chunk: List[int], params: Dict[str, Any]):
+    """Пачка целиком под savepoint; при ошибке — по одной заявке, чтобы отделить сбойные.
+    Возвращает (successful, failed_ids, текст последней ошибки)."""
+    try:
+        cur.execute("SAVEPOINT bulk_chunk")
+        result = run_action(cur, action, chunk, params)
+        cur.execute("RELEASE SAVEPOINT bulk_chunk")
+        return result['successful'], [], None
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT bulk_chunk")
+        log(f"[BULK-TICKETS] chunk of {len(chunk)} failed, retrying one by one: {e}")
+
+    successful, failed_ids, last_error = 0, [], None
+    for tid in chunk:
+        try:
+            cur.execute("SAVEPOINT bulk_ticket")
+            successful += run_action(cur, action, [tid], params)['successful']
+            cur.execute("RELEASE SAVEPOINT bulk_ticket")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT bulk_ticket")
+            failed_ids.append(tid)
+            last_error = f'#{tid}: {e}'[:1000]
+    return successful, failed_ids, last_error
+
+
+def process_bulk_jobs(conn, time_budget: float = None) -> Dict[str, Any]:
+    """Воркер mode=async: обрабатывает задания bulk_jobs пачками по BULK_JOB_CHUNK заявок.
+
+    Пачка и сдвиг курсора задания коммитятся одной транзакцией под блокировкой
+    строки задания (FOR UPDATE SKIP LOCKED): оборванный вызов откатывает только
+    незакоммиченную пачку, и следующий запуск начинает с неё же — повтор не
+    применяет уже обработанные заявки второй раз. Вызывает automation-dispatcher.
+    """
+    budget = BULK_WORKER_TIME_BUDGET_SECONDS if time_budget is None else time_budget
+    started = time.monotonic()
+    stats = {'chunks': 0, 'processed': 0, 'failed': 0, 'jobs_done': 0}
+    cur = conn.cursor()
+    while time.monotonic() - started < budget:
+        cur.execute(f"""
+            SELECT id, action, params, ticket_ids, cursor_pos, total
+            FROM {SCHEMA}.bulk_jobs
+            WHERE status IN ('queued', 'running')
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """)
+        row = cur.fetchone()
+        if not row:
+            conn.rollback()
+            break
+        job_id, action, params, ticket_ids, cursor_pos, total = row
+        chunk = (ticket_ids or [])[cursor_pos:cursor_pos + BULK_JOB_CHUNK]
+
+        successful, failed_ids, last_error = 0, [], None
+        if chunk:
+            if action in ACTION_HANDLERS:
+                successful, failed_ids, last_error = _run_chunk(cur, action, chunk, params or {})
+            else:
+                failed_ids, last_error = list(chunk), f'Неизвестное действие: {action}'
+
+        new_cursor = cursor_pos + len(chunk)
+        done = new_cursor >= total
+        cur.execute(f"""
+            UPDATE {SCHEMA}.bulk_jobs
+            SET cursor_pos = %s,
+                processed = processed + %s,
+                successful = successful + %s,
+                failed = failed + %s,
+                failed_ticket_ids = failed_ticket_ids || %s::int[],
+                last_error = COALESCE(%s, last_error),
+                status = CASE WHEN %s THEN 'done' ELSE 'running' END,
+                started_at = COALESCE(started_at, NOW()),
+                finished_at = CASE WHEN %s THEN NOW() ELSE NULL END,
+                updated_at = NOW()
+            WHERE id = %s
+        """, (new_cursor, len(chunk), successful, len(failed_ids), failed_ids, last_error, done, done, job_id))
+        conn.commit()
+
+        stats['chunks'] += 1
+        stats['processed'] += len(chunk)
+        stats['failed'] += len(failed_ids)
+        if done:
+            stats['jobs_done'] += 1
+            log(f"[BULK-TICKETS] Job #{job_id} done: {action}, {total} tickets")
+    cur.close()
+    return stats
 
 
 def verify_token(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -121,6 +500,15 @@ def verify_token(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     except:
         return None
 
+def _is_admin(cur, user_id) -> bool:
+    cur.execute(f"""
+        SELECT 1 FROM {SCHEMA}.user_roles ur
+        JOIN {SCHEMA}.roles r ON r.id = ur.role_id
+        WHERE ur.user_id = %s AND r.system_role = 'admin'
+        LIMIT 1
+    """, (user_id,))
+    return cur.fetchone() is not None
+
 def handler(event, context):
     """API эндпоинт для массовых операций с заявками"""
     
@@ -128,13 +516,22 @@ def handler(event, context):
         return response(200, {'message': 'OK'})
     
     method = event.get('httpMethod', 'POST')
+    query = event.get('queryStringParameters') or {}
     
-    if method != 'POST':
-        return response(405, {'error': 'Только POST метод разрешен'})
+    if method not in ('GET', 'POST'):
+        return response(405, {'error': 'Метод не поддерживается'})
     
     payload = verify_token(event)
+    is_worker_call = method == 'POST' and query.get('endpoint') == 'worker'
     
-    if not payload:
+    worker_secret_ok = False
+    if is_worker_call:
+        headers = event.get('headers') or {}
+        secret = headers.get('X-Bulk-Worker-Secret') or headers.get('x-bulk-worker-secret')
+        worker_secret_ok = bool(BULK_WORKER_SECRET) and secret == BULK_WORKER_SECRET
+        if not payload and not worker_secret_ok:
+            return response(401, {'error': 'Требуется авторизация'})
+    elif not payload:
         return response(401, {'error': 'Требуется авторизация'})
     
     try:
@@ -143,11 +540,26 @@ def handler(event, context):
         return response(500, {'error': 'Database connection failed'})
     
     try:
+        if is_worker_call:
+            if not worker_secret_ok:
+                cur = conn.cursor()
+                try:
+                    is_admin = _is_admin(cur, payload.get('user_id'))
+                finally:
+                    cur.close()
+                conn.rollback()
+                if not is_admin:
+                    return response(403, {'error': 'Доступно только администратору'})
+            return response(200, {'success': True, **process_bulk_jobs(conn)})
+        
+        if method == 'GET':
+            return get_bulk_jobs(conn, payload.get('user_id'), query.get('job_id'))
+        
         body = json.loads(event.get('body', '{}'))
         action = body.get('action')
         ticket_ids = body.get('ticket_ids', [])
         
-        log(f"[BULK-TICKETS] Action: {action}, IDs count: {len(ticket_ids)}")
+        log(f"[BULK-TICKETS] Action: {action}, IDs count: {len(ticket_ids)}, mode: {body.get('mode') or 'sync'}")
         
         if not ticket_ids:
             return response(400, {'error': 'Не указаны ID заявок'})
@@ -155,391 +567,58 @@ def handler(event, context):
         if not action:
             return response(400, {'error': 'Не указано действие'})
         
+        if action not in ACTION_HANDLERS:
+            return response(400, {'error': f'Неизвестное действие: {action}'})
+        
+        try:
+            ticket_ids_int = sorted({int(x) for x in ticket_ids})
+        except (TypeError, ValueError):
+            return response(400, {'error': 'ticket_ids должны быть числами'})
+        
         cur = conn.cursor()
-        successful = 0
+        params, error = prepare_action(cur, action, body)
+        if error:
+            return response(400, {'error': error})
         
-        if action == 'delete':
-            # Массовое удаление заявок
-            placeholders = ','.join(['%s'] * len(ticket_ids))
-            log(f"[BULK-TICKETS] Deleting tickets: {ticket_ids}")
-            
-            # Удаляем все связанные записи перед удалением заявок
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.notifications WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted notifications: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting notifications: {e}")
-            
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.ticket_history WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted history: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting history: {e}")
-            
-            try:
-                cur.execute(f"""
-                    DELETE FROM {SCHEMA}.comment_attachments
-                    WHERE comment_id IN (SELECT id FROM {SCHEMA}.ticket_comments WHERE ticket_id IN ({placeholders}))
-                """, ticket_ids)
-                log(f"[BULK-TICKETS] Deleted comment attachments: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting comment attachments: {e}")
-            
-            try:
-                cur.execute(f"""
-                    DELETE FROM {SCHEMA}.comment_reactions
-                    WHERE comment_id IN (SELECT id FROM {SCHEMA}.ticket_comments WHERE ticket_id IN ({placeholders}))
-                """, ticket_ids)
-                log(f"[BULK-TICKETS] Deleted comment reactions: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting comment reactions: {e}")
-            
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.ticket_comments WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted comments: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting comments: {e}")
-            
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.ticket_to_service_mappings WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted service mappings: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting mappings: {e}")
-            
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.ticket_custom_field_values WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted custom fields: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting custom fields: {e}")
-            
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.ticket_approvals WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted approvals: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting approvals: {e}")
-            
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.ticket_watchers WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted watchers: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting watchers: {e}")
-            
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.ticket_group_log WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted group log: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting group log: {e}")
-            
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.sla_violations WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted SLA violations: {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting SLA violations: {e}")
-            
-            try:
-                cur.execute(f"DELETE FROM {SCHEMA}.ticket_service_mappings WHERE ticket_id IN ({placeholders})", ticket_ids)
-                log(f"[BULK-TICKETS] Deleted service mappings (old): {cur.rowcount}")
-            except Exception as e:
-                log(f"[BULK-TICKETS] Error deleting service mappings (old): {e}")
-            
-            # Теперь удаляем сами заявки
-            cur.execute(f"DELETE FROM {SCHEMA}.tickets WHERE id IN ({placeholders})", ticket_ids)
-            successful = cur.rowcount
+        headers = event.get('headers') or {}
+        params['app_origin'] = headers.get('Origin') or headers.get('origin') or ''
+        params['actor_id'] = int(payload.get('user_id') or 0)
+        
+        if body.get('mode') == 'async':
+            return create_bulk_job(conn, action, params, ticket_ids_int, payload.get('user_id'))
+        
+        try:
+            result = run_action(cur, action, ticket_ids_int, params)
             conn.commit()
-            
+        except psycopg2.errors.ForeignKeyViolation as fk_err:
+            conn.rollback()
+            log(f"[BULK-TICKETS] FK violation on {action}: {fk_err}")
+            return response(400, {'error': FK_ERRORS.get(action, 'Связанные данные некорректны. Обновите страницу.')})
+        except Exception as upd_err:
+            conn.rollback()
+            log(f"[BULK-TICKETS] Update error on {action}: {upd_err}")
+            return response(500, {'error': f'Ошибка обновления: {upd_err}'})
+        
+        successful = result['successful']
+        if action == 'delete':
             log(f"[BULK-TICKETS] Successfully deleted {successful} tickets")
-            
             return response(200, {
                 'total': len(ticket_ids),
                 'successful': successful,
                 'message': f'Удалено {successful} заявок'
             })
-        
-        elif action == 'change_status':
-            status_id = body.get('status_id')
-            if not status_id:
-                return response(400, {'error': 'Не указан status_id'})
-
-            try:
-                status_id_int = int(status_id)
-            except (TypeError, ValueError):
-                return response(400, {'error': 'status_id должен быть числом'})
-
-            cur.execute(f"SELECT id, is_closed FROM {SCHEMA}.ticket_statuses WHERE id = %s", (status_id_int,))
-            status_row = cur.fetchone()
-            if not status_row:
-                log(f"[BULK-TICKETS] Status {status_id_int} not found in ticket_statuses")
-                return response(400, {
-                    'error': f'Статус #{status_id_int} не существует. Обновите страницу и выберите статус заново.'
-                })
-            archive_val = bool(status_row[1])
-
-            try:
-                ticket_ids_int = [int(x) for x in ticket_ids]
-            except (TypeError, ValueError):
-                return response(400, {'error': 'ticket_ids должны быть числами'})
-
-            old_status_ids = fetch_old_values(cur, ticket_ids_int, 'status_id')
-            new_status_name = get_name_by_id(cur, 'ticket_statuses', status_id_int)
-            old_status_names = {
-                tid: get_name_by_id(cur, 'ticket_statuses', old_id) if old_id else None
-                for tid, old_id in old_status_ids.items()
-            }
-
-            placeholders = ','.join(['%s'] * len(ticket_ids_int))
-            try:
-                cur.execute(f"""
-                    UPDATE {SCHEMA}.tickets
-                    SET status_id = %s, is_archived = %s, updated_at = NOW()
-                    WHERE id IN ({placeholders})
-                """, [status_id_int, archive_val] + ticket_ids_int)
-                successful = cur.rowcount
-
-                log_bulk_history(
-                    cur, ticket_ids_int, payload.get('user_id'),
-                    'status_id', old_status_names, new_status_name
-                )
-
-                conn.commit()
-            except psycopg2.errors.ForeignKeyViolation as fk_err:
-                conn.rollback()
-                log(f"[BULK-TICKETS] FK violation on change_status: {fk_err}")
-                return response(400, {
-                    'error': 'Невозможно применить статус: связанные данные некорректны. Обновите страницу.'
-                })
-            except Exception as upd_err:
-                conn.rollback()
-                log(f"[BULK-TICKETS] Update error on change_status: {upd_err}")
-                return response(500, {'error': f'Ошибка обновления: {upd_err}'})
-
-            return response(200, {
-                'total': len(ticket_ids_int),
-                'successful': successful,
-                'message': f'Обновлено {successful} заявок'
-            })
-        
-        elif action == 'change_priority':
-            priority_id = body.get('priority_id')
-            if not priority_id:
-                return response(400, {'error': 'Не указан priority_id'})
-
-            try:
-                priority_id_int = int(priority_id)
-                ticket_ids_int = [int(x) for x in ticket_ids]
-            except (TypeError, ValueError):
-                return response(400, {'error': 'priority_id и ticket_ids должны быть числами'})
-
-            cur.execute(f"SELECT 1 FROM {SCHEMA}.ticket_priorities WHERE id = %s", (priority_id_int,))
-            if not cur.fetchone():
-                return response(400, {
-                    'error': f'Приоритет #{priority_id_int} не существует. Обновите страницу.'
-                })
-
-            old_priority_ids = fetch_old_values(cur, ticket_ids_int, 'priority_id')
-            new_priority_name = get_name_by_id(cur, 'ticket_priorities', priority_id_int)
-            old_priority_names = {
-                tid: get_name_by_id(cur, 'ticket_priorities', old_id) if old_id else None
-                for tid, old_id in old_priority_ids.items()
-            }
-
-            placeholders = ','.join(['%s'] * len(ticket_ids_int))
-            try:
-                cur.execute(f"""
-                    UPDATE {SCHEMA}.tickets
-                    SET priority_id = %s, updated_at = NOW()
-                    WHERE id IN ({placeholders})
-                """, [priority_id_int] + ticket_ids_int)
-                successful = cur.rowcount
-
-                log_bulk_history(
-                    cur, ticket_ids_int, payload.get('user_id'),
-                    'priority_id', old_priority_names, new_priority_name
-                )
-
-                conn.commit()
-            except psycopg2.errors.ForeignKeyViolation as fk_err:
-                conn.rollback()
-                log(f"[BULK-TICKETS] FK violation on change_priority: {fk_err}")
-                return response(400, {
-                    'error': 'Невозможно применить приоритет: связанные данные некорректны.'
-                })
-            except Exception as upd_err:
-                conn.rollback()
-                log(f"[BULK-TICKETS] Update error on change_priority: {upd_err}")
-                return response(500, {'error': f'Ошибка обновления: {upd_err}'})
-
-            return response(200, {
-                'total': len(ticket_ids_int),
-                'successful': successful,
-                'message': f'Обновлено {successful} заявок'
-            })
-
-        elif action == 'change_executor':
-            user_id = body.get('user_id')
-
-            try:
-                ticket_ids_int = [int(x) for x in ticket_ids]
-                user_id_int = int(user_id) if user_id else None
-            except (TypeError, ValueError):
-                return response(400, {'error': 'user_id и ticket_ids должны быть числами'})
-
-            if user_id_int is not None:
-                cur.execute(f"SELECT 1 FROM {SCHEMA}.users WHERE id = %s", (user_id_int,))
-                if not cur.fetchone():
-                    return response(400, {
-                        'error': f'Пользователь #{user_id_int} не найден.'
-                    })
-
-            old_executor_ids = fetch_old_values(cur, ticket_ids_int, 'assigned_to')
-            new_executor_name = get_user_full_name(cur, user_id_int) if user_id_int else 'Снят с назначения'
-            old_executor_names = {
-                tid: (get_user_full_name(cur, old_id) if old_id else 'Не назначен')
-                for tid, old_id in old_executor_ids.items()
-            }
-
-            placeholders = ','.join(['%s'] * len(ticket_ids_int))
-            try:
-                cur.execute(f"""
-                    UPDATE {SCHEMA}.tickets
-                    SET assigned_to = %s, updated_at = NOW()
-                    WHERE id IN ({placeholders})
-                """, [user_id_int] + ticket_ids_int)
-                successful = cur.rowcount
-
-                log_bulk_history(
-                    cur, ticket_ids_int, payload.get('user_id'),
-                    'assigned_to', old_executor_names, new_executor_name
-                )
-
-                conn.commit()
-            except psycopg2.errors.ForeignKeyViolation as fk_err:
-                conn.rollback()
-                log(f"[BULK-TICKETS] FK violation on change_executor: {fk_err}")
-                return response(400, {'error': 'Невозможно назначить исполнителя.'})
-            except Exception as upd_err:
-                conn.rollback()
-                log(f"[BULK-TICKETS] Update error on change_executor: {upd_err}")
-                return response(500, {'error': f'Ошибка обновления: {upd_err}'})
-
-            return response(200, {
-                'total': len(ticket_ids_int),
-                'successful': successful,
-                'message': f'Обновлено {successful} заявок'
-            })
-
-        elif action == 'change_executor_group':
-            group_id = body.get('group_id')
-
-            try:
-                ticket_ids_int = [int(x) for x in ticket_ids]
-                group_id_int = int(group_id) if group_id else None
-            except (TypeError, ValueError):
-                return response(400, {'error': 'group_id и ticket_ids должны быть числами'})
-
-            if group_id_int is not None:
-                cur.execute(f"SELECT 1 FROM {SCHEMA}.executor_groups WHERE id = %s", (group_id_int,))
-                if not cur.fetchone():
-                    return response(400, {
-                        'error': f'Группа #{group_id_int} не существует.'
-                    })
-
-            old_group_ids = fetch_old_values(cur, ticket_ids_int, 'executor_group_id')
-            new_group_name = (get_name_by_id(cur, 'executor_groups', group_id_int)
-                              if group_id_int else 'Снята')
-            old_group_names = {
-                tid: (get_name_by_id(cur, 'executor_groups', old_id) if old_id else 'Не назначена')
-                for tid, old_id in old_group_ids.items()
-            }
-
-            placeholders = ','.join(['%s'] * len(ticket_ids_int))
-            try:
-                cur.execute(f"""
-                    UPDATE {SCHEMA}.tickets
-                    SET executor_group_id = %s, updated_at = NOW()
-                    WHERE id IN ({placeholders})
-                """, [group_id_int] + ticket_ids_int)
-                successful = cur.rowcount
-
-                log_bulk_history(
-                    cur, ticket_ids_int, payload.get('user_id'),
-                    'executor_group_id', old_group_names, new_group_name
-                )
-
-                conn.commit()
-            except psycopg2.errors.ForeignKeyViolation as fk_err:
-                conn.rollback()
-                log(f"[BULK-TICKETS] FK violation on change_executor_group: {fk_err}")
-                return response(400, {'error': 'Невозможно назначить группу.'})
-            except Exception as upd_err:
-                conn.rollback()
-                log(f"[BULK-TICKETS] Update error on change_executor_group: {upd_err}")
-                return response(500, {'error': f'Ошибка обновления: {upd_err}'})
-
-            return response(200, {
-                'total': len(ticket_ids_int),
-                'successful': successful,
-                'message': f'Обновлено {successful} заявок'
-            })
-
-        elif action == 'add_watchers':
-            user_ids = body.get('user_ids', [])
-            if not user_ids:
-                return response(400, {'error': 'Не указаны пользователи-наблюдатели'})
-
-            inserted = 0
-            # Список реальных вставок для последующих уведомлений в Битрикс
-            actually_added: list = []  # [(ticket_id, user_id), ...]
-            for tid in ticket_ids:
-                for uid in user_ids:
-                    try:
-                        cur.execute(
-                            f"INSERT INTO {SCHEMA}.ticket_watchers (ticket_id, user_id) "
-                            f"VALUES (%s, %s) ON CONFLICT (ticket_id, user_id) DO NOTHING",
-                            (tid, uid)
-                        )
-                        rc = cur.rowcount
-                        inserted += rc
-                        if rc > 0:
-                            actually_added.append((int(tid), int(uid)))
-                    except Exception as e:
-                        log(f"[BULK-TICKETS] watcher insert error t={tid} u={uid}: {e}")
-
-            cur.execute(
-                f"UPDATE {SCHEMA}.tickets SET updated_at = NOW() WHERE id IN ({','.join(['%s']*len(ticket_ids))})",
-                ticket_ids
-            )
-            conn.commit()
-
-            # Битрикс-уведомления для реально добавленных наблюдателей
-            if actually_added:
-                try:
-                    from bitrix_bot_notifier import notify_watcher_added
-                    headers = event.get('headers') or {}
-                    app_origin = headers.get('Origin') or headers.get('origin') or ''
-                    actor_id = int(payload.get('user_id') or 0)
-                    for t_id, u_id in actually_added:
-                        if u_id == actor_id:
-                            continue
-                        try:
-                            notify_watcher_added(
-                                cur, SCHEMA, t_id, u_id,
-                                actor_user_id=actor_id,
-                                app_origin=app_origin,
-                            )
-                        except Exception as bot_err:
-                            log(f"[bitrix-bot] watcher_added (bulk) failed t={t_id} u={u_id}: {bot_err}")
-                except Exception as imp_err:
-                    log(f"[bitrix-bot] import notifier failed: {imp_err}")
-
+        if action == 'add_watchers':
             return response(200, {
                 'total': len(ticket_ids),
                 'successful': len(ticket_ids),
-                'inserted': inserted,
-                'message': f'Добавлено наблюдателей: {inserted}'
+                'inserted': result['inserted'],
+                'message': f"Добавлено наблюдателей: {result['inserted']}"
             })
-
-        else:
-            return response(400, {'error': f'Неизвестное действие: {action}'})
+        return response(200, {
+            'total': len(ticket_ids_int),
+            'successful': successful,
+            'message': f'Обновлено {successful} заявок'
+        })
     
     except Exception as e:
         log(f"[BULK-TICKETS] Fatal error: {e}")
@@ -551,4 +630,4 @@ def handler(event, context):
         try:
             conn.close()
         except:
-            pass
\ No newline at end of file
+            pass
@@ -0,0 +1,48 @@
+"""Постановка уведомлений в Битрикс24 и MAX в очередь notification_outbox.
+
+Вызывается в той же транзакции, что и запись заявки/комментария: уведомление
+появится в очереди только если запись закоммичена. Отправляет воркер
+api-tickets (?endpoint=notification-outbox).
+"""
+import json
+import os
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+SCHEMA = os.environ.get('MAIN_DB_SCHEMA', 't_p67567221_one_file_page_projec')
+
+CHANNELS = ('bitrix', 'max')
+
+
+def enqueue_notification(cur, kind: str, ticket_id: Optional[int], payload: Dict[str, Any],
+                         channels: Iterable[str] = CHANNELS) -> None:
+    """Ставит уведомление в очередь — по строке на канал, одним INSERT.
+
+    kind: executor_assigned (payload: user_id, app_origin),
+          watcher_added (user_id, actor_user_id, app_origin),
+          comment_added (comment_id, app_origin).
+    """
+    channels = list(channels)
+    if not channels:
+        return
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.notification_outbox (channel, kind, ticket_id, payload)
+        SELECT c, %s, %s, %s::jsonb FROM unnest(%s::text[]) AS c
+    """, (kind, ticket_id, json.dumps(payload, ensure_ascii=False, default=str), channels))
+
+
+def enqueue_notifications(cur, kind: str, items: Iterable[Tuple[Optional[int], Dict[str, Any]]],
+                          channels: Iterable[str] = CHANNELS) -> int:
+    """Ставит пачку уведомлений одного вида одним INSERT: items — пары (ticket_id, payload).
+    Возвращает число добавленных строк."""
+    items = list(items)
+    channels = list(channels)
+    if not items or not channels:
+        return 0
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.notification_outbox (channel, kind, ticket_id, payload)
+        SELECT c, %s, i.ticket_id, i.payload
+        FROM unnest(%s::int[], %s::jsonb[]) AS i(ticket_id, payload)
+        CROSS JOIN unnest(%s::text[]) AS c
+    """, (kind, [t for t, _ in items],
+          [json.dumps(p, ensure_ascii=False, default=str) for _, p in items], channels))
+    return cur.rowcount
@@ -8,7 +8,9 @@ import uuid
 from concurrent.futures import ThreadPoolExecutor
 import requests
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
+from oauth_token_store import get_token, invalidate_token
 
 JWT_SECRET = os.environ.get('JWT_SECRET')
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -23,8 +25,6 @@ CORS_HEADERS = {
     'Access-Control-Max-Age': '86400',
 }
 
-_token_cache = {'token': None, 'expires_at': 0}
-
 SERVICE_KEYWORDS = {
     2: ['1с', '1c', 'база', 'базу', 'базы', 'rdp', 'удалён', 'удален', 'терминал', 'рабочий стол', 'stoma', 'ireland', 'мис'],
     3: ['битрикс', 'bitrix', 'crm', 'портал', 'б24'],
@@ -103,19 +103,137 @@ def response(status_code, body):
     }
 
 
-def get_db_connection():
-    return psycopg2.connect(
+# Соединение с БД переживает тёплые вызовы инстанса функции: повторный вызов
+# не платит за TCP/TLS и авторизацию. DB_CONN_REUSE=0 отключает переиспользование,
+# DB_CONN_MAX_AGE_SECONDS — через сколько секунд соединение переоткрывается,
+# DB_CONN_PING_AFTER_SECONDS — после какого простоя перед выдачей делается SELECT 1.
+DB_CONN_REUSE = os.environ.get('DB_CONN_REUSE', '1') != '0'
+DB_CONN_MAX_AGE_SECONDS = int(os.environ.get('DB_CONN_MAX_AGE_SECONDS', '300'))
+DB_CONN_PING_AFTER_SECONDS = int(os.environ.get('DB_CONN_PING_AFTER_SECONDS', '30'))
+# DB_METRICS_LOG=1 — строка метрик [DB] в лог после каждого вызова (по умолчанию выключена)
+DB_METRICS_LOG = os.environ.get('DB_METRICS_LOG', '0') == '1'
+
+_warm_conn = None
+# connects/reuses — за жизнь инстанса; остальное — за последнюю выдачу соединения
+_db_metrics = {'connects': 0, 'reuses': 0, 'reused': False, 'connect_ms': 0.0, 'queries': 0, 'query_ms': 0.0}
+
+
+class _TimedCursor(RealDictCursor):
+    """Курсор, считающий число и время запросов (см. get_db_metrics)"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _db_metrics['queries'] += 1
+            _db_metrics['query_ms'] += (time.perf_counter() - started) * 1000
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _db_metrics['queries'] += 1
+            _db_metrics['query_ms'] += (time.perf_counter() - started) * 1000
+
+
+class _WarmConnection(psycopg2.extensions.connection):
+    """Соединение, которое при close() откатывает транзакцию и остаётся открытым для следующего вызова"""
+    reusable = False
+    in_use = False
+    created_at = 0.0
+    released_at = 0.0
+
+    def close(self):
+        if not self.reusable or self.closed:
+            super().close()
+            return
+        self.in_use = False
+        self.released_at = time.monotonic()
+        try:
+            self.rollback()
+            if self.autocommit:
+                self.autocommit = False
+            self.cursor_factory = _TimedCursor
+        except psycopg2.Error as e:
+            print(f"[DB] Соединение не вернулось в инстанс: {e}")
+            self.discard()
+        if DB_METRICS_LOG:
+            print(f"[DB] connect={_db_metrics['connect_ms']:.1f}ms reused={_db_metrics['reused']} "
+                  f"queries={_db_metrics['queries']} query={_db_metrics['query_ms']:.1f}ms")
+
+    def discard(self):
+        """Закрывает соединение по-настоящему"""
+        self.reusable = False
+        if not self.closed:
+            super().close()
+
+
+def _is_alive(conn) -> bool:
+    if conn.closed or not conn.reusable:
+        return False
+    now = time.monotonic()
+    if now - conn.created_at > DB_CONN_MAX_AGE_SECONDS:
+        return False
+    if now - conn.released_at > DB_CONN_PING_AFTER_SECONDS:
+        try:
+            cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+    return True
+
+
+def get_db_connection(reuse: bool = True):
+    """
+    Подключение к БД с RealDictCursor и установкой search_path.
+    Между тёплыми вызовами возвращает то же соединение; conn.close() в обработчике
+    откатывает незавершённую транзакцию и оставляет его открытым.
+    reuse=False (или DB_CONN_REUSE=0) — отдельное соединение, которое закроется по-настоящему.
+    Если переиспользуемое соединение уже выдано (вложенный вызов), открывается отдельное.
+    """
+    global _warm_conn
+    started = time.perf_counter()
+    _db_metrics.update(queries=0, query_ms=0.0)
+    warm = reuse and DB_CONN_REUSE
+
+    if warm and _warm_conn is not None:
+        if _warm_conn.in_use:
+            warm = False
+        elif _is_alive(_warm_conn):
+            _warm_conn.in_use = True
+            _db_metrics['reuses'] += 1
+            _db_metrics.update(reused=True, connect_ms=(time.perf_counter() - started) * 1000)
+            return _warm_conn
+        else:
+            _warm_conn.discard()
+            _warm_conn = None
+
+    conn = psycopg2.connect(
         DATABASE_URL,
-        cursor_factory=RealDictCursor,
-        options=f'-c search_path={SCHEMA},public',
+        connection_factory=_WarmConnection,
+        cursor_factory=_TimedCursor,
+        options=f'-c search_path={SCHEMA},public'
     )
+    conn.created_at = conn.released_at = time.monotonic()
+    conn.in_use = True
+    if warm:
+        conn.reusable = True
+        _warm_conn = conn
+    _db_metrics['connects'] += 1
+    _db_metrics.update(reused=False, connect_ms=(time.perf_counter() - started) * 1000)
+    return conn
 
 
-def get_gigachat_token():
-    now = time.time()
-    if _token_cache['token'] and _token_cache['expires_at'] > now + 60:
-        return _token_cache['token']
+def get_db_metrics() -> dict:
+    """Метрики соединения: время подключения против времени запросов последней выдачи"""
+    return dict(_db_metrics)
 
+
+def _refresh_gigachat_token(refresh_token=None):
     resp = requests.post(
         'https://ngw.devices.sberbank.ru:9443/api/v2/oauth',
         headers={
@@ -129,10 +247,12 @@ def get_gigachat_token():
         timeout=TOKEN_TIMEOUT,
     )
     resp.raise_for_status()
-    data = resp.json()
-    _token_cache['token'] = data['access_token']
-    _token_cache['expires_at'] = data.get('expires_at', now + 1800) / 1000 if data.get('expires_at', 0) > 1000000000000 else data.get('expires_at', now + 1800)
-    return _token_cache['token']
+    return resp.json()
+
+
+def get_gigachat_token():
+    """Токен GigaChat из общего хранилища oauth_tokens: холодный инстанс не ходит в OAuth"""
+    return get_token('gigachat', _refresh_gigachat_token)
 
 
 def get_embedding_with_token(text, token):
@@ -397,8 +517,7 @@ def safe_call_gigachat(prompt, token):
             last_error = f'HTTP {status}'
             print(f'[classify] GigaChat HTTP error (attempt {attempt}/{attempts}): {last_error}')
             if status == 401:
-                _token_cache['token'] = None
-                _token_cache['expires_at'] = 0
+                invalidate_token('gigachat')
                 try:
                     current_token = get_gigachat_token()
                 except BaseException as te:
@@ -581,6 +700,7 @@ def classify_test_mode(description, ticket_services, services, mappings, example
 
 
 def save_log(description, result_data, success, error_message, raw_resp, examples_count, rules_count, duration_ms, test_mode):
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -607,12 +727,15 @@ def save_log(description, result_data, success, error_message, raw_resp, example
         ))
         conn.commit()
         cur.close()
-        conn.close()
     except (TypeError, AttributeError, ValueError, RuntimeError) as e:
         print(f'[classify] Failed to save log: {e}')
+    finally:
+        if conn:
+            conn.close()
 
 
 def save_pending_review(description, result):
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -630,22 +753,26 @@ def save_pending_review(description, result):
         ))
         conn.commit()
         cur.close()
-        conn.close()
     except BaseException as e:
         print(f'[classify] Failed to save pending review: {e}')
+    finally:
+        if conn:
+            conn.close()
 
 
 def fetch_catalog_data():
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(f"SELECT id, name FROM {SCHEMA}.ticket_services ORDER BY id")
-    ticket_services = [dict(r) for r in cur.fetchall()]
-    cur.execute(f"SELECT id, name FROM {SCHEMA}.services ORDER BY id")
-    services = [dict(r) for r in cur.fetchall()]
-    cur.execute(f"SELECT ticket_service_id, service_id FROM {SCHEMA}.ticket_service_mappings ORDER BY id")
-    mappings = [dict(r) for r in cur.fetchall()]
-    cur.close()
-    conn.close()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT id, name FROM {SCHEMA}.ticket_services ORDER BY id")
+        ticket_services = [dict(r) for r in cur.fetchall()]
+        cur.execute(f"SELECT id, name FROM {SCHEMA}.services ORDER BY id")
+        services = [dict(r) for r in cur.fetchall()]
+        cur.execute(f"SELECT ticket_service_id, service_id FROM {SCHEMA}.ticket_service_mappings ORDER BY id")
+        mappings = [dict(r) for r in cur.fetchall()]
+        cur.close()
+    finally:
+        conn.close()
     return ticket_services, services, mappings
 
 
@@ -676,17 +803,15 @@ def handler(event, context):
     if not GIGACHAT_ENABLED:
         print(f'[classify] GigaChat disabled. Using keyword + training examples fallback.')
         conn = get_db_connection()
-        cur = conn.cursor()
-        examples_text, rules_text, examples_count = build_training_context_keyword(cur, description)
-        cur.close()
-        conn.close()
+        try:
+            cur = conn.cursor()
+            examples_text, rules_text, examples_count = build_training_context_keyword(cur, description)
+            similar = find_similar_examples_keyword(cur, description) if examples_count > 0 else []
+            cur.close()
+        finally:
+            conn.close()
 
         if examples_count > 0:
-            conn2 = get_db_connection()
-            cur2 = conn2.cursor()
-            similar = find_similar_examples_keyword(cur2, description)
-            cur2.close()
-            conn2.close()
             if similar and similar[0][0] > 0.3:
                 best_score, best_ex = similar[0]
                 result = {
@@ -733,24 +858,17 @@ def handler(event, context):
             return response(200, {'result': fallback, 'debug': {'error': 'No GigaChat token'}})
         return response(200, fallback)
 
-    if USE_EMBEDDINGS and query_embedding:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        examples_text, rules_text, examples_count = build_training_context(cur, query_embedding)
-        cur.close()
-        conn.close()
-    elif USE_EMBEDDINGS and emb_error:
-        print(f'[classify] Embedding failed: {emb_error}. Falling back to keyword context.')
-        conn = get_db_connection()
-        cur = conn.cursor()
-        examples_text, rules_text, examples_count = build_training_context_keyword(cur, description)
-        cur.close()
-        conn.close()
-    else:
-        conn = get_db_connection()
+    conn = get_db_connection()
+    try:
         cur = conn.cursor()
-        examples_text, rules_text, examples_count = build_training_context_keyword(cur, description)
+        if USE_EMBEDDINGS and query_embedding:
+            examples_text, rules_text, examples_count = build_training_context(cur, query_embedding)
+        else:
+            if USE_EMBEDDINGS and emb_error:
+                print(f'[classify] Embedding failed: {emb_error}. Falling back to keyword context.')
+            examples_text, rules_text, examples_count = build_training_context_keyword(cur, description)
         cur.close()
+    finally:
         conn.close()
 
     error_message = None
@@ -3,8 +3,10 @@
 """
 import json
 import os
+import time
 import jwt
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 from typing import Dict, Any, Optional
 
@@ -35,15 +37,136 @@ def response(status_code: int, body: Any) -> Dict[str, Any]:
     }
 
 
-def get_db_connection():
+# Соединение с БД переживает тёплые вызовы инстанса функции: повторный вызов
+# не платит за TCP/TLS и авторизацию. DB_CONN_REUSE=0 отключает переиспользование,
+# DB_CONN_MAX_AGE_SECONDS — через сколько секунд соединение переоткрывается,
+# DB_CONN_PING_AFTER_SECONDS — после какого простоя перед выдачей делается SELECT 1.
+DB_CONN_REUSE = os.environ.get('DB_CONN_REUSE', '1') != '0'
+DB_CONN_MAX_AGE_SECONDS = int(os.environ.get('DB_CONN_MAX_AGE_SECONDS', '300'))
+DB_CONN_PING_AFTER_SECONDS = int(os.environ.get('DB_CONN_PING_AFTER_SECONDS', '30'))
+# DB_METRICS_LOG=1 — строка метрик [DB] в лог после каждого вызова (по умолчанию выключена)
+DB_METRICS_LOG = os.environ.get('DB_METRICS_LOG', '0') == '1'
+
+_warm_conn = None
+# connects/reuses — за жизнь инстанса; остальное — за последнюю выдачу соединения
+_db_metrics = {'connects': 0, 'reuses': 0, 'reused': False, 'connect_ms': 0.0, 'queries': 0, 'query_ms': 0.0}
+
+
+class _TimedCursor(RealDictCursor):
+    """Курсор, считающий число и время запросов (см. get_db_metrics)"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _db_metrics['queries'] += 1
+            _db_metrics['query_ms'] += (time.perf_counter() - started) * 1000
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _db_metrics['queries'] += 1
+            _db_metrics['query_ms'] += (time.perf_counter() - started) * 1000
+
+
+class _WarmConnection(psycopg2.extensions.connection):
+    """Соединение, которое при close() откатывает транзакцию и остаётся открытым для следующего вызова"""
+    reusable = False
+    in_use = False
+    created_at = 0.0
+    released_at = 0.0
+
+    def close(self):
+        if not self.reusable or self.closed:
+            super().close()
+            return
+        self.in_use = False
+        self.released_at = time.monotonic()
+        try:
+            self.rollback()
+            if self.autocommit:
+                self.autocommit = False
+            self.cursor_factory = _TimedCursor
+        except psycopg2.Error as e:
+            print(f"[DB] Соединение не вернулось в инстанс: {e}")
+            self.discard()
+        if DB_METRICS_LOG:
+            print(f"[DB] connect={_db_metrics['connect_ms']:.1f}ms reused={_db_metrics['reused']} "
+                  f"queries={_db_metrics['queries']} query={_db_metrics['query_ms']:.1f}ms")
+
+    def discard(self):
+        """Закрывает соединение по-настоящему"""
+        self.reusable = False
+        if not self.closed:
+            super().close()
+
+
+def _is_alive(conn) -> bool:
+    if conn.closed or not conn.reusable:
+        return False
+    now = time.monotonic()
+    if now - conn.created_at > DB_CONN_MAX_AGE_SECONDS:
+        return False
+    if now - conn.released_at > DB_CONN_PING_AFTER_SECONDS:
+        try:
+            cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+    return True
+
+
+def get_db_connection(reuse: bool = True):
+    """
+    Подключение к БД с RealDictCursor и установкой search_path.
+    Между тёплыми вызовами возвращает то же соединение; conn.close() в обработчике
+    откатывает незавершённую транзакцию и оставляет его открытым.
+    reuse=False (или DB_CONN_REUSE=0) — отдельное соединение, которое закроется по-настоящему.
+    Если переиспользуемое соединение уже выдано (вложенный вызов), открывается отдельное.
+    """
+    global _warm_conn
+    started = time.perf_counter()
+    _db_metrics.update(queries=0, query_ms=0.0)
+    warm = reuse and DB_CONN_REUSE
+
+    if warm and _warm_conn is not None:
+        if _warm_conn.in_use:
+            warm = False
+        elif _is_alive(_warm_conn):
+            _warm_conn.in_use = True
+            _db_metrics['reuses'] += 1
+            _db_metrics.update(reused=True, connect_ms=(time.perf_counter() - started) * 1000)
+            return _warm_conn
+        else:
+            _warm_conn.discard()
+            _warm_conn = None
+
     conn = psycopg2.connect(
         DATABASE_URL,
-        cursor_factory=RealDictCursor,
+        connection_factory=_WarmConnection,
+        cursor_factory=_TimedCursor,
         options=f'-c search_path={SCHEMA},public'
     )
+    conn.created_at = conn.released_at = time.monotonic()
+    conn.in_use = True
+    if warm:
+        conn.reusable = True
+        _warm_conn = conn
+    _db_metrics['connects'] += 1
+    _db_metrics.update(reused=False, connect_ms=(time.perf_counter() - started) * 1000)
     return conn
 
 
+def get_db_metrics() -> dict:
+    """Метрики соединения: время подключения против времени запросов последней выдачи"""
+    return dict(_db_metrics)
+
+
 def verify_token(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     headers = event.get('headers', {})
     token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -24,6 +24,7 @@ def handler(event: dict, context) -> dict:
     params = event.get('queryStringParameters') or {}
     entity = params.get('entity', 'groups')
 
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -38,7 +39,6 @@ def handler(event: dict, context) -> dict:
             result = route_groups(method, cur, conn, body)
 
         cur.close()
-        conn.close()
 
         data, status = result if isinstance(result, tuple) else (result, 200)
 
@@ -56,6 +56,9 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'error': str(e)}, ensure_ascii=False),
             'isBase64Encoded': False
         }
+    finally:
+        if conn:
+            conn.close()
 
 
 def route_groups(method, cur, conn, body):
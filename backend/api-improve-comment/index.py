@@ -3,6 +3,7 @@ import json
 import os
 import uuid
 import requests
+from oauth_token_store import get_token, invalidate_token
 
 GIGACHAT_AUTH_KEY = os.environ.get('GIGACHAT_AUTH_KEY')
 
@@ -14,15 +15,7 @@ CORS_HEADERS = {
     'Access-Control-Max-Age': '86400',
 }
 
-_token_cache = {'token': None, 'expires_at': 0}
-
-
-def get_gigachat_token():
-    import time
-    now = time.time()
-    if _token_cache['token'] and _token_cache['expires_at'] > now + 60:
-        return _token_cache['token']
-
+def _refresh_gigachat_token(refresh_token=None):
     resp = requests.post(
         'https://ngw.devices.sberbank.ru:9443/api/v2/oauth',
         headers={
@@ -36,10 +29,12 @@ def get_gigachat_token():
         timeout=15,
     )
     resp.raise_for_status()
-    data = resp.json()
-    _token_cache['token'] = data['access_token']
-    _token_cache['expires_at'] = now + data.get('expires_in', 1800)
-    return _token_cache['token']
+    return resp.json()
+
+
+def get_gigachat_token():
+    """Токен GigaChat из общего хранилища oauth_tokens: холодный инстанс не ходит в OAuth"""
+    return get_token('gigachat', _refresh_gigachat_token)
 
 
 def improve_text(text: str, token: str) -> str:
@@ -86,8 +81,14 @@ def handler(event: dict, context) -> dict:
     if len(text) > 4000:
         return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Текст слишком длинный (макс. 4000 символов)'})}
 
-    token = get_gigachat_token()
-    improved = improve_text(text, token)
+    try:
+        improved = improve_text(text, get_gigachat_token())
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 401:
+            raise
+        # Токен из хранилища отозван раньше срока — берём новый и повторяем один раз
+        invalidate_token('gigachat')
+        improved = improve_text(text, get_gigachat_token())
 
     return {
         'statusCode': 200,
@@ -21,6 +21,7 @@ def handler(event: dict, context) -> dict:
             'isBase64Encoded': False
         }
     
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -40,7 +41,6 @@ def handler(event: dict, context) -> dict:
             result = {'error': 'Method not allowed'}, 405
         
         cur.close()
-        conn.close()
         
         if isinstance(result, tuple):
             data, status = result
@@ -61,6 +61,9 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'error': str(e)}, ensure_ascii=False),
             'isBase64Encoded': False
         }
+    finally:
+        if conn:
+            conn.close()
 
 
 def handle_get(cur):
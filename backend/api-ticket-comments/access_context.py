@@ -0,0 +1,128 @@
+"""
+Контекст доступа пользователя: роли, права, видимые группы, доступ к скрытым комментариям.
+
+Загружается одним запросом и мемоизируется на время вызова функции
+(reset_access_context() в начале handler). Между тёплыми вызовами контекст
+хранится в памяти инстанса и переиспользуется, пока не изменилась
+access_control_version (её увеличивают триггеры на ролях, правах и группах) —
+тогда тот же запрос сразу возвращает свежие данные.
+"""
+from typing import Dict, Any, List, Optional
+from shared_utils import SCHEMA
+
+_WARM_CACHE_MAX_USERS = 500
+
+# user_id -> AccessContext, уже сверенный с версией в текущем вызове
+_request_memo: Dict[int, 'AccessContext'] = {}
+# user_id -> AccessContext из прошлых вызовов (сверяется с версией)
+_warm_cache: Dict[int, 'AccessContext'] = {}
+
+
+class AccessContext:
+    """Права пользователя в рамках одного запроса"""
+
+    def __init__(self, user_id: int, version: Optional[int], roles: List[Dict[str, Any]],
+                 permissions: List[str], restricted_user_ids: Optional[List[int]]):
+        self.user_id = user_id
+        self.version = version
+        self.roles = roles
+        self.role_ids = [r['role_id'] for r in roles]
+        self.permissions = set(permissions)
+
+        self.is_admin = False
+        self.can_see_internal = False
+        for r in roles:
+            name = (r.get('name') or '').strip().lower()
+            system_role = (r.get('system_role') or '').strip().lower()
+            if system_role == 'admin':
+                self.is_admin = True
+            if system_role in ('admin', 'executor') or name in ('admin', 'администратор', 'исполнитель'):
+                self.can_see_internal = True
+
+        self.view_all_tickets = self.has_permission('tickets', 'view_all')
+        self.view_own_only = self.has_permission('tickets', 'view_own_only')
+        # None — роль без ограничения по группам; [] — ограничение есть, но видеть некого
+        self.restricted_user_ids = restricted_user_ids
+
+    def has_permission(self, resource: str, action: str) -> bool:
+        return f'{resource}.{action}' in self.permissions
+
+    def has_role_named(self, *names: str) -> bool:
+        """Проверка по точному названию роли (как r.name IN (...) в SQL)"""
+        return any(r.get('name') in names for r in self.roles)
+
+
+def _empty_context(user_id: int) -> AccessContext:
+    return AccessContext(user_id, None, [], [], None)
+
+
+def reset_access_context() -> None:
+    """Сбрасывает мемо текущего вызова. Тёплый кэш остаётся и сверяется с версией."""
+    _request_memo.clear()
+
+
+def get_access_context(cur, user_id: Optional[int]) -> AccessContext:
+    """Контекст доступа пользователя за один запрос к БД (и ноль — повторно в том же вызове).
+
+    Запрос всегда читает access_control_version; данные ролей и прав собираются
+    только если версия не совпала с закэшированной.
+    """
+    if not user_id:
+        return _empty_context(0)
+    user_id = int(user_id)
+
+    memo = _request_memo.get(user_id)
+    if memo is not None:
+        return memo
+
+    cached = _warm_cache.get(user_id)
+    cached_version = cached.version if cached else None
+
+    cur.execute(f"""
+        SELECT v.version,
+               CASE WHEN v.version IS DISTINCT FROM %s THEN json_build_object(
+                   'roles', COALESCE((
+                       SELECT json_agg(json_build_object(
+                           'role_id', r.id, 'name', r.name, 'system_role', r.system_role,
+                           'restrict_to_groups', COALESCE(r.restrict_to_groups, false)
+                       ))
+                       FROM {SCHEMA}.user_roles ur
+                       JOIN {SCHEMA}.roles r ON r.id = ur.role_id
+                       WHERE ur.user_id = %s
+                   ), '[]'::json),
+                   'permissions', COALESCE((
+                       SELECT json_agg(DISTINCT p.resource || '.' || p.action)
+                       FROM {SCHEMA}.user_roles ur
+                       JOIN {SCHEMA}.role_permissions rp ON rp.role_id = ur.role_id
+                       JOIN {SCHEMA}.permissions p ON p.id = rp.permission_id
+                       WHERE ur.user_id = %s
+                   ), '[]'::json),
+                   'restricted_user_ids', COALESCE((
+                       SELECT json_agg(DISTINCT egm.user_id)
+                       FROM {SCHEMA}.user_roles ur
+                       JOIN {SCHEMA}.roles r ON r.id = ur.role_id AND r.restrict_to_groups = true
+                       JOIN {SCHEMA}.role_visible_groups rvg ON rvg.role_id = r.id
+                       JOIN {SCHEMA}.executor_group_members egm ON egm.group_id = rvg.group_id
+                       WHERE ur.user_id = %s
+                   ), '[]'::json)
+               ) END AS data
+        FROM (SELECT COALESCE(MAX(version), 0) AS version FROM {SCHEMA}.access_control_version) v
+    """, (cached_version, user_id, user_id, user_id))
+    row = cur.fetchone()
+    version = row['version']
+
+    if row['data'] is None and cached is not None:
+        ctx = cached
+    else:
+        data = row['data'] or {}
+        roles = data.get('roles') or []
+        restricted = None
+        if any(r.get('restrict_to_groups') for r in roles):
+            restricted = [int(u) for u in (data.get('restricted_user_ids') or [])]
+        ctx = AccessContext(user_id, version, roles, data.get('permissions') or [], restricted)
+        if len(_warm_cache) >= _WARM_CACHE_MAX_USERS and user_id not in _warm_cache:
+            _warm_cache.pop(next(iter(_warm_cache)))
+        _warm_cache[user_id] = ctx
+
+    _request_memo[user_id] = ctx
+    return ctx
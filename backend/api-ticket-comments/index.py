@@ -2,16 +2,16 @@
 API для работы с комментариями к заявкам
 """
 import json
-import os
 import re
 import gzip
 import base64
-import urllib.request
-import urllib.parse
-from typing import Dict, Any, List, Set
+from datetime import timedelta
+from typing import Dict, Any, List, Optional, Set, Tuple
 from pydantic import BaseModel, Field
 from shared_utils import response, get_db_connection, verify_token, handle_options, SCHEMA
-from max_bot_notifier import send_comment_notifications as max_send_comment_notifications
+from access_context import get_access_context, reset_access_context
+from notification_outbox import enqueue_notification
+from business_clock import SLA_CLOCK_HORIZON_DAYS, as_utc, db_now, load_group_clock, resume_deadline
 
 MENTION_RE = re.compile(r'@([a-zA-Z0-9_.\-]+)')
 
@@ -151,13 +151,22 @@ def _create_notification(cur, user_id: int, ticket_id: int, event_type: str,
         json.dumps(payload) if payload else None,
     ))
 
-BITRIX_PORTAL_URL = os.environ.get('BITRIX24_PORTAL_URL', '').rstrip('/')
-BITRIX_BOT_ID = os.environ.get('BITRIX_BOT_ID', '')
-BITRIX_BOT_CLIENT_ID = os.environ.get('BITRIX_BOT_CLIENT_ID', '')
-BITRIX_BOT_CLIENT_SECRET = os.environ.get('BITRIX_BOT_CLIENT_SECRET', '')
-BITRIX_BOT_REFRESH_TOKEN = os.environ.get('BITRIX_BOT_REFRESH_TOKEN', '')
 
-_bot_access_token = None
+def _refresh_ticket_list_rows(cur, ticket_id: int) -> None:
+    """Пересчитывает строку проекции списка заявок (ticket_list_rows) в текущей транзакции.
+    Сбой проекции не ломает комментарий — расхождение исправит задача сверки
+    ticket_list_rows_repair.
+    """
+    try:
+        cur.execute("SAVEPOINT ticket_list_rows_refresh")
+        cur.execute(f"SELECT {SCHEMA}.refresh_ticket_list_rows(%s::int[])", ([int(ticket_id)],))
+        cur.execute("RELEASE SAVEPOINT ticket_list_rows_refresh")
+    except Exception as e:
+        print(f"[ticket_list_rows] refresh error for ticket {ticket_id}: {e}")
+        try:
+            cur.execute("ROLLBACK TO SAVEPOINT ticket_list_rows_refresh")
+        except Exception:
+            pass
 
 
 class AttachmentInput(BaseModel):
@@ -186,6 +195,7 @@ def handler(event: dict, context) -> dict:
     if not payload:
         return response(401, {'error': 'Требуется авторизация'})
 
+    reset_access_context()
     conn = get_db_connection()
     if not conn:
         return response(500, {'error': 'Database connection failed'})
@@ -354,17 +364,49 @@ def handle_get_inline(event: Dict[str, Any], conn, payload: Dict[str, Any]) -> D
     })
 
 
-def handle_get_comments(event: Dict[str, Any], conn, payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Получение комментариев к заявке"""
-    params = event.get('queryStringParameters', {}) or {}
-    ticket_id = params.get('ticket_id')
+_COMMENTS_PAGE_DEFAULT = 30
+_COMMENTS_PAGE_MAX = 200
 
-    if not ticket_id:
-        return response(400, {'error': 'ticket_id parameter required'})
 
-    user_id = payload.get('user_id')
-    tid = int(ticket_id)
-    cur = conn.cursor()
+def _parse_comment_page(before_raw: Any, limit_raw: Any) -> Tuple[Optional[int], int]:
+    """(before_id, limit) страницы комментариев.
+
+    Без limit — страница по умолчанию (_COMMENTS_PAGE_DEFAULT самых новых):
+    тред целиком больше не отдаётся, старые страницы догружаются по before_id.
+    Некорректные значения — ValueError.
+    """
+    before_id = int(before_raw) if before_raw not in (None, '') else None
+    if limit_raw in (None, ''):
+        limit = _COMMENTS_PAGE_DEFAULT
+    else:
+        limit = int(limit_raw)
+        if not 1 <= limit <= _COMMENTS_PAGE_MAX:
+            raise ValueError(f'limit must be between 1 and {_COMMENTS_PAGE_MAX}')
+    return before_id, limit
+
+
+def _load_comment_page(cur, ticket_id: int, see_internal: bool,
+                       before_id: Optional[int], limit: Optional[int]) -> Tuple[List[Dict[str, Any]], bool]:
+    """Страница комментариев заявки от новых к старым и флаг has_more.
+
+    Курсор — id последнего полученного комментария: следующая страница
+    начинается строго после него по (created_at, id). Скрытые комментарии
+    отсекаются в SQL, чтобы limit считал только видимые.
+    """
+    where = ['tc.ticket_id = %s']
+    query_params: List[Any] = [ticket_id]
+    if not see_internal:
+        where.append('tc.is_internal = false')
+    if before_id is not None:
+        where.append(f"""(tc.created_at, tc.id) < (
+            SELECT b.created_at, b.id FROM {SCHEMA}.ticket_comments b
+            WHERE b.id = %s AND b.ticket_id = %s
+        )""")
+        query_params.extend([before_id, ticket_id])
+    limit_sql = ''
+    if limit is not None:
+        limit_sql = 'LIMIT %s'
+        query_params.append(limit + 1)
 
     cur.execute(f"""
         SELECT 
@@ -378,15 +420,41 @@ def handle_get_comments(event: Dict[str, Any], conn, payload: Dict[str, Any]) ->
             u.photo_url as user_photo_url
         FROM {SCHEMA}.ticket_comments tc
         LEFT JOIN {SCHEMA}.users u ON tc.user_id = u.id
-        WHERE tc.ticket_id = %s
-        ORDER BY tc.created_at DESC
-    """, (tid,))
+        WHERE {' AND '.join(where)}
+        ORDER BY tc.created_at DESC, tc.id DESC
+        {limit_sql}
+    """, tuple(query_params))
 
     comments = [dict(row) for row in cur.fetchall()]
+    has_more = limit is not None and len(comments) > limit
+    return comments[:limit] if has_more else comments, has_more
+
+
+def handle_get_comments(event: Dict[str, Any], conn, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Получение комментариев к заявке.
+
+    Пагинация: limit — размер страницы (новые сверху, по умолчанию
+    _COMMENTS_PAGE_DEFAULT), before_id — id последнего уже загруженного
+    комментария. В ответе has_more и next_before_id для следующей страницы.
+    Прочтения и вложения грузятся только для комментариев страницы.
+    """
+    params = event.get('queryStringParameters', {}) or {}
+    ticket_id = params.get('ticket_id')
+
+    if not ticket_id:
+        return response(400, {'error': 'ticket_id parameter required'})
+
+    try:
+        before_id, limit = _parse_comment_page(params.get('before_id'), params.get('limit'))
+    except ValueError as e:
+        return response(400, {'error': f'Invalid pagination: {e}'})
+
+    user_id = payload.get('user_id')
+    tid = int(ticket_id)
+    cur = conn.cursor()
 
     # Скрытые (внутренние) комментарии видят только Администратор и Исполнитель
-    if not _can_see_internal(cur, user_id):
-        comments = [c for c in comments if not c.get('is_internal')]
+    comments, has_more = _load_comment_page(cur, tid, _can_see_internal(cur, user_id), before_id, limit)
 
     # Вырезаем тяжёлые inline base64-картинки, чтобы ответ влез в лимит Cloud Functions.
     # Помечаем такие комментарии флагом has_inline_images=true, фронтенд может
@@ -419,7 +487,8 @@ def handle_get_comments(event: Dict[str, Any], conn, payload: Dict[str, Any]) ->
     # Для последнего (самого нового) комментария отдаём расширенную информацию
     # о прочитавших: ФИО, фото, время прочтения — для индикатора «Просмотрено: ...».
     # Автора комментария в этот список не включаем (он не «читал» — он написал).
-    if comments:
+    # Страницы со старыми комментариями (before_id) его не содержат.
+    if comments and before_id is None:
         latest = comments[0]  # ORDER BY created_at DESC => первый — самый новый
         latest_id = latest['id']
         cur.execute(f"""
@@ -497,12 +566,49 @@ def handle_get_comments(event: Dict[str, Any], conn, payload: Dict[str, Any]) ->
 
     return response(200, {
         'comments': comments,
+        'has_more': has_more,
+        'next_before_id': comments[-1]['id'] if has_more else None,
         'my_last_seen_at': my_last_seen_at.isoformat() if my_last_seen_at else None,
         'participants_seen': participants_seen,
         'participant_ids': sorted(participant_ids),
     })
 
 
+def _sla_resume_business(cur, ticket: Dict[str, Any]):
+    """Снятие паузы для SLA с графиком, как в api-tickets (group_tracking_service.sla_resume_business):
+    (рабочие секунды паузы, due_date, response_due_date). None — SLA без графика
+    или у группы заявки нет графиков: сдвиг по календарю."""
+    if not ticket.get('sla_paused_at'):
+        return None
+    cur.execute(f"""
+        SELECT s.use_work_schedule
+        FROM {SCHEMA}.sla s
+        JOIN {SCHEMA}.sla_service_mappings ssm ON s.id = ssm.sla_id
+        JOIN {SCHEMA}.ticket_to_service_mappings tsm ON
+            (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id = tsm.service_id)
+            OR (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id IS NULL)
+            OR (ssm.ticket_service_id IS NULL AND ssm.service_id = tsm.service_id)
+        WHERE tsm.ticket_id = %s
+        LIMIT 1
+    """, (ticket['id'],))
+    sla = cur.fetchone()
+    if not sla or not sla['use_work_schedule']:
+        return None
+    now = db_now(cur)
+    paused_at = as_utc(ticket['sla_paused_at'])
+    clock = load_group_clock(
+        cur, SCHEMA, ticket.get('executor_group_id'), paused_at,
+        now + timedelta(days=SLA_CLOCK_HORIZON_DAYS)
+    )
+    if not clock:
+        return None
+    return (
+        int(clock.elapsed_minutes(paused_at, now) * 60),
+        resume_deadline(clock, ticket.get('due_date'), paused_at, now),
+        resume_deadline(clock, ticket.get('response_due_date'), paused_at, now),
+    )
+
+
 def handle_create_comment(event: Dict[str, Any], conn, payload: Dict[str, Any]) -> Dict[str, Any]:
     """Создание комментария к заявке"""
     body = json.loads(event.get('body', '{}'))
@@ -521,6 +627,7 @@ def handle_create_comment(event: Dict[str, Any], conn, payload: Dict[str, Any])
     cur.execute(f"""
         SELECT t.id, t.assigned_to, t.created_by, t.status_id,
                t.previous_status_id, t.sla_paused_at, t.sla_paused_total_seconds,
+               t.executor_group_id, t.due_date, t.response_due_date,
                ts.is_reopened, ts.is_waiting_response
         FROM {SCHEMA}.tickets t
         JOIN {SCHEMA}.ticket_statuses ts ON ts.id = t.status_id
@@ -578,31 +685,49 @@ def handle_create_comment(event: Dict[str, Any], conn, payload: Dict[str, Any])
         and not data.is_internal
         and ticket['previous_status_id']
     ):
-        paused_seconds_to_add = 0
-        if ticket['sla_paused_at']:
-            cur.execute(
-                "SELECT EXTRACT(EPOCH FROM (NOW() - %s))::INTEGER AS sec",
-                (ticket['sla_paused_at'],),
-            )
-            paused_seconds_to_add = cur.fetchone()['sec'] or 0
-
-        cur.execute(f"""
-            UPDATE {SCHEMA}.tickets
-            SET updated_at = NOW(),
-                status_id = %s,
-                previous_status_id = NULL,
-                sla_paused_at = NULL,
-                sla_paused_total_seconds = COALESCE(sla_paused_total_seconds, 0) + %s,
-                due_date = CASE WHEN due_date IS NOT NULL
-                                THEN due_date + (%s || ' seconds')::INTERVAL
-                                ELSE NULL END,
-                response_due_date = CASE WHEN response_due_date IS NOT NULL
-                                         THEN response_due_date + (%s || ' seconds')::INTERVAL
-                                         ELSE NULL END,
-                waiting_reminder_sent_at = NULL
-            WHERE id = %s
-        """, (ticket['previous_status_id'], paused_seconds_to_add,
-              paused_seconds_to_add, paused_seconds_to_add, data.ticket_id))
+        # SLA с графиком: пауза и сдвиг сроков в рабочем времени группы, иначе — по календарю
+        resumed = _sla_resume_business(cur, ticket)
+        if resumed:
+            paused_seconds_to_add, due_date, response_due_date = resumed
+            cur.execute(f"""
+                UPDATE {SCHEMA}.tickets
+                SET updated_at = NOW(),
+                    status_id = %s,
+                    previous_status_id = NULL,
+                    sla_paused_at = NULL,
+                    sla_paused_total_seconds = COALESCE(sla_paused_total_seconds, 0) + %s,
+                    due_date = %s,
+                    response_due_date = %s,
+                    waiting_reminder_sent_at = NULL
+                WHERE id = %s
+            """, (ticket['previous_status_id'], paused_seconds_to_add,
+                  due_date, response_due_date, data.ticket_id))
+        else:
+            paused_seconds_to_add = 0
+            if ticket['sla_paused_at']:
+                cur.execute(
+                    "SELECT EXTRACT(EPOCH FROM (NOW() - %s))::INTEGER AS sec",
+                    (ticket['sla_paused_at'],),
+                )
+                paused_seconds_to_add = cur.fetchone()['sec'] or 0
+
+            cur.execute(f"""
+                UPDATE {SCHEMA}.tickets
+                SET updated_at = NOW(),
+                    status_id = %s,
+                    previous_status_id = NULL,
+                    sla_paused_at = NULL,
+                    sla_paused_total_seconds = COALESCE(sla_paused_total_seconds, 0) + %s,
+                    due_date = CASE WHEN due_date IS NOT NULL
+                                    THEN due_date + (%s || ' seconds')::INTERVAL
+                                    ELSE NULL END,
+                    response_due_date = CASE WHEN response_due_date IS NOT NULL
+                                             THEN response_due_date + (%s || ' seconds')::INTERVAL
+                                             ELSE NULL END,
+                    waiting_reminder_sent_at = NULL
+                WHERE id = %s
+            """, (ticket['previous_status_id'], paused_seconds_to_add,
+                  paused_seconds_to_add, paused_seconds_to_add, data.ticket_id))
 
         cur.execute(
             f"SELECT id, name FROM {SCHEMA}.ticket_statuses WHERE id = ANY(%s)",
@@ -670,6 +795,17 @@ def handle_create_comment(event: Dict[str, Any], conn, payload: Dict[str, Any])
         ON CONFLICT (user_id, ticket_id) DO UPDATE SET last_seen_at = NOW()
     """, (user_id, data.ticket_id))
 
+    # Битрикс- и MAX-бот: доставка через notification_outbox после коммита
+    headers = event.get('headers', {})
+    origin = headers.get('Origin') or headers.get('origin') or headers.get('Referer') or headers.get('referer') or ''
+    if origin:
+        origin = origin.rstrip('/')
+        parts = origin.replace('https://', '').replace('http://', '')
+        if '/' in parts:
+            origin = origin.split('/')[0] + '//' + origin.split('/')[2]
+    enqueue_notification(cur, 'comment_added', data.ticket_id, {'comment_id': comment['id'], 'app_origin': origin})
+
+    _refresh_ticket_list_rows(cur, data.ticket_id)
     conn.commit()
 
     cur.execute(f"""
@@ -679,68 +815,21 @@ def handle_create_comment(event: Dict[str, Any], conn, payload: Dict[str, Any])
     user_data = dict(cur.fetchone())
     comment.update(user_data)
 
-    try:
-        headers = event.get('headers', {})
-        origin = headers.get('Origin') or headers.get('origin') or headers.get('Referer') or headers.get('referer') or ''
-        if origin:
-            origin = origin.rstrip('/')
-            parts = origin.replace('https://', '').replace('http://', '')
-            if '/' in parts:
-                origin = origin.split('/')[0] + '//' + origin.split('/')[2]
-        print(f"[bitrix-bot] Sending notification for ticket {data.ticket_id}, author {user_id}")
-        send_bitrix_notifications(cur, data.ticket_id, user_id, data.comment, data.is_internal, origin)
-    except Exception as e:
-        import traceback
-        print(f"[bitrix-bot] Error: {e}\n{traceback.format_exc()}")
-
-    try:
-        headers = event.get('headers', {})
-        origin = headers.get('Origin') or headers.get('origin') or headers.get('Referer') or headers.get('referer') or ''
-        if origin:
-            origin = origin.rstrip('/')
-            parts = origin.replace('https://', '').replace('http://', '')
-            if '/' in parts:
-                origin = origin.split('/')[0] + '//' + origin.split('/')[2]
-        print(f"[max-bot] Sending notification for ticket {data.ticket_id}, author {user_id}")
-        max_send_comment_notifications(cur, SCHEMA, data.ticket_id, user_id, data.comment, data.is_internal, origin)
-    except Exception as e:
-        import traceback
-        print(f"[max-bot] Error: {e}\n{traceback.format_exc()}")
-
     cur.close()
     return response(201, comment)
 
 
 def _is_admin_user(cur, user_id: int) -> bool:
     """Проверяет, является ли пользователь администратором по ролям из БД"""
-    cur.execute(f"""
-        SELECT r.name, r.system_role
-        FROM {SCHEMA}.user_roles ur
-        JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-        WHERE ur.user_id = %s
-    """, (int(user_id),))
-    for row in cur.fetchall():
-        name = (row.get('name') or '').strip().lower()
-        system_role = (row.get('system_role') or '').strip().lower()
-        if system_role == 'admin' or name in ('admin', 'администратор'):
-            return True
-    return False
+    ctx = get_access_context(cur, user_id)
+    return ctx.is_admin or any(
+        (r.get('name') or '').strip().lower() in ('admin', 'администратор') for r in ctx.roles
+    )
 
 
 def _can_see_internal(cur, user_id: int) -> bool:
     """Скрытые комментарии видят только Администратор и Исполнитель"""
-    cur.execute(f"""
-        SELECT r.name, r.system_role
-        FROM {SCHEMA}.user_roles ur
-        JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-        WHERE ur.user_id = %s
-    """, (int(user_id),))
-    for row in cur.fetchall():
-        name = (row.get('name') or '').strip().lower()
-        system_role = (row.get('system_role') or '').strip().lower()
-        if system_role in ('admin', 'executor') or name in ('admin', 'администратор', 'исполнитель'):
-            return True
-    return False
+    return get_access_context(cur, user_id).can_see_internal
 
 
 def handle_edit_comment(event: Dict[str, Any], conn, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -857,6 +946,7 @@ def handle_edit_comment(event: Dict[str, Any], conn, payload: Dict[str, Any]) ->
     """, (comment_id,))
     updated = cur.fetchone()
 
+    _refresh_ticket_list_rows(cur, row['ticket_id'])
     conn.commit()
     cur.close()
 
@@ -918,186 +1008,7 @@ def handle_delete_comment(event: Dict[str, Any], conn, payload: Dict[str, Any])
         VALUES (%s, %s, 'comment', 'Удален комментарий', NULL, %s, NOW())
     """, (comment['ticket_id'], user_id, comment.get('is_internal', False)))
 
+    _refresh_ticket_list_rows(cur, comment['ticket_id'])
     conn.commit()
     cur.close()
     return response(200, {'message': 'Комментарий удален', 'id': comment_id})
-
-
-def _priority_emoji(priority_name: str) -> str:
-    name = priority_name.lower()
-    if 'критич' in name:
-        return '🚨🚨🚨'
-    if 'высок' in name:
-        return '⚠️⚠️⚠️'
-    if 'средн' in name:
-        return '🟠🟠🟠'
-    return '⚪️⚪️⚪️'
-
-
-def send_bitrix_notifications(cur, ticket_id: int, author_user_id: int, comment_text: str, is_internal: bool, app_origin: str = ''):
-    """Отправляет уведомления через чат-бота DreamDesk в Битрикс24"""
-    if not BITRIX_BOT_ID or not BITRIX_PORTAL_URL:
-        print(f"[bitrix-bot] Bot not configured (BOT_ID={bool(BITRIX_BOT_ID)}, PORTAL={bool(BITRIX_PORTAL_URL)})")
-        return
-
-    cur.execute(f"""
-        SELECT t.id, t.title, t.created_by, t.assigned_to,
-               author.full_name AS author_name,
-               creator.bitrix_user_id AS creator_bitrix_id,
-               executor.bitrix_user_id AS executor_bitrix_id,
-               p.name AS priority_name
-        FROM {SCHEMA}.tickets t
-        JOIN {SCHEMA}.users author ON author.id = %s
-        LEFT JOIN {SCHEMA}.users creator ON creator.id = t.created_by
-        LEFT JOIN {SCHEMA}.users executor ON executor.id = t.assigned_to
-        LEFT JOIN {SCHEMA}.ticket_priorities p ON t.priority_id = p.id
-        WHERE t.id = %s
-    """, (author_user_id, ticket_id))
-
-    row = cur.fetchone()
-    if not row:
-        return
-
-    cur.execute(f"""
-        SELECT tw.user_id, u.bitrix_user_id
-        FROM {SCHEMA}.ticket_watchers tw
-        JOIN {SCHEMA}.users u ON u.id = tw.user_id
-        WHERE tw.ticket_id = %s AND u.bitrix_user_id IS NOT NULL
-    """, (ticket_id,))
-    watchers = cur.fetchall() or []
-
-    # Для скрытых комментариев исключаем наблюдателей, не имеющих права видеть скрытые
-    if is_internal:
-        watchers = [w for w in watchers if _can_see_internal(cur, w['user_id'])]
-
-    recipients = _collect_recipients(row, author_user_id, is_internal, watchers)
-    if not recipients:
-        print(f"[bitrix-bot] No recipients for ticket {ticket_id}")
-        return
-
-    clean_text = _strip_markdown_images(comment_text or '')
-    preview = clean_text[:150] + ('...' if len(clean_text) > 150 else '')
-    ticket_title = row['title'] or f"Заявка #{row['id']}"
-
-    ticket_url = ''
-    if app_origin:
-        ticket_url = f"{app_origin}/tickets/{row['id']}"
-
-    access_token = _get_bot_token()
-    if not access_token:
-        print("[bitrix-bot] Failed to get access token")
-        return
-
-    priority_emoji = _priority_emoji(row.get('priority_name') or '')
-
-    for r in recipients:
-        message = (
-            f"{priority_emoji} [b]Новый комментарий в заявке #{row['id']}[/b]\n"
-            f"{ticket_title}\n\n"
-            f"[b]{row['author_name']}[/b]: {preview}"
-        )
-
-        keyboard = []
-        if ticket_url:
-            keyboard = [
-                {
-                    "TEXT": f"📋 Открыть заявку #{row['id']}",
-                    "LINK": ticket_url,
-                    "BG_COLOR": "#3B82F6",
-                    "TEXT_COLOR": "#FFFFFF",
-                    "DISPLAY": "LINE",
-                    "BLOCK": "Y"
-                }
-            ]
-
-        _send_bot_message(access_token, r['bitrix_id'], message, keyboard)
-
-
-def _collect_recipients(row, author_user_id: int, is_internal: bool, watchers=None) -> List[dict]:
-    """Определяет получателей уведомления"""
-    recipients = []
-    seen = set()
-
-    def add(bitrix_id, role):
-        if bitrix_id and bitrix_id not in seen:
-            seen.add(bitrix_id)
-            recipients.append({'bitrix_id': bitrix_id, 'role': role})
-
-    if is_internal:
-        if row['assigned_to'] and row['assigned_to'] != author_user_id:
-            add(row.get('executor_bitrix_id'), 'executor')
-        for w in (watchers or []):
-            if w['user_id'] != author_user_id:
-                add(w['bitrix_user_id'], 'watcher')
-        return recipients
-
-    if row['created_by'] != author_user_id:
-        add(row.get('creator_bitrix_id'), 'creator')
-
-    if row['assigned_to'] and row['assigned_to'] != author_user_id:
-        add(row.get('executor_bitrix_id'), 'executor')
-
-    for w in (watchers or []):
-        if w['user_id'] != author_user_id:
-            add(w['bitrix_user_id'], 'watcher')
-
-    return recipients
-
-
-def _get_bot_token() -> str:
-    """Получает access_token для бота, обновляя через refresh_token"""
-    global _bot_access_token
-    if _bot_access_token:
-        return _bot_access_token
-
-    if not BITRIX_BOT_REFRESH_TOKEN or not BITRIX_BOT_CLIENT_ID or not BITRIX_BOT_CLIENT_SECRET:
-        print("[bitrix-bot] Missing bot credentials for token refresh")
-        return ''
-
-    params = urllib.parse.urlencode({
-        'grant_type': 'refresh_token',
-        'client_id': BITRIX_BOT_CLIENT_ID,
-        'client_secret': BITRIX_BOT_CLIENT_SECRET,
-        'refresh_token': BITRIX_BOT_REFRESH_TOKEN,
-    })
-    url = f"https://oauth.bitrix.info/oauth/token/?{params}"
-
-    try:
-        req = urllib.request.Request(url, method='GET')
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-            _bot_access_token = data.get('access_token', '')
-            new_refresh = data.get('refresh_token', '')
-            if new_refresh:
-                print(f"[bitrix-bot] Token refreshed. New refresh_token: {new_refresh[:20]}...")
-            return _bot_access_token
-    except Exception as e:
-        print(f"[bitrix-bot] Token refresh failed: {e}")
-        return ''
-
-
-def _send_bot_message(access_token: str, bitrix_user_id: str, message: str, keyboard: list = None):
-    """Отправляет сообщение от имени чат-бота DreamDesk"""
-    url = f"{BITRIX_PORTAL_URL}/rest/imbot.message.add.json?auth={access_token}"
-
-    payload = {
-        'BOT_ID': BITRIX_BOT_ID,
-        'DIALOG_ID': bitrix_user_id,
-        'MESSAGE': message,
-    }
-
-    if keyboard:
-        payload['KEYBOARD'] = keyboard
-
-    data = json.dumps(payload).encode('utf-8')
-
-    try:
-        req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'}, method='POST')
-        with urllib.request.urlopen(req, timeout=5) as r:
-            result = json.loads(r.read().decode())
-            print(f"[bitrix-bot] Message sent to {bitrix_user_id}: {result.get('result', 'unknown')}")
-    except urllib.error.HTTPError as e:
-        body = e.read().decode() if e.fp else ''
-        print(f"[bitrix-bot] HTTP {e.code} sending to {bitrix_user_id}: {body[:300]}")
-    except Exception as e:
-        print(f"[bitrix-bot] Failed to send to {bitrix_user_id}: {e}")
\ No newline at end of file
@@ -1,8 +1,13 @@
 """Отправка уведомлений через чат-бота DreamDesk в Битрикс24"""
 import json
 import os
+import re
 import urllib.request
 import urllib.parse
+from typing import Any, Dict, List
+from access_context import get_access_context
+from bitrix_batch_client import get_bitrix_client
+from oauth_token_store import get_token, invalidate_token
 
 BITRIX_PORTAL_URL = os.environ.get('BITRIX24_PORTAL_URL', '').rstrip('/')
 BITRIX_BOT_ID = os.environ.get('BITRIX_BOT_ID', '')
@@ -10,43 +15,115 @@ BITRIX_BOT_CLIENT_ID = os.environ.get('BITRIX_BOT_CLIENT_ID', '')
 BITRIX_BOT_CLIENT_SECRET = os.environ.get('BITRIX_BOT_CLIENT_SECRET', '')
 BITRIX_BOT_REFRESH_TOKEN = os.environ.get('BITRIX_BOT_REFRESH_TOKEN', '')
 
-_bot_access_token = None
+# Итог отправок по меткам (set_delivery_tag): воркер notification_outbox
+# по нему решает, отправлено уведомление или его нужно повторить
+_delivery: Dict[Any, Dict[str, Any]] = {}
+_delivery_tag: Any = None
+
+# Пока пакет открыт (start_batch), сообщения копятся в клиенте и уходят
+# пачками batch в flush_batch(); вне пакета каждое сообщение уходит сразу
+_batch_open = False
+
+
+def _record_delivery(tag: Any, ok: bool, error: str = None) -> None:
+    counters = _delivery.setdefault(tag, {'sent': 0, 'failed': 0, 'error': None})
+    if ok:
+        counters['sent'] += 1
+    else:
+        counters['failed'] += 1
+        counters['error'] = error
+
+
+def set_delivery_tag(tag: Any) -> None:
+    """Метка, к которой относятся следующие отправки (id строки outbox)"""
+    global _delivery_tag
+    _delivery_tag = tag
+
+
+def pop_delivery_result(tag: Any = None) -> Dict[str, Any]:
+    """Возвращает счётчики отправок по метке и сбрасывает их"""
+    return _delivery.pop(tag, None) or {'sent': 0, 'failed': 0, 'error': None}
+
+
+def discard_delivery(tag: Any) -> int:
+    """Снимает с открытого пакета сообщения метки tag, ещё не ушедшие на портал,
+    и сбрасывает её счётчики. Возвращает число снятых сообщений."""
+    _delivery.pop(tag, None)
+    if not BITRIX_PORTAL_URL:
+        return 0
+    return get_bitrix_client(BITRIX_PORTAL_URL).discard(lambda t: isinstance(t, tuple) and t[0] == tag)
+
+
+def start_batch() -> None:
+    global _batch_open
+    _batch_open = True
+
+
+def flush_batch() -> Dict[str, Any]:
+    """Отправляет накопленные сообщения и закрывает пакет. Возвращает статистику клиента."""
+    global _batch_open
+    _batch_open = False
+    if not BITRIX_PORTAL_URL:
+        return {}
+    client = get_bitrix_client(BITRIX_PORTAL_URL)
+    if client.pending():
+        for r in client.flush(_get_bot_token(), refresh_auth=_refresh_bot_token):
+            tag, dialog_id = r['tag']
+            if not r['ok']:
+                print(f"[bitrix-bot] Failed to send to {dialog_id}: {r['error']}")
+            _record_delivery(tag, r['ok'], r['error'])
+    return client.get_stats()
+
+
+def _refresh_bot_oauth(refresh_token: str = None) -> dict:
+    """Обновляет токен бота. Сначала последним выданным refresh_token, затем начальным из окружения."""
+    last_error = None
+    for candidate in dict.fromkeys(t for t in (refresh_token, BITRIX_BOT_REFRESH_TOKEN) if t):
+        params = urllib.parse.urlencode({
+            'grant_type': 'refresh_token',
+            'client_id': BITRIX_BOT_CLIENT_ID,
+            'client_secret': BITRIX_BOT_CLIENT_SECRET,
+            'refresh_token': candidate,
+        })
+        url = f"https://oauth.bitrix.info/oauth/token/?{params}"
+        try:
+            req = urllib.request.Request(url, method='GET')
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                data = json.loads(resp.read().decode())
+        except Exception as e:
+            last_error = e
+            continue
+        if data.get('access_token'):
+            return data
+        last_error = data.get('error_description') or data.get('error')
+    raise RuntimeError(str(last_error))
 
 
 def _get_bot_token() -> str:
-    global _bot_access_token
-    if _bot_access_token:
-        return _bot_access_token
-
+    """Токен бота из общего хранилища oauth_tokens (обновляется одним инстансом)"""
     if not BITRIX_BOT_REFRESH_TOKEN or not BITRIX_BOT_CLIENT_ID or not BITRIX_BOT_CLIENT_SECRET:
         print("[bitrix-bot] Missing bot credentials for token refresh")
+        _record_delivery(_delivery_tag, False, 'missing bot credentials')
         return ''
 
-    params = urllib.parse.urlencode({
-        'grant_type': 'refresh_token',
-        'client_id': BITRIX_BOT_CLIENT_ID,
-        'client_secret': BITRIX_BOT_CLIENT_SECRET,
-        'refresh_token': BITRIX_BOT_REFRESH_TOKEN,
-    })
-    url = f"https://oauth.bitrix.info/oauth/token/?{params}"
-
     try:
-        req = urllib.request.Request(url, method='GET')
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-            _bot_access_token = data.get('access_token', '')
-            new_refresh = data.get('refresh_token', '')
-            if new_refresh:
-                print(f"[bitrix-bot] Token refreshed ok")
-            return _bot_access_token
+        return get_token('bitrix_bot', _refresh_bot_oauth)
     except Exception as e:
         print(f"[bitrix-bot] Token refresh failed: {e}")
+        _record_delivery(_delivery_tag, False, f'token refresh failed: {e}')
         return ''
 
 
-def _send_bot_message(access_token: str, bitrix_user_id: str, message: str, keyboard: list = None):
-    url = f"{BITRIX_PORTAL_URL}/rest/imbot.message.add.json?auth={access_token}"
+def _refresh_bot_token() -> str:
+    """Помечает токен отвергнутым (портал его не принял) и получает новый"""
+    invalidate_token('bitrix_bot')
+    return _get_bot_token()
+
 
+def _send_bot_message(access_token: str, bitrix_user_id: str, message: str, keyboard: list = None):
+    """Ставит imbot.message.add в очередь клиента; вне пакета сразу отправляет.
+    Токен берётся при отправке из oauth_token_store (после проверки вызывающим он уже в памяти).
+    """
     payload = {
         'BOT_ID': BITRIX_BOT_ID,
         'DIALOG_ID': bitrix_user_id,
@@ -56,18 +133,9 @@ def _send_bot_message(access_token: str, bitrix_user_id: str, message: str, keyb
     if keyboard:
         payload['KEYBOARD'] = keyboard
 
-    data = json.dumps(payload).encode('utf-8')
-
-    try:
-        req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'}, method='POST')
-        with urllib.request.urlopen(req, timeout=5) as r:
-            result = json.loads(r.read().decode())
-            print(f"[bitrix-bot] Message sent to {bitrix_user_id}: {result.get('result', 'unknown')}")
-    except urllib.error.HTTPError as e:
-        body = e.read().decode() if e.fp else ''
-        print(f"[bitrix-bot] HTTP {e.code} sending to {bitrix_user_id}: {body[:300]}")
-    except Exception as e:
-        print(f"[bitrix-bot] Failed to send to {bitrix_user_id}: {e}")
+    get_bitrix_client(BITRIX_PORTAL_URL).add('imbot.message.add', payload, tag=(_delivery_tag, bitrix_user_id))
+    if not _batch_open:
+        flush_batch()
 
 
 def _priority_emoji(priority_name: str) -> str:
@@ -249,4 +317,120 @@ def notify_watcher_added(cur, schema: str, ticket_id: int, watcher_user_id: int,
         ]
 
     _send_bot_message(access_token, row['watcher_bitrix_id'], message, keyboard)
-    print(f"[bitrix-bot] Watcher notification sent for ticket {ticket_id} to user {watcher_user_id}")
\ No newline at end of file
+    print(f"[bitrix-bot] Watcher notification sent for ticket {ticket_id} to user {watcher_user_id}")
+
+
+_MD_IMG_RE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+_HTML_IMG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+_BARE_DATA_URI_RE = re.compile(r'data:[^;\s)]+;base64,[A-Za-z0-9+/=]+')
+
+
+def _strip_markdown_images(text: str) -> str:
+    """Убирает картинки (markdown, <img>, голые data:base64) из текста уведомления"""
+    if not text:
+        return ''
+    out = _MD_IMG_RE.sub('', text)
+    out = _HTML_IMG_RE.sub('', out)
+    out = _BARE_DATA_URI_RE.sub('', out)
+    out = re.sub(r'[ \t]+\n', '\n', out)
+    out = re.sub(r'\n{3,}', '\n\n', out)
+    return out.strip()
+
+
+def _collect_comment_recipients(row, author_user_id: int, is_internal: bool, watchers=None) -> List[dict]:
+    """Получатели уведомления о комментарии: создатель, исполнитель, наблюдатели (кроме автора)"""
+    recipients = []
+    seen = set()
+
+    def add(bitrix_id, role):
+        if bitrix_id and bitrix_id not in seen:
+            seen.add(bitrix_id)
+            recipients.append({'bitrix_id': bitrix_id, 'role': role})
+
+    if not is_internal and row['created_by'] != author_user_id:
+        add(row.get('creator_bitrix_id'), 'creator')
+
+    if row['assigned_to'] and row['assigned_to'] != author_user_id:
+        add(row.get('executor_bitrix_id'), 'executor')
+
+    for w in (watchers or []):
+        if w['user_id'] != author_user_id:
+            add(w['bitrix_user_id'], 'watcher')
+
+    return recipients
+
+
+def send_comment_notifications(cur, schema: str, ticket_id: int, author_user_id: int,
+                               comment_text: str, is_internal: bool, app_origin: str = ''):
+    """Уведомляет участников заявки о новом комментарии.
+    Скрытый комментарий получают только исполнитель и наблюдатели с доступом к скрытым.
+    """
+    if not BITRIX_BOT_ID or not BITRIX_PORTAL_URL:
+        print("[bitrix-bot] Bot not configured, skipping comment notification")
+        return
+
+    cur.execute(f"""
+        SELECT t.id, t.title, t.created_by, t.assigned_to,
+               author.full_name AS author_name,
+               creator.bitrix_user_id AS creator_bitrix_id,
+               executor.bitrix_user_id AS executor_bitrix_id,
+               p.name AS priority_name
+        FROM {schema}.tickets t
+        JOIN {schema}.users author ON author.id = %s
+        LEFT JOIN {schema}.users creator ON creator.id = t.created_by
+        LEFT JOIN {schema}.users executor ON executor.id = t.assigned_to
+        LEFT JOIN {schema}.ticket_priorities p ON t.priority_id = p.id
+        WHERE t.id = %s
+    """, (author_user_id, ticket_id))
+
+    row = cur.fetchone()
+    if not row:
+        return
+
+    cur.execute(f"""
+        SELECT tw.user_id, u.bitrix_user_id
+        FROM {schema}.ticket_watchers tw
+        JOIN {schema}.users u ON u.id = tw.user_id
+        WHERE tw.ticket_id = %s AND u.bitrix_user_id IS NOT NULL
+    """, (ticket_id,))
+    watchers = cur.fetchall() or []
+
+    if is_internal:
+        watchers = [w for w in watchers if get_access_context(cur, w['user_id']).can_see_internal]
+
+    recipients = _collect_comment_recipients(row, author_user_id, is_internal, watchers)
+    if not recipients:
+        print(f"[bitrix-bot] No recipients for ticket {ticket_id}")
+        return
+
+    clean_text = _strip_markdown_images(comment_text or '')
+    preview = clean_text[:150] + ('...' if len(clean_text) > 150 else '')
+    ticket_title = row['title'] or f"Заявка #{row['id']}"
+
+    access_token = _get_bot_token()
+    if not access_token:
+        print("[bitrix-bot] Failed to get access token for comment notification")
+        return
+
+    priority_emoji = _priority_emoji(row.get('priority_name') or '')
+    message = (
+        f"{priority_emoji} [b]Новый комментарий в заявке #{row['id']}[/b]\n"
+        f"{ticket_title}\n\n"
+        f"[b]{row['author_name']}[/b]: {preview}"
+    )
+
+    keyboard = []
+    if app_origin:
+        keyboard = [
+            {
+                "TEXT": f"📋 Открыть заявку #{row['id']}",
+                "LINK": f"{app_origin}/tickets/{row['id']}",
+                "BG_COLOR": "#3B82F6",
+                "TEXT_COLOR": "#FFFFFF",
+                "DISPLAY": "LINE",
+                "BLOCK": "Y"
+            }
+        ]
+
+    for r in recipients:
+        _send_bot_message(access_token, r['bitrix_id'], message, keyboard)
@@ -0,0 +1,110 @@
+"""
+Замер business_clock на синтетическом годе графиков (без БД):
+
+    python business_clock_bench.py [--users 60] [--tickets 10000]
+
+Группы по 15 человек: пятидневка 9–18, сменный 2/2 и ночные смены 22–06,
+15 общих праздников и личные отгулы. Печатает время построения часов
+и расчётов elapsed/add для пачки заявок, а для сравнения — тот же
+elapsed через ScheduleCalendar.working_minutes по каждому участнику.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+from business_clock import BusinessClock, build_business_clock
+from work_schedule_index import ScheduleCalendar
+
+YEAR_START = date(2026, 1, 1)
+YEAR_END = date(2026, 12, 31)
+GROUP_SIZE = 15
+
+
+def _synthetic_calendar(users: int, seed: int = 42) -> ScheduleCalendar:
+    rnd = random.Random(seed)
+    schedules = []
+    for uid in range(1, users + 1):
+        kind = uid % 3
+        for dow in range(7):
+            if kind == 0 and dow < 5:
+                schedules.append({'user_id': uid, 'day_of_week': dow,
+                                  'start_time': dtime(9), 'end_time': dtime(18)})
+            elif kind == 1 and (dow + uid) % 4 < 2:
+                schedules.append({'user_id': uid, 'day_of_week': dow,
+                                  'start_time': dtime(8), 'end_time': dtime(20)})
+            elif kind == 2 and dow not in (5, 6):
+                schedules.append({'user_id': uid, 'day_of_week': dow,
+                                  'start_time': dtime(22), 'end_time': dtime(6)})
+
+    exceptions = []
+    holidays = rnd.sample(range((YEAR_END - YEAR_START).days), 15)
+    for offset in holidays:
+        exceptions.append({'user_id': None, 'exception_date': YEAR_START + timedelta(days=offset),
+                           'is_working': False})
+    for uid in range(1, users + 1):
+        for offset in rnd.sample(range((YEAR_END - YEAR_START).days), 20):
+            exceptions.append({'user_id': uid, 'exception_date': YEAR_START + timedelta(days=offset),
+                               'is_working': False})
+    return ScheduleCalendar(schedules, exceptions)
+
+
+def _timed(label: str, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f'{label:<48} {(time.perf_counter() - started) * 1000:9.1f} мс')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=60)
+    parser.add_argument('--tickets', type=int, default=10000)
+    args = parser.parse_args()
+
+    calendar = _timed('календарь (графики + исключения)', lambda: _synthetic_calendar(args.users))
+    groups = [list(range(g, min(g + GROUP_SIZE, args.users + 1)))
+              for g in range(1, args.users + 1, GROUP_SIZE)]
+    clocks = _timed(f'часы {len(groups)} групп на год', lambda: [
+        build_business_clock(calendar, users, YEAR_START, YEAR_END) for users in groups
+    ])
+    print(f'{"интервалов в часах группы":<48} {len(clocks[0]):9d}')
+
+    rnd = random.Random(7)
+    span = (YEAR_END - YEAR_START).days - 60
+    tickets = []
+    for _ in range(args.tickets):
+        start = datetime.combine(YEAR_START, dtime()) + timedelta(minutes=rnd.randrange(span * 24 * 60))
+        end = start + timedelta(minutes=rnd.randrange(30, 14 * 24 * 60))
+        tickets.append((rnd.randrange(len(groups)), start, end, rnd.choice((60, 240, 480, 2400))))
+
+    by_group = {}
+    for g, start, end, minutes in tickets:
+        by_group.setdefault(g, []).append((start, end, minutes))
+
+    def elapsed_all():
+        return [clocks[g].elapsed_minutes_many([(s, e) for s, e, _ in items])
+                for g, items in by_group.items()]
+
+    def add_all():
+        return [clocks[g].add_minutes_many([(s, m) for s, _, m in items])
+                for g, items in by_group.items()]
+
+    _timed(f'elapsed_minutes_many, {args.tickets} заявок', elapsed_all)
+    deadlines = _timed(f'add_minutes_many, {args.tickets} заявок', add_all)
+    missing = sum(1 for chunk in deadlines for d in chunk if d is None)
+    print(f'{"дедлайнов за горизонтом":<48} {missing:9d}')
+
+    sample = tickets[:max(args.tickets // 20, 1)]
+
+    def baseline():
+        # Без объединённых часов: смены каждого участника заново на каждую заявку
+        return [BusinessClock(
+            iv for uid in groups[g] for iv in calendar.shifts_between(uid, s, e)
+        ).elapsed_minutes(s, e) for g, s, e, _ in sample]
+
+    _timed(f'без индекса: shifts_between, {len(sample)} заявок', baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,27 +8,125 @@
    - 'all': равномерно по всем участникам (lead в приоритете, least-loaded)
    - 'working': равномерно по работающим сейчас участникам (по графику)
    - 'none': не распределять автоматически
+
+Привязки, группы и составы групп собираются в таблицу маршрутизации один раз
+на тёплый инстанс и сверяются с executor_routing_version (её увеличивают
+триггеры на этих таблицах) — не чаще раза за вызов функции
+(reset_executor_routing() в начале handler). Поиск исполнителя — словари;
+к БД остаётся запрос выбора участника группы по assignee_load; для групп
+'working' перед ним графики участников читаются в индекс смен (work_schedule_index).
 """
-from typing import Optional
-from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+from work_schedule_index import load_schedule_calendar
+
+_AUTO_ASSIGN_TYPES = ('all', 'working')
+
+
+class RoutingTable:
+    """Скомпилированные привязки исполнителей"""
+
+    def __init__(self, version: Optional[int], user_rows: list, group_rows: list,
+                 mapping_rows: list, member_rows: list):
+        self.version = version
+        # (ticket_service_id, service_id) -> user_id; (ts_id, None) -> все привязки услуги
+        self.direct: Dict[Tuple[int, Optional[int]], int] = {}
+        self.direct_any: Dict[int, int] = {}
+        for r in sorted(user_rows, key=lambda r: (r['service_id'] is None, r['service_id'] or 0, r['user_id'])):
+            self.direct.setdefault((r['ticket_service_id'], r['service_id']), r['user_id'])
+            self.direct_any.setdefault(r['ticket_service_id'], r['user_id'])
+
+        # group_id -> (auto_assign_type, balance_mode), только активные группы
+        self.groups: Dict[int, Tuple[str, str]] = {
+            r['id']: (r['auto_assign_type'] or 'none', r['balance_mode'] or 'none') for r in group_rows
+        }
+        # (ts_id, service_id) -> активные группы по возрастанию id; ts_id -> все группы услуги
+        self.group_map: Dict[Tuple[int, Optional[int]], List[int]] = {}
+        self.group_map_any: Dict[int, List[int]] = {}
+        for r in sorted(mapping_rows, key=lambda r: r['group_id']):
+            if r['group_id'] not in self.groups:
+                continue
+            self.group_map.setdefault((r['ticket_service_id'], r['service_id']), []).append(r['group_id'])
+            any_groups = self.group_map_any.setdefault(r['ticket_service_id'], [])
+            if r['group_id'] not in any_groups:
+                any_groups.append(r['group_id'])
+
+        # group_id -> активные участники
+        self.members: Dict[int, List[int]] = {}
+        for r in member_rows:
+            self.members.setdefault(r['group_id'], []).append(r['user_id'])
+
+    def direct_user(self, ticket_service_id: int, service_id: Optional[int]) -> Optional[int]:
+        if service_id is None:
+            return self.direct_any.get(ticket_service_id)
+        return self.direct.get((ticket_service_id, service_id))
+
+    def mapped_groups(self, ticket_service_id: int, service_id: Optional[int]) -> List[int]:
+        if service_id is None:
+            return self.group_map_any.get(ticket_service_id, [])
+        return self.group_map.get((ticket_service_id, service_id), [])
+
+
+_routing: Optional[RoutingTable] = None
+# Версия уже сверена в текущем вызове функции
+_routing_checked = False
+
+
+def reset_executor_routing() -> None:
+    """Следующее обращение к таблице маршрутизации заново сверит версию"""
+    global _routing_checked
+    _routing_checked = False
+
+
+def get_routing_table(cur, schema: str) -> RoutingTable:
+    """Таблица маршрутизации: сверка версии одним запросом, пересборка только при её смене"""
+    global _routing, _routing_checked
+    if _routing is not None and _routing_checked:
+        return _routing
+
+    cur.execute(f"SELECT COALESCE(MAX(version), 0) AS version FROM {schema}.executor_routing_version")
+    version = cur.fetchone()['version']
+    if _routing is None or _routing.version != version:
+        cur.execute(f"""
+            SELECT m.ticket_service_id, m.service_id, m.user_id
+            FROM {schema}.executor_user_service_mappings m
+            JOIN {schema}.users u ON u.id = m.user_id AND u.is_active = true
+        """)
+        user_rows = cur.fetchall()
+        cur.execute(f"""
+            SELECT id, auto_assign_type, balance_mode
+            FROM {schema}.executor_groups
+            WHERE is_active = true
+        """)
+        group_rows = cur.fetchall()
+        cur.execute(f"""
+            SELECT group_id, ticket_service_id, service_id
+            FROM {schema}.executor_group_service_mappings
+        """)
+        mapping_rows = cur.fetchall()
+        cur.execute(f"""
+            SELECT m.group_id, m.user_id
+            FROM {schema}.executor_group_members m
+            JOIN {schema}.users u ON u.id = m.user_id AND u.is_active = true
+        """)
+        member_rows = cur.fetchall()
+        _routing = RoutingTable(version, user_rows, group_rows, mapping_rows, member_rows)
+
+    _routing_checked = True
+    return _routing
 
 
 def resolve_executor(cur, schema: str, ticket_service_id: Optional[int], service_ids: list[int]) -> Optional[int]:
     if not ticket_service_id:
         return None
 
-    if not service_ids:
-        user_id = _find_direct_user(cur, schema, ticket_service_id, None)
-        if user_id:
-            return user_id
-        return _find_from_group(cur, schema, ticket_service_id, None)
-
-    for service_id in service_ids:
-        user_id = _find_direct_user(cur, schema, ticket_service_id, service_id)
+    routing = get_routing_table(cur, schema)
+    for service_id in (service_ids or [None]):
+        user_id = routing.direct_user(ticket_service_id, service_id)
         if user_id:
             return user_id
 
-        user_id = _find_from_group(cur, schema, ticket_service_id, service_id)
+        user_id = _find_from_group(cur, schema, routing, ticket_service_id, service_id)
         if user_id:
             return user_id
 
@@ -41,29 +139,11 @@ def resolve_executor_group(cur, schema: str, ticket_service_id: Optional[int], s
     if not ticket_service_id:
         return None
 
-    service_filter = [s for s in service_ids] if service_ids else [None]
-    for service_id in service_filter:
-        if service_id is None:
-            cur.execute(f"""
-                SELECT g.id AS group_id
-                FROM {schema}.executor_group_service_mappings m
-                JOIN {schema}.executor_groups g ON g.id = m.group_id AND g.is_active = true
-                WHERE m.ticket_service_id = %s
-                ORDER BY g.id
-                LIMIT 1
-            """, (ticket_service_id,))
-        else:
-            cur.execute(f"""
-                SELECT g.id AS group_id
-                FROM {schema}.executor_group_service_mappings m
-                JOIN {schema}.executor_groups g ON g.id = m.group_id AND g.is_active = true
-                WHERE m.ticket_service_id = %s AND m.service_id = %s
-                ORDER BY g.id
-                LIMIT 1
-            """, (ticket_service_id, service_id))
-        row = cur.fetchone()
-        if row:
-            return row['group_id']
+    routing = get_routing_table(cur, schema)
+    for service_id in (service_ids or [None]):
+        groups = routing.mapped_groups(ticket_service_id, service_id)
+        if groups:
+            return groups[0]
 
     return None
 
@@ -75,127 +155,59 @@ def pick_member_for_group(cur, schema: str, group_id: int) -> Optional[int]:
     if not group_id:
         return None
 
-    cur.execute(f"""
-        SELECT auto_assign_type, balance_mode
-        FROM {schema}.executor_groups
-        WHERE id = %s AND is_active = true
-    """, (group_id,))
-    group_row = cur.fetchone()
-    if not group_row:
+    routing = get_routing_table(cur, schema)
+    group = routing.groups.get(group_id)
+    if not group:
         return None
 
-    assign_type = group_row.get('auto_assign_type') or 'none'
-    if assign_type not in ('all', 'working'):
+    assign_type, balance_mode = group
+    if assign_type not in _AUTO_ASSIGN_TYPES:
         return None
 
-    balance_mode = group_row.get('balance_mode') or 'none'
-    return _pick_member(cur, schema, group_id, assign_type, balance_mode)
+    return _pick_member(cur, schema, routing.members.get(group_id, []), group_id, assign_type, balance_mode)
 
 
-def _find_direct_user(cur, schema: str, ticket_service_id: int, service_id: Optional[int]) -> Optional[int]:
-    if service_id is None:
-        cur.execute(f"""
-            SELECT m.user_id
-            FROM {schema}.executor_user_service_mappings m
-            JOIN {schema}.users u ON u.id = m.user_id AND u.is_active = true
-            WHERE m.ticket_service_id = %s
-            ORDER BY m.service_id
-            LIMIT 1
-        """, (ticket_service_id,))
-    else:
-        cur.execute(f"""
-            SELECT m.user_id
-            FROM {schema}.executor_user_service_mappings m
-            JOIN {schema}.users u ON u.id = m.user_id AND u.is_active = true
-            WHERE m.ticket_service_id = %s AND m.service_id = %s
-            LIMIT 1
-        """, (ticket_service_id, service_id))
-    row = cur.fetchone()
-    return row['user_id'] if row else None
+def _find_from_group(cur, schema: str, routing: RoutingTable, ticket_service_id: int,
+                     service_id: Optional[int]) -> Optional[int]:
+    for group_id in routing.mapped_groups(ticket_service_id, service_id):
+        assign_type, balance_mode = routing.groups[group_id]
+        if assign_type in _AUTO_ASSIGN_TYPES:
+            return _pick_member(cur, schema, routing.members.get(group_id, []), group_id, assign_type, balance_mode)
+    return None
 
 
-def _find_from_group(cur, schema: str, ticket_service_id: int, service_id: Optional[int]) -> Optional[int]:
-    if service_id is None:
-        cur.execute(f"""
-            SELECT g.id AS group_id, g.auto_assign_type, g.balance_mode
-            FROM {schema}.executor_group_service_mappings m
-            JOIN {schema}.executor_groups g ON g.id = m.group_id
-                AND g.is_active = true
-                AND g.auto_assign_type IN ('all', 'working')
-            WHERE m.ticket_service_id = %s
-            ORDER BY g.id
-            LIMIT 1
-        """, (ticket_service_id,))
-    else:
-        cur.execute(f"""
-            SELECT g.id AS group_id, g.auto_assign_type, g.balance_mode
-            FROM {schema}.executor_group_service_mappings m
-            JOIN {schema}.executor_groups g ON g.id = m.group_id
-                AND g.is_active = true
-                AND g.auto_assign_type IN ('all', 'working')
-            WHERE m.ticket_service_id = %s AND m.service_id = %s
-            ORDER BY g.id
-            LIMIT 1
-        """, (ticket_service_id, service_id))
-    group_row = cur.fetchone()
-    if not group_row:
+def _pick_member(cur, schema: str, member_ids: List[int], group_id: int,
+                 assign_type: str = 'all', balance_mode: str = 'none') -> Optional[int]:
+    """Выбирает участника группы: наименее загруженного (balanced) или давно не получавшего заявок"""
+    if not member_ids:
         return None
 
-    assign_type = group_row['auto_assign_type']
-    balance_mode = group_row.get('balance_mode') or 'none'
-    return _pick_member(cur, schema, group_row['group_id'], assign_type, balance_mode)
-
-
-def _pick_member(cur, schema: str, group_id: int, assign_type: str = 'all', balance_mode: str = 'none') -> Optional[int]:
-    now_utc = datetime.now(timezone.utc)
-    now_msk = now_utc + timedelta(hours=3)
-    current_day = now_msk.weekday()
-    current_time = now_msk.strftime('%H:%M:%S')
-
+    # Нагрузка — из assignee_load (поддерживается триггером на tickets), по ключу участника
     if balance_mode == 'balanced':
-        subquery = f"""
-            SELECT assigned_to,
-                   COUNT(*) FILTER (WHERE s.count_for_distribution = true) AS ticket_count,
-                   MAX(t.created_at) AS last_assigned_at
-            FROM {schema}.tickets t
-            JOIN {schema}.ticket_statuses s ON s.id = t.status_id
-            WHERE t.assigned_to IS NOT NULL
-            GROUP BY assigned_to
-        """
-        select_extra = "COALESCE(tc.ticket_count, 0) AS ticket_count"
-        order_clause = "m.is_lead DESC, COALESCE(tc.ticket_count, 0) ASC, tc.last_assigned_at ASC NULLS FIRST, RANDOM()"
+        order_clause = "m.is_lead DESC, COALESCE(al.active_count, 0) ASC, al.last_assigned_at ASC NULLS FIRST, RANDOM()"
     else:
-        subquery = f"""
-            SELECT assigned_to, MAX(created_at) AS last_assigned_at
-            FROM {schema}.tickets
-            WHERE assigned_to IS NOT NULL
-            GROUP BY assigned_to
-        """
-        select_extra = "tc.last_assigned_at"
-        order_clause = "tc.last_assigned_at ASC NULLS FIRST, RANDOM()"
-
-    schedule_join = ""
-    params = (group_id,)
+        order_clause = "al.last_assigned_at ASC NULLS FIRST, RANDOM()"
+
+    schedule_filter = ""
+    schedule_params: tuple = ()
     if assign_type == 'working':
-        schedule_join = f"""
-            JOIN {schema}.work_schedules ws ON ws.user_id = m.user_id
-                AND ws.day_of_week = %s
-                AND ws.is_active = true
-                AND ws.start_time <= %s::time
-                AND ws.end_time > %s::time
-        """
-        params = (current_day, current_time, current_time, group_id)
+        # Смены (включая ночные, праздники и исключения) — по индексу графиков
+        calendar = load_schedule_calendar(cur, schema, member_ids)
+        on_shift = sorted(calendar.on_shift(member_ids, datetime.now(timezone.utc)))
+        if not on_shift:
+            return None
+        schedule_filter = "AND m.user_id = ANY(%s)"
+        schedule_params = (on_shift,)
 
     cur.execute(f"""
-        SELECT m.user_id, m.is_lead, {select_extra}
+        SELECT m.user_id, m.is_lead, COALESCE(al.active_count, 0) AS ticket_count, al.last_assigned_at
         FROM {schema}.executor_group_members m
         JOIN {schema}.users u ON u.id = m.user_id AND u.is_active = true
-        {schedule_join}
-        LEFT JOIN ({subquery}) tc ON tc.assigned_to = m.user_id
-        WHERE m.group_id = %s
+        LEFT JOIN {schema}.assignee_load al ON al.user_id = m.user_id
+        WHERE m.group_id = %s {schedule_filter}
         ORDER BY {order_clause}
         LIMIT 1
-    """, params)
+    """, (group_id,) + schedule_params)
 
     row = cur.fetchone()
     return row['user_id'] if row else None
\ No newline at end of file
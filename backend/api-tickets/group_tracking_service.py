@@ -1,7 +1,15 @@
 """Сервис отслеживания перемещений заявки между группами исполнителей
-и фиксации нарушений SLA"""
-from typing import Dict, Any, Optional
+и фиксации нарушений SLA.
+
+Для SLA с use_work_schedule время в группе и просрочки считаются в рабочих
+минутах по графикам группы (business_clock), для остальных — по календарю."""
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
 from shared_utils import SCHEMA
+from business_clock import (
+    SLA_CLOCK_HORIZON_DAYS, as_utc, business_deadlines, db_now, load_group_clock,
+    minutes_between, resume_deadline,
+)
 
 
 def find_user_group(cur, user_id: int) -> Optional[Dict[str, Any]]:
@@ -21,7 +29,8 @@ def find_user_group(cur, user_id: int) -> Optional[Dict[str, Any]]:
 def find_ticket_sla(cur, ticket_id: int) -> Optional[Dict[str, Any]]:
     """Найти SLA привязанный к заявке через услуги/сервисы"""
     cur.execute(f"""
-        SELECT DISTINCT s.id, s.response_time_minutes, s.resolution_time_minutes
+        SELECT DISTINCT s.id, s.response_time_minutes, s.resolution_time_minutes,
+               s.use_work_schedule
         FROM {SCHEMA}.sla s
         JOIN {SCHEMA}.sla_service_mappings ssm ON s.id = ssm.sla_id
         JOIN {SCHEMA}.ticket_to_service_mappings tsm ON 
@@ -35,6 +44,39 @@ def find_ticket_sla(cur, ticket_id: int) -> Optional[Dict[str, Any]]:
     return dict(row) if row else None
 
 
+def sla_deadlines(cur, sla: Dict[str, Any], group_id: Optional[int],
+                  start: datetime) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Сроки решения и ответа SLA с графиком: рабочие минуты по графикам группы
+    от start. Если у группы нет графиков — календарные минуты."""
+    clock = load_group_clock(cur, SCHEMA, group_id, start)
+    due_date, response_due_date = business_deadlines(
+        clock, start, [sla.get('resolution_time_minutes'), sla.get('response_time_minutes')]
+    )
+    return due_date, response_due_date
+
+
+def sla_resume_business(cur, ticket_id: int, ticket: Dict[str, Any]):
+    """Снятие паузы для SLA с графиком: (рабочие секунды паузы, due_date, response_due_date).
+    None — SLA без графика или у группы заявки нет графиков: сдвиг по календарю."""
+    sla = find_ticket_sla(cur, ticket_id)
+    if not sla or not sla.get('use_work_schedule') or not ticket.get('sla_paused_at'):
+        return None
+    now = db_now(cur)
+    paused_at = as_utc(ticket['sla_paused_at'])
+    clock = load_group_clock(
+        cur, SCHEMA, ticket.get('executor_group_id'), paused_at,
+        now + timedelta(days=SLA_CLOCK_HORIZON_DAYS)
+    )
+    if not clock:
+        return None
+    paused_sec = int(clock.elapsed_minutes(paused_at, now) * 60)
+    return (
+        paused_sec,
+        resume_deadline(clock, ticket.get('due_date'), paused_at, now),
+        resume_deadline(clock, ticket.get('response_due_date'), paused_at, now),
+    )
+
+
 def get_group_budget(cur, sla_id: int, group_id: int) -> Optional[Dict[str, Any]]:
     """Получить бюджет группы для SLA"""
     cur.execute(f"""
@@ -65,23 +107,31 @@ def close_active_log_entry(cur, ticket_id: int, user_id: Optional[int] = None):
     if not active:
         return
 
+    sla = find_ticket_sla(cur, ticket_id)
+    business_minutes = None
+    if sla and sla.get('use_work_schedule'):
+        now = db_now(cur)
+        clock = load_group_clock(cur, SCHEMA, active['executor_group_id'], as_utc(active['assigned_at']), now)
+        if clock:
+            business_minutes = clock.elapsed_minutes(active['assigned_at'], now)
+
     cur.execute(f"""
         UPDATE {SCHEMA}.ticket_group_log
         SET released_at = CURRENT_TIMESTAMP,
-            time_spent_minutes = EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - assigned_at)) / 60,
+            time_spent_minutes = COALESCE(%s::float, EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - assigned_at)) / 60),
             overdue_minutes = GREATEST(0,
-                EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - assigned_at)) / 60 - COALESCE(budget_minutes, 999999)
+                COALESCE(%s::float, EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - assigned_at)) / 60)
+                - COALESCE(budget_minutes, 999999)
             )
         WHERE id = %s
         RETURNING time_spent_minutes, overdue_minutes, budget_minutes, executor_group_id
-    """, (active['id'],))
+    """, (business_minutes, business_minutes, active['id']))
     result = cur.fetchone()
 
     if not result:
         return
 
     if result['budget_minutes'] and result['overdue_minutes'] > 0:
-        sla = find_ticket_sla(cur, ticket_id)
         cur.execute(f"""
             INSERT INTO {SCHEMA}.sla_violations
                 (ticket_id, violation_type, executor_group_id,
@@ -145,7 +195,8 @@ def track_ticket_closed(cur, ticket_id: int, user_id: Optional[int] = None):
         return
 
     cur.execute(f"""
-        SELECT t.created_at, t.due_date, t.response_due_date,
+        SELECT t.created_at, t.due_date, t.response_due_date, t.executor_group_id,
+               t.sla_paused_at, t.sla_paused_total_seconds, NOW() AS now,
                EXISTS(
                    SELECT 1 FROM {SCHEMA}.ticket_comments tc
                    WHERE tc.ticket_id = t.id
@@ -157,46 +208,37 @@ def track_ticket_closed(cur, ticket_id: int, user_id: Optional[int] = None):
     if not ticket:
         return
 
+    now = as_utc(ticket['now'])
+    clock = None
+    if sla.get('use_work_schedule'):
+        clock = load_group_clock(cur, SCHEMA, ticket['executor_group_id'], as_utc(ticket['created_at']), now)
+    if clock:
+        actual = clock.active_minutes(
+            ticket['created_at'], now, ticket['sla_paused_total_seconds'], ticket['sla_paused_at']
+        )
+    else:
+        actual = minutes_between(None, ticket['created_at'], now)
+
+    violations = []
     if ticket['due_date']:
-        cur.execute("SELECT CURRENT_TIMESTAMP > %s AS overdue", (ticket['due_date'],))
-        if cur.fetchone()['overdue']:
-            actual_minutes = int(
-                (cur.fetchone()['overdue'] if False else 0) or 0
-            )
-            cur.execute(f"""
-                SELECT EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - created_at)) / 60 AS actual,
-                       EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - due_date)) / 60 AS overdue
-                FROM {SCHEMA}.tickets WHERE id = %s
-            """, (ticket_id,))
-            timing = cur.fetchone()
-            cur.execute(f"""
-                INSERT INTO {SCHEMA}.sla_violations
-                    (ticket_id, violation_type, budget_minutes, actual_minutes, overdue_minutes, sla_id)
-                VALUES (%s, 'global_resolution', %s, %s, %s, %s)
-            """, (
-                ticket_id,
-                sla['resolution_time_minutes'],
-                int(timing['actual']),
-                int(timing['overdue']),
-                sla['id']
-            ))
-
+        violations.append(('global_resolution', sla['resolution_time_minutes'],
+                           minutes_between(clock, ticket['due_date'], now)))
     if ticket['response_due_date'] and not ticket['has_any_comment']:
+        violations.append(('global_response', sla['response_time_minutes'],
+                           minutes_between(clock, ticket['response_due_date'], now)))
+
+    for violation_type, budget, overdue in violations:
+        if overdue <= 0:
+            continue
         cur.execute(f"""
-            SELECT EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - created_at)) / 60 AS actual,
-                   EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - response_due_date)) / 60 AS overdue
-            FROM {SCHEMA}.tickets WHERE id = %s
-        """, (ticket_id,))
-        timing = cur.fetchone()
-        if timing['overdue'] and timing['overdue'] > 0:
-            cur.execute(f"""
-                INSERT INTO {SCHEMA}.sla_violations
-                    (ticket_id, violation_type, budget_minutes, actual_minutes, overdue_minutes, sla_id)
-                VALUES (%s, 'global_response', %s, %s, %s, %s)
-            """, (
-                ticket_id,
-                sla['response_time_minutes'],
-                int(timing['actual']),
-                int(timing['overdue']),
-                sla['id']
-            ))
\ No newline at end of file
+            INSERT INTO {SCHEMA}.sla_violations
+                (ticket_id, violation_type, budget_minutes, actual_minutes, overdue_minutes, sla_id)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (
+            ticket_id,
+            violation_type,
+            budget,
+            int(actual),
+            int(overdue),
+            sla['id']
+        ))
@@ -1,13 +1,20 @@
 """
 API для работы с заявками (tickets) и категориями сервисов (service_categories)
 """
+import base64
 import json
 import re
 import traceback
+from contextlib import contextmanager
 from typing import Dict, Any, Optional, Set, List
+import psycopg2.extensions
 from pydantic import BaseModel, Field
-from shared_utils import response, get_db_connection, verify_token, handle_options, get_endpoint, SCHEMA
-from group_tracking_service import open_log_entry, track_assignment_change, track_ticket_closed
+from shared_utils import response, get_db_connection, get_db_metrics, verify_token, handle_options, get_endpoint, SCHEMA
+from group_tracking_service import (
+    open_log_entry, track_assignment_change, track_ticket_closed, sla_deadlines, sla_resume_business,
+)
+from business_clock import as_utc, db_now, load_group_clocks, minutes_between
+from access_context import AccessContext, get_access_context, reset_access_context
 
 
 # Лимит размера ответа Cloud Functions (~4 МБ). Чтобы гарантированно влезть,
@@ -16,6 +23,9 @@ _MAX_INLINE_DATA_URI_BYTES = 30 * 1024
 _DATA_URI_RE = re.compile(r'!\[([^\]]*)\]\((data:[^;)]+;base64,[^\)]+)\)')
 _RAW_DATA_URI_RE = re.compile(r'(data:[^;)\s]+;base64,[A-Za-z0-9+/=]+)')
 
+# Порог точного подсчёта для count=estimate в списке заявок
+_ESTIMATE_COUNT_CAP = 1000
+
 
 def _strip_heavy_inline_images(text: str, comment_id: int) -> str:
     """Заменяет тяжёлые data:base64 картинки в markdown-тексте плейсхолдером."""
@@ -41,39 +51,100 @@ def _strip_heavy_inline_images(text: str, comment_id: int) -> str:
     return out
 
 
+def _encode_ticket_cursor(sort_by: str, sort_dir: str, sort_value: Any, ticket_id: int) -> str:
+    """Кодирует позицию последней строки списка (ключ сортировки + t.id) в непрозрачный cursor."""
+    if hasattr(sort_value, 'isoformat'):
+        sort_value = sort_value.isoformat()
+    elif sort_value is not None:
+        sort_value = str(sort_value)
+    raw = json.dumps({'s': sort_by, 'd': sort_dir, 'v': sort_value, 'id': int(ticket_id)},
+                     ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_ticket_cursor(cursor: str) -> Optional[Dict[str, Any]]:
+    """Разбирает cursor из _encode_ticket_cursor. Возвращает None, если он повреждён."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        data['id'] = int(data['id'])
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('s'), str):
+        return None
+    return data
+
+
+def _ticket_seek_clause(sort_expr: str, sort_dir_sql: str, cursor_state: Dict[str, Any]):
+    """Условие keyset-пагинации «строго после строки курсора».
+
+    Порядок списка: ORDER BY sort_expr DESC NULLS LAST, t.id DESC
+    (или ASC NULLS FIRST, t.id ASC), поэтому NULL-значения ключа обрабатываем
+    отдельно от row-value сравнения (sort_expr, t.id) < (v, id).
+    """
+    value = cursor_state.get('v')
+    last_id = cursor_state['id']
+    if sort_dir_sql == 'DESC':
+        if value is None:
+            return f" AND ({sort_expr} IS NULL AND t.id < %s)", [last_id]
+        return f" AND ({sort_expr} IS NULL OR ({sort_expr}, t.id) < (%s, %s))", [value, last_id]
+    if value is None:
+        return f" AND ({sort_expr} IS NOT NULL OR t.id > %s)", [last_id]
+    return f" AND ({sort_expr}, t.id) > (%s, %s)", [value, last_id]
+
+
+def _count_tickets(cur, where_clause: str, params: List[Any], mode: str, table: str = 'tickets'):
+    """Считает total для списка заявок по режиму count=exact|estimate|none.
+
+    table — tickets или проекция ticket_list_rows (алиас в where_clause всегда t).
+    Возвращает (total, is_estimate). В режиме estimate считаем точно только до
+    _ESTIMATE_COUNT_CAP строк (LIMIT обрывает скан), а сверх порога берём оценку
+    планировщика — фронт показывает её как «1000+».
+    """
+    if mode == 'none':
+        return None, False
+    if mode == 'exact':
+        cur.execute(f"SELECT COUNT(*) AS total FROM {SCHEMA}.{table} t {where_clause}", params)
+        return cur.fetchone()['total'], False
+
+    cur.execute(f"""
+        SELECT COUNT(*) AS total FROM (
+            SELECT 1 FROM {SCHEMA}.{table} t {where_clause} LIMIT {_ESTIMATE_COUNT_CAP + 1}
+        ) capped
+    """, params)
+    capped = cur.fetchone()['total']
+    if capped <= _ESTIMATE_COUNT_CAP:
+        return capped, False
+
+    estimate = 0
+    try:
+        cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {SCHEMA}.{table} t {where_clause}", params)
+        plan = list(cur.fetchone().values())[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+    except Exception as e:
+        print(f"[TICKETS] count estimate error: {e}")
+    return max(estimate, _ESTIMATE_COUNT_CAP + 1), True
+
+
 def _get_user_role_info(cur, user_id: int) -> Dict[str, Any]:
     """Возвращает информацию о ролях пользователя: список role_id и флаг is_admin"""
-    cur.execute(
-        f"""
-        SELECT ur.role_id, r.system_role
-        FROM {SCHEMA}.user_roles ur
-        JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-        WHERE ur.user_id = %s
-        """,
-        (user_id,)
-    )
-    rows = cur.fetchall()
-    role_ids = [r['role_id'] for r in rows]
-    is_admin = any((r.get('system_role') or '').lower() == 'admin' for r in rows)
-    return {'role_ids': role_ids, 'is_admin': is_admin}
+    ctx = get_access_context(cur, user_id)
+    return {'role_ids': ctx.role_ids, 'is_admin': ctx.is_admin}
+
+
+def _has_ticket_permission(cur, user_id: int, action: str) -> bool:
+    """Право tickets.<action> или роль «Администратор»/«Admin»"""
+    ctx = get_access_context(cur, user_id)
+    return ctx.has_permission('tickets', action) or ctx.has_role_named('Администратор', 'Admin')
 
 
 def _can_see_internal(cur, user_id: int) -> bool:
     """Скрытые (внутренние) комментарии видят только Администратор и Исполнитель"""
     if not user_id:
         return False
-    cur.execute(f"""
-        SELECT r.name, r.system_role
-        FROM {SCHEMA}.user_roles ur
-        JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-        WHERE ur.user_id = %s
-    """, (int(user_id),))
-    for row in cur.fetchall():
-        name = (row.get('name') or '').strip().lower()
-        system_role = (row.get('system_role') or '').strip().lower()
-        if system_role in ('admin', 'executor') or name in ('admin', 'администратор', 'исполнитель'):
-            return True
-    return False
+    return get_access_context(cur, user_id).can_see_internal
 
 
 def _filter_statuses_by_role(statuses: List[Dict[str, Any]], role_info: Dict[str, Any],
@@ -166,44 +237,17 @@ from sla_handler import handle_sla, handle_sla_priority_times
 from sla_group_budgets_handler import handle_sla_group_budgets
 from sla_service_mappings_handler import handle_sla_service_mappings, resolve_sla_for_ticket
 from sla_analytics_handler import handle_sla_analytics
-from executor_assignment_resolver import resolve_executor, resolve_executor_group
-from bitrix_bot_notifier import notify_executor_assigned, notify_watcher_added
-from max_bot_notifier import (
-    notify_executor_assigned as max_notify_executor_assigned,
-    notify_watcher_added as max_notify_watcher_added,
+from ticket_user_state_handler import handle_ticket_user_state
+from ticket_list_projection import (
+    handle_ticket_list_projection, refresh_ticket_list_rows, refresh_ticket_list_rows_by_status,
 )
-
-
-def _resolve_watcher_target_user_ids(cur, targets: List[Dict[str, Any]]) -> List[int]:
-    """Разворачивает targets правил (user/group/role) в плоский список user_id."""
-    user_ids: Set[int] = set()
-    user_targets = [t['target_id'] for t in targets if t['target_type'] == 'user']
-    group_targets = [t['target_id'] for t in targets if t['target_type'] == 'group']
-    role_targets = [t['target_id'] for t in targets if t['target_type'] == 'role']
-
-    for uid in user_targets:
-        if uid:
-            user_ids.add(int(uid))
-
-    if group_targets:
-        ids_csv = ','.join(str(int(x)) for x in group_targets)
-        cur.execute(f"""
-            SELECT user_id FROM {SCHEMA}.executor_group_members
-            WHERE group_id IN ({ids_csv})
-        """)
-        for r in cur.fetchall():
-            user_ids.add(int(r['user_id']))
-
-    if role_targets:
-        ids_csv = ','.join(str(int(x)) for x in role_targets)
-        cur.execute(f"""
-            SELECT ur.user_id FROM {SCHEMA}.user_roles ur
-            WHERE ur.role_id IN ({ids_csv})
-        """)
-        for r in cur.fetchall():
-            user_ids.add(int(r['user_id']))
-
-    return list(user_ids)
+from watcher_rule_index import get_watcher_rule_index, reset_watcher_rule_index
+from executor_assignment_resolver import (
+    resolve_executor, resolve_executor_group, pick_member_for_group, reset_executor_routing,
+)
+from notification_outbox import enqueue_notification
+from notification_outbox_worker import handle_notification_outbox
+from sla_timer_worker import handle_sla_timers
 
 
 def _apply_watcher_rules(conn, ticket_id: int, trigger: str, app_origin: str = '') -> List[int]:
@@ -222,76 +266,25 @@ def _apply_watcher_rules(conn, ticket_id: int, trigger: str, app_origin: str = '
         if not ticket:
             return []
 
-        trigger_field = 'trigger_on_create' if trigger == 'create' else 'trigger_on_update'
-        cur.execute(f"""
-            SELECT id, category_id, department_id, priority_id, executor_group_id, assignee_id, match_mode
-            FROM {SCHEMA}.ticket_watcher_rules
-            WHERE is_active = true AND {trigger_field} = true
-        """)
-        rules = [dict(r) for r in cur.fetchall()]
-
-        matched_ids: List[int] = []
-        for r in rules:
-            mode = str(r.get('match_mode') or 'AND').upper()
-            conditions = [
-                (r.get('category_id'), ticket.get('category_id')),
-                (r.get('department_id'), ticket.get('department_id')),
-                (r.get('priority_id'), ticket.get('priority_id')),
-                (r.get('executor_group_id'), ticket.get('executor_group_id')),
-                (r.get('assignee_id'), ticket.get('assigned_to')),
-            ]
-            non_empty = [(rv, tv) for rv, tv in conditions if rv]
-            if not non_empty:
-                continue
-            if mode == 'OR':
-                if not any(rv == tv for rv, tv in non_empty):
-                    continue
-            else:
-                if not all(rv == tv for rv, tv in non_empty):
-                    continue
-            matched_ids.append(r['id'])
-
-        if not matched_ids:
+        _, user_ids = get_watcher_rule_index(cur, SCHEMA).match(trigger, ticket)
+        creator_id = ticket.get('created_by')
+        user_ids = sorted(uid for uid in user_ids if uid and uid != creator_id)
+        if not user_ids:
             return []
 
-        ids_csv = ','.join(str(int(x)) for x in matched_ids)
         cur.execute(f"""
-            SELECT rule_id, target_type, target_id
-            FROM {SCHEMA}.ticket_watcher_rule_targets
-            WHERE rule_id IN ({ids_csv})
-        """)
-        targets = [dict(t) for t in cur.fetchall()]
-        user_ids = _resolve_watcher_target_user_ids(cur, targets)
-        creator_id = ticket.get('created_by')
-
-        added: List[int] = []
-        for uid in user_ids:
-            if not uid:
-                continue
-            if creator_id and uid == creator_id:
-                continue
-            cur.execute(f"""
-                INSERT INTO {SCHEMA}.ticket_watchers (ticket_id, user_id)
-                VALUES (%s, %s)
-                ON CONFLICT (ticket_id, user_id) DO NOTHING
-                RETURNING user_id
-            """, (ticket_id, uid))
-            row = cur.fetchone()
-            if row:
-                added.append(int(row['user_id']))
-
-        conn.commit()
+            INSERT INTO {SCHEMA}.ticket_watchers (ticket_id, user_id)
+            SELECT %s, u FROM unnest(%s::int[]) AS u
+            ON CONFLICT (ticket_id, user_id) DO NOTHING
+            RETURNING user_id
+        """, (ticket_id, user_ids))
+        added: List[int] = sorted(int(r['user_id']) for r in cur.fetchall())
 
         for uid in added:
-            try:
-                notify_watcher_added(cur, SCHEMA, int(ticket_id), int(uid), app_origin=app_origin)
-            except Exception as bot_err:
-                print(f"[watcher-rules] bitrix notif failed t={ticket_id} u={uid}: {bot_err}")
-            try:
-                max_notify_watcher_added(cur, SCHEMA, int(ticket_id), int(uid), app_origin=app_origin)
-            except Exception as bot_err:
-                print(f"[watcher-rules] MAX notif failed t={ticket_id} u={uid}: {bot_err}")
+            enqueue_notification(cur, 'watcher_added', int(ticket_id),
+                                 {'user_id': uid, 'app_origin': app_origin})
 
+        conn.commit()
         return added
     finally:
         try:
@@ -720,7 +713,8 @@ def handle_dashboard_sla(method: str, event: Dict[str, Any], conn) -> Dict[str,
 
     SLA-метрики (соблюдение, в срок/просрочено, по приоритетам, просроченные,
     мини-графики времени) — пока заглушки.
-    CSAT, распределение оценок и среднее время первого ответа/решения — из БД.
+    CSAT, распределение оценок и среднее время первого ответа/решения — из БД;
+    для заявок с SLA по графику время считается в рабочих минутах групп.
     """
     payload = verify_token(event)
     if not payload:
@@ -754,27 +748,84 @@ def handle_dashboard_sla(method: str, event: Dict[str, Any], conn) -> Dict[str,
 
     cur = conn.cursor()
     try:
-        # Среднее время первого ответа (по первому внешнему комментарию)
-        cur.execute(f"""
-            SELECT AVG(EXTRACT(EPOCH FROM (fc.first_reply - t.created_at))) AS avg_sec
-            FROM {SCHEMA}.tickets t
+        # Заявки периода, чей SLA (первый по услугам, как в журнале групп) ведётся
+        # по графику: их время считается в рабочих минутах групп, остальные — в SQL
+        business_sql = f"""
+            SELECT ticket_id FROM (
+                SELECT DISTINCT ON (tsm.ticket_id) tsm.ticket_id, s.use_work_schedule
+                FROM {SCHEMA}.ticket_to_service_mappings tsm
+                JOIN {SCHEMA}.tickets bt ON bt.id = tsm.ticket_id
+                JOIN {SCHEMA}.sla_service_mappings ssm ON
+                    (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id = tsm.service_id)
+                    OR (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id IS NULL)
+                    OR (ssm.ticket_service_id IS NULL AND ssm.service_id = tsm.service_id)
+                JOIN {SCHEMA}.sla s ON s.id = ssm.sla_id
+                WHERE bt.created_at >= {start_expr} AND bt.created_at < {end_expr}
+                ORDER BY tsm.ticket_id, s.id
+            ) x WHERE x.use_work_schedule
+        """
+        first_reply_sql = f"""
             JOIN LATERAL (
                 SELECT MIN(c.created_at) AS first_reply
                 FROM {SCHEMA}.ticket_comments c
                 WHERE c.ticket_id = t.id AND c.user_id <> t.created_by AND NOT COALESCE(c.is_internal, false)
-            ) fc ON fc.first_reply IS NOT NULL
-            WHERE t.created_at >= {start_expr} AND t.created_at < {end_expr}
+            ) fc ON true
+        """
+
+        # Среднее время первого ответа (по первому внешнему комментарию)
+        cur.execute(f"""
+            SELECT SUM(EXTRACT(EPOCH FROM (fc.first_reply - t.created_at))) AS sum_sec,
+                   COUNT(*) AS cnt
+            FROM {SCHEMA}.tickets t
+            {first_reply_sql}
+            WHERE fc.first_reply IS NOT NULL
+              AND t.created_at >= {start_expr} AND t.created_at < {end_expr}
+              AND t.id NOT IN ({business_sql})
         """, qp)
-        first_resp_sec = cur.fetchone()['avg_sec']
+        first_resp = dict(cur.fetchone())
 
         # Среднее время решения
         cur.execute(f"""
-            SELECT AVG(EXTRACT(EPOCH FROM (t.closed_at - t.created_at))) AS avg_sec
+            SELECT SUM(EXTRACT(EPOCH FROM (t.closed_at - t.created_at))) AS sum_sec,
+                   COUNT(*) AS cnt
             FROM {SCHEMA}.tickets t
             WHERE t.closed_at IS NOT NULL
               AND t.created_at >= {start_expr} AND t.created_at < {end_expr}
+              AND t.id NOT IN ({business_sql})
         """, qp)
-        resolve_sec = cur.fetchone()['avg_sec']
+        resolve = dict(cur.fetchone())
+
+        cur.execute(f"""
+            SELECT t.executor_group_id, t.created_at, t.closed_at, fc.first_reply,
+                   COALESCE(t.sla_paused_total_seconds, 0) AS paused_seconds
+            FROM {SCHEMA}.tickets t
+            {first_reply_sql}
+            WHERE t.id IN ({business_sql})
+              AND (t.closed_at IS NOT NULL OR fc.first_reply IS NOT NULL)
+        """, qp)
+        business_rows = cur.fetchall()
+        if business_rows:
+            since = min(as_utc(r['created_at']) for r in business_rows)
+            until = max(
+                as_utc(v) for r in business_rows for v in (r['closed_at'], r['first_reply']) if v
+            )
+            clocks = load_group_clocks(
+                cur, SCHEMA, {r['executor_group_id'] for r in business_rows}, since, until
+            )
+            for r in business_rows:
+                clock = clocks.get(r['executor_group_id'])
+                if r['first_reply']:
+                    first_resp['sum_sec'] = float(first_resp['sum_sec'] or 0) + 60 * minutes_between(
+                        clock, r['created_at'], r['first_reply'])
+                    first_resp['cnt'] += 1
+                if r['closed_at']:
+                    resolve['sum_sec'] = float(resolve['sum_sec'] or 0) + 60 * (
+                        clock.active_minutes(r['created_at'], r['closed_at'], r['paused_seconds'])
+                        if clock else minutes_between(None, r['created_at'], r['closed_at'])
+                    )
+                    resolve['cnt'] += 1
+        first_resp_sec = float(first_resp['sum_sec']) / first_resp['cnt'] if first_resp['cnt'] else None
+        resolve_sec = float(resolve['sum_sec']) / resolve['cnt'] if resolve['cnt'] else None
 
         # CSAT и распределение оценок
         cur.execute(f"""
@@ -1185,6 +1236,9 @@ def handler(event: dict, context) -> dict:
         return handle_options()
     
     endpoint = get_endpoint(event)
+    reset_access_context()
+    reset_executor_routing()
+    reset_watcher_rule_index()
     
     try:
         conn = get_db_connection()
@@ -1238,6 +1292,14 @@ def handler(event: dict, context) -> dict:
             return handle_dashboard_services(method, event, conn)
         elif endpoint == 'dashboard-team':
             return handle_dashboard_team(method, event, conn)
+        elif endpoint == 'ticket-user-state':
+            return handle_ticket_user_state(method, event, conn)
+        elif endpoint == 'ticket-list-projection':
+            return handle_ticket_list_projection(method, event, conn)
+        elif endpoint == 'notification-outbox':
+            return handle_notification_outbox(method, event, conn)
+        elif endpoint == 'sla-timers':
+            return handle_sla_timers(method, event, conn)
         else:
             return response(400, {'error': 'Unknown endpoint'})
     finally:
@@ -1341,388 +1403,460 @@ def resolve_custom_field_values(fields: list, cur, org_cache: dict = None) -> li
     return resolved
 
 
-def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
-    payload = verify_token(event)
-    if not payload:
-        return response(401, {'error': 'Требуется авторизация'})
-    
-    user_id = payload.get('user_id')
-
-    if method == 'GET':
-        query_params = event.get('queryStringParameters', {}) or {}
-        # Пользователи без права видеть скрытые комментарии не должны узнавать
-        # даже о факте их существования (флаги "есть новый ответ")
-        _internal_cur = conn.cursor()
-        _hide_internal = not _can_see_internal(_internal_cur, user_id)
-        _internal_cur.close()
-        _internal_filter = ' AND {alias}.is_internal = false' if _hide_internal else ''
-        
-        ticket_id_param = query_params.get('ticket_id')
-        status_id = query_params.get('status_id')
-        priority_id = query_params.get('priority_id')
-        assigned_to = query_params.get('assigned_to')
-        created_by = query_params.get('created_by')
-        service_id = query_params.get('service_id')
-        is_archived = query_params.get('is_archived')
-        is_hidden = query_params.get('is_hidden')
-        hide_waiting = query_params.get('hide_waiting')
-        show_all = query_params.get('show_all')
-        needs_my_reply = query_params.get('needs_my_reply')
-        is_watcher = query_params.get('is_watcher')
-        from_date = query_params.get('from_date')
-        to_date = query_params.get('to_date')
-        page = max(1, int(query_params.get('page', 1)))
-        limit = min(100, max(1, int(query_params.get('limit', 50))))
-        offset = (page - 1) * limit
-
-        # Сортировка списка заявок. Whitelist допустимых полей.
-        sort_by_param = (query_params.get('sort_by') or 'created_at').strip()
-        sort_dir_param = (query_params.get('sort_dir') or 'desc').strip().lower()
-        sort_dir_sql = 'ASC' if sort_dir_param == 'asc' else 'DESC'
-        nulls_sql = 'NULLS FIRST' if sort_dir_sql == 'ASC' else 'NULLS LAST'
-
-        sort_map = {
-            'created_at': 't.created_at',
-            'due_date': 't.due_date',
-            'assignee': 'u1.full_name',
-            'creator': 'u2.full_name',
-            'status': 's.name',
-            'executor_group': 'eg.name',
-            'service': '(SELECT MIN(s2.name) FROM ' + SCHEMA + '.ticket_to_service_mappings tsm2 '
-                       'JOIN ' + SCHEMA + '.services s2 ON s2.id = tsm2.service_id '
-                       'WHERE tsm2.ticket_id = t.id)',
-            'ticket_service': '(SELECT MIN(ts2.name) FROM ' + SCHEMA + '.ticket_to_service_mappings tsm3 '
-                              'JOIN ' + SCHEMA + '.ticket_services ts2 ON ts2.id = tsm3.ticket_service_id '
-                              'WHERE tsm3.ticket_id = t.id)',
-        }
-        sort_field_sql = sort_map.get(sort_by_param, 't.created_at')
-        order_by_clause = f"ORDER BY {sort_field_sql} {sort_dir_sql} {nulls_sql}, t.id DESC"
-        
-        cur = conn.cursor()
-        
-        cur.execute(f"""
-            SELECT p.resource, p.action
-            FROM {SCHEMA}.permissions p
-            JOIN {SCHEMA}.role_permissions rp ON p.id = rp.permission_id
-            JOIN {SCHEMA}.user_roles ur ON rp.role_id = ur.role_id
-            WHERE ur.user_id = %s
-        """, (user_id,))
-        user_permissions = [dict(row) for row in cur.fetchall()]
-        
-        view_all_tickets = any(
-            p['resource'] == 'tickets' and p['action'] == 'view_all' 
-            for p in user_permissions
-        )
-        view_own_only = any(
-            p['resource'] == 'tickets' and p['action'] == 'view_own_only' 
-            for p in user_permissions
-        )
+def _ticket_scope_filter(query_params: Dict[str, Any], user_id: int, is_admin: bool):
+    """Фильтр «вкладки» списка: скрытые (ожидают подтверждения), архив или активные.
 
-        cur.execute(f"""
-            SELECT 1 FROM {SCHEMA}.user_roles ur
-            JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-            WHERE ur.user_id = %s AND r.system_role = 'admin'
-            LIMIT 1
-        """, (user_id,))
-        is_admin = cur.fetchone() is not None
-        
-        if not view_all_tickets and not view_own_only:
-            return response(200, {'tickets': [], 'total': 0, 'page': page, 'limit': limit, 'pages': 0})
+    Не применяется при выборке конкретной заявки (ticket_id) и при show_all=true.
+    Возвращает (sql, params).
+    """
+    if query_params.get('ticket_id') or query_params.get('show_all') == 'true':
+        return '', []
+    if query_params.get('is_hidden') == 'true':
+        sql = f" AND t.is_archived = false AND EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses hs WHERE hs.id = t.status_id AND hs.is_pending_confirmation = true)"
+        if not is_admin:
+            return sql + " AND t.assigned_to = %s", [user_id]
+        return sql, []
+    if query_params.get('is_archived') == 'true':
+        return f" AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses ps WHERE ps.id = t.status_id AND ps.is_pending_confirmation = true) AND (t.is_archived = true OR EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses cs WHERE cs.id = t.status_id AND cs.is_closed = true))", []
+    sql = f" AND t.is_archived = false AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses cs WHERE cs.id = t.status_id AND cs.is_closed = true)"
+    if is_admin:
+        return sql + f" AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses hs WHERE hs.id = t.status_id AND hs.is_pending_confirmation = true)", []
+    return sql + f" AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses hs WHERE hs.id = t.status_id AND hs.is_pending_confirmation = true AND t.assigned_to = %s)", [user_id]
+
+
+def _needs_my_reply_filter(user_id: int):
+    """Фильтр «нужен мой ответ»: я исполнитель, последний публичный комментарий — от заказчика."""
+    return f"""
+            AND t.assigned_to = %s
+            AND EXISTS (
+                SELECT 1 FROM {SCHEMA}.ticket_comments tcnr
+                WHERE tcnr.ticket_id = t.id
+                  AND tcnr.is_internal = false
+                  AND tcnr.user_id = t.created_by
+                  AND tcnr.created_at = (
+                      SELECT MAX(tcnr2.created_at) FROM {SCHEMA}.ticket_comments tcnr2
+                      WHERE tcnr2.ticket_id = t.id AND tcnr2.is_internal = false
+                  )
+            )
+        """, [user_id]
 
-        cur.execute(f"""
-            SELECT 1 FROM {SCHEMA}.user_roles ur
-            JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-            WHERE ur.user_id = %s AND r.restrict_to_groups = true
-            LIMIT 1
-        """, (user_id,))
-        restrict_to_groups = cur.fetchone() is not None
 
-        restricted_user_ids = None
-        if restrict_to_groups:
-            cur.execute(f"""
-                SELECT DISTINCT egm.user_id
-                FROM {SCHEMA}.user_roles ur
-                JOIN {SCHEMA}.roles r ON r.id = ur.role_id AND r.restrict_to_groups = true
-                JOIN {SCHEMA}.role_visible_groups rvg ON rvg.role_id = r.id
-                JOIN {SCHEMA}.executor_group_members egm ON egm.group_id = rvg.group_id
-                WHERE ur.user_id = %s
-            """, (user_id,))
-            restricted_user_ids = [row['user_id'] for row in cur.fetchall()]
-            if not restricted_user_ids:
-                return response(200, {'tickets': [], 'total': 0, 'page': page, 'limit': limit, 'pages': 0})
-        
-        where_clause = "WHERE 1=1"
-        params = []
+def _build_ticket_where(query_params: Dict[str, Any], user_id: int, access: AccessContext,
+                        include_scope: bool = True, include_reply: bool = True):
+    """Собирает WHERE списка заявок (алиас t) по правам и фильтрам запроса.
 
-        if restricted_user_ids is not None:
-            placeholders = ','.join(['%s'] * len(restricted_user_ids))
-            where_clause += f" AND t.assigned_to IN ({placeholders})"
-            params.extend(restricted_user_ids)
-        
-        if not view_all_tickets and view_own_only:
-            where_clause += f""" AND (
-                t.created_by = %s 
-                OR t.assigned_to = %s
-                OR EXISTS (SELECT 1 FROM {SCHEMA}.ticket_watchers tw WHERE tw.ticket_id = t.id AND tw.user_id = %s)
-                OR EXISTS (SELECT 1 FROM {SCHEMA}.ticket_approvals ta WHERE ta.ticket_id = t.id AND ta.approver_id = %s)
-                OR (t.executor_group_id IS NOT NULL AND t.assigned_to IS NULL AND EXISTS (
-                    SELECT 1 FROM {SCHEMA}.executor_group_members egm 
-                    WHERE egm.group_id = t.executor_group_id AND egm.user_id = %s
-                ))
-            )"""
-            params.extend([user_id, user_id, user_id, user_id, user_id])
-        
-        if status_id:
-            where_clause += " AND t.status_id = %s"
-            params.append(int(status_id))
-        if priority_id:
-            where_clause += " AND t.priority_id = %s"
-            params.append(int(priority_id))
-        if assigned_to:
-            where_clause += " AND t.assigned_to = %s"
-            params.append(int(assigned_to))
-        if created_by:
-            where_clause += " AND t.created_by = %s"
-            params.append(int(created_by))
-        if ticket_id_param:
-            where_clause += " AND t.id = %s"
-            params.append(int(ticket_id_param))
-        if service_id:
-            where_clause += " AND EXISTS (SELECT 1 FROM {SCHEMA}.ticket_to_service_mappings tsm2 WHERE tsm2.ticket_id = t.id AND tsm2.ticket_service_id = %s)".format(SCHEMA=SCHEMA)
-            params.append(int(service_id))
-        if not ticket_id_param and show_all != 'true':
-            if is_hidden == 'true':
-                where_clause += f" AND t.is_archived = false AND EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses hs WHERE hs.id = t.status_id AND hs.is_pending_confirmation = true)"
-                if not is_admin:
-                    where_clause += " AND t.assigned_to = %s"
-                    params.append(user_id)
-            elif is_archived == 'true':
-                where_clause += f" AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses ps WHERE ps.id = t.status_id AND ps.is_pending_confirmation = true) AND (t.is_archived = true OR EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses cs WHERE cs.id = t.status_id AND cs.is_closed = true))"
-            else:
-                where_clause += f" AND t.is_archived = false AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses cs WHERE cs.id = t.status_id AND cs.is_closed = true)"
-                if is_admin:
-                    where_clause += f" AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses hs WHERE hs.id = t.status_id AND hs.is_pending_confirmation = true)"
-                else:
-                    where_clause += f" AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses hs WHERE hs.id = t.status_id AND hs.is_pending_confirmation = true AND t.assigned_to = %s)"
-                    params.append(user_id)
-        if from_date:
-            where_clause += " AND t.created_at >= %s"
-            params.append(from_date)
-        if to_date:
-            where_clause += " AND t.created_at <= %s"
-            params.append(to_date)
-        if hide_waiting == 'true' and show_all != 'true':
-            where_clause += f" AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses wst WHERE wst.id = t.status_id AND wst.is_waiting_response = true)"
-        if needs_my_reply == 'true':
-            where_clause += f"""
-                AND t.assigned_to = %s
-                AND EXISTS (
-                    SELECT 1 FROM {SCHEMA}.ticket_comments tcnr
-                    WHERE tcnr.ticket_id = t.id
-                      AND tcnr.is_internal = false
-                      AND tcnr.user_id = t.created_by
-                      AND tcnr.created_at = (
-                          SELECT MAX(tcnr2.created_at) FROM {SCHEMA}.ticket_comments tcnr2
-                          WHERE tcnr2.ticket_id = t.id AND tcnr2.is_internal = false
-                      )
-                )
-            """
-            params.append(user_id)
-        if is_watcher == 'true':
-            where_clause += f"""
-                AND EXISTS (
-                    SELECT 1 FROM {SCHEMA}.ticket_watchers twf
-                    WHERE twf.ticket_id = t.id AND twf.user_id = %s
-                )
-            """
-            params.append(user_id)
-
-        # Поисковые фильтры по текстовым полям (ILIKE)
-        search_assignee = (query_params.get('search_assignee') or '').strip()
-        search_creator = (query_params.get('search_creator') or '').strip()
-        search_status = (query_params.get('search_status') or '').strip()
-        search_executor_group = (query_params.get('search_executor_group') or '').strip()
-        search_service = (query_params.get('search_service') or '').strip()
-        search_ticket_service = (query_params.get('search_ticket_service') or '').strip()
-        search_content = (query_params.get('search_content') or '').strip()
-        due_from = (query_params.get('due_from') or '').strip()
-        due_to = (query_params.get('due_to') or '').strip()
-
-        if search_assignee:
-            where_clause += f""" AND EXISTS (
-                SELECT 1 FROM {SCHEMA}.users uf
-                WHERE uf.id = t.assigned_to
-                  AND (uf.full_name ILIKE %s OR uf.username ILIKE %s)
-            )"""
-            params.extend([f"%{search_assignee}%", f"%{search_assignee}%"])
-        if search_creator:
-            where_clause += f""" AND EXISTS (
-                SELECT 1 FROM {SCHEMA}.users uc
-                WHERE uc.id = t.created_by
-                  AND (uc.full_name ILIKE %s OR uc.username ILIKE %s)
-            )"""
-            params.extend([f"%{search_creator}%", f"%{search_creator}%"])
-        if search_status:
-            where_clause += f""" AND EXISTS (
-                SELECT 1 FROM {SCHEMA}.ticket_statuses sf
-                WHERE sf.id = t.status_id AND sf.name ILIKE %s
-            )"""
-            params.append(f"%{search_status}%")
-        if search_executor_group:
-            where_clause += f""" AND EXISTS (
-                SELECT 1 FROM {SCHEMA}.executor_groups egf
-                WHERE egf.id = t.executor_group_id AND egf.name ILIKE %s
-            )"""
-            params.append(f"%{search_executor_group}%")
-        if search_service:
-            where_clause += f""" AND EXISTS (
-                SELECT 1 FROM {SCHEMA}.ticket_to_service_mappings tsmf
-                JOIN {SCHEMA}.services sff ON sff.id = tsmf.service_id
-                WHERE tsmf.ticket_id = t.id AND sff.name ILIKE %s
-            )"""
-            params.append(f"%{search_service}%")
-        if search_ticket_service:
-            where_clause += f""" AND EXISTS (
-                SELECT 1 FROM {SCHEMA}.ticket_to_service_mappings tsmf2
-                JOIN {SCHEMA}.ticket_services tsf ON tsf.id = tsmf2.ticket_service_id
-                WHERE tsmf2.ticket_id = t.id AND tsf.name ILIKE %s
-            )"""
-            params.append(f"%{search_ticket_service}%")
-        if search_content:
-            # Ищем по содержанию: title, description, доп. поля, номер, дата,
-            # комментарии, участники (заказчик/исполнитель/наблюдатели), сервис, услуга
-            like = f"%{search_content}%"
-            where_clause += f""" AND (
-                t.title ILIKE %s
-                OR t.description ILIKE %s
-                OR CAST(t.id AS TEXT) ILIKE %s
-                OR TO_CHAR(t.created_at, 'YYYY-MM-DD') ILIKE %s
-                OR EXISTS (
-                    SELECT 1 FROM {SCHEMA}.ticket_custom_field_values tcfv
-                    WHERE tcfv.ticket_id = t.id AND tcfv.value ILIKE %s
-                )
-                OR EXISTS (
-                    SELECT 1 FROM {SCHEMA}.ticket_comments tc
-                    WHERE tc.ticket_id = t.id AND tc.comment ILIKE %s
-                )
-                OR EXISTS (
-                    SELECT 1 FROM {SCHEMA}.users up
-                    WHERE up.id IN (t.created_by, t.assigned_to)
-                      AND (up.full_name ILIKE %s OR up.username ILIKE %s)
-                )
-                OR EXISTS (
-                    SELECT 1 FROM {SCHEMA}.ticket_watchers tw
-                    JOIN {SCHEMA}.users uw ON uw.id = tw.user_id
-                    WHERE tw.ticket_id = t.id
-                      AND (uw.full_name ILIKE %s OR uw.username ILIKE %s)
-                )
-                OR EXISTS (
-                    SELECT 1 FROM {SCHEMA}.ticket_to_service_mappings tsmc
-                    JOIN {SCHEMA}.services ssc ON ssc.id = tsmc.service_id
-                    WHERE tsmc.ticket_id = t.id AND ssc.name ILIKE %s
-                )
-                OR EXISTS (
-                    SELECT 1 FROM {SCHEMA}.ticket_to_service_mappings tsmc2
-                    JOIN {SCHEMA}.ticket_services tssc ON tssc.id = tsmc2.ticket_service_id
-                    WHERE tsmc2.ticket_id = t.id AND tssc.name ILIKE %s
-                )
-            )"""
-            params.extend([like] * 12)
-        if due_from:
-            where_clause += " AND t.due_date >= %s"
-            params.append(due_from)
-        if due_to:
-            where_clause += " AND t.due_date <= %s"
-            params.append(due_to)
-        
-        count_query = f"SELECT COUNT(*) AS total FROM {SCHEMA}.tickets t {where_clause}"
-        cur.execute(count_query, params)
-        total = cur.fetchone()['total']
-        
-        main_query = f"""
-            SELECT t.id, t.title, t.description, t.status_id, t.priority_id,
-                   t.assigned_to, t.created_by, t.created_at, t.updated_at,
-                   t.department_id, t.due_date, t.executor_group_id,
-                   t.confirmation_sent_at, t.rating, t.rejection_reason,
-                   t.previous_status_id,
-                   s.name as status_name, s.color as status_color, s.is_closed as status_is_closed,
-                   s.is_waiting_response as status_is_waiting_response,
-                   COALESCE(s.is_pending_confirmation, false) as status_is_pending_confirmation,
-                   COALESCE(s.is_reopened, false) as status_is_reopened,
-                   p.name as priority_name, p.color as priority_color,
-                   u1.username as assignee_email, u1.full_name as assignee_name, u1.photo_url as assignee_photo_url,
-                   u2.username as creator_email, u2.full_name as creator_name, u2.photo_url as creator_photo_url,
-                   eg.name as executor_group_name,
-                   (
-                       SELECT EXISTS(
-                           SELECT 1 FROM {SCHEMA}.ticket_comments tccr
-                           WHERE tccr.ticket_id = t.id
-                             AND tccr.user_id <> {int(user_id)}
-                             {_internal_filter.format(alias='tccr')}
-                             AND tccr.created_at > COALESCE(
-                                 (SELECT tv2.last_seen_at FROM {SCHEMA}.ticket_views tv2
-                                  WHERE tv2.user_id = {int(user_id)} AND tv2.ticket_id = t.id),
-                                 'epoch'::timestamp
-                             )
-                       )
-                   ) AS client_replied,
-                   (
-                       SELECT MAX(tccrt.created_at) FROM {SCHEMA}.ticket_comments tccrt
-                       WHERE tccrt.ticket_id = t.id
-                         AND tccrt.user_id <> {int(user_id)}
-                         {_internal_filter.format(alias='tccrt')}
-                         AND tccrt.created_at > COALESCE(
-                             (SELECT tv3.last_seen_at FROM {SCHEMA}.ticket_views tv3
-                              WHERE tv3.user_id = {int(user_id)} AND tv3.ticket_id = t.id),
-                             'epoch'::timestamp
-                         )
-                   ) AS client_replied_at,
-                   (
-                       SELECT COUNT(*) FROM {SCHEMA}.notifications nu
-                       WHERE nu.ticket_id = t.id AND nu.user_id = {int(user_id)} AND nu.is_read = false
-                   ) AS unread_count,
-                   (
-                       SELECT COUNT(*) FROM {SCHEMA}.notifications nu2
-                       WHERE nu2.ticket_id = t.id AND nu2.user_id = {int(user_id)}
-                         AND nu2.is_read = false AND nu2.event_type = 'mention'
-                   ) AS unread_mentions,
-                   (
-                       SELECT EXISTS(
-                           SELECT 1 FROM {SCHEMA}.ticket_comments tcnew
-                           WHERE tcnew.ticket_id = t.id
-                             AND tcnew.user_id <> {int(user_id)}
-                             {_internal_filter.format(alias='tcnew')}
-                             AND tcnew.created_at > COALESCE(
-                                 (SELECT tv.last_seen_at FROM {SCHEMA}.ticket_views tv
-                                  WHERE tv.user_id = {int(user_id)} AND tv.ticket_id = t.id),
-                                 'epoch'::timestamp
-                             )
-                       )
-                   ) AS has_new
-            FROM {SCHEMA}.tickets t
-            LEFT JOIN {SCHEMA}.ticket_statuses s ON t.status_id = s.id
-            LEFT JOIN {SCHEMA}.ticket_priorities p ON t.priority_id = p.id
-            LEFT JOIN {SCHEMA}.users u1 ON t.assigned_to = u1.id
-            LEFT JOIN {SCHEMA}.users u2 ON t.created_by = u2.id
-            LEFT JOIN {SCHEMA}.executor_groups eg ON t.executor_group_id = eg.id
-            {where_clause}
-            {order_by_clause}
-            LIMIT %s OFFSET %s
+    include_scope / include_reply=False — без фильтра вкладки и «нужен мой ответ»:
+    bootstrap добавляет их сам внутри COUNT(*) FILTER (...).
+    Возвращает (where_clause, params).
+    """
+    ticket_id_param = query_params.get('ticket_id')
+    status_id = query_params.get('status_id')
+    priority_id = query_params.get('priority_id')
+    assigned_to = query_params.get('assigned_to')
+    created_by = query_params.get('created_by')
+    service_id = query_params.get('service_id')
+    hide_waiting = query_params.get('hide_waiting')
+    show_all = query_params.get('show_all')
+    needs_my_reply = query_params.get('needs_my_reply') if include_reply else None
+    is_watcher = query_params.get('is_watcher')
+    from_date = query_params.get('from_date')
+    to_date = query_params.get('to_date')
+    restricted_user_ids = access.restricted_user_ids
+    view_all_tickets = access.view_all_tickets
+    view_own_only = access.view_own_only
+
+    where_clause = "WHERE 1=1"
+    params = []
+
+    if restricted_user_ids is not None:
+        placeholders = ','.join(['%s'] * len(restricted_user_ids))
+        where_clause += f" AND t.assigned_to IN ({placeholders})"
+        params.extend(restricted_user_ids)
+    
+    if not view_all_tickets and view_own_only:
+        where_clause += f""" AND (
+            t.created_by = %s 
+            OR t.assigned_to = %s
+            OR EXISTS (SELECT 1 FROM {SCHEMA}.ticket_watchers tw WHERE tw.ticket_id = t.id AND tw.user_id = %s)
+            OR EXISTS (SELECT 1 FROM {SCHEMA}.ticket_approvals ta WHERE ta.ticket_id = t.id AND ta.approver_id = %s)
+            OR (t.executor_group_id IS NOT NULL AND t.assigned_to IS NULL AND EXISTS (
+                SELECT 1 FROM {SCHEMA}.executor_group_members egm 
+                WHERE egm.group_id = t.executor_group_id AND egm.user_id = %s
+            ))
+        )"""
+        params.extend([user_id, user_id, user_id, user_id, user_id])
+    
+    if status_id:
+        where_clause += " AND t.status_id = %s"
+        params.append(int(status_id))
+    if priority_id:
+        where_clause += " AND t.priority_id = %s"
+        params.append(int(priority_id))
+    if assigned_to:
+        where_clause += " AND t.assigned_to = %s"
+        params.append(int(assigned_to))
+    if created_by:
+        where_clause += " AND t.created_by = %s"
+        params.append(int(created_by))
+    if ticket_id_param:
+        where_clause += " AND t.id = %s"
+        params.append(int(ticket_id_param))
+    if service_id:
+        where_clause += " AND EXISTS (SELECT 1 FROM {SCHEMA}.ticket_to_service_mappings tsm2 WHERE tsm2.ticket_id = t.id AND tsm2.ticket_service_id = %s)".format(SCHEMA=SCHEMA)
+        params.append(int(service_id))
+    if include_scope:
+        scope_sql, scope_params = _ticket_scope_filter(query_params, user_id, access.is_admin)
+        where_clause += scope_sql
+        params.extend(scope_params)
+    if from_date:
+        where_clause += " AND t.created_at >= %s"
+        params.append(from_date)
+    if to_date:
+        where_clause += " AND t.created_at <= %s"
+        params.append(to_date)
+    if hide_waiting == 'true' and show_all != 'true':
+        where_clause += f" AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_statuses wst WHERE wst.id = t.status_id AND wst.is_waiting_response = true)"
+    if needs_my_reply == 'true':
+        reply_sql, reply_params = _needs_my_reply_filter(user_id)
+        where_clause += reply_sql
+        params.extend(reply_params)
+    if is_watcher == 'true':
+        where_clause += f"""
+            AND EXISTS (
+                SELECT 1 FROM {SCHEMA}.ticket_watchers twf
+                WHERE twf.ticket_id = t.id AND twf.user_id = %s
+            )
         """
-        cur.execute(main_query, params + [limit, offset])
-        tickets = [dict(row) for row in cur.fetchall()]
-        
-        if tickets:
-            ticket_ids = [t['id'] for t in tickets]
-            ticket_id_map = {t['id']: t for t in tickets}
-            for t in tickets:
+        params.append(user_id)
+
+    # Поисковые фильтры по текстовым полям (ILIKE)
+    search_assignee = (query_params.get('search_assignee') or '').strip()
+    search_creator = (query_params.get('search_creator') or '').strip()
+    search_status = (query_params.get('search_status') or '').strip()
+    search_executor_group = (query_params.get('search_executor_group') or '').strip()
+    search_service = (query_params.get('search_service') or '').strip()
+    search_ticket_service = (query_params.get('search_ticket_service') or '').strip()
+    search_content = (query_params.get('search_content') or '').strip()
+    due_from = (query_params.get('due_from') or '').strip()
+    due_to = (query_params.get('due_to') or '').strip()
+
+    if search_assignee:
+        where_clause += f""" AND EXISTS (
+            SELECT 1 FROM {SCHEMA}.users uf
+            WHERE uf.id = t.assigned_to
+              AND (uf.full_name ILIKE %s OR uf.username ILIKE %s)
+        )"""
+        params.extend([f"%{search_assignee}%", f"%{search_assignee}%"])
+    if search_creator:
+        where_clause += f""" AND EXISTS (
+            SELECT 1 FROM {SCHEMA}.users uc
+            WHERE uc.id = t.created_by
+              AND (uc.full_name ILIKE %s OR uc.username ILIKE %s)
+        )"""
+        params.extend([f"%{search_creator}%", f"%{search_creator}%"])
+    if search_status:
+        where_clause += f""" AND EXISTS (
+            SELECT 1 FROM {SCHEMA}.ticket_statuses sf
+            WHERE sf.id = t.status_id AND sf.name ILIKE %s
+        )"""
+        params.append(f"%{search_status}%")
+    if search_executor_group:
+        where_clause += f""" AND EXISTS (
+            SELECT 1 FROM {SCHEMA}.executor_groups egf
+            WHERE egf.id = t.executor_group_id AND egf.name ILIKE %s
+        )"""
+        params.append(f"%{search_executor_group}%")
+    if search_service:
+        where_clause += f""" AND EXISTS (
+            SELECT 1 FROM {SCHEMA}.ticket_to_service_mappings tsmf
+            JOIN {SCHEMA}.services sff ON sff.id = tsmf.service_id
+            WHERE tsmf.ticket_id = t.id AND sff.name ILIKE %s
+        )"""
+        params.append(f"%{search_service}%")
+    if search_ticket_service:
+        where_clause += f""" AND EXISTS (
+            SELECT 1 FROM {SCHEMA}.ticket_to_service_mappings tsmf2
+            JOIN {SCHEMA}.ticket_services tsf ON tsf.id = tsmf2.ticket_service_id
+            WHERE tsmf2.ticket_id = t.id AND tsf.name ILIKE %s
+        )"""
+        params.append(f"%{search_ticket_service}%")
+    if search_content:
+        # Ищем по содержанию: title, description, доп. поля, номер, дата,
+        # комментарии, участники (заказчик/исполнитель/наблюдатели), сервис, услуга.
+        # Всё это собрано в поисковый документ ticket_search_documents:
+        # полнотекст (формы слов) + триграммы (часть слова, номер, e-mail).
+        where_clause += f""" AND t.id IN (
+            SELECT tsd.ticket_id FROM {SCHEMA}.ticket_search_documents tsd
+            WHERE tsd.document @@ (plainto_tsquery('russian', %s) || plainto_tsquery('simple', %s))
+               OR tsd.search_text ILIKE %s
+        )"""
+        params.extend([search_content, search_content, f"%{search_content}%"])
+    if due_from:
+        where_clause += " AND t.due_date >= %s"
+        params.append(due_from)
+    if due_to:
+        where_clause += " AND t.due_date <= %s"
+        params.append(due_to)
+
+    return where_clause, params
+
+
+def _list_tickets(conn, user_id: int, query_params: Dict[str, Any],
+                  access: Optional[AccessContext] = None):
+    """Список заявок для endpoint=tickets (GET). Возвращает (status_code, body).
+
+    access — готовый контекст доступа (get_access_context); если не передан,
+    загружается здесь. Вынесено из handle_tickets, чтобы составные эндпоинты
+    (bootstrap) брали данные напрямую, без JSON-сериализации ответа.
+    """
+    # Пользователи без права видеть скрытые комментарии не должны узнавать
+    # даже о факте их существования (флаги "есть новый ответ")
+    if access is None:
+        _access_cur = conn.cursor()
+        access = get_access_context(_access_cur, user_id)
+        _access_cur.close()
+    _hide_internal = not access.can_see_internal
+    _internal_filter = ' AND {alias}.is_internal = false' if _hide_internal else ''
+    
+    page = max(1, int(query_params.get('page', 1)))
+    limit = min(100, max(1, int(query_params.get('limit', 50))))
+    offset = (page - 1) * limit
+
+    # Сортировка списка заявок. Whitelist допустимых полей.
+    sort_by_param = (query_params.get('sort_by') or 'created_at').strip()
+    sort_dir_param = (query_params.get('sort_dir') or 'desc').strip().lower()
+    sort_dir_sql = 'ASC' if sort_dir_param == 'asc' else 'DESC'
+    nulls_sql = 'NULLS FIRST' if sort_dir_sql == 'ASC' else 'NULLS LAST'
+
+    # source=projection — читать из денормализованной проекции ticket_list_rows
+    # (статусы, имена, услуги, нарушения SLA и последний комментарий уже в строке).
+    use_projection = (query_params.get('source') or '').strip().lower() == 'projection'
+
+    sort_map = {
+        'created_at': 't.created_at',
+        'due_date': 't.due_date',
+        'assignee': 'u1.full_name',
+        'creator': 'u2.full_name',
+        'status': 's.name',
+        'executor_group': 'eg.name',
+        'service': '(SELECT MIN(s2.name) FROM ' + SCHEMA + '.ticket_to_service_mappings tsm2 '
+                   'JOIN ' + SCHEMA + '.services s2 ON s2.id = tsm2.service_id '
+                   'WHERE tsm2.ticket_id = t.id)',
+        'ticket_service': '(SELECT MIN(ts2.name) FROM ' + SCHEMA + '.ticket_to_service_mappings tsm3 '
+                          'JOIN ' + SCHEMA + '.ticket_services ts2 ON ts2.id = tsm3.ticket_service_id '
+                          'WHERE tsm3.ticket_id = t.id)',
+    }
+    if use_projection:
+        sort_map.update({
+            'assignee': 't.assignee_name',
+            'creator': 't.creator_name',
+            'status': 't.status_name',
+            'executor_group': 't.executor_group_name',
+            'service': 't.service_sort_name',
+            'ticket_service': 't.ticket_service_sort_name',
+        })
+    # При поиске по содержанию доступна сортировка по релевантности (и она
+    # используется по умолчанию, если sort_by не передан явно).
+    search_content_raw = (query_params.get('search_content') or '').strip()
+    if search_content_raw:
+        # Ранг считается в LATERAL-джойне основного запроса (rank_join_sql ниже),
+        # строка поиска передаётся обычным параметром
+        sort_map['relevance'] = 'rel.rank'
+        if not query_params.get('sort_by'):
+            sort_by_param = 'relevance'
+    sort_key = sort_by_param if sort_by_param in sort_map else 'created_at'
+    sort_field_sql = sort_map[sort_key]
+    rank_join_sql = ''
+    rank_params: List[Any] = []
+    if sort_key == 'relevance':
+        rank_join_sql = f"""LEFT JOIN LATERAL (
+            SELECT ts_rank_cd(tsr.document, plainto_tsquery('russian', %s) || plainto_tsquery('simple', %s)) AS rank
+            FROM {SCHEMA}.ticket_search_documents tsr WHERE tsr.ticket_id = t.id
+        ) rel ON true"""
+        rank_params = [search_content_raw, search_content_raw]
+
+    # Keyset-пагинация (opt-in): ?cursor= — первая страница, дальше next_cursor из ответа.
+    # В этом режиме t.id идёт в том же направлении, что и ключ сортировки,
+    # чтобы позицию можно было искать row-value сравнением без OFFSET.
+    cursor_mode = 'cursor' in query_params
+    cursor_state = None
+    cursor_raw = (query_params.get('cursor') or '').strip()
+    if cursor_raw:
+        cursor_state = _decode_ticket_cursor(cursor_raw)
+        if not cursor_state or cursor_state.get('s') != sort_key or cursor_state.get('d') != sort_dir_sql:
+            return 400, {'error': 'Некорректный cursor: сбросьте пагинацию'}
+    id_dir_sql = sort_dir_sql if cursor_mode else 'DESC'
+    order_by_clause = f"ORDER BY {sort_field_sql} {sort_dir_sql} {nulls_sql}, t.id {id_dir_sql}"
+    # Режим подсчёта total: exact (по умолчанию) | estimate | none.
+    # count_only=true — вернуть только total без самого списка (для бейджей).
+    count_mode = (query_params.get('count') or 'exact').strip().lower()
+    if count_mode not in ('exact', 'estimate', 'none'):
+        return 400, {'error': 'count должен быть exact, estimate или none'}
+    count_only = query_params.get('count_only') == 'true'
+    empty_page = {'tickets': [], 'total': 0, 'page': page, 'limit': limit, 'pages': 0}
+    if cursor_mode:
+        empty_page['next_cursor'] = None
+
+    if not access.view_all_tickets and not access.view_own_only:
+        return 200, empty_page
+    if access.restricted_user_ids is not None and not access.restricted_user_ids:
+        return 200, empty_page
+
+    cur = conn.cursor()
+    where_clause, params = _build_ticket_where(query_params, user_id, access)
+    
+    list_table = 'ticket_list_rows' if use_projection else 'tickets'
+    total, total_is_estimate = _count_tickets(
+        cur, where_clause, params, 'exact' if count_only else count_mode, table=list_table,
+    )
+    if count_only:
+        cur.close()
+        return 200, {'total': total}
+
+    page_where_clause = where_clause
+    page_params = list(params)
+    if cursor_state:
+        seek_sql, seek_params = _ticket_seek_clause(sort_field_sql, sort_dir_sql, cursor_state)
+        page_where_clause += seek_sql
+        page_params.extend(seek_params)
+    cursor_select = f",\n                   {sort_field_sql} AS cursor_sort_key" if cursor_mode else ''
+    # Флаги «новый ответ» и счётчики непрочитанного берём из read-модели ticket_user_state
+    # (поддерживается триггерами). Строки нет, только если пользователь ни разу не открывал
+    # заявку и не получал по ней уведомлений — тогда считаем по комментариям напрямую.
+    foreign_col = 'last_foreign_public_comment_at' if _hide_internal else 'last_foreign_comment_at'
+    
+    if use_projection:
+        last_comment_col = 'last_public_comment' if _hide_internal else 'last_comment'
+        list_columns = f"""t.id, t.title, t.description, t.status_id, t.priority_id,
+               t.assigned_to, t.created_by, t.created_at, t.updated_at,
+               t.department_id, t.due_date, t.executor_group_id,
+               t.confirmation_sent_at, t.rating, t.rejection_reason,
+               t.previous_status_id,
+               t.status_name, t.status_color, t.status_is_closed,
+               t.status_is_waiting_response, t.status_is_pending_confirmation, t.status_is_reopened,
+               t.priority_name, t.priority_color,
+               t.assignee_email, t.assignee_name, t.assignee_photo_url,
+               t.creator_email, t.creator_name, t.creator_photo_url,
+               t.executor_group_name,
+               t.services, t.ticket_service, t.sla_violation_count,
+               t.{last_comment_col} AS last_comment,"""
+        list_from = f"{SCHEMA}.ticket_list_rows t"
+    else:
+        list_columns = """t.id, t.title, t.description, t.status_id, t.priority_id,
+               t.assigned_to, t.created_by, t.created_at, t.updated_at,
+               t.department_id, t.due_date, t.executor_group_id,
+               t.confirmation_sent_at, t.rating, t.rejection_reason,
+               t.previous_status_id,
+               s.name as status_name, s.color as status_color, s.is_closed as status_is_closed,
+               s.is_waiting_response as status_is_waiting_response,
+               COALESCE(s.is_pending_confirmation, false) as status_is_pending_confirmation,
+               COALESCE(s.is_reopened, false) as status_is_reopened,
+               p.name as priority_name, p.color as priority_color,
+               u1.username as assignee_email, u1.full_name as assignee_name, u1.photo_url as assignee_photo_url,
+               u2.username as creator_email, u2.full_name as creator_name, u2.photo_url as creator_photo_url,
+               eg.name as executor_group_name,"""
+        list_from = f"""{SCHEMA}.tickets t
+        LEFT JOIN {SCHEMA}.ticket_statuses s ON t.status_id = s.id
+        LEFT JOIN {SCHEMA}.ticket_priorities p ON t.priority_id = p.id
+        LEFT JOIN {SCHEMA}.users u1 ON t.assigned_to = u1.id
+        LEFT JOIN {SCHEMA}.users u2 ON t.created_by = u2.id
+        LEFT JOIN {SCHEMA}.executor_groups eg ON t.executor_group_id = eg.id"""
+
+    main_query = f"""
+        SELECT {list_columns}
+               CASE WHEN tus.ticket_id IS NOT NULL
+                    THEN COALESCE(tus.{foreign_col} > COALESCE(tus.last_seen_at, 'epoch'::timestamp), false)
+                    ELSE EXISTS(
+                        SELECT 1 FROM {SCHEMA}.ticket_comments tccr
+                        WHERE tccr.ticket_id = t.id
+                          AND tccr.user_id <> {int(user_id)}
+                          {_internal_filter.format(alias='tccr')}
+                    )
+               END AS client_replied,
+               CASE WHEN tus.ticket_id IS NOT NULL
+                    THEN CASE WHEN tus.{foreign_col} > COALESCE(tus.last_seen_at, 'epoch'::timestamp)
+                              THEN tus.{foreign_col} END
+                    ELSE (
+                        SELECT MAX(tccrt.created_at) FROM {SCHEMA}.ticket_comments tccrt
+                        WHERE tccrt.ticket_id = t.id
+                          AND tccrt.user_id <> {int(user_id)}
+                          {_internal_filter.format(alias='tccrt')}
+                    )
+               END AS client_replied_at,
+               COALESCE(tus.unread_count, 0) AS unread_count,
+               COALESCE(tus.unread_mentions, 0) AS unread_mentions,
+               CASE WHEN tus.ticket_id IS NOT NULL
+                    THEN COALESCE(tus.{foreign_col} > COALESCE(tus.last_seen_at, 'epoch'::timestamp), false)
+                    ELSE EXISTS(
+                        SELECT 1 FROM {SCHEMA}.ticket_comments tcnew
+                        WHERE tcnew.ticket_id = t.id
+                          AND tcnew.user_id <> {int(user_id)}
+                          {_internal_filter.format(alias='tcnew')}
+                    )
+               END AS has_new{cursor_select}
+        FROM {list_from}
+        LEFT JOIN {SCHEMA}.ticket_user_state tus ON tus.ticket_id = t.id AND tus.user_id = {int(user_id)}
+        {rank_join_sql}
+        {page_where_clause}
+        {order_by_clause}
+        LIMIT %s OFFSET %s
+    """
+    # Без total берём на одну строку больше, чтобы понять, есть ли следующая страница
+    fetch_extra = cursor_mode or total is None
+    cur.execute(main_query, rank_params + page_params + [limit + 1 if fetch_extra else limit, 0 if cursor_mode else offset])
+    tickets = [dict(row) for row in cur.fetchall()]
+
+    has_more = len(tickets) > limit
+    if fetch_extra:
+        tickets = tickets[:limit]
+
+    next_cursor = None
+    if cursor_mode:
+        if has_more and tickets:
+            last = tickets[-1]
+            next_cursor = _encode_ticket_cursor(sort_key, sort_dir_sql, last.get('cursor_sort_key'), last['id'])
+        for t in tickets:
+            t.pop('cursor_sort_key', None)
+    
+    if tickets:
+        ticket_ids = [t['id'] for t in tickets]
+        ticket_id_map = {t['id']: t for t in tickets}
+        for t in tickets:
+            t['custom_fields'] = []
+            if not use_projection:
                 t['services'] = []
                 t['ticket_service'] = None
-                t['custom_fields'] = []
                 t['sla_violation_count'] = 0
-            
-            ids_str = ','.join(str(int(i)) for i in ticket_ids)
-            
+        
+        ids_str = ','.join(str(int(i)) for i in ticket_ids)
+        
+        cur.execute(f"""
+            SELECT tcfv.ticket_id, cf.id, cf.name, cf.field_type, tcfv.value, cf.hide_label
+            FROM {SCHEMA}.ticket_custom_field_values tcfv
+            JOIN {SCHEMA}.ticket_custom_fields cf ON tcfv.field_id = cf.id
+            WHERE tcfv.ticket_id IN ({ids_str})
+        """)
+        cf_by_ticket = {}
+        for row in cur.fetchall():
+            r = dict(row)
+            tid = r.pop('ticket_id')
+            cf_by_ticket.setdefault(tid, []).append(r)
+        org_cache = None
+        if any(
+            f.get('field_type') == 'company_structure' and f.get('value')
+            for fields in cf_by_ticket.values() for f in fields
+        ):
+            org_cache = _load_org_structure_cache(cur)
+        for tid, fields in cf_by_ticket.items():
+            if tid in ticket_id_map:
+                ticket_id_map[tid]['custom_fields'] = resolve_custom_field_values(fields, cur, org_cache)
+
+        if use_projection:
+            for t in tickets:
+                lc_row = t.get('last_comment')
+                if lc_row and lc_row.get('comment'):
+                    lc_row['comment'] = _strip_heavy_inline_images(lc_row['comment'], lc_row.get('id') or 0)
+        else:
             cur.execute(f"""
                 SELECT tsm.ticket_id, s.id, s.name, sc.name as category_name
                 FROM {SCHEMA}.ticket_to_service_mappings tsm
@@ -1735,7 +1869,7 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
                 tid = r.pop('ticket_id')
                 if tid in ticket_id_map:
                     ticket_id_map[tid]['services'].append(r)
-            
+        
             cur.execute(f"""
                 SELECT tsm.ticket_id, ts.id, ts.name
                 FROM {SCHEMA}.ticket_to_service_mappings tsm
@@ -1748,28 +1882,7 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
                 tid = r.pop('ticket_id')
                 if tid in ticket_id_map and ticket_id_map[tid]['ticket_service'] is None:
                     ticket_id_map[tid]['ticket_service'] = r
-            
-            cur.execute(f"""
-                SELECT tcfv.ticket_id, cf.id, cf.name, cf.field_type, tcfv.value, cf.hide_label
-                FROM {SCHEMA}.ticket_custom_field_values tcfv
-                JOIN {SCHEMA}.ticket_custom_fields cf ON tcfv.field_id = cf.id
-                WHERE tcfv.ticket_id IN ({ids_str})
-            """)
-            cf_by_ticket = {}
-            for row in cur.fetchall():
-                r = dict(row)
-                tid = r.pop('ticket_id')
-                cf_by_ticket.setdefault(tid, []).append(r)
-            org_cache = None
-            if any(
-                f.get('field_type') == 'company_structure' and f.get('value')
-                for fields in cf_by_ticket.values() for f in fields
-            ):
-                org_cache = _load_org_structure_cache(cur)
-            for tid, fields in cf_by_ticket.items():
-                if tid in ticket_id_map:
-                    ticket_id_map[tid]['custom_fields'] = resolve_custom_field_values(fields, cur, org_cache)
-            
+        
             cur.execute(f"""
                 SELECT ticket_id, COUNT(*) AS cnt
                 FROM {SCHEMA}.sla_violations
@@ -1805,10 +1918,29 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
                 if r.get('created_at') is not None:
                     r['created_at'] = str(r['created_at'])
                 ticket_id_map[tid]['last_comment'] = r
-        
-        cur.close()
-        pages = (total + limit - 1) // limit
-        return response(200, {'tickets': tickets, 'total': total, 'page': page, 'limit': limit, 'pages': pages})
+    
+    cur.close()
+    pages = (total + limit - 1) // limit if total is not None else None
+    result = {'tickets': tickets, 'total': total, 'page': page, 'limit': limit, 'pages': pages}
+    if count_mode != 'exact':
+        result['total_is_estimate'] = total_is_estimate
+        result['has_more'] = has_more if fetch_extra else page < (pages or 0)
+    if cursor_mode:
+        result['next_cursor'] = next_cursor
+    return 200, result
+
+
+def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
+    payload = verify_token(event)
+    if not payload:
+        return response(401, {'error': 'Требуется авторизация'})
+    
+    user_id = payload.get('user_id')
+
+    if method == 'GET':
+        query_params = event.get('queryStringParameters', {}) or {}
+        status_code, body = _list_tickets(conn, user_id, query_params)
+        return response(status_code, body)
     
     elif method == 'POST':
         body = json.loads(event.get('body', '{}'))
@@ -1869,7 +2001,6 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
                         executor_group_id = default_group_id
 
             if executor_group_id and not assigned_to:
-                from executor_assignment_resolver import pick_member_for_group
                 picked = pick_member_for_group(cur, SCHEMA, executor_group_id)
                 if picked:
                     assigned_to = picked
@@ -1881,18 +2012,32 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
 
         due_date_sql = 'NULL'
         response_due_date_sql = 'NULL'
+        sla_due_params: list = []
         try:
             sla = resolve_sla_for_ticket(cur, data.ticket_service_id, data.service_ids)
             if sla:
-                if sla.get('resolution_time_minutes'):
-                    due_date_sql = f"NOW() + INTERVAL '{int(sla['resolution_time_minutes'])} minutes'"
-                if sla.get('response_time_minutes'):
-                    response_due_date_sql = f"NOW() + INTERVAL '{int(sla['response_time_minutes'])} minutes'"
+                if sla.get('use_work_schedule') and executor_group_id:
+                    # Сроки в рабочих минутах по графикам группы исполнителей
+                    due_date, response_due_date = sla_deadlines(
+                        cur, sla, executor_group_id, db_now(cur)
+                    )
+                    if due_date:
+                        due_date_sql = '%s'
+                        sla_due_params.append(due_date)
+                    if response_due_date:
+                        response_due_date_sql = '%s'
+                        sla_due_params.append(response_due_date)
+                else:
+                    if sla.get('resolution_time_minutes'):
+                        due_date_sql = f"NOW() + INTERVAL '{int(sla['resolution_time_minutes'])} minutes'"
+                    if sla.get('response_time_minutes'):
+                        response_due_date_sql = f"NOW() + INTERVAL '{int(sla['response_time_minutes'])} minutes'"
         except Exception as e:
             print(f"[TICKETS] SLA resolve error on create: {e}\n{traceback.format_exc()}")
             conn.rollback()
             due_date_sql = 'NULL'
             response_due_date_sql = 'NULL'
+            sla_due_params = []
 
         # Дедлайн по умолчанию: если SLA не задал срок решения и заявка создаётся
         # без указанного дедлайна — ставим N рабочих дней (по умолчанию 1),
@@ -1930,7 +2075,8 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
                 priority_id,
                 assigned_to,
                 executor_group_id,
-                payload['user_id']
+                payload['user_id'],
+                *sla_due_params
             ))
         except Exception as e:
             print(f"[TICKETS] INSERT ticket error on create: {e}\n{traceback.format_exc()}")
@@ -2014,6 +2160,12 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
         except Exception as e:
             print(f"[TICKETS] notify on create error: {e}")
 
+        if ticket.get('assigned_to'):
+            origin = (event.get('headers', {}).get('Origin') or event.get('headers', {}).get('origin') or '').rstrip('/')
+            enqueue_notification(cur, 'executor_assigned', ticket['id'],
+                                 {'user_id': ticket['assigned_to'], 'app_origin': origin})
+
+        refresh_ticket_list_rows(cur, [ticket['id']])
         conn.commit()
 
         # Фиксируем начало работы группы в ticket_group_log
@@ -2054,17 +2206,6 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
             if assignee:
                 ticket['assignee_name'] = assignee['full_name']
                 ticket['assignee_email'] = assignee['email']
-            
-            try:
-                origin = (event.get('headers', {}).get('Origin') or event.get('headers', {}).get('origin') or '').rstrip('/')
-                notify_executor_assigned(cur, SCHEMA, ticket['id'], ticket['assigned_to'], origin)
-            except Exception as e:
-                print(f"[TICKETS] Bitrix notification error on create: {e}")
-            try:
-                origin = (event.get('headers', {}).get('Origin') or event.get('headers', {}).get('origin') or '').rstrip('/')
-                max_notify_executor_assigned(cur, SCHEMA, ticket['id'], ticket['assigned_to'], origin)
-            except Exception as e:
-                print(f"[TICKETS] MAX notification error on create: {e}")
 
         try:
             origin_for_rules = (event.get('headers', {}).get('Origin') or event.get('headers', {}).get('origin') or '').rstrip('/')
@@ -2111,20 +2252,7 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
         def _can_edit_content() -> bool:
             if old_ticket.get('created_by') == user_id:
                 return True
-            cur.execute(f"""
-                SELECT 1
-                FROM {SCHEMA}.user_roles ur
-                JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-                LEFT JOIN {SCHEMA}.role_permissions rp ON rp.role_id = ur.role_id
-                LEFT JOIN {SCHEMA}.permissions p ON p.id = rp.permission_id
-                WHERE ur.user_id = %s
-                  AND (
-                        (p.resource = 'tickets' AND p.action = 'edit_content')
-                        OR r.name IN ('Администратор', 'Admin')
-                      )
-                LIMIT 1
-            """, (user_id,))
-            return cur.fetchone() is not None
+            return _has_ticket_permission(cur, user_id, 'edit_content')
 
         # Проверка прав на редактирование содержания (только если реально что-то меняется)
         _content_changed_title = 'title' in body and body.get('title') != old_ticket.get('title')
@@ -2289,21 +2417,43 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
                     svc_ids = [r['service_id'] for r in svc_rows if r['service_id']]
                     ts_id = next((r['ticket_service_id'] for r in svc_rows if r['ticket_service_id']), None)
                     sla = resolve_sla_for_ticket(cur, ts_id, svc_ids)
-                    if sla and sla.get('resolution_time_minutes'):
-                        update_fields.append(
-                            f"due_date = NOW() + INTERVAL '{int(sla['resolution_time_minutes'])} minutes'"
-                        )
-                    if sla and sla.get('response_time_minutes'):
-                        update_fields.append(
-                            f"response_due_date = NOW() + INTERVAL '{int(sla['response_time_minutes'])} minutes'"
-                        )
+                    reopen_group_id = body.get('executor_group_id', old_ticket.get('executor_group_id'))
+                    if sla and sla.get('use_work_schedule') and reopen_group_id:
+                        due_date, response_due_date = sla_deadlines(cur, sla, reopen_group_id, db_now(cur))
+                        if due_date:
+                            update_fields.append("due_date = %s")
+                            params.append(due_date)
+                        if response_due_date:
+                            update_fields.append("response_due_date = %s")
+                            params.append(response_due_date)
+                    else:
+                        if sla and sla.get('resolution_time_minutes'):
+                            update_fields.append(
+                                f"due_date = NOW() + INTERVAL '{int(sla['resolution_time_minutes'])} minutes'"
+                            )
+                        if sla and sla.get('response_time_minutes'):
+                            update_fields.append(
+                                f"response_due_date = NOW() + INTERVAL '{int(sla['response_time_minutes'])} minutes'"
+                            )
                     update_fields.append("sla_paused_at = NULL")
                     update_fields.append("sla_paused_total_seconds = 0")
                     update_fields.append("previous_status_id = NULL")
                     update_fields.append("waiting_reminder_sent_at = NULL")
                 elif (not is_pausing) and was_pausing:
                     # Снятие паузы (не из закрытого статуса): сдвигаем дедлайн на длительность паузы.
-                    if old_ticket.get('sla_paused_at'):
+                    # Для SLA с графиком пауза и остаток срока считаются в рабочих минутах.
+                    resumed = sla_resume_business(cur, ticket_id, old_ticket)
+                    if resumed:
+                        paused_sec, due_date, response_due_date = resumed
+                        update_fields.append(
+                            "sla_paused_total_seconds = COALESCE(sla_paused_total_seconds, 0) + %s"
+                        )
+                        params.append(paused_sec)
+                        update_fields.append("due_date = %s")
+                        params.append(due_date)
+                        update_fields.append("response_due_date = %s")
+                        params.append(response_due_date)
+                    elif old_ticket.get('sla_paused_at'):
                         cur.execute(
                             "SELECT EXTRACT(EPOCH FROM (NOW() - %s))::INTEGER AS sec",
                             (old_ticket['sla_paused_at'],),
@@ -2333,20 +2483,7 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
         
         if 'assigned_to' in body:
             if body['assigned_to'] != old_ticket['assigned_to']:
-                cur.execute(f"""
-                    SELECT 1
-                    FROM {SCHEMA}.permissions p
-                    JOIN {SCHEMA}.role_permissions rp ON p.id = rp.permission_id
-                    JOIN {SCHEMA}.user_roles ur ON rp.role_id = ur.role_id
-                    JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-                    WHERE ur.user_id = %s
-                      AND (
-                            (p.resource = 'tickets' AND p.action = 'assign_executor')
-                            OR r.name IN ('Администратор', 'Admin')
-                          )
-                    LIMIT 1
-                """, (user_id,))
-                if not cur.fetchone():
+                if not _has_ticket_permission(cur, user_id, 'assign_executor'):
                     cur.close()
                     return response(403, {'error': 'Недостаточно прав для смены исполнителя'})
                 history_entries.append(('assigned_to', get_user_name(old_ticket['assigned_to']) or 'Не назначен', get_user_name(body['assigned_to']) or 'Снят с назначения'))
@@ -2392,20 +2529,7 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
             old_due_date_str = old_ticket['due_date'].isoformat() if old_ticket['due_date'] else None
             new_due_date_str = body['due_date']
             if new_due_date_str != old_due_date_str:
-                cur.execute(f"""
-                    SELECT 1
-                    FROM {SCHEMA}.permissions p
-                    JOIN {SCHEMA}.role_permissions rp ON p.id = rp.permission_id
-                    JOIN {SCHEMA}.user_roles ur ON rp.role_id = ur.role_id
-                    JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-                    WHERE ur.user_id = %s
-                      AND (
-                            (p.resource = 'tickets' AND p.action = 'edit_deadline')
-                            OR r.name IN ('Администратор', 'Admin')
-                          )
-                    LIMIT 1
-                """, (user_id,))
-                if not cur.fetchone():
+                if not _has_ticket_permission(cur, user_id, 'edit_deadline'):
                     cur.close()
                     return response(403, {'error': 'Недостаточно прав для редактирования дедлайна'})
                 history_entries.append(('due_date', old_due_date_str if old_due_date_str else 'Не установлен', new_due_date_str if new_due_date_str else 'Удален'))
@@ -2664,19 +2788,13 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
         except Exception as e:
             print(f"[TICKETS] group_log update error: {e}")
 
-        conn.commit()
-        
         if 'assigned_to' in body and body['assigned_to'] and body['assigned_to'] != old_ticket.get('assigned_to'):
-            try:
-                origin = (event.get('headers', {}).get('Origin') or event.get('headers', {}).get('origin') or '').rstrip('/')
-                notify_executor_assigned(cur, SCHEMA, ticket_id, body['assigned_to'], origin)
-            except Exception as e:
-                print(f"[TICKETS] Bitrix notification error on assign: {e}")
-            try:
-                origin = (event.get('headers', {}).get('Origin') or event.get('headers', {}).get('origin') or '').rstrip('/')
-                max_notify_executor_assigned(cur, SCHEMA, ticket_id, body['assigned_to'], origin)
-            except Exception as e:
-                print(f"[TICKETS] MAX notification error on assign: {e}")
+            origin = (event.get('headers', {}).get('Origin') or event.get('headers', {}).get('origin') or '').rstrip('/')
+            enqueue_notification(cur, 'executor_assigned', ticket_id,
+                                 {'user_id': body['assigned_to'], 'app_origin': origin})
+
+        refresh_ticket_list_rows(cur, [ticket_id])
+        conn.commit()
 
         try:
             origin_for_rules = (event.get('headers', {}).get('Origin') or event.get('headers', {}).get('origin') or '').rstrip('/')
@@ -2711,6 +2829,7 @@ def handle_tickets(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
         cur.execute(f"DELETE FROM {SCHEMA}.ticket_to_service_mappings WHERE ticket_id = %s", (ticket_id,))
         cur.execute(f"DELETE FROM {SCHEMA}.ticket_custom_field_values WHERE ticket_id = %s", (ticket_id,))
         cur.execute(f"DELETE FROM {SCHEMA}.tickets WHERE id = %s", (ticket_id,))
+        refresh_ticket_list_rows(cur, [ticket_id])
         
         conn.commit()
         cur.close()
@@ -2806,6 +2925,33 @@ def handle_service_categories(method: str, event: Dict[str, Any], conn) -> Dict[
     
     return response(405, {'error': 'Method not allowed'})
 
+def _load_ticket_dictionaries(cur, role_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Справочники заявок; статусы отфильтрованы по ролям (role_info: role_ids, is_admin)."""
+    cur.execute(f'SELECT id, name, icon FROM {SCHEMA}.ticket_categories ORDER BY name')
+    categories = [dict(row) for row in cur.fetchall()]
+    
+    cur.execute(f"SELECT id, name, level, color, COALESCE(description, '') as description, COALESCE(is_critical, false) as is_critical FROM {SCHEMA}.ticket_priorities ORDER BY level DESC")
+    priorities = [dict(row) for row in cur.fetchall()]
+    
+    cur.execute(f'SELECT id, name, color, is_closed, is_approval, is_approval_revoked, is_approved, is_waiting_response, is_pending_confirmation, is_in_progress, COALESCE(is_paused, false) AS is_paused FROM {SCHEMA}.ticket_statuses ORDER BY id')
+    statuses = [dict(row) for row in cur.fetchall()]
+    status_role_map = _load_status_role_map(cur)
+    statuses = _filter_statuses_by_role(statuses, role_info, status_role_map)
+    
+    cur.execute(f'SELECT id, name, description FROM {SCHEMA}.departments ORDER BY name')
+    departments = [dict(row) for row in cur.fetchall()]
+    
+    cur.execute(f'SELECT id, name, field_type, options, is_required FROM {SCHEMA}.ticket_custom_fields ORDER BY name')
+    custom_fields = [dict(row) for row in cur.fetchall()]
+    
+    return {
+        'categories': categories,
+        'priorities': priorities,
+        'statuses': statuses,
+        'departments': departments,
+        'custom_fields': custom_fields
+    }
+
 def handle_ticket_dictionaries(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
     """Обработчик для получения справочников заявок"""
     payload = verify_token(event)
@@ -2818,32 +2964,9 @@ def handle_ticket_dictionaries(method: str, event: Dict[str, Any], conn) -> Dict
     cur = conn.cursor()
     
     try:
-        cur.execute(f'SELECT id, name, icon FROM {SCHEMA}.ticket_categories ORDER BY name')
-        categories = [dict(row) for row in cur.fetchall()]
-        
-        cur.execute(f"SELECT id, name, level, color, COALESCE(description, '') as description, COALESCE(is_critical, false) as is_critical FROM {SCHEMA}.ticket_priorities ORDER BY level DESC")
-        priorities = [dict(row) for row in cur.fetchall()]
-        
-        cur.execute(f'SELECT id, name, color, is_closed, is_approval, is_approval_revoked, is_approved, is_waiting_response, is_pending_confirmation, is_in_progress, COALESCE(is_paused, false) AS is_paused FROM {SCHEMA}.ticket_statuses ORDER BY id')
-        statuses = [dict(row) for row in cur.fetchall()]
-        status_role_map = _load_status_role_map(cur)
         user_id = payload.get('user_id')
         role_info = _get_user_role_info(cur, user_id) if user_id else {'role_ids': [], 'is_admin': False}
-        statuses = _filter_statuses_by_role(statuses, role_info, status_role_map)
-        
-        cur.execute(f'SELECT id, name, description FROM {SCHEMA}.departments ORDER BY name')
-        departments = [dict(row) for row in cur.fetchall()]
-        
-        cur.execute(f'SELECT id, name, field_type, options, is_required FROM {SCHEMA}.ticket_custom_fields ORDER BY name')
-        custom_fields = [dict(row) for row in cur.fetchall()]
-        
-        return response(200, {
-            'categories': categories,
-            'priorities': priorities,
-            'statuses': statuses,
-            'departments': departments,
-            'custom_fields': custom_fields
-        })
+        return response(200, _load_ticket_dictionaries(cur, role_info))
     
     except Exception as e:
         return response(500, {'error': str(e)})
@@ -2972,6 +3095,7 @@ def handle_ticket_statuses(method: str, event: Dict[str, Any], conn) -> Dict[str
             f"UPDATE {SCHEMA}.tickets SET is_archived = %s WHERE status_id = %s AND COALESCE(is_archived, false) <> %s",
             (bool(is_closed), status_id, bool(is_closed))
         )
+        refresh_ticket_list_rows_by_status(cur, status_id)
         
         conn.commit()
         cur.close()
@@ -2992,6 +3116,53 @@ def handle_ticket_statuses(method: str, event: Dict[str, Any], conn) -> Dict[str
     
     return response(405, {'error': 'Method not allowed'})
 
+def _load_ticket_services(cur) -> List[Dict[str, Any]]:
+    """Активные услуги заявок со связанными сервисами и списком видимости.
+
+    Связи добираются двумя запросами на все услуги сразу, а не парой запросов на каждую.
+    """
+    cur.execute(f'''
+        SELECT ts.id, ts.name, ts.description, ts.ticket_title, ts.category_id, 
+               tsc.name as category_name, ts.created_at 
+        FROM {SCHEMA}.ticket_services ts
+        LEFT JOIN {SCHEMA}.ticket_service_categories tsc ON ts.category_id = tsc.id
+        WHERE ts.is_active = true
+        ORDER BY ts.name
+    ''')
+    rows = cur.fetchall()
+    ids = [row['id'] for row in rows]
+    service_ids_map: Dict[int, List[int]] = {i: [] for i in ids}
+    visible_map: Dict[int, List[int]] = {i: [] for i in ids}
+    if ids:
+        cur.execute(f'''
+            SELECT ticket_service_id, service_id
+            FROM {SCHEMA}.ticket_service_mappings
+            WHERE ticket_service_id = ANY(%s)
+        ''', (ids,))
+        for r in cur.fetchall():
+            service_ids_map[r['ticket_service_id']].append(r['service_id'])
+
+        cur.execute(f'''
+            SELECT ticket_service_id, user_id
+            FROM {SCHEMA}.ticket_service_visible_users
+            WHERE ticket_service_id = ANY(%s)
+        ''', (ids,))
+        for r in cur.fetchall():
+            visible_map[r['ticket_service_id']].append(r['user_id'])
+
+    return [{
+        'id': row['id'],
+        'name': row['name'],
+        'description': row['description'] or '',
+        'ticket_title': row['ticket_title'] or '',
+        'category_id': row['category_id'],
+        'category_name': row['category_name'],
+        'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+        'service_ids': service_ids_map[row['id']],
+        'visible_to_user_ids': visible_map[row['id']],
+    } for row in rows]
+
+
 def handle_ticket_services(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
     """Обработчик для управления услугами заявок (ticket_services)"""
     payload = verify_token(event)
@@ -3002,42 +3173,7 @@ def handle_ticket_services(method: str, event: Dict[str, Any], conn) -> Dict[str
     
     try:
         if method == 'GET':
-            cur.execute(f'''
-                SELECT ts.id, ts.name, ts.description, ts.ticket_title, ts.category_id, 
-                       tsc.name as category_name, ts.created_at 
-                FROM {SCHEMA}.ticket_services ts
-                LEFT JOIN {SCHEMA}.ticket_service_categories tsc ON ts.category_id = tsc.id
-                WHERE ts.is_active = true
-                ORDER BY ts.name
-            ''')
-            rows = cur.fetchall()
-            ticket_services = []
-            for row in rows:
-                cur.execute(f'''
-                    SELECT service_id 
-                    FROM {SCHEMA}.ticket_service_mappings 
-                    WHERE ticket_service_id = %s
-                ''', (row['id'],))
-                service_ids = [r['service_id'] for r in cur.fetchall()]
-                
-                cur.execute(f'''
-                    SELECT user_id 
-                    FROM {SCHEMA}.ticket_service_visible_users 
-                    WHERE ticket_service_id = %s
-                ''', (row['id'],))
-                visible_to_user_ids = [r['user_id'] for r in cur.fetchall()]
-                
-                ticket_services.append({
-                    'id': row['id'],
-                    'name': row['name'],
-                    'description': row['description'] or '',
-                    'ticket_title': row['ticket_title'] or '',
-                    'category_id': row['category_id'],
-                    'category_name': row['category_name'],
-                    'created_at': row['created_at'].isoformat() if row['created_at'] else None,
-                    'service_ids': service_ids,
-                    'visible_to_user_ids': visible_to_user_ids
-                })
+            ticket_services = _load_ticket_services(cur)
             return response(200, ticket_services)
         
         elif method == 'POST':
@@ -3214,6 +3350,21 @@ def handle_ticket_service_mappings(method: str, event: Dict[str, Any], conn) ->
     finally:
         cur.close()
 
+
+def _load_ticket_approvals(cur, ticket_id: int) -> List[Dict[str, Any]]:
+    """Согласования заявки (новые сверху) с данными согласующего"""
+    cur.execute(f"""
+        SELECT ta.id, ta.ticket_id, ta.approver_id, ta.status, ta.comment, 
+               ta.created_at, ta.updated_at,
+               u.full_name as approver_name, u.email as approver_email, u.photo_url as approver_photo_url
+        FROM {SCHEMA}.ticket_approvals ta
+        LEFT JOIN {SCHEMA}.users u ON ta.approver_id = u.id
+        WHERE ta.ticket_id = %s
+        ORDER BY ta.created_at DESC
+    """, (ticket_id,))
+    return [dict(row) for row in cur.fetchall()]
+
+
 def handle_ticket_approvals(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
     """Обработчик для управления согласованиями заявок"""
     payload = verify_token(event)
@@ -3230,17 +3381,7 @@ def handle_ticket_approvals(method: str, event: Dict[str, Any], conn) -> Dict[st
             if not ticket_id:
                 return response(400, {'error': 'ticket_id is required'})
             
-            cur.execute(f"""
-                SELECT ta.id, ta.ticket_id, ta.approver_id, ta.status, ta.comment, 
-                       ta.created_at, ta.updated_at,
-                       u.full_name as approver_name, u.email as approver_email, u.photo_url as approver_photo_url
-                FROM {SCHEMA}.ticket_approvals ta
-                LEFT JOIN {SCHEMA}.users u ON ta.approver_id = u.id
-                WHERE ta.ticket_id = %s
-                ORDER BY ta.created_at DESC
-            """, (ticket_id,))
-            approvals = [dict(row) for row in cur.fetchall()]
-            return response(200, approvals)
+            return response(200, _load_ticket_approvals(cur, ticket_id))
         
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
@@ -3251,20 +3392,7 @@ def handle_ticket_approvals(method: str, event: Dict[str, Any], conn) -> Dict[st
                 return response(400, {'error': 'ticket_id and approver_ids are required'})
             
             approver_user_id = payload.get('user_id')
-            cur.execute(f"""
-                SELECT 1
-                FROM {SCHEMA}.permissions p
-                JOIN {SCHEMA}.role_permissions rp ON p.id = rp.permission_id
-                JOIN {SCHEMA}.user_roles ur ON rp.role_id = ur.role_id
-                JOIN {SCHEMA}.roles r ON r.id = ur.role_id
-                WHERE ur.user_id = %s
-                  AND (
-                        (p.resource = 'tickets' AND p.action = 'edit_approvers')
-                        OR r.name IN ('Администратор', 'Admin')
-                      )
-                LIMIT 1
-            """, (approver_user_id,))
-            if not cur.fetchone():
+            if not _has_ticket_permission(cur, approver_user_id, 'edit_approvers'):
                 return response(403, {'error': 'Недостаточно прав для назначения согласующих'})
             
             for approver_id in approver_ids:
@@ -3358,6 +3486,7 @@ def handle_ticket_approvals(method: str, event: Dict[str, Any], conn) -> Dict[st
                             WHERE id = %s
                         """, (revoked_status['id'], ticket_id))
             
+            refresh_ticket_list_rows(cur, [ticket_id])
             conn.commit()
             return response(200, {'message': f'Ticket {action} successfully'})
         
@@ -3413,6 +3542,7 @@ def handle_ticket_confirmation(method: str, event: dict, conn) -> dict:
                 VALUES (%s, %s, 'status_id', %s, %s, NOW())
             """, (ticket_id, user_id, _old_name, _new_name))
 
+            refresh_ticket_list_rows(cur, [ticket_id])
             conn.commit()
             return response(200, {'message': 'Заявка отправлена на подтверждение заказчику'})
 
@@ -3465,6 +3595,7 @@ def handle_ticket_confirmation(method: str, event: dict, conn) -> dict:
                     VALUES (%s, %s, 'status_id', %s, %s, NOW())
                 """, (ticket_id, user_id, _old_name, _new_name))
 
+                refresh_ticket_list_rows(cur, [ticket_id])
                 conn.commit()
                 return response(200, {'message': 'Заявка подтверждена и закрыта', 'rating': int(rating)})
 
@@ -3498,6 +3629,7 @@ def handle_ticket_confirmation(method: str, event: dict, conn) -> dict:
                     VALUES (%s, %s, 'status_id', %s, %s, NOW())
                 """, (ticket_id, user_id, _old_name, _new_name))
 
+                refresh_ticket_list_rows(cur, [ticket_id])
                 conn.commit()
                 return response(200, {'message': 'Заявка возвращена в работу'})
 
@@ -3565,6 +3697,15 @@ def handle_ticket_watchers(method: str, event: dict, conn) -> dict:
                     VALUES (%s, %s, 'watcher_added', NULL, %s, false, NOW())
                 """, (ticket_id, user_id, watcher_name))
 
+            # Уведомление в Битрикс- и MAX-бот (только если реально добавили нового, не сами себя)
+            if really_inserted and int(watcher_user_id) != int(payload.get('user_id') or 0):
+                headers = event.get('headers') or {}
+                enqueue_notification(cur, 'watcher_added', int(ticket_id), {
+                    'user_id': int(watcher_user_id),
+                    'actor_user_id': int(payload.get('user_id') or 0),
+                    'app_origin': headers.get('Origin') or headers.get('origin') or '',
+                })
+
             conn.commit()
 
             # Уведомление новому наблюдателю
@@ -3577,32 +3718,6 @@ def handle_ticket_watchers(method: str, event: dict, conn) -> dict:
                 """, (watcher_user_id, ticket_id, f'Вы добавлены как наблюдатель к заявке: {ticket_row["title"]}'))
                 conn.commit()
 
-            # Уведомление в Битрикс-бот (только если реально добавили нового, не сами себя)
-            if really_inserted and int(watcher_user_id) != int(payload.get('user_id') or 0):
-                try:
-                    from bitrix_bot_notifier import notify_watcher_added
-                    headers = event.get('headers') or {}
-                    app_origin = headers.get('Origin') or headers.get('origin') or ''
-                    notify_watcher_added(
-                        cur, SCHEMA, int(ticket_id), int(watcher_user_id),
-                        actor_user_id=int(payload.get('user_id') or 0),
-                        app_origin=app_origin,
-                    )
-                except Exception as bot_err:
-                    print(f"[bitrix-bot] watcher_added notification failed: {bot_err}")
-
-                # Уведомление в MAX-бот
-                try:
-                    headers = event.get('headers') or {}
-                    app_origin = headers.get('Origin') or headers.get('origin') or ''
-                    max_notify_watcher_added(
-                        cur, SCHEMA, int(ticket_id), int(watcher_user_id),
-                        actor_user_id=int(payload.get('user_id') or 0),
-                        app_origin=app_origin,
-                    )
-                except Exception as bot_err:
-                    print(f"[max-bot] watcher_added notification failed: {bot_err}")
-
             cur.execute(f"""
                 SELECT tw.id, tw.user_id, tw.added_at,
                        u.full_name, u.username as email, u.photo_url
@@ -3647,15 +3762,69 @@ def handle_ticket_watchers(method: str, event: dict, conn) -> dict:
         cur.close()
 
 
+@contextmanager
+def _count_db_round_trips(conn):
+    """Считает execute() всех курсоров, открытых на conn внутри блока (для метрик ответа)."""
+    stats = {'queries': 0}
+    base_factory = conn.cursor_factory or psycopg2.extensions.cursor
+
+    class _CountingCursor(base_factory):
+        def execute(self, query, vars=None):
+            stats['queries'] += 1
+            return super().execute(query, vars)
+
+    conn.cursor_factory = _CountingCursor
+    try:
+        yield stats
+    finally:
+        conn.cursor_factory = base_factory
+
+
+def _count_bootstrap_badges(cur, user_id: int, query_params: Dict[str, Any], access: AccessContext):
+    """hidden_count и needs_my_reply_count одним агрегатом COUNT(*) FILTER (...).
+
+    Семантика как у двух вызовов списка с count_only: текущие фильтры запроса плюс
+    is_hidden=true для первого счётчика и needs_my_reply=true для второго.
+    """
+    if not access.view_all_tickets and not access.view_own_only:
+        return 0, 0
+    if access.restricted_user_ids is not None and not access.restricted_user_ids:
+        return 0, 0
+
+    where_clause, where_params = _build_ticket_where(
+        query_params, user_id, access, include_scope=False, include_reply=False,
+    )
+    reply_sql, reply_params = _needs_my_reply_filter(user_id)
+
+    hidden_sql, hidden_params = _ticket_scope_filter({**query_params, 'is_hidden': 'true'}, user_id, access.is_admin)
+    if query_params.get('needs_my_reply') == 'true':
+        hidden_sql += reply_sql
+        hidden_params = hidden_params + reply_params
+
+    scope_sql, scope_params = _ticket_scope_filter(query_params, user_id, access.is_admin)
+
+    cur.execute(f"""
+        SELECT COUNT(*) FILTER (WHERE true {hidden_sql}) AS hidden_count,
+               COUNT(*) FILTER (WHERE true {scope_sql} {reply_sql}) AS needs_my_reply_count
+        FROM {SCHEMA}.tickets t
+        {where_clause}
+    """, hidden_params + scope_params + reply_params + where_params)
+    row = cur.fetchone()
+    return row['hidden_count'], row['needs_my_reply_count']
+
+
 def handle_tickets_bootstrap(method: str, event: dict, conn) -> dict:
     """Объединённая стартовая загрузка страницы «Мои заявки» одним вызовом.
 
     За один поход в БД (одно соединение) возвращает всё для первого рендера,
     чтобы фронт не слал ~6 параллельных запросов и не упирался в rate-limit БД.
+    Контекст доступа пользователя загружается один раз и передаётся в список
+    и счётчики; данные собираются из словарей, без JSON-сериализации ответов.
 
     Возвращает: tickets (список с пагинацией), dictionaries (категории,
     приоритеты, статусы, отделы, доп. поля), ticket_services,
-    hidden_count, needs_my_reply_count.
+    hidden_count, needs_my_reply_count, db_round_trips (число запросов к БД),
+    db_connect_ms и db_conn_reused (сколько стоило получить соединение и было ли оно тёплым).
 
     Параметры запроса — те же, что у endpoint=tickets (page, limit, sort_by,
     sort_dir, фильтры, is_archived, hide_waiting и т.д.).
@@ -3667,49 +3836,220 @@ def handle_tickets_bootstrap(method: str, event: dict, conn) -> dict:
     if not payload:
         return response(401, {'error': 'Требуется авторизация'})
 
+    user_id = payload.get('user_id')
     base_params = event.get('queryStringParameters', {}) or {}
 
-    def _call(handler_fn, extra_params=None):
-        ev = dict(event)
-        ev['queryStringParameters'] = {**base_params, **(extra_params or {})}
-        return handler_fn('GET', ev, conn)
-
-    def _parse(resp, default):
-        if resp.get('statusCode') == 200:
-            try:
-                return json.loads(resp.get('body') or 'null')
-            except (json.JSONDecodeError, TypeError):
-                return default
-        return default
-
-    # 1. Основной список заявок (с текущими фильтрами/сортировкой)
-    tickets_resp = handle_tickets('GET', event, conn)
-    if tickets_resp.get('statusCode') in (401, 403):
-        return tickets_resp
-    tickets_data = _parse(tickets_resp, {'tickets': [], 'total': 0, 'pages': 1})
+    with _count_db_round_trips(conn) as db_stats:
+        cur = conn.cursor()
+        try:
+            access = get_access_context(cur, user_id)
 
-    # 2. Справочники
-    dictionaries = _parse(_call(handle_ticket_dictionaries), {})
+            # 1. Основной список заявок (с текущими фильтрами/сортировкой)
+            status_code, tickets_data = _list_tickets(conn, user_id, base_params, access)
+            if status_code in (401, 403):
+                return response(status_code, tickets_data)
+            if status_code != 200:
+                tickets_data = {'tickets': [], 'total': 0, 'pages': 1}
 
-    # 3. Услуги заявок
-    ticket_services = _parse(_call(handle_ticket_services), [])
+            # 2. Справочники (роли берутся из того же контекста доступа)
+            dictionaries = _load_ticket_dictionaries(cur, _get_user_role_info(cur, user_id))
 
-    # 4. Счётчики: скрытые и «нужен мой ответ» (limit=1, берём только total)
-    hidden_resp = _call(handle_tickets, {'page': '1', 'limit': '1', 'is_hidden': 'true'})
-    hidden_count = _parse(hidden_resp, {}).get('total', 0)
+            # 3. Услуги заявок
+            ticket_services = _load_ticket_services(cur)
 
-    reply_resp = _call(handle_tickets, {'page': '1', 'limit': '1', 'needs_my_reply': 'true'})
-    needs_my_reply_count = _parse(reply_resp, {}).get('total', 0)
+            # 4. Счётчики: скрытые и «нужен мой ответ» — один агрегат
+            hidden_count, needs_my_reply_count = _count_bootstrap_badges(cur, user_id, base_params, access)
+        finally:
+            cur.close()
 
+    db_metrics = get_db_metrics()
     return response(200, {
         'tickets': tickets_data,
         'dictionaries': dictionaries,
         'ticket_services': ticket_services,
         'hidden_count': hidden_count,
         'needs_my_reply_count': needs_my_reply_count,
+        'db_round_trips': db_stats['queries'],
+        'db_connect_ms': round(db_metrics['connect_ms'], 1),
+        'db_conn_reused': db_metrics['reused'],
     })
 
 
+_COMMENTS_PAGE_DEFAULT = 30
+_COMMENTS_PAGE_MAX = 200
+
+
+def _parse_comment_page(before_raw: Any, limit_raw: Any):
+    """(before_id, limit) страницы комментариев.
+
+    Та же семантика, что в api-ticket-comments: без limit — страница по умолчанию
+    из самых новых комментариев. Некорректные значения — ValueError.
+    """
+    before_id = int(before_raw) if before_raw not in (None, '') else None
+    if limit_raw in (None, ''):
+        limit = _COMMENTS_PAGE_DEFAULT
+    else:
+        limit = int(limit_raw)
+        if not 1 <= limit <= _COMMENTS_PAGE_MAX:
+            raise ValueError(f'limit must be between 1 and {_COMMENTS_PAGE_MAX}')
+    return before_id, limit
+
+
+def _load_ticket_full(conn, user_id: int, ticket_id: int, query_params: Dict[str, Any],
+                      include_comments: bool = True, comments_before_id: Optional[int] = None,
+                      comments_limit: Optional[int] = None):
+    """Данные карточки заявки для tickets-full. Возвращает (status_code, body).
+
+    Заявка берётся из _list_tickets (те же права и формат строки, что у списка),
+    согласования — из _load_ticket_approvals, без промежуточной JSON-сериализации.
+    comments_limit/comments_before_id — страница комментариев (новые сверху);
+    вложения грузятся только для неё.
+    """
+    ticket_data = None
+    history: list = []
+    approvals: list = []
+    comments: list = []
+    comments_has_more = False
+    participant_ids: list = []
+    my_last_seen_at = None
+
+    status_code, tickets_body = _list_tickets(conn, user_id, {**query_params, 'ticket_id': str(ticket_id)})
+    if status_code == 200:
+        tickets_list = tickets_body.get('tickets') or []
+        if tickets_list:
+            ticket_data = tickets_list[0]
+    elif status_code in (401, 403, 404):
+        return status_code, tickets_body
+
+    cur = conn.cursor()
+    try:
+        approvals = _load_ticket_approvals(cur, ticket_id)
+
+        # Скрытые (внутренние) события истории видят только Администратор и Исполнитель
+        history_internal_filter = '' if _can_see_internal(cur, user_id) else 'AND th.is_internal = false'
+
+        # История изменений
+        cur.execute(f"""
+            SELECT th.id, th.ticket_id, th.user_id, th.field_name,
+                   th.old_value, th.new_value, th.created_at,
+                   u.username as user_name, u.full_name as user_full_name
+            FROM {SCHEMA}.ticket_history th
+            LEFT JOIN {SCHEMA}.users u ON th.user_id = u.id
+            WHERE th.ticket_id = %s {history_internal_filter}
+            ORDER BY th.created_at DESC
+        """, (ticket_id,))
+        history = [dict(row) for row in cur.fetchall()]
+
+        # Комментарии (облегчённый формат, без read_by/read_by_users —
+        # эти данные не критичны для рендера переписки и догружаются
+        # отдельным запросом при необходимости)
+        if include_comments:
+            # Скрытые (внутренние) комментарии видят только Администратор и Исполнитель;
+            # отсекаем их в SQL, чтобы лимит страницы считал только видимые
+            where = ['tc.ticket_id = %s']
+            comment_params: List[Any] = [ticket_id]
+            if not _can_see_internal(cur, user_id):
+                where.append('tc.is_internal = false')
+            if comments_before_id is not None:
+                where.append(f"""(tc.created_at, tc.id) < (
+                    SELECT b.created_at, b.id FROM {SCHEMA}.ticket_comments b
+                    WHERE b.id = %s AND b.ticket_id = %s
+                )""")
+                comment_params.extend([comments_before_id, ticket_id])
+            limit_sql = ''
+            if comments_limit is not None:
+                limit_sql = 'LIMIT %s'
+                comment_params.append(comments_limit + 1)
+
+            cur.execute(f"""
+                SELECT 
+                    tc.id, tc.ticket_id, tc.user_id, tc.comment,
+                    tc.is_internal, tc.created_at,
+                    tc.is_pinned, tc.pinned_at, tc.pinned_by,
+                    tc.edited_at, tc.edited_by,
+                    u.username as user_name,
+                    u.full_name as user_full_name,
+                    u.photo_url as user_photo_url
+                FROM {SCHEMA}.ticket_comments tc
+                LEFT JOIN {SCHEMA}.users u ON tc.user_id = u.id
+                WHERE {' AND '.join(where)}
+                ORDER BY tc.created_at DESC, tc.id DESC
+                {limit_sql}
+            """, tuple(comment_params))
+            comments = [dict(row) for row in cur.fetchall()]
+            if comments_limit is not None and len(comments) > comments_limit:
+                comments = comments[:comments_limit]
+                comments_has_more = True
+
+            # Вырезаем тяжёлые inline base64-картинки, помечая флагом
+            for c in comments:
+                original = c.get('comment') or ''
+                if 'base64,' in original:
+                    stripped = _strip_heavy_inline_images(original, c['id'])
+                    if stripped != original:
+                        c['comment'] = stripped
+                        c['has_inline_images'] = True
+
+            comment_ids = [c['id'] for c in comments]
+            if comment_ids:
+                ids_csv = ','.join(str(int(i)) for i in comment_ids)
+                attachments_map: Dict[int, List[Dict[str, Any]]] = {cid: [] for cid in comment_ids}
+                cur.execute(f"""
+                    SELECT id, comment_id, filename, url, size
+                    FROM {SCHEMA}.comment_attachments
+                    WHERE comment_id IN ({ids_csv})
+                    ORDER BY id ASC
+                """)
+                for r in cur.fetchall():
+                    attachments_map.setdefault(r['comment_id'], []).append({
+                        'id': r['id'],
+                        'filename': r['filename'],
+                        'url': r['url'],
+                        'size': r['size'],
+                    })
+                for c in comments:
+                    c['attachments'] = attachments_map.get(c['id'], [])
+            else:
+                for c in comments:
+                    c['attachments'] = []
+
+            # participant_ids
+            pids: Set[int] = set()
+            if ticket_data:
+                if ticket_data.get('created_by'):
+                    pids.add(ticket_data['created_by'])
+                if ticket_data.get('assigned_to'):
+                    pids.add(ticket_data['assigned_to'])
+            cur.execute(f"SELECT user_id FROM {SCHEMA}.ticket_watchers WHERE ticket_id = %s", (ticket_id,))
+            pids.update(r['user_id'] for r in cur.fetchall())
+            cur.execute(f"SELECT approver_id FROM {SCHEMA}.ticket_approvers WHERE ticket_id = %s", (ticket_id,))
+            pids.update(r['approver_id'] for r in cur.fetchall())
+            participant_ids = sorted(pids)
+
+            # my_last_seen_at
+            if user_id:
+                cur.execute(f"""
+                    SELECT last_seen_at FROM {SCHEMA}.ticket_views
+                    WHERE user_id = %s AND ticket_id = %s
+                """, (user_id, ticket_id))
+                row = cur.fetchone()
+                if row and row.get('last_seen_at'):
+                    my_last_seen_at = row['last_seen_at'].isoformat()
+    finally:
+        cur.close()
+
+    return 200, {
+        'ticket': ticket_data,
+        'history': history,
+        'approvals': approvals,
+        'comments': comments,
+        'comments_has_more': comments_has_more,
+        'comments_next_before_id': comments[-1]['id'] if comments_has_more else None,
+        'participant_ids': participant_ids,
+        'my_last_seen_at': my_last_seen_at,
+    }
+
+
 def handle_tickets_full(method: str, event: dict, conn) -> dict:
     """Объединённая загрузка данных заявки одним вызовом.
 
@@ -3720,6 +4060,9 @@ def handle_tickets_full(method: str, event: dict, conn) -> dict:
     Параметры:
       ticket_id (обязателен) — id заявки
       include_comments (опционально, default=true) — выключатель для лёгкого режима
+      comments_limit, comments_before_id (опционально) — страница комментариев,
+        как limit/before_id в api-ticket-comments (по умолчанию — самые новые);
+        в ответе comments_has_more и comments_next_before_id
     """
     if method != 'GET':
         return response(405, {'error': 'Only GET method allowed'})
@@ -3741,145 +4084,15 @@ def handle_tickets_full(method: str, event: dict, conn) -> dict:
     include_comments_raw = (params.get('include_comments') or 'true').lower()
     include_comments = include_comments_raw not in ('false', '0', 'no')
 
-    user_id = payload.get('user_id')
-
-    ticket_data = None
-    history: list = []
-    approvals: list = []
-    comments: list = []
-    participant_ids: list = []
-    my_last_seen_at = None
-
     try:
-        ticket_event = dict(event)
-        ticket_event['queryStringParameters'] = {
-            **(event.get('queryStringParameters') or {}),
-            'ticket_id': str(ticket_id),
-        }
-        tickets_resp = handle_tickets('GET', ticket_event, conn)
-        if tickets_resp.get('statusCode') == 200:
-            try:
-                body = json.loads(tickets_resp.get('body') or '{}')
-                tickets_list = body.get('tickets') or []
-                if tickets_list:
-                    ticket_data = tickets_list[0]
-            except (json.JSONDecodeError, TypeError):
-                ticket_data = None
-        elif tickets_resp.get('statusCode') in (401, 403, 404):
-            return tickets_resp
-
-        approvals_resp = handle_ticket_approvals('GET', ticket_event, conn)
-        if approvals_resp.get('statusCode') == 200:
-            try:
-                approvals = json.loads(approvals_resp.get('body') or '[]') or []
-            except (json.JSONDecodeError, TypeError):
-                approvals = []
+        comments_before_id, comments_limit = _parse_comment_page(
+            params.get('comments_before_id'), params.get('comments_limit'))
+    except ValueError as e:
+        return response(400, {'error': f'Invalid comments pagination: {e}'})
 
-        cur = conn.cursor()
-        try:
-            # Скрытые (внутренние) события истории видят только Администратор и Исполнитель
-            history_internal_filter = '' if _can_see_internal(cur, user_id) else 'AND th.is_internal = false'
-
-            # История изменений
-            cur.execute(f"""
-                SELECT th.id, th.ticket_id, th.user_id, th.field_name,
-                       th.old_value, th.new_value, th.created_at,
-                       u.username as user_name, u.full_name as user_full_name
-                FROM {SCHEMA}.ticket_history th
-                LEFT JOIN {SCHEMA}.users u ON th.user_id = u.id
-                WHERE th.ticket_id = %s {history_internal_filter}
-                ORDER BY th.created_at DESC
-            """, (ticket_id,))
-            history = [dict(row) for row in cur.fetchall()]
-
-            # Комментарии (облегчённый формат, без read_by/read_by_users —
-            # эти данные не критичны для рендера переписки и догружаются
-            # отдельным запросом при необходимости)
-            if include_comments:
-                cur.execute(f"""
-                    SELECT 
-                        tc.id, tc.ticket_id, tc.user_id, tc.comment,
-                        tc.is_internal, tc.created_at,
-                        tc.is_pinned, tc.pinned_at, tc.pinned_by,
-                        tc.edited_at, tc.edited_by,
-                        u.username as user_name,
-                        u.full_name as user_full_name,
-                        u.photo_url as user_photo_url
-                    FROM {SCHEMA}.ticket_comments tc
-                    LEFT JOIN {SCHEMA}.users u ON tc.user_id = u.id
-                    WHERE tc.ticket_id = %s
-                    ORDER BY tc.created_at DESC
-                """, (ticket_id,))
-                comments = [dict(row) for row in cur.fetchall()]
-
-                # Скрытые (внутренние) комментарии видят только Администратор и Исполнитель
-                if not _can_see_internal(cur, user_id):
-                    comments = [c for c in comments if not c.get('is_internal')]
-
-                # Вырезаем тяжёлые inline base64-картинки, помечая флагом
-                for c in comments:
-                    original = c.get('comment') or ''
-                    if 'base64,' in original:
-                        stripped = _strip_heavy_inline_images(original, c['id'])
-                        if stripped != original:
-                            c['comment'] = stripped
-                            c['has_inline_images'] = True
-
-                comment_ids = [c['id'] for c in comments]
-                if comment_ids:
-                    ids_csv = ','.join(str(int(i)) for i in comment_ids)
-                    attachments_map: Dict[int, List[Dict[str, Any]]] = {cid: [] for cid in comment_ids}
-                    cur.execute(f"""
-                        SELECT id, comment_id, filename, url, size
-                        FROM {SCHEMA}.comment_attachments
-                        WHERE comment_id IN ({ids_csv})
-                        ORDER BY id ASC
-                    """)
-                    for r in cur.fetchall():
-                        attachments_map.setdefault(r['comment_id'], []).append({
-                            'id': r['id'],
-                            'filename': r['filename'],
-                            'url': r['url'],
-                            'size': r['size'],
-                        })
-                    for c in comments:
-                        c['attachments'] = attachments_map.get(c['id'], [])
-                else:
-                    for c in comments:
-                        c['attachments'] = []
-
-                # participant_ids
-                pids: Set[int] = set()
-                if ticket_data:
-                    if ticket_data.get('created_by'):
-                        pids.add(ticket_data['created_by'])
-                    if ticket_data.get('assigned_to'):
-                        pids.add(ticket_data['assigned_to'])
-                cur.execute(f"SELECT user_id FROM {SCHEMA}.ticket_watchers WHERE ticket_id = %s", (ticket_id,))
-                pids.update(r['user_id'] for r in cur.fetchall())
-                cur.execute(f"SELECT approver_id FROM {SCHEMA}.ticket_approvers WHERE ticket_id = %s", (ticket_id,))
-                pids.update(r['approver_id'] for r in cur.fetchall())
-                participant_ids = sorted(pids)
-
-                # my_last_seen_at
-                if user_id:
-                    cur.execute(f"""
-                        SELECT last_seen_at FROM {SCHEMA}.ticket_views
-                        WHERE user_id = %s AND ticket_id = %s
-                    """, (user_id, ticket_id))
-                    row = cur.fetchone()
-                    if row and row.get('last_seen_at'):
-                        my_last_seen_at = row['last_seen_at'].isoformat()
-        finally:
-            cur.close()
+    try:
+        status_code, body = _load_ticket_full(conn, payload.get('user_id'), ticket_id, params, include_comments,
+                                              comments_before_id, comments_limit)
     except Exception as e:
         return response(500, {'error': f'tickets-full failed: {str(e)}'})
-
-    return response(200, {
-        'ticket': ticket_data,
-        'history': history,
-        'approvals': approvals,
-        'comments': comments,
-        'participant_ids': participant_ids,
-        'my_last_seen_at': my_last_seen_at,
-    })
\ No newline at end of file
+    return response(status_code, body)
@@ -5,11 +5,38 @@ import re
 import urllib.request
 import urllib.parse
 import urllib.error
+from typing import Any, Dict
+from access_context import get_access_context
 
 MAX_BOT_TOKEN = os.environ.get('MAX_BOT_TOKEN', '')
 MAX_API_BASE = 'https://botapi.max.ru'  # старый домен, всё ещё рабочий
 # MAX требует токен в заголовке Authorization БЕЗ префикса Bearer
 
+# Итог отправок по меткам (set_delivery_tag): воркер notification_outbox
+# по нему решает, отправлено уведомление или его нужно повторить
+_delivery: Dict[Any, Dict[str, Any]] = {}
+_delivery_tag: Any = None
+
+
+def _record_delivery(ok: bool, error: str = None) -> None:
+    counters = _delivery.setdefault(_delivery_tag, {'sent': 0, 'failed': 0, 'error': None})
+    if ok:
+        counters['sent'] += 1
+    else:
+        counters['failed'] += 1
+        counters['error'] = error
+
+
+def set_delivery_tag(tag: Any) -> None:
+    """Метка, к которой относятся следующие отправки (id строки outbox)"""
+    global _delivery_tag
+    _delivery_tag = tag
+
+
+def pop_delivery_result(tag: Any = None) -> Dict[str, Any]:
+    """Возвращает счётчики отправок по метке и сбрасывает их"""
+    return _delivery.pop(tag, None) or {'sent': 0, 'failed': 0, 'error': None}
+
 
 def _strip_bbcode(text: str) -> str:
     """MAX не поддерживает BBcode/HTML — вырезаем теги, оставляя текст."""
@@ -67,6 +94,7 @@ def _send_max_message(max_user_id: str, text: str, ticket_id: int = None, ticket
         with urllib.request.urlopen(req, timeout=8) as resp:
             body = resp.read().decode('utf-8', errors='replace')
             print(f'[max-bot] Sent to {max_user_id}: HTTP {resp.status}')
+            _record_delivery(True)
     except urllib.error.HTTPError as e:
         body = e.read().decode('utf-8', errors='replace') if e.fp else ''
         # На случай если API ждёт chat_id вместо user_id — пробуем chat_id
@@ -74,8 +102,10 @@ def _send_max_message(max_user_id: str, text: str, ticket_id: int = None, ticket
             _send_max_message_chat(max_user_id, plain, ticket_id, ticket_url)
             return
         print(f'[max-bot] HTTP {e.code} sending to {max_user_id}: {body[:300]}')
+        _record_delivery(False, f'HTTP {e.code}: {body[:200]}')
     except Exception as e:
         print(f'[max-bot] Failed to send to {max_user_id}: {e}')
+        _record_delivery(False, str(e)[:200])
 
 
 def _send_max_message_chat(chat_id: str, text: str, ticket_id: int = None, ticket_url: str = ''):
@@ -109,8 +139,10 @@ def _send_max_message_chat(chat_id: str, text: str, ticket_id: int = None, ticke
         )
         with urllib.request.urlopen(req, timeout=8) as resp:
             print(f'[max-bot] Sent via chat_id to {chat_id}: HTTP {resp.status}')
+            _record_delivery(True)
     except Exception as e:
         print(f'[max-bot] Fallback failed to {chat_id}: {e}')
+        _record_delivery(False, str(e)[:200])
 
 
 def _priority_emoji(priority_name: str) -> str:
@@ -270,6 +302,10 @@ def send_comment_notifications(cur, schema: str, ticket_id: int, author_user_id:
     """, (ticket_id,))
     watchers = cur.fetchall() or []
 
+    # Для скрытых комментариев исключаем наблюдателей без права видеть скрытые
+    if is_internal:
+        watchers = [w for w in watchers if get_access_context(cur, w['user_id']).can_see_internal]
+
     seen = set()
     recipients = []
 
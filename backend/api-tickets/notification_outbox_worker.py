@@ -0,0 +1,240 @@
+"""Воркер доставки notification_outbox в Битрикс24 и MAX.
+
+Берёт пачку готовых к отправке строк (FOR UPDATE SKIP LOCKED), сразу коммитит
+аренду — сдвигает next_attempt_at на OUTBOX_LEASE_SECONDS, чтобы упавший посреди
+пачки вызов не потерял строки, — и отправляет их уже вне транзакции захвата.
+Сообщения Битрикс24 всей пачки уходят вместе через batch (bitrix_batch_client),
+итог по каждой строке собирается по метке — id строки.
+Ошибка отправки — повтор с нарастающей паузой, после OUTBOX_MAX_ATTEMPTS — dead.
+"""
+import json
+import os
+from typing import Dict, Any
+from shared_utils import response, verify_token, SCHEMA
+from access_context import get_access_context
+import bitrix_bot_notifier
+from bitrix_batch_client import get_bitrix_client
+import max_bot_notifier
+
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_BATCH_MAX = 500
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_MAX_ATTEMPTS = 6
+# Пауза перед следующей попыткой по номеру неудачной попытки, сек
+_RETRY_DELAYS = [60, 300, 900, 3600, 10800]
+# Вызов без токена администратора должен передать его в X-Outbox-Secret;
+# не задан — воркер запускает только администратор
+OUTBOX_WORKER_SECRET = os.environ.get('OUTBOX_WORKER_SECRET', '')
+
+_NOTIFIERS = {'bitrix': bitrix_bot_notifier, 'max': max_bot_notifier}
+
+
+def _deliver(cur, row: Dict[str, Any]) -> None:
+    """Готовит и отправляет одно уведомление; итог — в счётчиках нотификатора по метке row['id']."""
+    notifier = _NOTIFIERS.get(row['channel'])
+    if notifier is None:
+        raise ValueError(f"unknown channel {row['channel']}")
+
+    p = row['payload'] or {}
+    origin = (p.get('app_origin') or '').rstrip('/')
+    ticket_id = row['ticket_id']
+    notifier.set_delivery_tag(row['id'])
+
+    if row['kind'] == 'executor_assigned':
+        notifier.notify_executor_assigned(cur, SCHEMA, ticket_id, int(p['user_id']), origin)
+    elif row['kind'] == 'watcher_added':
+        notifier.notify_watcher_added(cur, SCHEMA, ticket_id, int(p['user_id']),
+                                      actor_user_id=int(p.get('actor_user_id') or 0), app_origin=origin)
+    elif row['kind'] == 'comment_added':
+        # Текст берём из БД: в очереди только id, комментарий мог быть отредактирован или удалён
+        cur.execute(f"""
+            SELECT user_id, comment, is_internal FROM {SCHEMA}.ticket_comments WHERE id = %s
+        """, (p['comment_id'],))
+        comment = cur.fetchone()
+        if comment:
+            notifier.send_comment_notifications(cur, SCHEMA, ticket_id, comment['user_id'],
+                                                comment['comment'], comment['is_internal'], origin)
+    else:
+        raise ValueError(f"unknown kind {row['kind']}")
+
+
+def drain_outbox(conn, batch_size: int = OUTBOX_BATCH_SIZE) -> Dict[str, Any]:
+    """Отправляет одну пачку уведомлений. Возвращает счётчики claimed/sent/retry/dead."""
+    stats: Dict[str, Any] = {'claimed': 0, 'sent': 0, 'retry': 0, 'dead': 0}
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            UPDATE {SCHEMA}.notification_outbox o
+            SET attempts = o.attempts + 1,
+                next_attempt_at = NOW() + make_interval(secs => %s)
+            WHERE o.id IN (
+                SELECT id FROM {SCHEMA}.notification_outbox
+                WHERE status = 'pending' AND next_attempt_at <= NOW()
+                ORDER BY next_attempt_at, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING o.id, o.channel, o.kind, o.ticket_id, o.payload, o.attempts
+        """, (OUTBOX_LEASE_SECONDS, batch_size))
+        rows = sorted(cur.fetchall(), key=lambda r: r['id'])
+        conn.commit()
+        stats['claimed'] = len(rows)
+
+        crashed: Dict[int, str] = {}
+        bitrix_bot_notifier.start_batch()
+        try:
+            for row in rows:
+                try:
+                    _deliver(cur, row)
+                except Exception as e:
+                    conn.rollback()
+                    # Строка уйдёт на повтор: её сообщения из пакета не отправляем,
+                    # иначе получатели увидят их дважды
+                    bitrix_bot_notifier.discard_delivery(row['id'])
+                    crashed[row['id']] = f'{type(e).__name__}: {e}'
+        finally:
+            stats['bitrix'] = bitrix_bot_notifier.flush_batch()
+            for notifier in _NOTIFIERS.values():
+                notifier.set_delivery_tag(None)
+
+        for row in rows:
+            if row['id'] in crashed:
+                result = _NOTIFIERS.get(row['channel'], bitrix_bot_notifier).pop_delivery_result(row['id'])
+                # До сбоя часть сообщений уже ушла сразу, вне пакета (MAX) — не повторяем
+                error = crashed[row['id']] if not result['sent'] else None
+                note = crashed[row['id']][:1000] if result['sent'] else None
+            else:
+                result = _NOTIFIERS[row['channel']].pop_delivery_result(row['id'])
+                # Частичный успех не повторяем: иначе получившие сообщение получат его ещё раз
+                error = result['error'] if result['failed'] and not result['sent'] else None
+                note = result['error'] if result['failed'] and result['sent'] else None
+
+            if error is None:
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.notification_outbox
+                    SET status = 'sent', sent_at = NOW(), last_error = %s
+                    WHERE id = %s
+                """, (note, row['id']))
+                stats['sent'] += 1
+            elif row['attempts'] >= OUTBOX_MAX_ATTEMPTS:
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.notification_outbox
+                    SET status = 'dead', last_error = %s
+                    WHERE id = %s
+                """, (error[:1000], row['id']))
+                stats['dead'] += 1
+                print(f"[outbox] #{row['id']} {row['channel']}/{row['kind']} dead after {row['attempts']} attempts: {error}")
+            else:
+                delay = _RETRY_DELAYS[min(row['attempts'], len(_RETRY_DELAYS)) - 1]
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.notification_outbox
+                    SET next_attempt_at = NOW() + make_interval(secs => %s), last_error = %s
+                    WHERE id = %s
+                """, (delay, error[:1000], row['id']))
+                stats['retry'] += 1
+            conn.commit()
+    finally:
+        cur.close()
+    return stats
+
+
+def _outbox_stats(cur) -> Dict[str, Any]:
+    cur.execute(f"""
+        SELECT status, channel, COUNT(*) AS cnt,
+               MIN(created_at) FILTER (WHERE status = 'pending') AS oldest_pending
+        FROM {SCHEMA}.notification_outbox
+        WHERE status <> 'sent' OR sent_at > NOW() - INTERVAL '1 day'
+        GROUP BY status, channel
+    """)
+    counts: Dict[str, Dict[str, int]] = {}
+    oldest = None
+    for r in cur.fetchall():
+        counts.setdefault(r['status'], {})[r['channel']] = r['cnt']
+        if r['oldest_pending'] and (oldest is None or r['oldest_pending'] < oldest):
+            oldest = r['oldest_pending']
+
+    cur.execute(f"""
+        SELECT id, channel, kind, ticket_id, attempts, last_error, created_at
+        FROM {SCHEMA}.notification_outbox
+        WHERE status = 'dead'
+        ORDER BY created_at DESC
+        LIMIT 20
+    """)
+    portal = bitrix_bot_notifier.BITRIX_PORTAL_URL
+    return {
+        'counts': counts,
+        'oldest_pending': oldest.isoformat() if oldest else None,
+        'dead_sample': [dict(r) for r in cur.fetchall()],
+        # Пропускная способность batch-клиента Битрикс24 за жизнь текущего инстанса
+        'bitrix_client': get_bitrix_client(portal).get_stats() if portal else None,
+    }
+
+
+def handle_notification_outbox(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
+    """Очередь уведомлений notification_outbox.
+
+    GET  — счётчики по статусам и каналам (sent — за сутки), возраст самой старой
+           ожидающей строки и последние dead (только администратор).
+    POST body:
+      {}                               — отправить пачку (вызывает automation-dispatcher);
+      { "batch_size": N }              — размер пачки (до OUTBOX_BATCH_MAX);
+      { "action": "retry", "ids": [..] } — вернуть dead-строки в очередь (администратор).
+    """
+    if method not in ('GET', 'POST'):
+        return response(405, {'error': 'Метод не поддерживается'})
+
+    payload = verify_token(event)
+    cur = conn.cursor()
+    try:
+        is_admin = bool(payload) and get_access_context(cur, payload.get('user_id')).is_admin
+    finally:
+        cur.close()
+
+    try:
+        body = json.loads(event.get('body') or '{}') if method == 'POST' else {}
+    except json.JSONDecodeError:
+        return response(400, {'error': 'Invalid JSON'})
+
+    if method == 'GET' or body.get('action') == 'retry':
+        if not payload:
+            return response(401, {'error': 'Требуется авторизация'})
+        if not is_admin:
+            return response(403, {'error': 'Доступно только администратору'})
+    elif not is_admin:
+        headers = event.get('headers') or {}
+        if not OUTBOX_WORKER_SECRET or (headers.get('X-Outbox-Secret') or headers.get('x-outbox-secret')) != OUTBOX_WORKER_SECRET:
+            return response(401, {'error': 'Требуется авторизация'})
+
+    if method == 'GET':
+        cur = conn.cursor()
+        try:
+            return response(200, _outbox_stats(cur))
+        finally:
+            cur.close()
+
+    if body.get('action') == 'retry':
+        ids = body.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return response(400, {'error': 'ids must be a non-empty list'})
+        try:
+            ids = [int(i) for i in ids]
+        except (TypeError, ValueError):
+            return response(400, {'error': 'ids must be integers'})
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                UPDATE {SCHEMA}.notification_outbox
+                SET status = 'pending', attempts = 0, next_attempt_at = NOW()
+                WHERE id = ANY(%s) AND status = 'dead'
+            """, (ids,))
+            requeued = cur.rowcount
+            conn.commit()
+        finally:
+            cur.close()
+        return response(200, {'success': True, 'requeued': requeued})
+
+    try:
+        batch_size = min(max(int(body.get('batch_size') or OUTBOX_BATCH_SIZE), 1), OUTBOX_BATCH_MAX)
+    except (TypeError, ValueError):
+        return response(400, {'error': 'batch_size must be integer'})
+    return response(200, {'success': True, **drain_outbox(conn, batch_size)})
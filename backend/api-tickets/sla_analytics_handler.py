@@ -1,6 +1,8 @@
 """Обработчик аналитики SLA — нарушения, статистика по группам, данные для заявки"""
 from typing import Dict, Any
 from shared_utils import response, verify_token, SCHEMA
+from business_clock import as_utc, db_now, load_group_clocks
+from group_tracking_service import find_ticket_sla
 
 
 def handle_sla_analytics(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
@@ -196,7 +198,23 @@ def _get_ticket_sla_info(cur, params: dict, payload: dict | None = None) -> Dict
         WHERE gl.ticket_id = %s AND gl.released_at IS NULL
         LIMIT 1
     """, (int(ticket_id),))
-    active_group = cur.fetchone()
+    active_group = dict(cur.fetchone() or {}) or None
+
+    # Для SLA с графиком время в группе — рабочие минуты по графикам группы
+    sla = find_ticket_sla(cur, int(ticket_id))
+    use_work_schedule = bool(sla and sla.get('use_work_schedule'))
+    now = db_now(cur) if use_work_schedule else None
+    clocks: dict = {}
+
+    def group_clock(group_id, since):
+        if group_id not in clocks:
+            clocks[group_id] = load_group_clocks(cur, SCHEMA, [group_id], as_utc(since), now).get(group_id)
+        return clocks[group_id]
+
+    if use_work_schedule and active_group:
+        clock = group_clock(active_group['executor_group_id'], active_group['assigned_at'])
+        if clock:
+            active_group['elapsed_minutes'] = clock.elapsed_minutes(active_group['assigned_at'], now)
 
     cur.execute(f"""
         SELECT sv.violation_type, sv.overdue_minutes, sv.violated_at,
@@ -294,7 +312,12 @@ def _get_ticket_sla_info(cur, params: dict, payload: dict | None = None) -> Dict
                 stat = cur.fetchone()
                 stat = dict(stat) if stat else {}
                 elapsed = stat.get('total_spent') or 0
-                if stat.get('is_active') and stat.get('last_assigned_at'):
+                clock = None
+                if use_work_schedule and stat.get('is_active') and stat.get('last_assigned_at'):
+                    clock = group_clock(ug_id, stat['last_assigned_at'])
+                if clock:
+                    elapsed = float(elapsed or 0) + clock.elapsed_minutes(stat['last_assigned_at'], now)
+                elif stat.get('is_active') and stat.get('last_assigned_at'):
                     cur.execute("""
                         SELECT EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - %s)) / 60
                     """, (stat['last_assigned_at'],))
@@ -313,7 +336,8 @@ def _get_ticket_sla_info(cur, params: dict, payload: dict | None = None) -> Dict
 
     return response(200, {
         'ticket': ticket,
-        'active_group': dict(active_group) if active_group else None,
+        'active_group': active_group,
+        'use_work_schedule': use_work_schedule,
         'violations': violations,
         'has_violations': len(violations) > 0,
         'my_group': my_group,
@@ -0,0 +1,315 @@
+"""Воркер таймеров SLA (sla_timers).
+
+Таймеры заводят и переставляют триггеры БД при создании заявки, смене срока,
+статуса и паузы (V0263). Воркер берёт только наступившие таймеры
+(fire_at <= NOW(), FOR UPDATE SKIP LOCKED) и в той же транзакции отмечает
+fired_at и выпускает события:
+  response_warning / resolution_warning — предупреждение исполнителю;
+  response_breach — нарушение срока реакции (исполнителю и наблюдателям),
+                    если на заявку так и не ответили;
+  resolution_breach — уведомление 'overdue' исполнителю, автору и наблюдателям
+                      (tickets-overdue-checker не повторит его в течение суток);
+  no_response — перевод заявки в no_response_status_id из настроек SLA.
+Ошибка по таймеру откатывается до точки сохранения, таймер повторяется позже.
+Записи sla_violations по-прежнему создаются при закрытии заявки — с итоговой
+просрочкой.
+"""
+import json
+import os
+import time
+from typing import Dict, Any, List
+from psycopg2.extras import execute_values
+from shared_utils import response, verify_token, SCHEMA
+from access_context import get_access_context
+from group_tracking_service import track_ticket_closed, sla_resume_business
+from ticket_list_projection import refresh_ticket_list_rows
+
+SLA_TIMERS_BATCH_SIZE = 200
+SLA_TIMERS_BATCH_MAX = 1000
+SLA_TIMERS_TIME_BUDGET_SECONDS = 20
+SLA_TIMERS_MAX_ATTEMPTS = 5
+SLA_TIMERS_RETRY_SECONDS = 300
+# Вызов без токена администратора должен передать его в X-Sla-Timers-Secret;
+# не задан — воркер запускает только администратор
+SLA_TIMERS_SECRET = os.environ.get('SLA_TIMERS_SECRET', '')
+
+
+def _claim(cur, batch_size: int) -> List[Dict[str, Any]]:
+    cur.execute(f"""
+        UPDATE {SCHEMA}.sla_timers st
+        SET fired_at = NOW(), attempts = st.attempts + 1, updated_at = NOW()
+        WHERE st.id IN (
+            SELECT id FROM {SCHEMA}.sla_timers
+            WHERE fired_at IS NULL AND fire_at <= NOW()
+            ORDER BY fire_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING st.id, st.ticket_id, st.kind, st.fire_at, st.sla_id, st.attempts
+    """, (batch_size,))
+    return sorted(cur.fetchall(), key=lambda r: (r['fire_at'], r['id']))
+
+
+def _load_tickets(cur, ticket_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Состояние заявок пачки одним запросом"""
+    cur.execute(f"""
+        SELECT t.id, t.title, t.status_id, t.assigned_to, t.created_by, t.executor_group_id,
+               t.due_date, t.response_due_date, t.sla_paused_at, t.is_archived,
+               EXISTS (SELECT 1 FROM {SCHEMA}.ticket_comments tc WHERE tc.ticket_id = t.id) AS has_any_comment,
+               ARRAY(SELECT w.user_id FROM {SCHEMA}.ticket_watchers w
+                     WHERE w.ticket_id = t.id AND w.user_id IS NOT NULL) AS watcher_ids
+        FROM {SCHEMA}.tickets t
+        WHERE t.id = ANY(%s)
+    """, (ticket_ids,))
+    return {r['id']: dict(r) for r in cur.fetchall()}
+
+
+def _minutes_left(deadline, fire_at) -> int:
+    return max(int(round((deadline - fire_at).total_seconds() / 60)), 0) if deadline else 0
+
+
+def _no_response_transition(cur, ticket: Dict[str, Any], sla: Dict[str, Any],
+                            statuses: Dict[int, Dict[str, Any]]) -> bool:
+    """Перевод заявки без ответа клиента в статус из SLA — как смена статуса в api-tickets"""
+    target = statuses.get(sla.get('no_response_status_id'))
+    current = statuses.get(ticket['status_id'])
+    if not target or not current or not current['is_waiting_response']:
+        return False
+
+    ticket_id = ticket['id']
+    fields = ["status_id = %s", "is_archived = %s", "updated_at = NOW()"]
+    params: List[Any] = [target['id'], bool(target['is_closed'])]
+
+    if target['is_closed']:
+        fields.append("closed_at = COALESCE(closed_at, NOW())")
+
+    is_pausing = (target['is_waiting_response'] or target['is_pending_confirmation']
+                  or target['is_paused'] or target['is_closed'])
+    if not is_pausing:
+        resumed = sla_resume_business(cur, ticket_id, ticket)
+        if resumed:
+            paused_sec, due_date, response_due_date = resumed
+            fields += ["sla_paused_total_seconds = COALESCE(sla_paused_total_seconds, 0) + %s",
+                       "due_date = %s", "response_due_date = %s"]
+            params += [paused_sec, due_date, response_due_date]
+        elif ticket.get('sla_paused_at'):
+            fields += [
+                "sla_paused_total_seconds = COALESCE(sla_paused_total_seconds, 0)"
+                " + EXTRACT(EPOCH FROM (NOW() - sla_paused_at))::INTEGER",
+                "due_date = due_date + (NOW() - sla_paused_at)",
+                "response_due_date = response_due_date + (NOW() - sla_paused_at)",
+            ]
+        fields += ["sla_paused_at = NULL", "previous_status_id = NULL", "waiting_reminder_sent_at = NULL"]
+
+    cur.execute(f"""
+        UPDATE {SCHEMA}.tickets SET {', '.join(fields)}
+        WHERE id = %s AND status_id = %s
+    """, params + [ticket_id, ticket['status_id']])
+    if cur.rowcount != 1:
+        # Статус уже сменили — журнал групп и нарушения при закрытии не трогаем
+        return False
+
+    if target['is_closed'] and not ticket.get('is_archived'):
+        track_ticket_closed(cur, ticket_id, None)
+
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.ticket_history (ticket_id, user_id, field_name, old_value, new_value, created_at)
+        VALUES (%s, NULL, 'status_id', %s, %s, NOW())
+    """, (ticket_id, current['name'], target['name']))
+    return True
+
+
+def _fire(cur, timer: Dict[str, Any], ticket: Dict[str, Any], sla: Dict[str, Any],
+          statuses: Dict[int, Dict[str, Any]], notifications: list) -> bool:
+    """Выпускает событие таймера. False — событие уже неактуально."""
+    kind = timer['kind']
+    ticket_id = ticket['id']
+    title = ticket.get('title') or ''
+    assignee = ticket.get('assigned_to')
+    watchers = set(ticket.get('watcher_ids') or [])
+
+    def notify(user_ids, event_type: str, message: str):
+        for uid in sorted({u for u in user_ids if u}):
+            notifications.append((uid, ticket_id, event_type, message, event_type))
+
+    if kind in ('response_warning', 'response_breach') and ticket['has_any_comment']:
+        return False
+
+    if kind == 'response_warning':
+        left = _minutes_left(ticket['response_due_date'], timer['fire_at'])
+        notify([assignee], 'sla_warning',
+               f'Заявка #{ticket_id} «{title}»: до срока реакции {left} мин')
+    elif kind == 'resolution_warning':
+        left = _minutes_left(ticket['due_date'], timer['fire_at'])
+        notify([assignee], 'sla_warning',
+               f'Заявка #{ticket_id} «{title}»: до срока решения {left} мин')
+    elif kind == 'response_breach':
+        notify({assignee} | watchers, 'sla_breach',
+               f'Заявка #{ticket_id} «{title}»: нарушен срок реакции')
+    elif kind == 'resolution_breach':
+        notify({assignee, ticket.get('created_by')} | watchers, 'overdue',
+               f'Заявка #{ticket_id} «{title}» просрочена')
+    elif kind == 'no_response':
+        if not _no_response_transition(cur, ticket, sla, statuses):
+            return False
+        target = statuses[sla['no_response_status_id']]
+        notify({assignee, ticket.get('created_by')}, 'status_change',
+               f'Заявка #{ticket_id} «{title}» переведена в статус «{target["name"]}»: нет ответа')
+    else:
+        return False
+    return True
+
+
+def _drain_batch(conn, batch_size: int, stats: Dict[str, Any]) -> int:
+    """Одна пачка наступивших таймеров в одной транзакции. Возвращает число взятых."""
+    cur = conn.cursor()
+    try:
+        timers = _claim(cur, batch_size)
+        if not timers:
+            conn.commit()
+            return 0
+
+        tickets = _load_tickets(cur, sorted({t['ticket_id'] for t in timers}))
+        sla_ids = sorted({t['sla_id'] for t in timers if t['sla_id']})
+        cur.execute(f"""
+            SELECT id, no_response_minutes, no_response_status_id
+            FROM {SCHEMA}.sla WHERE id = ANY(%s)
+        """, (sla_ids,))
+        slas = {r['id']: dict(r) for r in cur.fetchall()}
+        cur.execute(f"""
+            SELECT id, name, COALESCE(is_closed, false) AS is_closed,
+                   COALESCE(is_waiting_response, false) AS is_waiting_response,
+                   COALESCE(is_pending_confirmation, false) AS is_pending_confirmation,
+                   COALESCE(is_paused, false) AS is_paused
+            FROM {SCHEMA}.ticket_statuses
+        """)
+        statuses = {r['id']: dict(r) for r in cur.fetchall()}
+
+        notifications: list = []
+        moved_ticket_ids: List[int] = []
+        for timer in timers:
+            ticket = tickets.get(timer['ticket_id'])
+            if not ticket:
+                stats['skipped'] += 1
+                continue
+            cur.execute("SAVEPOINT sla_timer")
+            try:
+                fired = _fire(cur, timer, ticket, slas.get(timer['sla_id']) or {}, statuses, notifications)
+                cur.execute("RELEASE SAVEPOINT sla_timer")
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT sla_timer")
+                error = f'{type(e).__name__}: {e}'
+                if timer['attempts'] < SLA_TIMERS_MAX_ATTEMPTS:
+                    # Повтор позже: срок срабатывания сдвигается, fired_at снимается
+                    cur.execute(f"""
+                        UPDATE {SCHEMA}.sla_timers
+                        SET fired_at = NULL, fire_at = NOW() + make_interval(secs => %s), last_error = %s
+                        WHERE id = %s
+                    """, (SLA_TIMERS_RETRY_SECONDS, error[:1000], timer['id']))
+                    stats['retry'] += 1
+                else:
+                    cur.execute(f"UPDATE {SCHEMA}.sla_timers SET last_error = %s WHERE id = %s",
+                                (error[:1000], timer['id']))
+                    stats['failed'] += 1
+                print(f"[sla-timers] #{timer['id']} {timer['kind']} ticket {timer['ticket_id']}: {error}")
+                continue
+            key = timer['kind'] if fired else 'skipped'
+            stats[key] = stats.get(key, 0) + 1
+            if fired and timer['kind'] == 'no_response':
+                moved_ticket_ids.append(timer['ticket_id'])
+
+        refresh_ticket_list_rows(cur, moved_ticket_ids)
+
+        if notifications:
+            execute_values(cur, f"""
+                INSERT INTO {SCHEMA}.notifications
+                    (user_id, ticket_id, type, message, event_type, is_read, created_at)
+                VALUES %s
+            """, notifications, template="(%s, %s, %s, %s, %s, false, NOW())",
+                page_size=SLA_TIMERS_BATCH_MAX)
+            stats['notifications'] += len(notifications)
+        conn.commit()
+        return len(timers)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def drain_sla_timers(conn, batch_size: int = SLA_TIMERS_BATCH_SIZE) -> Dict[str, Any]:
+    """Разбирает наступившие таймеры пачками, пока они есть и не вышел бюджет времени"""
+    started = time.monotonic()
+    stats: Dict[str, Any] = {'claimed': 0, 'skipped': 0, 'retry': 0, 'failed': 0,
+                             'notifications': 0, 'has_more': False}
+    while True:
+        if time.monotonic() - started > SLA_TIMERS_TIME_BUDGET_SECONDS:
+            stats['has_more'] = True
+            break
+        claimed = _drain_batch(conn, batch_size, stats)
+        stats['claimed'] += claimed
+        if claimed < batch_size:
+            break
+    stats['duration_ms'] = int((time.monotonic() - started) * 1000)
+    return stats
+
+
+def _timer_stats(cur) -> Dict[str, Any]:
+    cur.execute(f"""
+        SELECT kind,
+               COUNT(*) FILTER (WHERE fired_at IS NULL) AS pending,
+               COUNT(*) FILTER (WHERE fired_at IS NULL AND fire_at <= NOW()) AS due,
+               COUNT(*) FILTER (WHERE fired_at > NOW() - INTERVAL '1 day') AS fired_day,
+               MIN(fire_at) FILTER (WHERE fired_at IS NULL) AS next_fire_at
+        FROM {SCHEMA}.sla_timers
+        GROUP BY kind
+        ORDER BY kind
+    """)
+    return {'kinds': [dict(r) for r in cur.fetchall()]}
+
+
+def handle_sla_timers(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
+    """Таймеры SLA.
+
+    GET  — по видам: ожидающие, наступившие, сработавшие за сутки, ближайший
+           срок (только администратор).
+    POST body:
+      {}                  — разобрать наступившие таймеры (вызывает automation-dispatcher);
+      { "batch_size": N } — размер пачки (до SLA_TIMERS_BATCH_MAX).
+    """
+    if method not in ('GET', 'POST'):
+        return response(405, {'error': 'Метод не поддерживается'})
+
+    payload = verify_token(event)
+    cur = conn.cursor()
+    try:
+        is_admin = bool(payload) and get_access_context(cur, payload.get('user_id')).is_admin
+    finally:
+        cur.close()
+
+    try:
+        body = json.loads(event.get('body') or '{}') if method == 'POST' else {}
+    except json.JSONDecodeError:
+        return response(400, {'error': 'Invalid JSON'})
+
+    if method == 'GET':
+        if not payload:
+            return response(401, {'error': 'Требуется авторизация'})
+        if not is_admin:
+            return response(403, {'error': 'Доступно только администратору'})
+        cur = conn.cursor()
+        try:
+            return response(200, _timer_stats(cur))
+        finally:
+            cur.close()
+
+    if not is_admin:
+        headers = event.get('headers') or {}
+        if not SLA_TIMERS_SECRET or (headers.get('X-Sla-Timers-Secret') or headers.get('x-sla-timers-secret')) != SLA_TIMERS_SECRET:
+            return response(401, {'error': 'Требуется авторизация'})
+
+    try:
+        batch_size = min(max(int(body.get('batch_size') or SLA_TIMERS_BATCH_SIZE), 1), SLA_TIMERS_BATCH_MAX)
+    except (TypeError, ValueError):
+        return response(400, {'error': 'batch_size must be integer'})
+    return response(200, {'success': True, **drain_sla_timers(conn, batch_size)})
@@ -0,0 +1,139 @@
+"""Проекция списка заявок ticket_list_rows: обновление из путей записи и верификатор"""
+import json
+from typing import Dict, Any, Iterable
+from shared_utils import response, verify_token, SCHEMA
+from access_context import get_access_context
+
+_SAMPLE_SIZE = 20
+
+
+def refresh_ticket_list_rows(cur, ticket_ids: Iterable[Any]) -> None:
+    """Пересчитывает строки проекции для заявок в текущей транзакции.
+
+    Сбой проекции не должен ронять саму запись заявки: откатываемся к savepoint,
+    а расхождение потом исправит сверка repair_ticket_list_rows (задача автоматизации).
+    """
+    ids = sorted({int(i) for i in (ticket_ids or []) if i})
+    if not ids:
+        return
+    try:
+        cur.execute("SAVEPOINT ticket_list_rows_refresh")
+        cur.execute(f"SELECT {SCHEMA}.refresh_ticket_list_rows(%s::int[])", (ids,))
+        cur.execute("RELEASE SAVEPOINT ticket_list_rows_refresh")
+    except Exception as e:
+        print(f"[TICKETS] ticket_list_rows refresh error for {ids[:10]}: {e}")
+        try:
+            cur.execute("ROLLBACK TO SAVEPOINT ticket_list_rows_refresh")
+        except Exception:
+            pass
+
+
+def refresh_ticket_list_rows_by_status(cur, status_id: int) -> None:
+    """Пересчитывает проекцию для всех заявок в статусе (после правки справочника статусов)."""
+    cur.execute(f"SELECT id FROM {SCHEMA}.tickets WHERE status_id = %s", (status_id,))
+    refresh_ticket_list_rows(cur, [row['id'] for row in cur.fetchall()])
+
+
+def _is_admin(cur, user_id: int) -> bool:
+    return get_access_context(cur, user_id).is_admin
+
+
+def _diff_projection(cur) -> Dict[str, Any]:
+    """Сравнивает ticket_list_rows с живым джойном ticket_list_rows_live.
+
+    missing — заявки нет в проекции, orphaned — в проекции осталась удалённая заявка,
+    stale — строка отличается хотя бы одной колонкой.
+    """
+    cur.execute(f"""
+        WITH diff AS (
+            SELECT COALESCE(v.id, r.id) AS id,
+                   CASE WHEN r.id IS NULL THEN 'missing'
+                        WHEN v.id IS NULL THEN 'orphaned'
+                        ELSE 'stale' END AS kind
+            FROM {SCHEMA}.ticket_list_rows_live v
+            FULL JOIN {SCHEMA}.ticket_list_rows r ON r.id = v.id
+            WHERE r.id IS NULL OR v.id IS NULL
+               OR to_jsonb(v) <> (to_jsonb(r) - 'refreshed_at')
+        )
+        SELECT kind, COUNT(*) AS cnt, array_agg(id ORDER BY id DESC) AS ids
+        FROM diff
+        GROUP BY kind
+    """)
+    result = {'missing': 0, 'stale': 0, 'orphaned': 0, 'samples': {}, 'ids': []}
+    for row in cur.fetchall():
+        result[row['kind']] = row['cnt']
+        result['samples'][row['kind']] = list(row['ids'][:_SAMPLE_SIZE])
+        result['ids'].extend(row['ids'])
+    return result
+
+
+def handle_ticket_list_projection(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
+    """Верификатор проекции ticket_list_rows (только администратор).
+
+    GET — расхождения проекции с живым джойном: количество missing/stale/orphaned и примеры id.
+    POST body:
+      { "ticket_ids": [..] } — пересчитать указанные заявки;
+      { "full": true }       — пересобрать проекцию целиком;
+      {}                     — найти расхождения и пересчитать только их
+                               (раз в час то же делает задача ticket_list_rows_repair).
+    """
+    payload = verify_token(event)
+    if not payload:
+        return response(401, {'error': 'Требуется авторизация'})
+
+    if method not in ('GET', 'POST'):
+        return response(405, {'error': 'Метод не поддерживается'})
+
+    cur = conn.cursor()
+    try:
+        if not _is_admin(cur, payload.get('user_id')):
+            return response(403, {'error': 'Доступно только администратору'})
+
+        if method == 'GET':
+            diff = _diff_projection(cur)
+            cur.execute(f"SELECT COUNT(*) AS cnt, MIN(refreshed_at) AS oldest FROM {SCHEMA}.ticket_list_rows")
+            stats = cur.fetchone()
+            return response(200, {
+                'in_sync': not diff['ids'],
+                'rows': stats['cnt'],
+                'oldest_refresh': stats['oldest'].isoformat() if stats['oldest'] else None,
+                'missing': diff['missing'],
+                'stale': diff['stale'],
+                'orphaned': diff['orphaned'],
+                'samples': diff['samples'],
+            })
+
+        try:
+            body = json.loads(event.get('body') or '{}')
+        except json.JSONDecodeError:
+            return response(400, {'error': 'Invalid JSON'})
+
+        if body.get('full'):
+            cur.execute(f"SELECT {SCHEMA}.refresh_ticket_list_rows(NULL) AS rows")
+            rows = cur.fetchone()['rows']
+            conn.commit()
+            return response(200, {'success': True, 'mode': 'full', 'rows': rows})
+
+        raw_ids = body.get('ticket_ids')
+        if raw_ids is None:
+            # Та же сверка, что у задачи автоматизации ticket_list_rows_repair
+            cur.execute(f"SELECT {SCHEMA}.repair_ticket_list_rows() AS repaired")
+            repaired = cur.fetchone()['repaired']
+            conn.commit()
+            return response(200, {'success': True, 'mode': 'diff', 'repaired': repaired})
+
+        if not isinstance(raw_ids, list):
+            return response(400, {'error': 'ticket_ids must be a list'})
+        try:
+            ids = sorted({int(i) for i in raw_ids})
+        except (TypeError, ValueError):
+            return response(400, {'error': 'ticket_ids must be integers'})
+
+        rows = 0
+        if ids:
+            cur.execute(f"SELECT {SCHEMA}.refresh_ticket_list_rows(%s::int[]) AS rows", (ids,))
+            rows = cur.fetchone()['rows']
+        conn.commit()
+        return response(200, {'success': True, 'mode': 'ids', 'repaired': len(ids), 'rows': rows})
+    finally:
+        cur.close()
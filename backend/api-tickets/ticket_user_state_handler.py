@@ -0,0 +1,46 @@
+"""Обслуживание read-модели ticket_user_state (непрочитанное по паре пользователь × заявка)"""
+import json
+from typing import Dict, Any
+from shared_utils import response, verify_token, SCHEMA
+from access_context import get_access_context
+
+
+def _is_admin(cur, user_id: int) -> bool:
+    return get_access_context(cur, user_id).is_admin
+
+
+def handle_ticket_user_state(method: str, event: Dict[str, Any], conn) -> Dict[str, Any]:
+    """Пересборка ticket_user_state из ticket_views, ticket_comments и notifications.
+
+    POST body: { "ticket_id": int } — пересобрать одну заявку; без ticket_id — всю таблицу.
+    Таблица поддерживается триггерами, пересборка нужна только после ручных правок данных.
+    """
+    payload = verify_token(event)
+    if not payload:
+        return response(401, {'error': 'Требуется авторизация'})
+
+    if method != 'POST':
+        return response(405, {'error': 'Метод не поддерживается'})
+
+    cur = conn.cursor()
+    try:
+        if not _is_admin(cur, payload.get('user_id')):
+            return response(403, {'error': 'Доступно только администратору'})
+
+        try:
+            body = json.loads(event.get('body') or '{}')
+        except json.JSONDecodeError:
+            return response(400, {'error': 'Invalid JSON'})
+
+        ticket_id = body.get('ticket_id')
+        try:
+            ticket_id = int(ticket_id) if ticket_id is not None else None
+        except (TypeError, ValueError):
+            return response(400, {'error': 'ticket_id must be integer'})
+
+        cur.execute(f"SELECT {SCHEMA}.rebuild_ticket_user_state(%s) AS rows", (ticket_id,))
+        rows = cur.fetchone()['rows']
+        conn.commit()
+        return response(200, {'success': True, 'ticket_id': ticket_id, 'rows': rows})
+    finally:
+        cur.close()
@@ -0,0 +1,144 @@
+"""
+Скомпилированный индекс правил наблюдателей (ticket_watcher_rules).
+
+AND-правило ищется по точному ключу (category, department, priority,
+executor_group, assignee), где неуказанное условие — None: заявка проверяет
+все 32 маски своего ключа. OR-правила разложены по спискам на каждое поле.
+Цели правил (пользователи, группы, роли) заранее развёрнуты в множества user_id.
+
+Индекс живёт между тёплыми вызовами и сверяется с watcher_rules_version
+(её увеличивают триггеры на правилах, их целях, составах групп и ролях
+пользователей) не чаще раза за вызов (reset_watcher_rule_index() в начале handler).
+"""
+from itertools import product
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+# Поля заявки в порядке ключа; у правила исполнитель называется assignee_id
+TICKET_FIELDS = ('category_id', 'department_id', 'priority_id', 'executor_group_id', 'assigned_to')
+RULE_FIELDS = ('category_id', 'department_id', 'priority_id', 'executor_group_id', 'assignee_id')
+
+
+class WatcherRuleIndex:
+    """Правила одного триггера (создание или изменение заявки)"""
+
+    def __init__(self):
+        self.and_rules: Dict[Tuple, List[int]] = {}
+        # позиция поля -> значение -> id правил
+        self.or_postings: List[Dict[int, List[int]]] = [{} for _ in RULE_FIELDS]
+
+    def add(self, rule: dict) -> None:
+        key = tuple(rule.get(f) or None for f in RULE_FIELDS)
+        if all(v is None for v in key):
+            return
+        if str(rule.get('match_mode') or 'AND').upper() == 'OR':
+            for pos, value in enumerate(key):
+                if value is not None:
+                    self.or_postings[pos].setdefault(value, []).append(rule['id'])
+        else:
+            self.and_rules.setdefault(key, []).append(rule['id'])
+
+    def match(self, ticket: dict) -> List[int]:
+        """id сработавших правил по возрастанию"""
+        values = tuple(ticket.get(f) or None for f in TICKET_FIELDS)
+        matched: Set[int] = set()
+        for mask in product((False, True), repeat=len(values)):
+            key = tuple(v if keep else None for v, keep in zip(values, mask))
+            matched.update(self.and_rules.get(key, ()))
+        for pos, value in enumerate(values):
+            if value is not None:
+                matched.update(self.or_postings[pos].get(value, ()))
+        return sorted(matched)
+
+
+class CompiledWatcherRules:
+    def __init__(self, version: Optional[int], rules: list, targets: list,
+                 group_members: list, role_members: list):
+        self.version = version
+        self.by_trigger = {'create': WatcherRuleIndex(), 'update': WatcherRuleIndex()}
+        for r in rules:
+            if r['trigger_on_create']:
+                self.by_trigger['create'].add(r)
+            if r['trigger_on_update']:
+                self.by_trigger['update'].add(r)
+
+        groups: Dict[int, Set[int]] = {}
+        for r in group_members:
+            groups.setdefault(r['group_id'], set()).add(int(r['user_id']))
+        roles: Dict[int, Set[int]] = {}
+        for r in role_members:
+            roles.setdefault(r['role_id'], set()).add(int(r['user_id']))
+
+        resolved: Dict[int, Set[int]] = {}
+        for t in targets:
+            users = resolved.setdefault(t['rule_id'], set())
+            if not t['target_id']:
+                continue
+            if t['target_type'] == 'user':
+                users.add(int(t['target_id']))
+            elif t['target_type'] == 'group':
+                users |= groups.get(t['target_id'], set())
+            elif t['target_type'] == 'role':
+                users |= roles.get(t['target_id'], set())
+        self.targets: Dict[int, FrozenSet[int]] = {rid: frozenset(u) for rid, u in resolved.items()}
+
+    def match(self, trigger: str, ticket: dict) -> Tuple[List[int], Set[int]]:
+        """Сработавшие правила и объединение их целей (user_id)"""
+        rule_ids = self.by_trigger[trigger].match(ticket)
+        user_ids: Set[int] = set()
+        for rid in rule_ids:
+            user_ids |= self.targets.get(rid, frozenset())
+        return rule_ids, user_ids
+
+
+_compiled: Optional[CompiledWatcherRules] = None
+_compiled_checked = False
+
+
+def reset_watcher_rule_index() -> None:
+    """Следующее обращение к индексу заново сверит версию"""
+    global _compiled_checked
+    _compiled_checked = False
+
+
+def get_watcher_rule_index(cur, schema: str) -> CompiledWatcherRules:
+    """Индекс правил: сверка версии одним запросом, пересборка только при её смене"""
+    global _compiled, _compiled_checked
+    if _compiled is not None and _compiled_checked:
+        return _compiled
+
+    cur.execute(f"SELECT COALESCE(MAX(version), 0) AS version FROM {schema}.watcher_rules_version")
+    version = cur.fetchone()['version']
+    if _compiled is None or _compiled.version != version:
+        cur.execute(f"""
+            SELECT id, category_id, department_id, priority_id, executor_group_id, assignee_id,
+                   match_mode, trigger_on_create, trigger_on_update
+            FROM {schema}.ticket_watcher_rules
+            WHERE is_active = true AND (trigger_on_create = true OR trigger_on_update = true)
+        """)
+        rules = cur.fetchall()
+        cur.execute(f"""
+            SELECT t.rule_id, t.target_type, t.target_id
+            FROM {schema}.ticket_watcher_rule_targets t
+            JOIN {schema}.ticket_watcher_rules r ON r.id = t.rule_id AND r.is_active = true
+        """)
+        targets = cur.fetchall()
+        cur.execute(f"""
+            SELECT m.group_id, m.user_id
+            FROM {schema}.executor_group_members m
+            WHERE m.group_id IN (
+                SELECT t.target_id FROM {schema}.ticket_watcher_rule_targets t WHERE t.target_type = 'group'
+            )
+        """)
+        group_members = cur.fetchall()
+        cur.execute(f"""
+            SELECT ur.role_id, ur.user_id
+            FROM {schema}.user_roles ur
+            WHERE ur.role_id IN (
+                SELECT t.target_id FROM {schema}.ticket_watcher_rule_targets t WHERE t.target_type = 'role'
+            )
+        """)
+        role_members = cur.fetchall()
+        _compiled = CompiledWatcherRules(version, rules, targets, group_members, role_members)
+
+    _compiled_checked = True
+    return _compiled
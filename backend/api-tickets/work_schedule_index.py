@@ -0,0 +1,195 @@
+"""
+Индекс рабочих графиков: кто сейчас на смене, когда начнётся следующая смена
+и сколько рабочих минут между двумя моментами.
+
+Недельный график (work_schedules) и исключения (work_schedule_exceptions:
+праздники для всех — user_id IS NULL — и личные отгулы/переносы) разворачиваются
+в интервалы смен по датам в часовом поясе графиков SCHEDULE_TIMEZONE
+(по умолчанию Europe/Moscow). Смена с end_time <= start_time — ночная и
+заканчивается на следующий день. Интервалы хранятся в UTC, все ответы
+считаются в памяти по снимку из двух запросов (load_schedule_calendar),
+поэтому вопросы о сотнях пользователей не размножают обращения к БД.
+
+Исключения учитываются только в загруженном диапазоне дат (date_from..date_to).
+"""
+import os
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover — Python < 3.9
+    ZoneInfo = None
+
+SCHEDULE_TIMEZONE = os.environ.get('SCHEDULE_TIMEZONE', 'Europe/Moscow')
+# Запасной вариант, если в окружении нет базы часовых поясов
+_MSK = timezone(timedelta(hours=3), 'MSK')
+
+# Насколько далеко вперёд искать следующую смену
+NEXT_SHIFT_HORIZON_DAYS = 14
+
+Interval = Tuple[datetime, datetime]
+
+
+def get_schedule_tz() -> tzinfo:
+    """Часовой пояс графиков работы"""
+    if ZoneInfo is not None:
+        try:
+            return ZoneInfo(SCHEDULE_TIMEZONE)
+        except Exception:
+            pass
+    return _MSK
+
+
+def _as_utc(value: datetime, tz: tzinfo) -> datetime:
+    """Наивное время считается временем графиков, не UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=tz)
+    return value.astimezone(timezone.utc)
+
+
+def _as_time(value) -> time:
+    if isinstance(value, time):
+        return value
+    return time.fromisoformat(str(value))
+
+
+class ScheduleCalendar:
+    """Смены пользователей по датам, построенные из недельных графиков и исключений"""
+
+    def __init__(self, schedules: Iterable[dict], exceptions: Iterable[dict] = (),
+                 tz: Optional[tzinfo] = None):
+        self.tz = tz or get_schedule_tz()
+        # user_id -> день недели (0 = пн) -> (начало, конец)
+        self._weekly: Dict[int, Dict[int, Tuple[time, time]]] = {}
+        for r in schedules:
+            if r.get('is_active', True):
+                self._weekly.setdefault(r['user_id'], {})[int(r['day_of_week'])] = (
+                    _as_time(r['start_time']), _as_time(r['end_time'])
+                )
+
+        self._global_exc: Dict[date, dict] = {}
+        self._user_exc: Dict[Tuple[int, date], dict] = {}
+        for e in exceptions:
+            if e.get('user_id') is None:
+                self._global_exc[e['exception_date']] = e
+            else:
+                self._user_exc[(e['user_id'], e['exception_date'])] = e
+
+        self._day_cache: Dict[Tuple[int, date], List[Interval]] = {}
+
+    @property
+    def user_ids(self) -> Set[int]:
+        return set(self._weekly) | {uid for uid, _ in self._user_exc}
+
+    def local_date(self, at: datetime) -> date:
+        return _as_utc(at, self.tz).astimezone(self.tz).date()
+
+    def shifts_starting_on(self, user_id: int, day: date) -> List[Interval]:
+        """Смены пользователя, начинающиеся в указанную дату, в UTC"""
+        key = (user_id, day)
+        cached = self._day_cache.get(key)
+        if cached is not None:
+            return cached
+
+        weekly = self._weekly.get(user_id, {}).get(day.weekday())
+        exc = self._user_exc.get(key) or self._global_exc.get(day)
+        bounds: Optional[Tuple[time, time]] = weekly
+        if exc is not None:
+            if not exc.get('is_working'):
+                bounds = None
+            elif exc.get('start_time') and exc.get('end_time'):
+                # Общий рабочий день с особыми часами касается только тех, у кого есть график
+                if exc.get('user_id') is not None or user_id in self._weekly:
+                    bounds = (_as_time(exc['start_time']), _as_time(exc['end_time']))
+
+        shifts: List[Interval] = []
+        if bounds is not None:
+            start_t, end_t = bounds
+            end_day = day + timedelta(days=1) if end_t <= start_t else day
+            shifts.append((
+                _as_utc(datetime.combine(day, start_t), self.tz),
+                _as_utc(datetime.combine(end_day, end_t), self.tz),
+            ))
+        self._day_cache[key] = shifts
+        return shifts
+
+    def shifts_between(self, user_id: int, start: datetime, end: datetime) -> List[Interval]:
+        """Смены, пересекающиеся с [start, end), по порядку"""
+        start, end = _as_utc(start, self.tz), _as_utc(end, self.tz)
+        day = self.local_date(start) - timedelta(days=1)
+        last = self.local_date(end)
+        result = []
+        while day <= last:
+            for s, e in self.shifts_starting_on(user_id, day):
+                if s < end and e > start:
+                    result.append((s, e))
+            day += timedelta(days=1)
+        return result
+
+    def is_on_shift(self, user_id: int, at: datetime) -> bool:
+        at = _as_utc(at, self.tz)
+        day = self.local_date(at)
+        for d in (day - timedelta(days=1), day):
+            for s, e in self.shifts_starting_on(user_id, d):
+                if s <= at < e:
+                    return True
+        return False
+
+    def on_shift(self, user_ids: Iterable[int], at: datetime) -> Set[int]:
+        """Кто из пользователей на смене в момент at"""
+        return {uid for uid in user_ids if self.is_on_shift(uid, at)}
+
+    def next_shift_start(self, user_id: int, after: datetime,
+                         horizon_days: int = NEXT_SHIFT_HORIZON_DAYS) -> Optional[datetime]:
+        """Начало ближайшей смены строго после after (None — в горизонте смен нет)"""
+        after = _as_utc(after, self.tz)
+        day = self.local_date(after)
+        for offset in range(horizon_days + 1):
+            for s, _ in self.shifts_starting_on(user_id, day + timedelta(days=offset)):
+                if s > after:
+                    return s
+        return None
+
+    def working_minutes(self, user_id: int, start: datetime, end: datetime) -> float:
+        """Рабочие минуты пользователя в [start, end)"""
+        start, end = _as_utc(start, self.tz), _as_utc(end, self.tz)
+        if end <= start:
+            return 0.0
+        total = 0.0
+        for s, e in self.shifts_between(user_id, start, end):
+            total += (min(e, end) - max(s, start)).total_seconds()
+        return total / 60
+
+    def working_minutes_many(self, items: Iterable[Tuple[int, datetime, datetime]]) -> List[float]:
+        """working_minutes для списка (user_id, start, end) за один вызов"""
+        return [self.working_minutes(uid, s, e) for uid, s, e in items]
+
+
+def load_schedule_calendar(cur, schema: str, user_ids: Optional[Iterable[int]] = None,
+                           date_from: Optional[date] = None,
+                           date_to: Optional[date] = None) -> ScheduleCalendar:
+    """Снимок графиков (всех или указанных пользователей) и исключений за диапазон дат.
+    По умолчанию диапазон — от вчера до NEXT_SHIFT_HORIZON_DAYS вперёд."""
+    tz = get_schedule_tz()
+    today = datetime.now(timezone.utc).astimezone(tz).date()
+    date_from = date_from or today - timedelta(days=1)
+    date_to = date_to or today + timedelta(days=NEXT_SHIFT_HORIZON_DAYS + 1)
+    ids = sorted({int(u) for u in user_ids}) if user_ids is not None else None
+
+    cur.execute(f"""
+        SELECT user_id, day_of_week, start_time, end_time, is_active
+        FROM {schema}.work_schedules
+        WHERE is_active = true AND (%s::int[] IS NULL OR user_id = ANY(%s::int[]))
+    """, (ids, ids))
+    schedules = cur.fetchall()
+
+    cur.execute(f"""
+        SELECT user_id, exception_date, is_working, start_time, end_time
+        FROM {schema}.work_schedule_exceptions
+        WHERE exception_date BETWEEN %s AND %s
+          AND (user_id IS NULL OR %s::int[] IS NULL OR user_id = ANY(%s::int[]))
+    """, (date_from, date_to, ids, ids))
+    exceptions = cur.fetchall()
+
+    return ScheduleCalendar(schedules, exceptions, tz)
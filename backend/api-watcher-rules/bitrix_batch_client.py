@@ -0,0 +1,224 @@
+"""Клиент REST Битрикс24 с отправкой команд пачками через метод batch.
+
+Команды копятся в очереди и уходят по BITRIX_BATCH_MAX штук за один HTTP-запрос
+по keep-alive соединению, которое живёт между тёплыми вызовами функции.
+Ошибки возвращаются по каждой команде отдельно (result_error в ответе batch).
+"""
+import http.client
+import json
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Лимит Битрикс24 на число команд в одном batch
+BITRIX_BATCH_MAX = 50
+BITRIX_HTTP_TIMEOUT = 15
+
+# Ошибки, после которых токен нужно получить заново
+AUTH_ERRORS = ('expired_token', 'invalid_token', 'NO_AUTH_FOUND')
+
+
+def _build_query(params: Dict[str, Any], prefix: str = '') -> List[Tuple[str, str]]:
+    """Плоские пары ключ-значение в нотации PHP (KEYBOARD[0][TEXT]=...), как ждёт batch"""
+    pairs: List[Tuple[str, str]] = []
+    items = params.items() if isinstance(params, dict) else enumerate(params)
+    for key, value in items:
+        name = f'{prefix}[{key}]' if prefix else str(key)
+        if isinstance(value, (dict, list, tuple)):
+            pairs.extend(_build_query(value, name))
+        elif value is None:
+            continue
+        elif isinstance(value, bool):
+            pairs.append((name, 'Y' if value else 'N'))
+        else:
+            pairs.append((name, str(value)))
+    return pairs
+
+
+def build_command(method: str, params: Dict[str, Any]) -> str:
+    """Строка команды для batch: method?query"""
+    return f"{method}?{urllib.parse.urlencode(_build_query(params))}"
+
+
+class BitrixError(Exception):
+    """Ошибка REST Битрикс24 на уровне всего запроса"""
+
+    def __init__(self, error: str, description: str = ''):
+        super().__init__(f'{error}: {description}' if description else error)
+        self.error = error
+        self.description = description
+
+    @property
+    def is_auth_error(self) -> bool:
+        return self.error in AUTH_ERRORS
+
+
+class BitrixBatchClient:
+    """Очередь команд REST и их пакетная отправка на портал"""
+
+    def __init__(self, portal_url: str):
+        parsed = urllib.parse.urlsplit(portal_url)
+        self.portal_url = portal_url
+        self._host = parsed.netloc
+        self._secure = parsed.scheme != 'http'
+        self._base_path = parsed.path.rstrip('/')
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._queue: List[Tuple[str, Dict[str, Any], Any]] = []
+        self._stats = {'commands': 0, 'failed': 0, 'batches': 0, 'http_errors': 0,
+                       'reconnects': 0, 'http_ms': 0.0}
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._conn is None:
+            cls = http.client.HTTPSConnection if self._secure else http.client.HTTPConnection
+            self._conn = cls(self._host, timeout=BITRIX_HTTP_TIMEOUT)
+            self._stats['reconnects'] += 1
+        return self._conn
+
+    def _drop_connection(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _post(self, method: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST на /rest/<method>.json.
+
+        Повтор — только если переиспользованное keep-alive соединение оказалось
+        закрыто сервером: обрыв при отправке или до первого байта ответа. Таймаут
+        чтения и обрыв посреди ответа не повторяются: batch мог уже выполниться,
+        и повтор продублировал бы до BITRIX_BATCH_MAX сообщений.
+        """
+        body = json.dumps(payload).encode('utf-8')
+        path = f"{self._base_path}/rest/{method}.json"
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        started = time.monotonic()
+        try:
+            for attempt in (1, 2):
+                reused = self._conn is not None
+                conn = self._connection()
+                try:
+                    conn.request('POST', path, body=body, headers=headers)
+                    resp = conn.getresponse()
+                except (BrokenPipeError, ConnectionResetError):
+                    # http.client.RemoteDisconnected — подкласс ConnectionResetError
+                    self._drop_connection()
+                    if attempt == 2 or not reused:
+                        raise
+                    continue
+                except Exception:
+                    self._drop_connection()
+                    raise
+                try:
+                    raw = resp.read()
+                except Exception:
+                    self._drop_connection()
+                    raise
+                break
+            if resp.getheader('Connection', '').lower() == 'close':
+                self._drop_connection()
+        finally:
+            self._stats['http_ms'] += (time.monotonic() - started) * 1000
+
+        try:
+            data = json.loads(raw.decode() or '{}')
+        except ValueError:
+            data = {}
+        if resp.status >= 400 or 'error' in data:
+            error = data.get('error') or f'HTTP {resp.status}'
+            description = data.get('error_description') or raw.decode(errors='replace')[:200]
+            raise BitrixError(error, description)
+        return data
+
+    def add(self, method: str, params: Dict[str, Any], tag: Any = None) -> None:
+        """Ставит команду в очередь. tag вернётся рядом с результатом команды."""
+        self._queue.append((method, params, tag))
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def discard(self, match: Callable[[Any], bool]) -> int:
+        """Убирает из очереди ещё не отправленные команды, чей tag подходит под match.
+        Возвращает число убранных команд."""
+        kept = [item for item in self._queue if not match(item[2])]
+        dropped = len(self._queue) - len(kept)
+        self._queue = kept
+        return dropped
+
+    def flush(self, auth: str, refresh_auth: Optional[Callable[[], str]] = None) -> List[Dict[str, Any]]:
+        """Отправляет очередь пачками. Возвращает [{tag, ok, result, error}] в порядке add().
+
+        refresh_auth вызывается один раз, если портал отверг токен; пачка повторяется с новым.
+        """
+        queue, self._queue = self._queue, []
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(queue), BITRIX_BATCH_MAX):
+            chunk = queue[start:start + BITRIX_BATCH_MAX]
+            chunk_results, auth_rejected = self._send_chunk(chunk, auth)
+            if auth_rejected and refresh_auth is not None:
+                auth, refresh_auth = refresh_auth(), None
+                if auth:
+                    chunk_results, _ = self._send_chunk(chunk, auth)
+            # Команды и ошибки — по итогу пачки, повтор с новым токеном не считается дважды
+            self._stats['commands'] += len(chunk)
+            self._stats['failed'] += sum(1 for r in chunk_results if not r['ok'])
+            results.extend(chunk_results)
+        return results
+
+    def _send_chunk(self, chunk: List[Tuple[str, Dict[str, Any], Any]],
+                    auth: str) -> Tuple[List[Dict[str, Any]], bool]:
+        cmd = {f'c{i}': build_command(method, params) for i, (method, params, _) in enumerate(chunk)}
+        self._stats['batches'] += 1
+        try:
+            data = self._post('batch', {'auth': auth, 'halt': 0, 'cmd': cmd})
+        except BitrixError as e:
+            print(f"[bitrix-batch] batch of {len(chunk)} rejected: {e}")
+            return [{'tag': tag, 'ok': False, 'result': None, 'error': str(e)[:200]}
+                    for _, _, tag in chunk], e.is_auth_error
+        except Exception as e:
+            self._stats['http_errors'] += 1
+            error = str(e)[:200]
+            print(f"[bitrix-batch] batch of {len(chunk)} failed: {error}")
+            return [{'tag': tag, 'ok': False, 'result': None, 'error': error} for _, _, tag in chunk], False
+
+        body = data.get('result') or {}
+        ok_results = body.get('result') or {}
+        errors = body.get('result_error') or {}
+        # Пустой словарь PHP отдаёт как []
+        if isinstance(ok_results, list):
+            ok_results = dict(enumerate(ok_results))
+        if isinstance(errors, list):
+            errors = {}
+
+        results = []
+        for i, (_, _, tag) in enumerate(chunk):
+            key = f'c{i}'
+            if key in errors:
+                err = errors[key]
+                if isinstance(err, dict):
+                    err = f"{err.get('error', '')}: {err.get('error_description', '')}".strip(': ')
+                results.append({'tag': tag, 'ok': False, 'result': None, 'error': str(err)[:200]})
+            else:
+                results.append({'tag': tag, 'ok': True, 'result': ok_results.get(key), 'error': None})
+        return results, False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Накопленные за жизнь инстанса счётчики и пропускная способность"""
+        stats = dict(self._stats)
+        stats['http_ms'] = round(stats['http_ms'], 1)
+        seconds = stats['http_ms'] / 1000
+        stats['commands_per_sec'] = round(stats['commands'] / seconds, 1) if seconds else None
+        stats['avg_batch_size'] = round(stats['commands'] / stats['batches'], 1) if stats['batches'] else None
+        return stats
+
+
+_clients: Dict[str, BitrixBatchClient] = {}
+
+
+def get_bitrix_client(portal_url: str) -> BitrixBatchClient:
+    """Клиент портала, переживающий тёплые вызовы вместе с keep-alive соединением"""
+    client = _clients.get(portal_url)
+    if client is None:
+        client = _clients[portal_url] = BitrixBatchClient(portal_url)
+    return client
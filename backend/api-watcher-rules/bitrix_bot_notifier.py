@@ -3,6 +3,9 @@ import json
 import os
 import urllib.request
 import urllib.parse
+from typing import Any, Dict
+from bitrix_batch_client import get_bitrix_client
+from oauth_token_store import get_token, invalidate_token
 
 BITRIX_PORTAL_URL = os.environ.get('BITRIX24_PORTAL_URL', '').rstrip('/')
 BITRIX_BOT_ID = os.environ.get('BITRIX_BOT_ID', '')
@@ -10,51 +13,82 @@ BITRIX_BOT_CLIENT_ID = os.environ.get('BITRIX_BOT_CLIENT_ID', '')
 BITRIX_BOT_CLIENT_SECRET = os.environ.get('BITRIX_BOT_CLIENT_SECRET', '')
 BITRIX_BOT_REFRESH_TOKEN = os.environ.get('BITRIX_BOT_REFRESH_TOKEN', '')
 
-_bot_access_token = None
+# Пока пакет открыт (start_batch), сообщения копятся в клиенте
+_batch_open = False
+
+
+def _refresh_bot_oauth(refresh_token: str = None) -> dict:
+    """Обновляет токен бота. Сначала последним выданным refresh_token, затем начальным из окружения."""
+    last_error = None
+    for candidate in dict.fromkeys(t for t in (refresh_token, BITRIX_BOT_REFRESH_TOKEN) if t):
+        params = urllib.parse.urlencode({
+            'grant_type': 'refresh_token',
+            'client_id': BITRIX_BOT_CLIENT_ID,
+            'client_secret': BITRIX_BOT_CLIENT_SECRET,
+            'refresh_token': candidate,
+        })
+        url = f"https://oauth.bitrix.info/oauth/token/?{params}"
+        try:
+            req = urllib.request.Request(url, method='GET')
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                data = json.loads(resp.read().decode())
+        except Exception as e:
+            last_error = e
+            continue
+        if data.get('access_token'):
+            return data
+        last_error = data.get('error_description') or data.get('error')
+    raise RuntimeError(str(last_error))
 
 
 def _get_bot_token() -> str:
-    global _bot_access_token
-    if _bot_access_token:
-        return _bot_access_token
-
+    """Токен бота из общего хранилища oauth_tokens (обновляется одним инстансом)"""
     if not BITRIX_BOT_REFRESH_TOKEN or not BITRIX_BOT_CLIENT_ID or not BITRIX_BOT_CLIENT_SECRET:
+        print("[bitrix-bot] Missing bot credentials for token refresh")
         return ''
 
-    params = urllib.parse.urlencode({
-        'grant_type': 'refresh_token',
-        'client_id': BITRIX_BOT_CLIENT_ID,
-        'client_secret': BITRIX_BOT_CLIENT_SECRET,
-        'refresh_token': BITRIX_BOT_REFRESH_TOKEN,
-    })
-    url = f"https://oauth.bitrix.info/oauth/token/?{params}"
-
     try:
-        req = urllib.request.Request(url, method='GET')
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-            _bot_access_token = data.get('access_token', '')
-            return _bot_access_token
+        return get_token('bitrix_bot', _refresh_bot_oauth)
     except Exception as e:
         print(f"[bitrix-bot] Token refresh failed: {e}")
         return ''
 
 
-def _send_bot_message(access_token: str, bitrix_user_id: str, message: str, keyboard: list = None):
-    url = f"{BITRIX_PORTAL_URL}/rest/imbot.message.add.json?auth={access_token}"
+def _refresh_bot_token() -> str:
+    """Помечает токен отвергнутым (портал его не принял) и получает новый"""
+    invalidate_token('bitrix_bot')
+    return _get_bot_token()
+
+
+def start_batch() -> None:
+    """Дальнейшие сообщения копятся и уходят пачками batch в flush_batch()"""
+    global _batch_open
+    _batch_open = True
+
 
+def flush_batch() -> Dict[str, Any]:
+    """Отправляет накопленные сообщения и закрывает пакет. Возвращает статистику клиента."""
+    global _batch_open
+    _batch_open = False
+    if not BITRIX_PORTAL_URL:
+        return {}
+    client = get_bitrix_client(BITRIX_PORTAL_URL)
+    if client.pending():
+        for r in client.flush(_get_bot_token(), refresh_auth=_refresh_bot_token):
+            if not r['ok']:
+                print(f"[bitrix-bot] Failed to send to {r['tag']}: {r['error']}")
+    return client.get_stats()
+
+
+def _send_bot_message(access_token: str, bitrix_user_id: str, message: str, keyboard: list = None):
+    """Ставит imbot.message.add в очередь клиента; вне пакета сразу отправляет"""
     payload = {'BOT_ID': BITRIX_BOT_ID, 'DIALOG_ID': bitrix_user_id, 'MESSAGE': message}
     if keyboard:
         payload['KEYBOARD'] = keyboard
 
-    data = json.dumps(payload).encode('utf-8')
-
-    try:
-        req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'}, method='POST')
-        with urllib.request.urlopen(req, timeout=5) as r:
-            json.loads(r.read().decode())
-    except Exception as e:
-        print(f"[bitrix-bot] Failed to send to {bitrix_user_id}: {e}")
+    get_bitrix_client(BITRIX_PORTAL_URL).add('imbot.message.add', payload, tag=bitrix_user_id)
+    if not _batch_open:
+        flush_batch()
 
 
 def notify_watcher_added(cur, schema: str, ticket_id: int, watcher_user_id: int, app_origin: str = ''):
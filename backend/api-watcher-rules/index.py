@@ -7,16 +7,25 @@ POST   /         - создать правило
 PUT    /?id=X    - обновить правило
 DELETE /?id=X    - удалить правило
 POST   /?action=apply - применить правила к заявке (используется внутренне) body: {ticket_id, trigger: 'create'|'update'}
+POST   /?action=backfill - прогон правил по существующим заявкам пачками (см. backfill_rules)
+GET    /?action=backfill[&job_id=X] - состояние задания backfill / последние задания
+POST   /?action=backfill_worker - продолжить выполняющиеся задания backfill (automation-dispatcher,
+                                  заголовок X-Watcher-Backfill-Secret)
 """
 import json
+import os
+import time
 from typing import Any, Dict, List, Optional
 
 from shared_utils import (
     response, get_db_connection, verify_token,
     handle_options, safe_int, get_query_param, SCHEMA,
 )
+from notification_outbox import enqueue_notifications
 
 VALID_TARGET_TYPES = ('user', 'group', 'role')
+# Общий секрет воркера backfill; не задан — воркер не запускается
+WATCHER_BACKFILL_SECRET = os.environ.get('WATCHER_BACKFILL_SECRET', '')
 
 
 def handler(event, context):
@@ -24,13 +33,36 @@ def handler(event, context):
     if event.get('httpMethod') == 'OPTIONS':
         return handle_options()
 
+    method = event.get('httpMethod', 'GET')
+    action = get_query_param(event, 'action', '')
+
+    if method == 'POST' and action == 'backfill_worker':
+        headers = event.get('headers') or {}
+        secret = headers.get('X-Watcher-Backfill-Secret') or headers.get('x-watcher-backfill-secret')
+        if not WATCHER_BACKFILL_SECRET or secret != WATCHER_BACKFILL_SECRET:
+            return response(401, {'error': 'Требуется авторизация'})
+        try:
+            conn = get_db_connection()
+        except Exception:
+            return response(500, {'error': 'Database connection failed'})
+        try:
+            return response(200, {'success': True, **drain_backfill_jobs(conn)})
+        except Exception as e:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return response(500, {'error': str(e)})
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
     payload = verify_token(event)
     if not payload:
         return response(401, {'error': 'Требуется авторизация'})
 
-    method = event.get('httpMethod', 'GET')
-    action = get_query_param(event, 'action', '')
-
     try:
         conn = get_db_connection()
     except Exception:
@@ -40,6 +72,8 @@ def handler(event, context):
         if method == 'GET':
             if action == 'reference':
                 return get_reference(conn)
+            if action == 'backfill':
+                return get_backfill(conn, safe_int(get_query_param(event, 'job_id')))
             rid = safe_int(get_query_param(event, 'id'))
             if rid:
                 return get_rule(conn, rid)
@@ -52,7 +86,7 @@ def handler(event, context):
             if action == 'apply_executor_change':
                 return apply_executor_change(conn, body)
             if action == 'backfill':
-                return backfill_rules(conn, body)
+                return backfill_rules(conn, body, payload.get('user_id'))
             return create_rule(conn, body)
 
         if method == 'PUT':
@@ -436,31 +470,14 @@ def apply_rules(conn, body: Dict[str, Any]):
             if row:
                 added.append(int(row['user_id']))
 
-    conn.commit()
-
-    # Битрикс-уведомления для новых наблюдателей, добавленных по правилам
+    # Уведомления новым наблюдателям — через очередь notification_outbox в той же транзакции
     if added:
-        try:
-            from bitrix_bot_notifier import notify_watcher_added
-            app_origin = (body.get('app_origin') if isinstance(body, dict) else '') or ''
-            for uid in added:
-                try:
-                    notify_watcher_added(cur, SCHEMA, int(ticket_id), int(uid), app_origin=app_origin)
-                except Exception as bot_err:
-                    print(f"[bitrix-bot] watcher rule notification failed t={ticket_id} u={uid}: {bot_err}")
-        except Exception as imp_err:
-            print(f"[bitrix-bot] import notifier failed: {imp_err}")
+        app_origin = (body.get('app_origin') if isinstance(body, dict) else '') or ''
+        enqueue_notifications(cur, 'watcher_added', [
+            (int(ticket_id), {'user_id': int(uid), 'app_origin': app_origin}) for uid in added
+        ])
 
-        try:
-            from max_bot_notifier import notify_watcher_added as max_notify_watcher_added
-            app_origin = (body.get('app_origin') if isinstance(body, dict) else '') or ''
-            for uid in added:
-                try:
-                    max_notify_watcher_added(cur, SCHEMA, int(ticket_id), int(uid), app_origin=app_origin)
-                except Exception as bot_err:
-                    print(f"[max-bot] watcher rule notification failed t={ticket_id} u={uid}: {bot_err}")
-        except Exception as imp_err:
-            print(f"[max-bot] import notifier failed: {imp_err}")
+    conn.commit()
 
     cur.close()
     return response(200, {
@@ -545,31 +562,14 @@ def apply_executor_change(conn, body: Dict[str, Any]):
         if row:
             added.append(int(row['user_id']))
 
-    conn.commit()
-
-    # Битрикс-уведомления для новых наблюдателей (смена исполнителя по правилам)
+    # Уведомления новым наблюдателям — через очередь notification_outbox в той же транзакции
     if added:
-        try:
-            from bitrix_bot_notifier import notify_watcher_added
-            app_origin = (body.get('app_origin') if isinstance(body, dict) else '') or ''
-            for uid in added:
-                try:
-                    notify_watcher_added(cur, SCHEMA, int(ticket_id), int(uid), app_origin=app_origin)
-                except Exception as bot_err:
-                    print(f"[bitrix-bot] exec change watcher notif failed t={ticket_id} u={uid}: {bot_err}")
-        except Exception as imp_err:
-            print(f"[bitrix-bot] import notifier failed: {imp_err}")
+        app_origin = (body.get('app_origin') if isinstance(body, dict) else '') or ''
+        enqueue_notifications(cur, 'watcher_added', [
+            (int(ticket_id), {'user_id': int(uid), 'app_origin': app_origin}) for uid in added
+        ])
 
-        try:
-            from max_bot_notifier import notify_watcher_added as max_notify_watcher_added
-            app_origin = (body.get('app_origin') if isinstance(body, dict) else '') or ''
-            for uid in added:
-                try:
-                    max_notify_watcher_added(cur, SCHEMA, int(ticket_id), int(uid), app_origin=app_origin)
-                except Exception as bot_err:
-                    print(f"[max-bot] exec change watcher notif failed t={ticket_id} u={uid}: {bot_err}")
-        except Exception as imp_err:
-            print(f"[max-bot] import notifier failed: {imp_err}")
+    conn.commit()
 
     cur.close()
     return response(200, {
@@ -580,19 +580,292 @@ def apply_executor_change(conn, body: Dict[str, Any]):
     })
 
 
-def backfill_rules(conn, body: Dict[str, Any]):
-    """Однократный прогон правил trigger_on_create по уже существующим заявкам.
+BACKFILL_CHUNK_DEFAULT = 500
+BACKFILL_CHUNK_MAX = 5000
+# Сколько секунд одного вызова тратить на пачки; остаток прогона — следующим вызовом
+BACKFILL_TIME_BUDGET_SECONDS = 20
+
+_BACKFILL_JOB_FIELDS = """
+    id, status, params, dry_run, cursor_ticket_id, total_tickets, processed_tickets,
+    matched_tickets, added_watchers, notifications_queued, last_error, created_by,
+    created_at, updated_at, finished_at
+"""
+
+# Совпадение правил с пачкой заявок, цели правил и кандидаты в наблюдатели — одним запросом.
+# Условие правила пустое — правило не срабатывает (как _rule_matches_ticket).
+_BACKFILL_CANDIDATES_SQL = """
+    WITH chunk AS (
+        SELECT id, category_id, department_id, priority_id, executor_group_id, assigned_to, created_by
+        FROM {schema}.tickets
+        WHERE id = ANY(%(ticket_ids)s)
+    ), rules AS (
+        SELECT id, category_id, department_id, priority_id, executor_group_id, assignee_id,
+               UPPER(COALESCE(match_mode, 'AND')) = 'OR' AS is_or
+        FROM {schema}.ticket_watcher_rules
+        WHERE is_active = true AND trigger_on_create = true
+          AND (%(rule_id)s::int IS NULL OR id = %(rule_id)s::int)
+          AND COALESCE(category_id, department_id, priority_id, executor_group_id, assignee_id) IS NOT NULL
+    ), matches AS (
+        SELECT c.id AS ticket_id, c.created_by, r.id AS rule_id
+        FROM chunk c
+        JOIN rules r ON CASE WHEN r.is_or THEN
+                (r.category_id = c.category_id)
+                OR (r.department_id = c.department_id)
+                OR (r.priority_id = c.priority_id)
+                OR (r.executor_group_id = c.executor_group_id)
+                OR (r.assignee_id = c.assigned_to)
+            ELSE
+                (r.category_id IS NULL OR r.category_id = c.category_id)
+                AND (r.department_id IS NULL OR r.department_id = c.department_id)
+                AND (r.priority_id IS NULL OR r.priority_id = c.priority_id)
+                AND (r.executor_group_id IS NULL OR r.executor_group_id = c.executor_group_id)
+                AND (r.assignee_id IS NULL OR r.assignee_id = c.assigned_to)
+            END
+    ), rule_users AS (
+        SELECT t.rule_id, t.target_id AS user_id
+        FROM {schema}.ticket_watcher_rule_targets t
+        WHERE t.target_type = 'user' AND t.rule_id IN (SELECT id FROM rules)
+        UNION
+        SELECT t.rule_id, m.user_id
+        FROM {schema}.ticket_watcher_rule_targets t
+        JOIN {schema}.executor_group_members m ON m.group_id = t.target_id
+        WHERE t.target_type = 'group' AND t.rule_id IN (SELECT id FROM rules)
+        UNION
+        SELECT t.rule_id, ur.user_id
+        FROM {schema}.ticket_watcher_rule_targets t
+        JOIN {schema}.user_roles ur ON ur.role_id = t.target_id
+        WHERE t.target_type = 'role' AND t.rule_id IN (SELECT id FROM rules)
+    ), candidates AS (
+        SELECT DISTINCT m.ticket_id, ru.user_id
+        FROM matches m
+        JOIN rule_users ru ON ru.rule_id = m.rule_id
+        WHERE ru.user_id IS NOT NULL AND ru.user_id IS DISTINCT FROM m.created_by
+    )
+"""
 
-    Параметры body (опционально):
+
+def _backfill_job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    view = dict(job)
+    total = view.get('total_tickets') or 0
+    view['progress_percent'] = round(100.0 * view['processed_tickets'] / total, 1) if total else 100.0
+    for key in ('created_at', 'updated_at', 'finished_at'):
+        if view.get(key):
+            view[key] = view[key].isoformat()
+    return view
+
+
+def _backfill_chunk(cur, job: Dict[str, Any]) -> Dict[str, Any]:
+    """Обрабатывает одну пачку заявок после курсора. Возвращает приращения счётчиков."""
+    params = job['params'] or {}
+    status_ids = params.get('ticket_status_ids') or []
+    chunk_size = params.get('chunk_size') or BACKFILL_CHUNK_DEFAULT
+    limit = params.get('limit') or 0
+    if limit:
+        chunk_size = min(chunk_size, limit - job['processed_tickets'])
+
+    cur.execute(f"""
+        SELECT id FROM {SCHEMA}.tickets
+        WHERE id > %s AND (%s::int[] = '{{}}' OR status_id = ANY(%s::int[]))
+        ORDER BY id
+        LIMIT %s
+    """, (job['cursor_ticket_id'], status_ids, status_ids, chunk_size))
+    ticket_ids = [r['id'] for r in cur.fetchall()]
+    if not ticket_ids:
+        return {'processed': 0, 'cursor': job['cursor_ticket_id'], 'matched': 0, 'added': 0, 'notified': 0}
+
+    sql_params = {'ticket_ids': ticket_ids, 'rule_id': params.get('rule_id')}
+    head = _BACKFILL_CANDIDATES_SQL.format(schema=SCHEMA)
+    if job['dry_run']:
+        cur.execute(head + f"""
+            SELECT (SELECT COUNT(DISTINCT ticket_id) FROM matches) AS matched,
+                   COUNT(*) AS added,
+                   '[]'::json AS added_rows
+            FROM candidates c
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {SCHEMA}.ticket_watchers w
+                WHERE w.ticket_id = c.ticket_id AND w.user_id = c.user_id
+            )
+        """, sql_params)
+    else:
+        cur.execute(head + f""", inserted AS (
+                INSERT INTO {SCHEMA}.ticket_watchers (ticket_id, user_id)
+                SELECT ticket_id, user_id FROM candidates
+                ON CONFLICT (ticket_id, user_id) DO NOTHING
+                RETURNING ticket_id, user_id
+            )
+            SELECT (SELECT COUNT(DISTINCT ticket_id) FROM matches) AS matched,
+                   COUNT(*) AS added,
+                   COALESCE(json_agg(json_build_array(ticket_id, user_id)), '[]'::json) AS added_rows
+            FROM inserted
+        """, sql_params)
+    row = cur.fetchone()
+
+    notified = 0
+    if row['added_rows'] and params.get('send_notifications'):
+        app_origin = params.get('app_origin') or ''
+        notified = enqueue_notifications(cur, 'watcher_added', [
+            (int(t_id), {'user_id': int(u_id), 'app_origin': app_origin}) for t_id, u_id in row['added_rows']
+        ])
+
+    return {
+        'processed': len(ticket_ids),
+        'cursor': ticket_ids[-1],
+        'matched': row['matched'],
+        'added': row['added'],
+        'notified': notified,
+    }
+
+
+def _run_backfill_job(conn, job_id: int, started: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Гоняет пачки, пока не кончатся заявки или бюджет времени вызова.
+
+    Каждая пачка — своя транзакция: блокировка строки задания, вставка наблюдателей,
+    сдвиг курсора и счётчиков. Параллельный вызов по тому же заданию пропускает
+    занятую строку и возвращает текущее состояние. started — начало вызова,
+    если бюджет делится между несколькими заданиями.
+    """
+    started = time.monotonic() if started is None else started
+    cur = conn.cursor()
+    try:
+        while True:
+            cur.execute(f"""
+                SELECT {_BACKFILL_JOB_FIELDS} FROM {SCHEMA}.watcher_backfill_jobs
+                WHERE id = %s AND status = 'running'
+                FOR UPDATE SKIP LOCKED
+            """, (job_id,))
+            job = cur.fetchone()
+            if not job:
+                conn.rollback()
+                break
+
+            limit = (job['params'] or {}).get('limit') or 0
+            try:
+                delta = _backfill_chunk(cur, job)
+            except Exception as e:
+                conn.rollback()
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.watcher_backfill_jobs
+                    SET last_error = %s, updated_at = NOW()
+                    WHERE id = %s
+                """, (str(e)[:1000], job_id))
+                conn.commit()
+                print(f"[backfill] job {job_id} chunk after #{job['cursor_ticket_id']} failed: {e}")
+                break
+
+            finished = delta['processed'] == 0 or (limit and job['processed_tickets'] + delta['processed'] >= limit)
+            cur.execute(f"""
+                UPDATE {SCHEMA}.watcher_backfill_jobs
+                SET cursor_ticket_id = %s,
+                    processed_tickets = processed_tickets + %s,
+                    matched_tickets = matched_tickets + %s,
+                    added_watchers = added_watchers + %s,
+                    notifications_queued = notifications_queued + %s,
+                    status = CASE WHEN %s THEN 'done' ELSE status END,
+                    finished_at = CASE WHEN %s THEN NOW() ELSE finished_at END,
+                    last_error = NULL,
+                    updated_at = NOW()
+                WHERE id = %s
+            """, (delta['cursor'], delta['processed'], delta['matched'], delta['added'],
+                  delta['notified'], bool(finished), bool(finished), job_id))
+            conn.commit()
+
+            if finished or time.monotonic() - started > BACKFILL_TIME_BUDGET_SECONDS:
+                break
+
+        cur.execute(f"SELECT {_BACKFILL_JOB_FIELDS} FROM {SCHEMA}.watcher_backfill_jobs WHERE id = %s", (job_id,))
+        job = cur.fetchone()
+        conn.rollback()
+        return _backfill_job_view(job) if job else None
+    finally:
+        cur.close()
+
+
+def drain_backfill_jobs(conn) -> Dict[str, Any]:
+    """Воркер: продолжает выполняющиеся задания backfill по порядку создания,
+    пока не выйдет общий бюджет времени вызова (задача watcher_backfill в automation-dispatcher)"""
+    started = time.monotonic()
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            SELECT id FROM {SCHEMA}.watcher_backfill_jobs
+            WHERE status = 'running'
+            ORDER BY id
+        """)
+        job_ids = [r['id'] for r in cur.fetchall()]
+        conn.rollback()
+    finally:
+        cur.close()
+
+    jobs = []
+    for job_id in job_ids:
+        if time.monotonic() - started > BACKFILL_TIME_BUDGET_SECONDS:
+            break
+        job = _run_backfill_job(conn, job_id, started)
+        if job:
+            jobs.append(job)
+    return {
+        'jobs': jobs,
+        'done': sum(1 for j in jobs if j.get('status') != 'running'),
+        'has_more': len(jobs) < len(job_ids) or any(j.get('status') == 'running' for j in jobs),
+    }
+
+
+def get_backfill(conn, job_id: Optional[int]):
+    """Состояние задания backfill по id или 20 последних заданий"""
+    cur = conn.cursor()
+    try:
+        if job_id:
+            cur.execute(f"SELECT {_BACKFILL_JOB_FIELDS} FROM {SCHEMA}.watcher_backfill_jobs WHERE id = %s", (job_id,))
+            job = cur.fetchone()
+            if not job:
+                return response(404, {'error': 'Задание не найдено'})
+            return response(200, _backfill_job_view(job))
+        cur.execute(f"""
+            SELECT {_BACKFILL_JOB_FIELDS} FROM {SCHEMA}.watcher_backfill_jobs
+            ORDER BY created_at DESC
+            LIMIT 20
+        """)
+        return response(200, {'jobs': [_backfill_job_view(j) for j in cur.fetchall()]})
+    finally:
+        cur.close()
+
+
+def backfill_rules(conn, body: Dict[str, Any], user_id: Optional[int] = None):
+    """Прогон правил trigger_on_create по уже существующим заявкам — фоновое задание пачками.
+
+    Новый прогон, параметры body (опционально):
       - rule_id (int): применить только одно правило (иначе — все активные с trigger_on_create=true)
       - ticket_status_ids (list[int]): ограничить статусами заявок (по умолчанию — все)
-      - dry_run (bool): только посчитать совпадения, не вставлять в ticket_watchers
-      - send_notifications (bool, default false): слать ли Битрикс-уведомления добавленным наблюдателям
+      - dry_run (bool): только посчитать, сколько наблюдателей добавилось бы, не трогая ticket_watchers
+      - send_notifications (bool, default false): поставить уведомления добавленным наблюдателям в outbox
       - limit (int): максимум заявок (по умолчанию без лимита)
+      - chunk_size (int): заявок в пачке (по умолчанию BACKFILL_CHUNK_DEFAULT)
+    Продолжение: { "job_id": N } — с сохранённого курсора; { "job_id": N, "cancel": true } — остановить.
+    Ответ — состояние задания после первого отрезка; задание в статусе 'running'
+    продолжает воркер (?action=backfill_worker) по расписанию automation-dispatcher,
+    повторный вызов с job_id лишь ускоряет его.
     """
-    rule_id = safe_int(body.get('rule_id'))
-    raw_statuses = body.get('ticket_status_ids') or []
+    job_id = safe_int(body.get('job_id'))
+    if job_id:
+        if body.get('cancel'):
+            cur = conn.cursor()
+            try:
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.watcher_backfill_jobs
+                    SET status = 'cancelled', finished_at = NOW(), updated_at = NOW()
+                    WHERE id = %s AND status = 'running'
+                """, (job_id,))
+                conn.commit()
+            finally:
+                cur.close()
+            return get_backfill(conn, job_id)
+        job = _run_backfill_job(conn, job_id)
+        if not job:
+            return response(404, {'error': 'Задание не найдено'})
+        return response(200, job)
+
     status_ids: List[int] = []
+    raw_statuses = body.get('ticket_status_ids') or []
     if isinstance(raw_statuses, list):
         for v in raw_statuses:
             try:
@@ -601,155 +874,39 @@ def backfill_rules(conn, body: Dict[str, Any]):
                     status_ids.append(iv)
             except (TypeError, ValueError):
                 continue
-    dry_run = bool(body.get('dry_run', False))
-    send_notifications = bool(body.get('send_notifications', False))
-    app_origin = (body.get('app_origin') or '').rstrip('/')
     try:
-        limit = int(body.get('limit') or 0)
+        limit = max(int(body.get('limit') or 0), 0)
+        chunk_size = min(max(int(body.get('chunk_size') or BACKFILL_CHUNK_DEFAULT), 1), BACKFILL_CHUNK_MAX)
     except (TypeError, ValueError):
-        limit = 0
+        return response(400, {'error': 'limit и chunk_size должны быть целыми'})
+
+    params = {
+        'rule_id': safe_int(body.get('rule_id')),
+        'ticket_status_ids': status_ids,
+        'send_notifications': bool(body.get('send_notifications', False)),
+        'app_origin': (body.get('app_origin') or '').rstrip('/'),
+        'limit': limit,
+        'chunk_size': chunk_size,
+    }
+    dry_run = bool(body.get('dry_run', False))
 
     cur = conn.cursor()
-
-    rule_filter_sql = ''
-    if rule_id:
-        rule_filter_sql = f' AND id = {int(rule_id)}'
-    cur.execute(f"""
-        SELECT id, category_id, department_id, priority_id, executor_group_id, assignee_id, match_mode
-        FROM {SCHEMA}.ticket_watcher_rules
-        WHERE is_active = true AND trigger_on_create = true{rule_filter_sql}
-    """)
-    rules = [dict(r) for r in cur.fetchall()]
-    if not rules:
-        cur.close()
-        return response(200, {
-            'success': True,
-            'message': 'Активных правил с trigger_on_create не найдено',
-            'processed_tickets': 0,
-            'matched_tickets': 0,
-            'added_watchers_total': 0,
-            'rules_count': 0,
-        })
-
-    rule_ids_csv = ','.join(str(int(r['id'])) for r in rules)
-    cur.execute(f"""
-        SELECT rule_id, target_type, target_id
-        FROM {SCHEMA}.ticket_watcher_rule_targets
-        WHERE rule_id IN ({rule_ids_csv})
-    """)
-    all_targets = [dict(t) for t in cur.fetchall()]
-
-    targets_by_rule: Dict[int, List[Dict[str, Any]]] = {}
-    for t in all_targets:
-        targets_by_rule.setdefault(int(t['rule_id']), []).append(t)
-    resolved_by_rule: Dict[int, List[int]] = {}
-    for r_id, t_list in targets_by_rule.items():
-        resolved_by_rule[r_id] = _resolve_target_user_ids(cur, t_list)
-
-    status_filter_sql = ''
-    if status_ids:
-        status_filter_sql = f" AND status_id IN ({','.join(str(s) for s in status_ids)})"
-    limit_sql = f' LIMIT {int(limit)}' if limit > 0 else ''
-
-    cur.execute(f"""
-        SELECT id, category_id, department_id, priority_id, executor_group_id, assigned_to, created_by
-        FROM {SCHEMA}.tickets
-        WHERE 1=1{status_filter_sql}
-        ORDER BY id ASC
-        {limit_sql}
-    """)
-    tickets = [dict(t) for t in cur.fetchall()]
-
-    processed = 0
-    matched_tickets = 0
-    added_total = 0
-    per_ticket_added: List[Dict[str, Any]] = []
-    notify_queue: List[Dict[str, int]] = []
-
-    for ticket in tickets:
-        processed += 1
-        matched_rule_ids: List[int] = [
-            int(r['id']) for r in rules if _rule_matches_ticket(r, ticket)
-        ]
-
-        if not matched_rule_ids:
-            continue
-        matched_tickets += 1
-
-        candidates: set = set()
-        for r_id in matched_rule_ids:
-            for uid in resolved_by_rule.get(r_id, []):
-                if uid:
-                    candidates.add(int(uid))
-
-        creator_id = ticket.get('created_by')
-        ticket_added: List[int] = []
-        for uid in candidates:
-            if creator_id and uid == creator_id:
-                continue
-            if dry_run:
-                cur.execute(f"""
-                    SELECT 1 FROM {SCHEMA}.ticket_watchers
-                    WHERE ticket_id = %s AND user_id = %s
-                """, (ticket['id'], uid))
-                if cur.fetchone():
-                    continue
-                ticket_added.append(uid)
-            else:
-                cur.execute(f"""
-                    INSERT INTO {SCHEMA}.ticket_watchers (ticket_id, user_id)
-                    VALUES (%s, %s)
-                    ON CONFLICT (ticket_id, user_id) DO NOTHING
-                    RETURNING user_id
-                """, (ticket['id'], uid))
-                row = cur.fetchone()
-                if row:
-                    ticket_added.append(int(row['user_id']))
-
-        if ticket_added:
-            added_total += len(ticket_added)
-            per_ticket_added.append({
-                'ticket_id': ticket['id'],
-                'matched_rules': matched_rule_ids,
-                'added_user_ids': ticket_added,
-            })
-            if send_notifications and not dry_run:
-                for uid in ticket_added:
-                    notify_queue.append({'ticket_id': int(ticket['id']), 'user_id': int(uid)})
-
-    if not dry_run:
+    try:
+        cur.execute(f"""
+            SELECT COUNT(*) AS cnt FROM {SCHEMA}.tickets
+            WHERE (%s::int[] = '{{}}' OR status_id = ANY(%s::int[]))
+        """, (status_ids, status_ids))
+        total = cur.fetchone()['cnt']
+        if limit:
+            total = min(total, limit)
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.watcher_backfill_jobs (params, dry_run, total_tickets, created_by)
+            VALUES (%s::jsonb, %s, %s, %s)
+            RETURNING id
+        """, (json.dumps(params), dry_run, total, user_id))
+        job_id = cur.fetchone()['id']
         conn.commit()
+    finally:
+        cur.close()
 
-    if notify_queue:
-        try:
-            from bitrix_bot_notifier import notify_watcher_added
-            for item in notify_queue:
-                try:
-                    notify_watcher_added(cur, SCHEMA, item['ticket_id'], item['user_id'], app_origin=app_origin)
-                except Exception as bot_err:
-                    print(f"[backfill] notify failed t={item['ticket_id']} u={item['user_id']}: {bot_err}")
-        except Exception as imp_err:
-            print(f"[backfill] notifier import failed: {imp_err}")
-
-        try:
-            from max_bot_notifier import notify_watcher_added as max_notify_watcher_added
-            for item in notify_queue:
-                try:
-                    max_notify_watcher_added(cur, SCHEMA, item['ticket_id'], item['user_id'], app_origin=app_origin)
-                except Exception as bot_err:
-                    print(f"[backfill][max] notify failed t={item['ticket_id']} u={item['user_id']}: {bot_err}")
-        except Exception as imp_err:
-            print(f"[backfill][max] notifier import failed: {imp_err}")
-
-    cur.close()
-    return response(200, {
-        'success': True,
-        'dry_run': dry_run,
-        'rule_id': rule_id,
-        'rules_count': len(rules),
-        'processed_tickets': processed,
-        'matched_tickets': matched_tickets,
-        'added_watchers_total': added_total,
-        'notifications_sent': len(notify_queue),
-        'per_ticket': per_ticket_added[:500],
-    })
\ No newline at end of file
+    return response(200, _run_backfill_job(conn, job_id))
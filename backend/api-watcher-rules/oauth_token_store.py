@@ -0,0 +1,124 @@
+"""Общий для всех функций кэш OAuth-токенов в таблице oauth_tokens.
+
+Токен ищется в памяти инстанса, затем в БД; обновляет его только тот вызов,
+который взял блокировку строки провайдера, остальные после ожидания читают
+уже обновлённый токен. Холодный инстанс обходится одним чтением из БД вместо
+запроса к OAuth-серверу. Работает на отдельном коротком соединении, чтобы
+блокировка не жила в транзакции обработчика.
+"""
+import os
+import time
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from typing import Any, Callable, Dict, Optional
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = os.environ.get('MAIN_DB_SCHEMA', 't_p67567221_one_file_page_projec')
+
+# Токен, которому осталось жить меньше, считается истёкшим
+TOKEN_MIN_TTL_SECONDS = 60
+TOKEN_LOCK_TIMEOUT = '20s'
+
+# refresh(refresh_token из БД или None) -> ответ OAuth-сервера:
+# access_token и срок (expires_at / expires / expires_in), опционально новый refresh_token
+Refresher = Callable[[Optional[str]], Dict[str, Any]]
+
+_memory: Dict[str, Dict[str, Any]] = {}
+
+
+def _expires_at(data: Dict[str, Any], now: float) -> float:
+    """Срок жизни в unix-секундах: GigaChat отдаёт expires_at в мс, Битрикс24 — expires и expires_in"""
+    value = data.get('expires_at') or data.get('expires')
+    if value:
+        value = float(value)
+        return value / 1000 if value > 1e12 else value
+    return now + float(data.get('expires_in') or 1800)
+
+
+def _remember(provider: str, token: str, expires_at: float) -> str:
+    _memory[provider] = {'token': token, 'expires_at': expires_at}
+    return token
+
+
+def get_token(provider: str, refresh: Refresher, min_ttl: int = TOKEN_MIN_TTL_SECONDS) -> str:
+    """Действующий access_token провайдера. Ошибки refresh пробрасываются вызывающему."""
+    now = time.time()
+    cached = _memory.get(provider)
+    if cached and cached['expires_at'] > now + min_ttl:
+        return cached['token']
+
+    try:
+        conn = psycopg2.connect(DATABASE_URL, connect_timeout=5, cursor_factory=RealDictCursor)
+    except Exception as e:
+        # Без БД работаем как раньше — обновляем токен сами
+        print(f"[token-store] DB unavailable, refreshing {provider} directly: {e}")
+        data = refresh(None)
+        return _remember(provider, data['access_token'], _expires_at(data, now))
+
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT access_token, EXTRACT(EPOCH FROM expires_at) AS expires_at
+            FROM {SCHEMA}.oauth_tokens WHERE provider = %s
+        """, (provider,))
+        row = cur.fetchone()
+        if row and row['access_token'] and row['expires_at'] and float(row['expires_at']) > now + min_ttl:
+            conn.rollback()
+            return _remember(provider, row['access_token'], float(row['expires_at']))
+
+        cur.execute(f"SET LOCAL lock_timeout = '{TOKEN_LOCK_TIMEOUT}'")
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.oauth_tokens (provider) VALUES (%s)
+            ON CONFLICT (provider) DO NOTHING
+        """, (provider,))
+        cur.execute(f"""
+            SELECT access_token, refresh_token, EXTRACT(EPOCH FROM expires_at) AS expires_at
+            FROM {SCHEMA}.oauth_tokens WHERE provider = %s
+            FOR UPDATE
+        """, (provider,))
+        row = cur.fetchone()
+        now = time.time()
+        # Пока ждали блокировку, токен мог обновить другой инстанс
+        if row['access_token'] and row['expires_at'] and float(row['expires_at']) > now + min_ttl:
+            conn.commit()
+            return _remember(provider, row['access_token'], float(row['expires_at']))
+
+        data = refresh(row['refresh_token'])
+        expires_at = _expires_at(data, now)
+        cur.execute(f"""
+            UPDATE {SCHEMA}.oauth_tokens
+            SET access_token = %s,
+                refresh_token = COALESCE(%s, refresh_token),
+                expires_at = to_timestamp(%s),
+                refreshed_at = NOW(),
+                refresh_count = refresh_count + 1
+            WHERE provider = %s
+        """, (data['access_token'], data.get('refresh_token') or None, expires_at, provider))
+        conn.commit()
+        print(f"[token-store] {provider} token refreshed")
+        return _remember(provider, data['access_token'], expires_at)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def invalidate_token(provider: str) -> None:
+    """Помечает токен истёкшим (сервис его отверг), если его ещё не заменили"""
+    cached = _memory.pop(provider, None)
+    if not cached:
+        return
+    try:
+        conn = psycopg2.connect(DATABASE_URL, connect_timeout=5)
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                UPDATE {SCHEMA}.oauth_tokens SET expires_at = NOW()
+                WHERE provider = %s AND access_token = %s
+            """, (provider, cached['token']))
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[token-store] invalidate {provider} failed: {e}")
@@ -1,6 +1,26 @@
-"""API для управления графиками работы исполнителей"""
+"""API для управления графиками работы исполнителей
+
+GET    /                                   — графики всех пользователей
+GET    /?user_id=X                         — график пользователя
+POST   /  body: {user_id, schedules}       — сохранить недельный график
+DELETE /?user_id=X                         — удалить график
+GET    /?action=on-shift[&user_ids=1,2][&at=ISO] — кто на смене и начало следующей смены
+POST   /?action=working-minutes  body: {items: [{user_id, from, to}]} — рабочие минуты
+GET    /?action=exceptions[&date_from=&date_to=] — праздники и личные исключения
+POST   /?action=exceptions  body: {user_id?, exception_date, is_working, start_time?, end_time?, note?}
+DELETE /?action=exceptions&id=X
+"""
 import json
+from datetime import date, datetime, timedelta, timezone
 from shared_utils import response, get_db_connection, verify_token, handle_options, safe_int, get_query_param, SCHEMA
+from work_schedule_index import get_schedule_tz, load_schedule_calendar, SCHEDULE_TIMEZONE
+
+# Больше пар за один вызов working-minutes не принимаем
+WORKING_MINUTES_MAX_ITEMS = 5000
+# Интервал длиннее не принимаем: расчёт идёт по дням
+WORKING_MINUTES_MAX_SPAN_DAYS = 366
+# Сумма дней по всем интервалам одного вызова
+WORKING_MINUTES_MAX_TOTAL_DAYS = 100000
 
 
 def handler(event, context):
@@ -14,8 +34,16 @@ def handler(event, context):
 
     method = event.get('httpMethod', 'GET')
 
+    action = get_query_param(event, 'action')
+
     conn = get_db_connection()
     try:
+        if action == 'on-shift' and method == 'GET':
+            return handle_on_shift(conn, event)
+        if action == 'working-minutes' and method == 'POST':
+            return handle_working_minutes(conn, event)
+        if action == 'exceptions':
+            return handle_exceptions(conn, event, method)
         if method == 'GET':
             return handle_get(conn, event)
         elif method == 'POST':
@@ -145,3 +173,148 @@ def handle_delete(conn, event):
     conn.commit()
     cur.close()
     return response(200, {'message': 'График удалён'})
+
+
+def _parse_moment(value, default: datetime = None):
+    """ISO-время; без пояса — время графиков"""
+    if not value:
+        return default
+    moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=get_schedule_tz())
+    return moment
+
+
+def _parse_ids(raw) -> list:
+    if not raw:
+        return []
+    items = raw.split(',') if isinstance(raw, str) else raw
+    return [i for i in (safe_int(x) for x in items) if i]
+
+
+def handle_on_shift(conn, event):
+    """Кто на смене в момент at (по умолчанию сейчас) и когда начнётся следующая смена"""
+    try:
+        at = _parse_moment(get_query_param(event, 'at'), datetime.now(timezone.utc))
+    except ValueError:
+        return response(400, {'error': 'at должен быть в формате ISO 8601'})
+    user_ids = _parse_ids(get_query_param(event, 'user_ids'))
+
+    cur = conn.cursor()
+    tz = get_schedule_tz()
+    day = at.astimezone(tz).date()
+    calendar = load_schedule_calendar(
+        cur, SCHEMA, user_ids or None,
+        day - timedelta(days=1), day + timedelta(days=15),
+    )
+    cur.close()
+
+    users = []
+    for uid in sorted(user_ids or calendar.user_ids):
+        next_start = calendar.next_shift_start(uid, at)
+        users.append({
+            'user_id': uid,
+            'on_shift': calendar.is_on_shift(uid, at),
+            'next_shift_start': next_start.astimezone(tz).isoformat() if next_start else None,
+        })
+    return response(200, {
+        'at': at.astimezone(tz).isoformat(),
+        'timezone': SCHEDULE_TIMEZONE,
+        'on_shift': [u['user_id'] for u in users if u['on_shift']],
+        'users': users,
+    })
+
+
+def handle_working_minutes(conn, event):
+    """Рабочие минуты по графику для пачки интервалов одним вызовом"""
+    body = json.loads(event.get('body') or '{}')
+    raw_items = body.get('items')
+    if not isinstance(raw_items, list) or not raw_items:
+        return response(400, {'error': 'items обязателен'})
+    if len(raw_items) > WORKING_MINUTES_MAX_ITEMS:
+        return response(400, {'error': f'Не больше {WORKING_MINUTES_MAX_ITEMS} интервалов за запрос'})
+
+    items = []
+    total_days = 0
+    try:
+        for it in raw_items:
+            uid = safe_int(it.get('user_id'))
+            start, end = _parse_moment(it.get('from')), _parse_moment(it.get('to'))
+            if not uid or not start or not end:
+                return response(400, {'error': 'Каждый интервал: user_id, from, to'})
+            span_days = max((end - start).days + 1, 0)
+            if span_days > WORKING_MINUTES_MAX_SPAN_DAYS:
+                return response(400, {'error': f'Интервал from..to не длиннее {WORKING_MINUTES_MAX_SPAN_DAYS} дней'})
+            total_days += span_days
+            items.append((uid, start, end))
+    except (ValueError, AttributeError):
+        return response(400, {'error': 'from/to должны быть в формате ISO 8601'})
+    if total_days > WORKING_MINUTES_MAX_TOTAL_DAYS:
+        return response(400, {'error': f'Не больше {WORKING_MINUTES_MAX_TOTAL_DAYS} дней по всем интервалам за запрос'})
+
+    tz = get_schedule_tz()
+    cur = conn.cursor()
+    calendar = load_schedule_calendar(
+        cur, SCHEMA, {uid for uid, _, _ in items},
+        min(s for _, s, _ in items).astimezone(tz).date() - timedelta(days=1),
+        max(e for _, _, e in items).astimezone(tz).date(),
+    )
+    cur.close()
+
+    minutes = calendar.working_minutes_many(items)
+    return response(200, {'minutes': [round(m, 2) for m in minutes]})
+
+
+def handle_exceptions(conn, event, method):
+    """Праздники (user_id пустой) и личные исключения из графика"""
+    cur = conn.cursor()
+    try:
+        if method == 'GET':
+            today = date.today()
+            date_from = get_query_param(event, 'date_from') or (today - timedelta(days=30)).isoformat()
+            date_to = get_query_param(event, 'date_to') or (today + timedelta(days=365)).isoformat()
+            cur.execute(f"""
+                SELECT e.id, e.user_id, u.full_name AS user_name, e.exception_date, e.is_working,
+                       e.start_time, e.end_time, e.note
+                FROM {SCHEMA}.work_schedule_exceptions e
+                LEFT JOIN {SCHEMA}.users u ON u.id = e.user_id
+                WHERE e.exception_date BETWEEN %s AND %s
+                ORDER BY e.exception_date, e.user_id NULLS FIRST
+            """, (date_from, date_to))
+            return response(200, [dict(r) for r in cur.fetchall()])
+
+        if method == 'POST':
+            body = json.loads(event.get('body') or '{}')
+            exception_date = body.get('exception_date')
+            if not exception_date:
+                return response(400, {'error': 'exception_date обязателен'})
+            is_working = bool(body.get('is_working', False))
+            start_time = body.get('start_time') if is_working else None
+            end_time = body.get('end_time') if is_working else None
+            if bool(start_time) != bool(end_time):
+                return response(400, {'error': 'start_time и end_time указываются вместе'})
+            cur.execute(f"""
+                INSERT INTO {SCHEMA}.work_schedule_exceptions
+                    (user_id, exception_date, is_working, start_time, end_time, note)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT ((COALESCE(user_id, 0)), exception_date) DO UPDATE
+                SET is_working = EXCLUDED.is_working, start_time = EXCLUDED.start_time,
+                    end_time = EXCLUDED.end_time, note = EXCLUDED.note, updated_at = NOW()
+                RETURNING id
+            """, (safe_int(body.get('user_id')), exception_date, is_working, start_time, end_time,
+                  body.get('note')))
+            exception_id = cur.fetchone()['id']
+            conn.commit()
+            return response(200, {'id': exception_id, 'message': 'Исключение сохранено'})
+
+        if method == 'DELETE':
+            exception_id = safe_int(get_query_param(event, 'id'))
+            if not exception_id:
+                return response(400, {'error': 'id обязателен'})
+            cur.execute(f"DELETE FROM {SCHEMA}.work_schedule_exceptions WHERE id = %s", (exception_id,))
+            conn.commit()
+            return response(200, {'message': 'Исключение удалено'})
+
+        return response(405, {'error': 'Method not allowed'})
+    finally:
+        cur.close()
@@ -14,6 +14,14 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 SYNC_POSITIONS_URL = 'https://functions.poehali.dev/554d2115-1c37-4955-b544-bc0a5df0b466'
 INACTIVE_USERS_URL = 'https://functions.poehali.dev/7bf1dc65-32dd-447a-a33e-8b1a7bed5b07'
 REASSIGN_BY_SCHEDULE_URL = 'https://functions.poehali.dev/42295d4a-eb89-4bd6-b915-d94a2a734b16'
+NOTIFICATION_OUTBOX_URL = 'https://functions.poehali.dev/42feebee-e551-4872-901b-0512a2085c1a?endpoint=notification-outbox'
+OUTBOX_WORKER_SECRET = os.environ.get('OUTBOX_WORKER_SECRET', '')
+BULK_JOBS_WORKER_URL = 'https://functions.poehali.dev/582ca427-5c6d-4995-b1b5-f4f206c12a07?endpoint=worker'
+BULK_WORKER_SECRET = os.environ.get('BULK_WORKER_SECRET', '')
+SLA_TIMERS_URL = 'https://functions.poehali.dev/42feebee-e551-4872-901b-0512a2085c1a?endpoint=sla-timers'
+SLA_TIMERS_SECRET = os.environ.get('SLA_TIMERS_SECRET', '')
+WATCHER_BACKFILL_URL = 'https://functions.poehali.dev/b6560f3c-5899-486e-83da-00fe16d0dd2f?action=backfill_worker'
+WATCHER_BACKFILL_SECRET = os.environ.get('WATCHER_BACKFILL_SECRET', '')
 
 CORS_HEADERS = {
     'Content-Type': 'application/json',
@@ -25,6 +33,7 @@ CORS_HEADERS = {
 
 PRESET_INTERVALS = {
     'off': None,
+    'every_minute': timedelta(minutes=1),
     'hourly': timedelta(hours=1),
     'every_6h': timedelta(hours=6),
     'every_12h': timedelta(hours=12),
@@ -348,6 +357,94 @@ def execute_job(job_key, params, auth_token=None):
         except Exception as e:
             return 'error', str(e)[:500], {}
 
+    if job_key == 'notification_outbox':
+        try:
+            r = requests.post(
+                NOTIFICATION_OUTBOX_URL,
+                json={'batch_size': params.get('batch_size', 50)},
+                headers={'Content-Type': 'application/json', 'X-Outbox-Secret': OUTBOX_WORKER_SECRET},
+                timeout=300,
+            )
+            data = r.json() if r.headers.get('Content-Type', '').startswith('application/json') else {'raw': r.text[:500]}
+            if r.ok:
+                return 'success', f"Отправлено {data.get('sent', 0)}, повтор {data.get('retry', 0)}, dead {data.get('dead', 0)}", data
+            return 'error', data.get('error') or f'HTTP {r.status_code}', data
+        except Exception as e:
+            return 'error', str(e)[:500], {}
+
+    if job_key == 'bulk_jobs':
+        try:
+            r = requests.post(
+                BULK_JOBS_WORKER_URL,
+                json={},
+                headers={'Content-Type': 'application/json', 'X-Bulk-Worker-Secret': BULK_WORKER_SECRET},
+                timeout=300,
+            )
+            data = r.json() if r.headers.get('Content-Type', '').startswith('application/json') else {'raw': r.text[:500]}
+            if r.ok:
+                return 'success', f"Пачек {data.get('chunks', 0)}, заявок {data.get('processed', 0)}, ошибок {data.get('failed', 0)}", data
+            return 'error', data.get('error') or f'HTTP {r.status_code}', data
+        except Exception as e:
+            return 'error', str(e)[:500], {}
+
+    if job_key == 'sla_timers':
+        try:
+            r = requests.post(
+                SLA_TIMERS_URL,
+                json={'batch_size': params.get('batch_size', 200)},
+                headers={'Content-Type': 'application/json', 'X-Sla-Timers-Secret': SLA_TIMERS_SECRET},
+                timeout=300,
+            )
+            data = r.json() if r.headers.get('Content-Type', '').startswith('application/json') else {'raw': r.text[:500]}
+            if r.ok:
+                return 'success', f"Таймеров {data.get('claimed', 0)}, уведомлений {data.get('notifications', 0)}, повтор {data.get('retry', 0)}", data
+            return 'error', data.get('error') or f'HTTP {r.status_code}', data
+        except Exception as e:
+            return 'error', str(e)[:500], {}
+
+    if job_key == 'watcher_backfill':
+        try:
+            r = requests.post(
+                WATCHER_BACKFILL_URL,
+                json={},
+                headers={'Content-Type': 'application/json', 'X-Watcher-Backfill-Secret': WATCHER_BACKFILL_SECRET},
+                timeout=300,
+            )
+            data = r.json() if r.headers.get('Content-Type', '').startswith('application/json') else {'raw': r.text[:500]}
+            if r.ok:
+                return 'success', f"Заданий {len(data.get('jobs', []))}, завершено {data.get('done', 0)}", data
+            return 'error', data.get('error') or f'HTTP {r.status_code}', data
+        except Exception as e:
+            return 'error', str(e)[:500], {}
+
+    if job_key == 'assignee_load_reconcile':
+        try:
+            conn = get_db()
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT reconcile_assignee_load()")
+                fixed = cur.fetchone()[0]
+                conn.commit()
+            finally:
+                conn.close()
+            return 'success', f'Исправлено записей нагрузки: {fixed}', {'fixed': fixed}
+        except Exception as e:
+            return 'error', str(e)[:500], {}
+
+    if job_key == 'ticket_list_rows_repair':
+        try:
+            conn = get_db()
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT repair_ticket_list_rows()")
+                repaired = cur.fetchone()[0]
+                conn.commit()
+            finally:
+                conn.close()
+            return 'success', f'Пересчитано строк проекции: {repaired}', {'repaired': repaired}
+        except Exception as e:
+            return 'error', str(e)[:500], {}
+
     return 'error', f'Неизвестная задача: {job_key}', {}
 
 
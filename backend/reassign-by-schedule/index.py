@@ -4,19 +4,28 @@
 
 Логика (только для групп с auto_assign_type = 'working'):
 - Берём открытые (не закрытые) заявки, назначенные на участников таких групп.
-- Если у текущего исполнителя сейчас НЕ его рабочая смена (нет активной записи
-  в work_schedules на текущий момент по МСК), а в группе есть коллеги, которые
+- Если у текущего исполнителя сейчас НЕ его рабочая смена (по индексу графиков
+  work_schedule_index: ночные смены, праздники и исключения, пояс графиков),
+  а в группе есть коллеги, которые
   СЕЙЧАС на смене — передаём заявку наименее загруженному из работающих коллег.
 - Если на смене в группе никого нет — оставляем заявку как есть.
 - Балансировка по нагрузке: получатель — тот, у кого меньше всего активных заявок
   (по статусам с count_for_distribution = true).
 - Каждая передача фиксируется записью в ticket_history.
+
+Прогон читает снимок несколькими запросами (участники групп с нагрузкой, их
+графики и исключения, заявки исполнителей не на смене, имена), строит план в памяти — нагрузка получателя растёт,
+а прежнего исполнителя уменьшается по мере распределения, — и применяет его
+одним UPDATE и одной вставкой в историю. POST {"dry_run": true} — только план.
 """
 import os
 import json
+import random
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime, timezone, timedelta
+from psycopg2.extras import RealDictCursor, execute_values
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+from work_schedule_index import load_schedule_calendar
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 SCHEMA = os.environ.get('MAIN_DB_SCHEMA')
@@ -24,6 +33,12 @@ SCHEMA = os.environ.get('MAIN_DB_SCHEMA')
 
 def handler(event: dict, context) -> dict:
     """Перераспределение заявок при окончании рабочего дня исполнителя"""
+    try:
+        body = json.loads((event or {}).get('body') or '{}')
+    except (TypeError, ValueError):
+        body = {}
+    dry_run = bool(isinstance(body, dict) and body.get('dry_run'))
+
     conn = psycopg2.connect(
         DATABASE_URL,
         cursor_factory=RealDictCursor,
@@ -31,75 +46,43 @@ def handler(event: dict, context) -> dict:
     )
     cur = conn.cursor()
 
-    now_msk = datetime.now(timezone.utc) + timedelta(hours=3)
-    current_day = now_msk.weekday()
-    current_time = now_msk.strftime('%H:%M:%S')
-
-    reassigned = 0
-    details = []
+    now = datetime.now(timezone.utc)
 
     try:
-        cur.execute(f"""
-            SELECT t.id AS ticket_id, t.assigned_to, t.executor_group_id,
-                   g.id AS group_id, g.balance_mode
-            FROM {SCHEMA}.tickets t
-            JOIN {SCHEMA}.ticket_statuses st ON st.id = t.status_id
-            JOIN {SCHEMA}.executor_group_members gm ON gm.user_id = t.assigned_to
-            JOIN {SCHEMA}.executor_groups g ON g.id = gm.group_id
-                AND g.is_active = true
-                AND g.auto_assign_type = 'working'
-            WHERE t.assigned_to IS NOT NULL
-              AND COALESCE(t.is_archived, false) = false
-              AND COALESCE(st.is_closed, false) = false
-              AND NOT EXISTS (
-                  SELECT 1 FROM {SCHEMA}.work_schedules ws
-                  WHERE ws.user_id = t.assigned_to
-                    AND ws.day_of_week = %s
-                    AND ws.is_active = true
-                    AND ws.start_time <= %s::time
-                    AND ws.end_time > %s::time
-              )
-            ORDER BY t.id
-        """, (current_day, current_time, current_time))
-        candidates = cur.fetchall()
-
-        for tk in candidates:
-            ticket_id = tk['ticket_id']
-            group_id = tk['group_id']
-            old_user = tk['assigned_to']
-
-            new_user = _pick_working_member(
-                cur, group_id, current_day, current_time, exclude_user=old_user
-            )
-            if not new_user or new_user == old_user:
-                continue
-
-            cur.execute(f"""
-                UPDATE {SCHEMA}.tickets
-                SET assigned_to = %s, updated_at = NOW()
-                WHERE id = %s
-            """, (new_user, ticket_id))
-
-            old_name = _user_name(cur, old_user)
-            new_name = _user_name(cur, new_user)
-            cur.execute(f"""
-                INSERT INTO {SCHEMA}.ticket_history
-                    (ticket_id, user_id, field_name, old_value, new_value, created_at)
-                VALUES (%s, NULL, 'assigned_to', %s, %s, NOW())
-            """, (ticket_id, old_name, f"{new_name} (передано: окончание смены)"))
-
-            reassigned += 1
-            details.append({'ticket_id': ticket_id, 'from': old_user, 'to': new_user})
-
-        conn.commit()
+        members = _load_members(cur)
+        member_ids = {m['user_id'] for m in members}
+        calendar = load_schedule_calendar(cur, SCHEMA, member_ids)
+        on_shift = calendar.on_shift(member_ids, now)
+
+        candidates = _load_candidates(cur, member_ids - on_shift)
+        roster = [m for m in members if m['is_active'] and m['user_id'] in on_shift]
+        plan = _plan_reassignments(candidates, roster)
+
+        names = _user_names(cur, {p['from'] for p in plan} | {p['to'] for p in plan})
+        details = [
+            {**p, 'from_name': names.get(p['from']), 'to_name': names.get(p['to'])}
+            for p in plan
+        ]
+
+        if dry_run:
+            conn.rollback()
+            reassigned = 0
+        else:
+            applied = _apply_plan(cur, plan, names)
+            conn.commit()
+            details = [d for d in details if d['ticket_id'] in applied]
+            reassigned = len(details)
+
         return {
             'statusCode': 200,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
             'body': json.dumps({
                 'checked': len(candidates),
+                'planned': len(plan),
                 'reassigned': reassigned,
+                'dry_run': dry_run,
                 'details': details,
-            })
+            }, ensure_ascii=False)
         }
     except Exception as e:
         conn.rollback()
@@ -113,40 +96,129 @@ def handler(event: dict, context) -> dict:
         conn.close()
 
 
-def _pick_working_member(cur, group_id, current_day, current_time, exclude_user):
-    """Выбирает участника группы, который СЕЙЧАС на смене, с минимальной нагрузкой.
-    Нагрузка = число активных заявок (статусы с count_for_distribution = true)."""
+def _load_members(cur) -> List[Dict[str, Any]]:
+    """Участники активных групп 'working' с нагрузкой из assignee_load
+    (число активных заявок по статусам с count_for_distribution = true)."""
     cur.execute(f"""
-        SELECT m.user_id, m.is_lead, COALESCE(tc.ticket_count, 0) AS ticket_count
+        SELECT m.group_id, m.user_id, m.is_lead, u.is_active,
+               COALESCE(al.active_count, 0) AS ticket_count
         FROM {SCHEMA}.executor_group_members m
-        JOIN {SCHEMA}.users u ON u.id = m.user_id AND u.is_active = true
-        JOIN {SCHEMA}.work_schedules ws ON ws.user_id = m.user_id
-            AND ws.day_of_week = %s
-            AND ws.is_active = true
-            AND ws.start_time <= %s::time
-            AND ws.end_time > %s::time
-        LEFT JOIN (
-            SELECT assigned_to, COUNT(*) AS ticket_count
-            FROM {SCHEMA}.tickets t
-            JOIN {SCHEMA}.ticket_statuses s ON s.id = t.status_id
-                AND s.count_for_distribution = true
-            WHERE COALESCE(t.is_archived, false) = false
-            GROUP BY assigned_to
-        ) tc ON tc.assigned_to = m.user_id
-        WHERE m.group_id = %s AND m.user_id <> %s
-        ORDER BY ticket_count ASC, m.is_lead DESC, RANDOM()
-        LIMIT 1
-    """, (current_day, current_time, current_time, group_id, exclude_user))
-    row = cur.fetchone()
-    return row['user_id'] if row else None
-
-
-def _user_name(cur, user_id):
-    if not user_id:
-        return 'Не назначен'
+        JOIN {SCHEMA}.executor_groups g ON g.id = m.group_id
+            AND g.is_active = true
+            AND g.auto_assign_type = 'working'
+        JOIN {SCHEMA}.users u ON u.id = m.user_id
+        LEFT JOIN {SCHEMA}.assignee_load al ON al.user_id = m.user_id
+    """)
+    return cur.fetchall()
+
+
+def _load_candidates(cur, off_shift_user_ids) -> List[Dict[str, Any]]:
+    """Открытые заявки исполнителей не на смене, в группах с auto_assign_type = 'working'.
+    Исполнитель в нескольких таких группах — заявка берётся один раз, с группой меньшего id."""
+    if not off_shift_user_ids:
+        return []
+    cur.execute(f"""
+        SELECT DISTINCT ON (t.id)
+               t.id AS ticket_id, t.assigned_to, t.executor_group_id,
+               g.id AS group_id, g.balance_mode,
+               COALESCE(st.count_for_distribution, false) AS count_for_distribution
+        FROM {SCHEMA}.tickets t
+        JOIN {SCHEMA}.ticket_statuses st ON st.id = t.status_id
+        JOIN {SCHEMA}.executor_group_members gm ON gm.user_id = t.assigned_to
+        JOIN {SCHEMA}.executor_groups g ON g.id = gm.group_id
+            AND g.is_active = true
+            AND g.auto_assign_type = 'working'
+        WHERE t.assigned_to = ANY(%s)
+          AND COALESCE(t.is_archived, false) = false
+          AND COALESCE(st.is_closed, false) = false
+        ORDER BY t.id, g.id
+    """, (sorted(off_shift_user_ids),))
+    return cur.fetchall()
+
+
+def _plan_reassignments(candidates, roster) -> List[Dict[str, Any]]:
+    """План передач без обращений к БД. Получатель — наименее загруженный участник
+    группы на смене (при равенстве — руководитель, затем случайный); нагрузка
+    пересчитывается после каждой передачи, поэтому пачка заявок расходится по смене.
+    Заявка в статусе без count_for_distribution в нагрузку не входит и её не меняет."""
+    members_by_group: Dict[int, List[Dict[str, Any]]] = {}
+    load: Dict[int, int] = {}
+    for m in roster:
+        members_by_group.setdefault(m['group_id'], []).append(m)
+        load[m['user_id']] = m['ticket_count']
+    tie_break = {uid: random.random() for uid in load}
+
+    plan = []
+    for tk in candidates:
+        old_user = tk['assigned_to']
+        members = [m for m in members_by_group.get(tk['group_id'], ()) if m['user_id'] != old_user]
+        if not members:
+            continue
+        best = min(members, key=lambda m: (load[m['user_id']], not m['is_lead'], tie_break[m['user_id']]))
+        new_user = best['user_id']
+        if tk['count_for_distribution']:
+            load[new_user] += 1
+            if old_user in load:
+                load[old_user] -= 1
+        plan.append({'ticket_id': tk['ticket_id'], 'from': old_user, 'to': new_user, 'group_id': tk['group_id']})
+    return plan
+
+
+def _apply_plan(cur, plan, names) -> set:
+    """Один UPDATE по всему плану и одна вставка истории. Заявки, которые с момента
+    чтения снимка уже переназначили, пропускаются. Возвращает id переданных заявок."""
+    if not plan:
+        return set()
+    cur.execute(f"""
+        UPDATE {SCHEMA}.tickets t
+        SET assigned_to = p.new_user, updated_at = NOW()
+        FROM unnest(%s::int[], %s::int[], %s::int[]) AS p(ticket_id, old_user, new_user)
+        WHERE t.id = p.ticket_id AND t.assigned_to = p.old_user
+        RETURNING t.id
+    """, ([p['ticket_id'] for p in plan], [p['from'] for p in plan], [p['to'] for p in plan]))
+    applied = {r['id'] for r in cur.fetchall()}
+    _refresh_ticket_list_rows(cur, applied)
+
+    execute_values(cur, f"""
+        INSERT INTO {SCHEMA}.ticket_history
+            (ticket_id, user_id, field_name, old_value, new_value, created_at)
+        VALUES %s
+    """, [
+        (p['ticket_id'], names.get(p['from']), f"{names.get(p['to'])} (передано: окончание смены)")
+        for p in plan if p['ticket_id'] in applied
+    ], template="(%s, NULL, 'assigned_to', %s, %s, NOW())", page_size=1000)
+    return applied
+
+
+def _refresh_ticket_list_rows(cur, ticket_ids) -> None:
+    """Пересчитывает строки проекции списка заявок (ticket_list_rows) в текущей транзакции.
+    Сбой проекции не откатывает переназначение — расхождение исправит задача сверки
+    ticket_list_rows_repair.
+    """
+    ids = sorted({int(i) for i in ticket_ids if i})
+    if not ids:
+        return
+    try:
+        cur.execute("SAVEPOINT ticket_list_rows_refresh")
+        cur.execute(f"SELECT {SCHEMA}.refresh_ticket_list_rows(%s::int[])", (ids,))
+        cur.execute("RELEASE SAVEPOINT ticket_list_rows_refresh")
+    except Exception as e:
+        print(f"[reassign-by-schedule] ticket_list_rows refresh error: {e}")
+        try:
+            cur.execute("ROLLBACK TO SAVEPOINT ticket_list_rows_refresh")
+        except Exception:
+            pass
+
+
+def _user_names(cur, user_ids) -> Dict[int, str]:
+    """Имена пользователей одним запросом"""
+    ids = sorted(u for u in user_ids if u)
+    if not ids:
+        return {}
     cur.execute(f"""
-        SELECT COALESCE(full_name, username) AS name
-        FROM {SCHEMA}.users WHERE id = %s
-    """, (user_id,))
-    row = cur.fetchone()
-    return row['name'] if row else f'#{user_id}'
\ No newline at end of file
+        SELECT id, COALESCE(full_name, username) AS name
+        FROM {SCHEMA}.users WHERE id = ANY(%s)
+    """, (ids,))
+    names = {uid: f'#{uid}' for uid in ids}
+    names.update({r['id']: r['name'] for r in cur.fetchall()})
+    return names
@@ -0,0 +1,229 @@
+"""
+Часы рабочего времени для SLA с флагом use_work_schedule.
+
+Рабочее время группы исполнителей — объединение смен её участников
+(недельные графики, праздники и исключения из work_schedule_index). Смены
+за диапазон дат сливаются в отсортированные непересекающиеся интервалы,
+к ним строится массив нарастающих рабочих секунд. После этого и «сколько
+рабочих минут между t1 и t2», и «момент через N рабочих минут» — двоичный
+поиск по массиву, а не проход по календарю: тысячи заявок считаются одним
+вызовом *_many по часам, построенным один раз.
+
+Колонки заявок смешанные: due_date/response_due_date — с часовым поясом,
+created_at, assigned_at, sla_paused_at — TIMESTAMP без пояса, который
+считается UTC. Поэтому наивные значения на входе трактуются как UTC, а
+результаты возвращаются с поясом UTC (as_utc приводит к тому же виду
+значения из БД для сравнений). Текущий момент берётся из БД (db_now),
+чтобы не расходиться с NOW() в соседних запросах.
+"""
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from work_schedule_index import ScheduleCalendar, get_schedule_tz, load_schedule_calendar
+
+# Насколько далеко вперёд строятся часы для расчёта дедлайнов
+SLA_CLOCK_HORIZON_DAYS = int(os.environ.get('SLA_CLOCK_HORIZON_DAYS', '120'))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Время из БД в UTC с поясом; наивное значение считается UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _ts(value: datetime) -> float:
+    return (as_utc(value) - _EPOCH).total_seconds()
+
+
+def _from_ts(ts: float) -> datetime:
+    return _EPOCH + timedelta(seconds=ts)
+
+
+class BusinessClock:
+    """Рабочие интервалы одного календаря с префиксными суммами"""
+
+    def __init__(self, intervals: Iterable[Tuple[datetime, datetime]]):
+        merged: List[List[float]] = []
+        for s, e in sorted((_ts(s), _ts(e)) for s, e in intervals):
+            if e <= s:
+                continue
+            if merged and s <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+
+        self._starts = [s for s, _ in merged]
+        self._ends = [e for _, e in merged]
+        # Рабочие секунды до начала и до конца i-го интервала
+        self._cum_start: List[float] = []
+        self._cum_end: List[float] = []
+        total = 0.0
+        for s, e in merged:
+            self._cum_start.append(total)
+            total += e - s
+            self._cum_end.append(total)
+        self.total_seconds = total
+
+    def __bool__(self) -> bool:
+        return bool(self._starts)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def _worked_until(self, t: float) -> float:
+        """Рабочие секунды от начала часов до момента t"""
+        i = bisect_right(self._starts, t) - 1
+        if i < 0:
+            return 0.0
+        return self._cum_start[i] + min(t, self._ends[i]) - self._starts[i]
+
+    def elapsed_minutes(self, start: datetime, end: datetime) -> float:
+        """Рабочие минуты в [start, end)"""
+        if start is None or end is None:
+            return 0.0
+        return max(self._worked_until(_ts(end)) - self._worked_until(_ts(start)), 0.0) / 60
+
+    def elapsed_minutes_many(self, items: Iterable[Tuple[datetime, datetime]]) -> List[float]:
+        """elapsed_minutes для списка (start, end)"""
+        return [self.elapsed_minutes(s, e) for s, e in items]
+
+    def active_minutes(self, start: datetime, end: datetime, paused_seconds: float = 0,
+                       paused_since: Optional[datetime] = None) -> float:
+        """Рабочие минуты заявки за вычетом пауз: накопленной (sla_paused_total_seconds,
+        в рабочих секундах) и текущей, если заявка сейчас на паузе"""
+        minutes = self.elapsed_minutes(start, end) - float(paused_seconds or 0) / 60
+        if paused_since is not None:
+            minutes -= self.elapsed_minutes(max(as_utc(paused_since), as_utc(start)), end)
+        return max(minutes, 0.0)
+
+    def add_minutes(self, start: datetime, minutes: float) -> Optional[datetime]:
+        """Момент (UTC), когда от start пройдёт minutes рабочих минут.
+        None — столько рабочего времени нет в пределах построенных часов."""
+        if minutes <= 0:
+            return _from_ts(_ts(start))
+        target = self._worked_until(_ts(start)) + minutes * 60
+        j = bisect_left(self._cum_end, target)
+        if j >= len(self._cum_end):
+            return None
+        return _from_ts(self._starts[j] + target - self._cum_start[j])
+
+    def add_minutes_many(self, items: Iterable[Tuple[datetime, float]]) -> List[Optional[datetime]]:
+        """add_minutes для списка (start, minutes)"""
+        return [self.add_minutes(s, m) for s, m in items]
+
+
+def build_business_clock(calendar: ScheduleCalendar, user_ids: Iterable[int],
+                         date_from: date, date_to: date) -> BusinessClock:
+    """Часы из объединения смен пользователей, начинающихся в date_from - 1 .. date_to
+    (день до диапазона — ради ночных смен, переходящих в него)"""
+    users = list(user_ids)
+    intervals = []
+    day = date_from - timedelta(days=1)
+    while day <= date_to:
+        for uid in users:
+            intervals.extend(calendar.shifts_starting_on(uid, day))
+        day += timedelta(days=1)
+    return BusinessClock(intervals)
+
+
+def _local_date(value: datetime) -> date:
+    return as_utc(value).astimezone(get_schedule_tz()).date()
+
+
+def db_now(cur) -> datetime:
+    """Текущее время БД (UTC с поясом)"""
+    cur.execute("SELECT NOW() AS now")
+    row = cur.fetchone()
+    return as_utc(row['now'] if isinstance(row, dict) else row[0])
+
+
+def load_group_clocks(cur, schema: str, group_ids: Iterable[int],
+                      since: datetime, until: datetime) -> Dict[int, BusinessClock]:
+    """Часы групп исполнителей на отрезок [since, until] тремя запросами на все группы.
+    Группы без графиков у участников в результат не попадают — для них срок
+    считается по календарному времени."""
+    ids = sorted({int(g) for g in group_ids if g})
+    if not ids:
+        return {}
+    cur.execute(f"""
+        SELECT group_id, user_id
+        FROM {schema}.executor_group_members
+        WHERE group_id = ANY(%s)
+    """, (ids,))
+    members: Dict[int, List[int]] = {}
+    for r in cur.fetchall():
+        gid, uid = (r['group_id'], r['user_id']) if isinstance(r, dict) else (r[0], r[1])
+        members.setdefault(gid, []).append(int(uid))
+    if not members:
+        return {}
+
+    date_from = _local_date(since) - timedelta(days=1)
+    date_to = _local_date(until) + timedelta(days=1)
+    calendar = load_schedule_calendar(
+        cur, schema, {u for users in members.values() for u in users}, date_from, date_to
+    )
+    clocks = {}
+    for gid, users in members.items():
+        clock = build_business_clock(calendar, users, date_from, date_to)
+        if clock:
+            clocks[gid] = clock
+    return clocks
+
+
+def load_group_clock(cur, schema: str, group_id: Optional[int], since: datetime,
+                     until: Optional[datetime] = None) -> Optional[BusinessClock]:
+    """Часы одной группы; until по умолчанию — since + SLA_CLOCK_HORIZON_DAYS"""
+    if not group_id:
+        return None
+    until = until or since + timedelta(days=SLA_CLOCK_HORIZON_DAYS)
+    return load_group_clocks(cur, schema, [group_id], since, until).get(int(group_id))
+
+
+def business_deadlines(clock: Optional[BusinessClock], start: datetime,
+                       minutes: Sequence[Optional[int]]) -> List[Optional[datetime]]:
+    """Дедлайны через minutes рабочих минут от start; без часов или за горизонтом —
+    календарные минуты, как у SLA без графика"""
+    result = []
+    for m in minutes:
+        if not m:
+            result.append(None)
+            continue
+        due = clock.add_minutes(start, m) if clock else None
+        if due is None:
+            due = _from_ts(_ts(start) + int(m) * 60)
+        result.append(due)
+    return result
+
+
+def minutes_between(clock: Optional[BusinessClock], start: datetime, end: datetime) -> float:
+    """Минуты от start до end (отрицательные, если end раньше): рабочие по часам,
+    календарные — если часов нет"""
+    start, end = as_utc(start), as_utc(end)
+    if clock is None:
+        return (end - start).total_seconds() / 60
+    if end >= start:
+        return clock.elapsed_minutes(start, end)
+    return -clock.elapsed_minutes(end, start)
+
+
+def resume_deadline(clock: BusinessClock, deadline: Optional[datetime],
+                    paused_at: datetime, now: datetime) -> Optional[datetime]:
+    """Дедлайн после паузы [paused_at, now): рабочие минуты, остававшиеся на момент
+    паузы, отсчитываются заново от now. Срок, истёкший ещё до паузы, сдвигается
+    на календарную длительность паузы, как у SLA без графика."""
+    if deadline is None:
+        return None
+    deadline, paused_at, now = as_utc(deadline), as_utc(paused_at), as_utc(now)
+    remaining = minutes_between(clock, paused_at, deadline)
+    if remaining > 0:
+        moved = clock.add_minutes(now, remaining)
+        if moved is not None:
+            return moved
+    return deadline + (now - paused_at)
@@ -1,19 +1,228 @@
 """
 Фоновая задача: автозакрытие заявок, ожидающих подтверждения более 2 дней.
 Запускается по расписанию (cron). Закрывает заявки с рейтингом 5 по умолчанию.
-v2
+Заявки закрываются пачками по AUTO_CLOSE_CHUNK: на пачку один UPDATE ... RETURNING,
+одна многострочная вставка в историю и учёт закрытия (журнал групп, нарушения SLA)
+набором запросов на всю пачку. Для SLA с графиком время в группе и просрочки
+считаются в рабочих минутах (business_clock) — часами, построенными раз на пачку.
+Нагрузку исполнителей (assignee_load) пересчитывает триггер на tickets,
+строки проекции списка заявок (ticket_list_rows) — пересчёт в той же транзакции.
+v4
 """
 import os
 import json
+import time
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from business_clock import as_utc, load_group_clocks, minutes_between
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 SCHEMA = os.environ.get('MAIN_DB_SCHEMA')
 
+AUTO_CLOSE_CHUNK = 500
+# Потолок за один запуск и бюджет времени: после долгого простоя хвост закроют следующие запуски
+AUTO_CLOSE_MAX_PER_RUN = int(os.environ.get('AUTO_CLOSE_MAX_PER_RUN', '5000'))
+AUTO_CLOSE_TIME_BUDGET_SECONDS = 20
+
+
+def _refresh_ticket_list_rows(cur, ticket_ids) -> None:
+    """Пересчитывает строки проекции списка заявок (ticket_list_rows) в текущей транзакции.
+    Сбой проекции не откатывает закрытие — расхождение исправит задача сверки
+    ticket_list_rows_repair.
+    """
+    ids = sorted({int(i) for i in ticket_ids if i})
+    if not ids:
+        return
+    try:
+        cur.execute("SAVEPOINT ticket_list_rows_refresh")
+        cur.execute(f"SELECT {SCHEMA}.refresh_ticket_list_rows(%s::int[])", (ids,))
+        cur.execute("RELEASE SAVEPOINT ticket_list_rows_refresh")
+    except Exception as e:
+        print(f"[auto-close] ticket_list_rows refresh error: {e}")
+        try:
+            cur.execute("ROLLBACK TO SAVEPOINT ticket_list_rows_refresh")
+        except Exception:
+            pass
+
+
+def _close_chunk(cur, pending_ids: list, closed_status_id: int, limit: int) -> list:
+    """Закрывает до limit заявок одним UPDATE. Возвращает [{id, old_status_id, was_archived}]."""
+    cur.execute(f"""
+        WITH batch AS (
+            SELECT id, status_id, is_archived
+            FROM {SCHEMA}.tickets
+            WHERE status_id = ANY(%s)
+              AND confirmation_sent_at IS NOT NULL
+              AND confirmation_sent_at < NOW() - INTERVAL '2 days'
+            ORDER BY confirmation_sent_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE {SCHEMA}.tickets t
+        SET status_id = %s,
+            rating = 5,
+            is_archived = true,
+            closed_at = COALESCE(t.closed_at, NOW()),
+            updated_at = NOW()
+        FROM batch b
+        WHERE t.id = b.id
+        RETURNING t.id, b.status_id AS old_status_id, COALESCE(b.is_archived, false) AS was_archived
+    """, (pending_ids, limit, closed_status_id))
+    return cur.fetchall()
+
+
+def _business_timings(cur, ticket_sla: str, ticket_ids: list):
+    """Рабочие минуты для заявок пачки с SLA по графику: {log_id: минуты в группе}
+    и строки нарушений [(ticket_id, тип, бюджет, факт, просрочка, sla_id)].
+    Часы всех групп пачки строятся одним load_group_clocks."""
+    cur.execute(f"""
+        WITH ticket_sla AS ({ticket_sla})
+        SELECT t.id, t.executor_group_id, t.created_at, t.due_date, t.response_due_date,
+               t.sla_paused_at, COALESCE(t.sla_paused_total_seconds, 0) AS paused_seconds,
+               ts.sla_id, ts.response_time_minutes, ts.resolution_time_minutes,
+               g.id AS log_id, g.executor_group_id AS log_group_id, g.assigned_at,
+               EXISTS (SELECT 1 FROM {SCHEMA}.ticket_comments tc WHERE tc.ticket_id = t.id) AS has_any_comment,
+               NOW() AS now
+        FROM {SCHEMA}.tickets t
+        JOIN ticket_sla ts ON ts.ticket_id = t.id AND ts.use_work_schedule
+        LEFT JOIN LATERAL (
+            SELECT id, executor_group_id, assigned_at
+            FROM {SCHEMA}.ticket_group_log
+            WHERE ticket_id = t.id AND released_at IS NULL
+            ORDER BY assigned_at DESC
+            LIMIT 1
+        ) g ON true
+        WHERE t.id = ANY(%(ids)s)
+    """, {'ids': ticket_ids})
+    rows = cur.fetchall()
+    if not rows:
+        return [], {}, []
+
+    now = as_utc(rows[0]['now'])
+    since = min(as_utc(v) for r in rows for v in (r['created_at'], r['assigned_at']) if v)
+    group_ids = {r['executor_group_id'] for r in rows} | {r['log_group_id'] for r in rows}
+    clocks = load_group_clocks(cur, SCHEMA, group_ids, since, now)
+
+    business_ids, log_minutes, violations = [], {}, []
+    for r in rows:
+        clock = clocks.get(r['executor_group_id'])
+        log_clock = clocks.get(r['log_group_id'])
+        if r['log_id'] and log_clock:
+            log_minutes[r['log_id']] = log_clock.elapsed_minutes(r['assigned_at'], now)
+        if not clock:
+            continue
+        business_ids.append(r['id'])
+        actual = clock.active_minutes(r['created_at'], now, r['paused_seconds'], r['sla_paused_at'])
+        checks = [('global_resolution', r['resolution_time_minutes'], r['due_date'])]
+        if not r['has_any_comment']:
+            checks.append(('global_response', r['response_time_minutes'], r['response_due_date']))
+        for violation_type, budget, deadline in checks:
+            overdue = minutes_between(clock, deadline, now) if deadline else 0
+            if overdue > 0:
+                violations.append((r['id'], violation_type, budget, int(actual), int(overdue), r['sla_id']))
+    return business_ids, log_minutes, violations
+
+
+def _track_closed(cur, ticket_ids: list) -> None:
+    """track_ticket_closed (api-tickets) для пачки: закрытие активных записей журнала
+    групп и фиксация нарушений SLA — по запросу на вид записи, а не на заявку."""
+    # SLA заявки через её услуги/сервисы — одна запись на заявку
+    ticket_sla = f"""
+        SELECT DISTINCT ON (tsm.ticket_id)
+               tsm.ticket_id, s.id AS sla_id, s.response_time_minutes, s.resolution_time_minutes,
+               s.use_work_schedule
+        FROM {SCHEMA}.ticket_to_service_mappings tsm
+        JOIN {SCHEMA}.sla_service_mappings ssm ON
+            (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id = tsm.service_id)
+            OR (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id IS NULL)
+            OR (ssm.ticket_service_id IS NULL AND ssm.service_id = tsm.service_id)
+        JOIN {SCHEMA}.sla s ON s.id = ssm.sla_id
+        WHERE tsm.ticket_id = ANY(%(ids)s)
+        ORDER BY tsm.ticket_id, s.id
+    """
+    business_ids, log_minutes, business_violations = _business_timings(cur, ticket_sla, ticket_ids)
+    params = {
+        'ids': ticket_ids,
+        'business_ids': business_ids,
+        'log_ids': list(log_minutes),
+        'log_minutes': list(log_minutes.values()),
+    }
+    # Время в группе: рабочие минуты для SLA с графиком, иначе календарные
+    spent = """COALESCE(
+                (SELECT b.minutes FROM unnest(%(log_ids)s::int[], %(log_minutes)s::float[]) AS b(id, minutes)
+                 WHERE b.id = g.id),
+                EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - g.assigned_at)) / 60
+            )"""
+
+    cur.execute(f"""
+        WITH ticket_sla AS ({ticket_sla}),
+        released AS (
+            UPDATE {SCHEMA}.ticket_group_log g
+            SET released_at = CURRENT_TIMESTAMP,
+                time_spent_minutes = {spent},
+                overdue_minutes = GREATEST(0, {spent} - COALESCE(g.budget_minutes, 999999))
+            WHERE g.id IN (
+                SELECT DISTINCT ON (ticket_id) id
+                FROM {SCHEMA}.ticket_group_log
+                WHERE ticket_id = ANY(%(ids)s) AND released_at IS NULL
+                ORDER BY ticket_id, assigned_at DESC
+            )
+            RETURNING g.ticket_id, g.executor_group_id, g.budget_minutes,
+                      g.time_spent_minutes, g.overdue_minutes
+        )
+        INSERT INTO {SCHEMA}.sla_violations
+            (ticket_id, violation_type, executor_group_id,
+             budget_minutes, actual_minutes, overdue_minutes, sla_id)
+        SELECT r.ticket_id, 'group_resolution', r.executor_group_id,
+               r.budget_minutes, r.time_spent_minutes::int, r.overdue_minutes::int, ts.sla_id
+        FROM released r
+        LEFT JOIN ticket_sla ts ON ts.ticket_id = r.ticket_id
+        WHERE r.budget_minutes IS NOT NULL AND r.budget_minutes <> 0 AND r.overdue_minutes > 0
+    """, params)
+
+    cur.execute(f"""
+        WITH ticket_sla AS ({ticket_sla})
+        INSERT INTO {SCHEMA}.sla_violations
+            (ticket_id, violation_type, budget_minutes, actual_minutes, overdue_minutes, sla_id)
+        SELECT t.id, 'global_resolution', ts.resolution_time_minutes,
+               (EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - t.created_at)) / 60)::int,
+               (EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - t.due_date)) / 60)::int,
+               ts.sla_id
+        FROM {SCHEMA}.tickets t
+        JOIN ticket_sla ts ON ts.ticket_id = t.id
+        WHERE t.id = ANY(%(ids)s) AND t.id <> ALL(%(business_ids)s::int[])
+          AND t.due_date IS NOT NULL AND CURRENT_TIMESTAMP > t.due_date
+        UNION ALL
+        SELECT t.id, 'global_response', ts.response_time_minutes,
+               (EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - t.created_at)) / 60)::int,
+               (EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - t.response_due_date)) / 60)::int,
+               ts.sla_id
+        FROM {SCHEMA}.tickets t
+        JOIN ticket_sla ts ON ts.ticket_id = t.id
+        WHERE t.id = ANY(%(ids)s) AND t.id <> ALL(%(business_ids)s::int[])
+          AND t.response_due_date IS NOT NULL AND CURRENT_TIMESTAMP > t.response_due_date
+          AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.ticket_comments tc WHERE tc.ticket_id = t.id)
+    """, params)
+
+    if business_violations:
+        execute_values(cur, f"""
+            INSERT INTO {SCHEMA}.sla_violations
+                (ticket_id, violation_type, budget_minutes, actual_minutes, overdue_minutes, sla_id)
+            VALUES %s
+        """, business_violations, page_size=AUTO_CLOSE_CHUNK)
+
 
 def handler(event: dict, context) -> dict:
     """Автозакрытие заявок, ожидающих подтверждения более 2 дней"""
+    started = time.monotonic()
+    max_per_run = AUTO_CLOSE_MAX_PER_RUN
+    try:
+        body = json.loads((event or {}).get('body') or '{}')
+        if body.get('max_tickets_per_run'):
+            max_per_run = max(int(body['max_tickets_per_run']), 1)
+    except (TypeError, ValueError, AttributeError):
+        pass
+
     conn = psycopg2.connect(
         DATABASE_URL,
         cursor_factory=RealDictCursor,
@@ -22,56 +231,74 @@ def handler(event: dict, context) -> dict:
     cur = conn.cursor()
 
     try:
-        # Находим статус "Ожидает подтверждения"
-        cur.execute(f"SELECT id, name FROM {SCHEMA}.ticket_statuses WHERE is_pending_confirmation = TRUE LIMIT 1")
-        pending_status = cur.fetchone()
-        if not pending_status:
+        # Все статусы "Ожидает подтверждения"
+        cur.execute(f"SELECT id, name FROM {SCHEMA}.ticket_statuses WHERE is_pending_confirmation = TRUE ORDER BY id")
+        pending_statuses = {r['id']: r['name'] for r in cur.fetchall()}
+        if not pending_statuses:
             return {'statusCode': 200, 'body': json.dumps({'message': 'Статус pending_confirmation не найден', 'closed': 0})}
 
-        # Находим закрытый статус
-        cur.execute(f"SELECT id, name FROM {SCHEMA}.ticket_statuses WHERE is_closed = TRUE LIMIT 1")
+        # Закрытый статус
+        cur.execute(f"SELECT id, name FROM {SCHEMA}.ticket_statuses WHERE is_closed = TRUE ORDER BY id LIMIT 1")
         closed_status = cur.fetchone()
         if not closed_status:
             return {'statusCode': 200, 'body': json.dumps({'message': 'Закрытый статус не найден', 'closed': 0})}
 
-        # Находим все заявки, которые ожидают подтверждения больше 2 дней
-        cur.execute(f"""
-            SELECT id, created_by
-            FROM {SCHEMA}.tickets
-            WHERE status_id = %s
-              AND confirmation_sent_at IS NOT NULL
-              AND confirmation_sent_at < NOW() - INTERVAL '2 days'
-        """, (pending_status['id'],))
-        tickets_to_close = cur.fetchall()
-
         closed_count = 0
-        for ticket in tickets_to_close:
+        chunks = 0
+        has_more = False
+        while closed_count < max_per_run:
+            if time.monotonic() - started > AUTO_CLOSE_TIME_BUDGET_SECONDS:
+                has_more = True
+                break
+            limit = min(AUTO_CLOSE_CHUNK, max_per_run - closed_count)
             # Закрываем с автооценкой 5 (дедлайн истёк — считаем выполненным)
-            cur.execute(f"""
-                UPDATE {SCHEMA}.tickets
-                SET status_id = %s,
-                    rating = 5,
-                    is_archived = true,
-                    updated_at = NOW()
-                WHERE id = %s
-            """, (closed_status['id'], ticket['id']))
-
-            # Запись в историю
-            cur.execute(f"""
+            rows = _close_chunk(cur, list(pending_statuses), closed_status['id'], limit)
+            if not rows:
+                break
+
+            # Запись в историю — одна вставка на пачку
+            execute_values(cur, f"""
                 INSERT INTO {SCHEMA}.ticket_history (ticket_id, user_id, field_name, old_value, new_value, created_at)
-                VALUES (%s, NULL, 'status_id', %s, %s, NOW())
-            """, (ticket['id'], pending_status['name'], closed_status['name']))
+                VALUES %s
+            """, [
+                (r['id'], pending_statuses.get(r['old_status_id']), closed_status['name'])
+                for r in rows
+            ], template="(%s, NULL, 'status_id', %s, %s, NOW())", page_size=AUTO_CLOSE_CHUNK)
+
+            newly_closed = [r['id'] for r in rows if not r['was_archived']]
+            if newly_closed:
+                try:
+                    cur.execute("SAVEPOINT auto_close_tracking")
+                    _track_closed(cur, newly_closed)
+                    cur.execute("RELEASE SAVEPOINT auto_close_tracking")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT auto_close_tracking")
+                    print(f'[auto-close] group_log close error: {e}')
 
-            closed_count += 1
+            _refresh_ticket_list_rows(cur, [r['id'] for r in rows])
+            conn.commit()
+            closed_count += len(rows)
+            chunks += 1
+            if len(rows) < limit:
+                break
+        else:
+            has_more = True
 
-        conn.commit()
-        print(f'[auto-close] Закрыто заявок: {closed_count}')
+        duration_ms = int((time.monotonic() - started) * 1000)
+        print(f'[auto-close] Закрыто заявок: {closed_count}, пачек: {chunks}, {duration_ms} мс'
+              + (' (остались заявки на следующий запуск)' if has_more else ''))
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'message': f'Закрыто заявок: {closed_count}', 'closed': closed_count})
+            'body': json.dumps({
+                'message': f'Закрыто заявок: {closed_count}',
+                'closed': closed_count,
+                'chunks': chunks,
+                'has_more': has_more,
+                'duration_ms': duration_ms,
+            })
         }
 
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
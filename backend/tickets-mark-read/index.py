@@ -3,6 +3,8 @@ API сброса непрочитанного по заявке для теку
 POST /tickets-mark-read body: { "ticket_id": int }
 - Обновляет ticket_views.last_seen_at = NOW()
 - Помечает is_read=true все notifications текущего юзера по этой заявке
+- Read-модель ticket_user_state (флаги и счётчики списка заявок) обновляется
+  триггерами на ticket_views и notifications
 """
 import json
 from typing import Dict, Any
@@ -20,68 +20,60 @@ def handler(event: dict, context) -> dict:
     )
     cur = conn.cursor()
 
-    created_overdue = 0
-    notified_users = set()
-
     try:
+        # Получатели (исполнитель, автор, наблюдатели) всех просроченных заявок и вставка
+        # уведомлений — одним запросом; антиджойн отсекает тех, кому уже писали за сутки
         cur.execute(f"""
-            SELECT t.id, t.title, t.assigned_to, t.created_by, t.due_date,
-                   COALESCE(s.is_closed, false) AS is_closed
-            FROM {SCHEMA}.tickets t
-            LEFT JOIN {SCHEMA}.ticket_statuses s ON s.id = t.status_id
-            WHERE t.due_date IS NOT NULL
-              AND t.due_date < NOW()
-              AND COALESCE(s.is_closed, false) = false
+            WITH overdue AS (
+                SELECT t.id, t.title, t.assigned_to, t.created_by
+                FROM {SCHEMA}.tickets t
+                LEFT JOIN {SCHEMA}.ticket_statuses s ON s.id = t.status_id
+                WHERE t.due_date IS NOT NULL
+                  AND t.due_date < NOW()
+                  AND t.is_archived IS NOT TRUE
+                  AND COALESCE(s.is_closed, false) = false
+            ), recipients AS (
+                SELECT o.id AS ticket_id, o.title, o.assigned_to AS user_id
+                FROM overdue o WHERE o.assigned_to IS NOT NULL
+                UNION
+                SELECT o.id, o.title, o.created_by
+                FROM overdue o WHERE o.created_by IS NOT NULL
+                UNION
+                SELECT o.id, o.title, w.user_id
+                FROM overdue o
+                JOIN {SCHEMA}.ticket_watchers w ON w.ticket_id = o.id
+                WHERE w.user_id IS NOT NULL
+            ), inserted AS (
+                INSERT INTO {SCHEMA}.notifications
+                    (user_id, ticket_id, type, event_type, message, is_read, created_at)
+                SELECT r.user_id, r.ticket_id, 'overdue', 'overdue',
+                       'Заявка #' || r.ticket_id || ' «' || COALESCE(r.title, '') || '» просрочена',
+                       false, NOW()
+                FROM recipients r
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {SCHEMA}.notifications n
+                    WHERE n.ticket_id = r.ticket_id
+                      AND n.user_id = r.user_id
+                      AND n.event_type = 'overdue'
+                      AND n.created_at > NOW() - INTERVAL '24 hours'
+                )
+                RETURNING user_id
+            )
+            SELECT (SELECT COUNT(*) FROM overdue) AS overdue_tickets,
+                   COUNT(*) AS notifications_created,
+                   COUNT(DISTINCT user_id) AS users_notified
+            FROM inserted
         """)
-        overdue_tickets = cur.fetchall()
-
-        for tk in overdue_tickets:
-            ticket_id = tk['id']
-            recipients = set()
-            if tk['assigned_to']:
-                recipients.add(int(tk['assigned_to']))
-            if tk['created_by']:
-                recipients.add(int(tk['created_by']))
-
-            cur.execute(f"""
-                SELECT user_id FROM {SCHEMA}.ticket_watchers WHERE ticket_id = %s
-            """, (ticket_id,))
-            for w in cur.fetchall():
-                if w['user_id']:
-                    recipients.add(int(w['user_id']))
-
-            if not recipients:
-                continue
-
-            for uid in recipients:
-                cur.execute(f"""
-                    SELECT 1 FROM {SCHEMA}.notifications
-                    WHERE ticket_id = %s
-                      AND user_id = %s
-                      AND event_type = 'overdue'
-                      AND created_at > NOW() - INTERVAL '24 hours'
-                    LIMIT 1
-                """, (ticket_id, uid))
-                if cur.fetchone():
-                    continue
-
-                message = f"Заявка #{ticket_id} «{tk['title']}» просрочена"
-                cur.execute(f"""
-                    INSERT INTO {SCHEMA}.notifications
-                        (user_id, ticket_id, type, event_type, message, is_read, created_at)
-                    VALUES (%s, %s, 'overdue', 'overdue', %s, false, NOW())
-                """, (uid, ticket_id, message))
-                created_overdue += 1
-                notified_users.add(uid)
+        stats = cur.fetchone()
 
         conn.commit()
         return {
             'statusCode': 200,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
             'body': json.dumps({
-                'overdue_tickets': len(overdue_tickets),
-                'notifications_created': created_overdue,
-                'users_notified': len(notified_users),
+                'overdue_tickets': stats['overdue_tickets'],
+                'notifications_created': stats['notifications_created'],
+                'users_notified': stats['users_notified'],
             })
         }
     except Exception as e:
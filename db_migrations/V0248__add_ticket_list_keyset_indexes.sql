@@ -0,0 +1,5 @@
+-- Индексы для keyset-пагинации списка заявок (?cursor=): поиск позиции
+-- по (ключ сортировки, id) вместо OFFSET, чтобы глубокие страницы стоили как первая.
+CREATE INDEX IF NOT EXISTS idx_tickets_created_at_id ON tickets (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tickets_due_date_id ON tickets (due_date, id);
+CREATE INDEX IF NOT EXISTS idx_users_full_name ON users (full_name);
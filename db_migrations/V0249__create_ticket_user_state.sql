@@ -0,0 +1,201 @@
+-- Read-модель «непрочитанного» по паре (пользователь, заявка).
+-- Заменяет пять коррелированных подзапросов списка заявок (client_replied,
+-- client_replied_at, unread_count, unread_mentions, has_new) одним JOIN.
+-- Комментарии, ticket_views и notifications пишут разные функции, поэтому
+-- таблица поддерживается триггерами — так её не обходит ни один путь записи.
+CREATE TABLE IF NOT EXISTS ticket_user_state (
+    user_id INTEGER NOT NULL,
+    ticket_id INTEGER NOT NULL,
+    last_seen_at TIMESTAMP,
+    -- последний комментарий другого пользователя (включая скрытые)
+    last_foreign_comment_at TIMESTAMP,
+    -- последний публичный комментарий другого пользователя
+    last_foreign_public_comment_at TIMESTAMP,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    unread_mentions INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, ticket_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ticket_user_state_ticket ON ticket_user_state(ticket_id);
+CREATE INDEX IF NOT EXISTS idx_ticket_comments_ticket_created ON ticket_comments(ticket_id, created_at);
+
+-- Создаёт полностью рассчитанную строку состояния, если её ещё нет.
+CREATE OR REPLACE FUNCTION ticket_user_state_ensure(p_user_id INTEGER, p_ticket_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p_user_id IS NULL OR p_ticket_id IS NULL THEN
+        RETURN;
+    END IF;
+    INSERT INTO ticket_user_state (
+        user_id, ticket_id, last_seen_at,
+        last_foreign_comment_at, last_foreign_public_comment_at,
+        unread_count, unread_mentions
+    )
+    SELECT p_user_id, p_ticket_id,
+           (SELECT tv.last_seen_at FROM ticket_views tv
+            WHERE tv.user_id = p_user_id AND tv.ticket_id = p_ticket_id),
+           (SELECT MAX(tc.created_at) FROM ticket_comments tc
+            WHERE tc.ticket_id = p_ticket_id AND tc.user_id <> p_user_id),
+           (SELECT MAX(tc.created_at) FROM ticket_comments tc
+            WHERE tc.ticket_id = p_ticket_id AND tc.user_id <> p_user_id
+              AND COALESCE(tc.is_internal, false) = false),
+           (SELECT COUNT(*) FROM notifications n
+            WHERE n.user_id = p_user_id AND n.ticket_id = p_ticket_id AND n.is_read = false),
+           (SELECT COUNT(*) FROM notifications n
+            WHERE n.user_id = p_user_id AND n.ticket_id = p_ticket_id AND n.is_read = false
+              AND n.event_type = 'mention')
+    ON CONFLICT (user_id, ticket_id) DO NOTHING;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Полная пересборка из исходных таблиц (для одной заявки или для всех).
+CREATE OR REPLACE FUNCTION rebuild_ticket_user_state(p_ticket_id INTEGER DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    DELETE FROM ticket_user_state
+    WHERE p_ticket_id IS NULL OR ticket_id = p_ticket_id;
+
+    INSERT INTO ticket_user_state (
+        user_id, ticket_id, last_seen_at,
+        last_foreign_comment_at, last_foreign_public_comment_at,
+        unread_count, unread_mentions
+    )
+    SELECT pairs.user_id, pairs.ticket_id,
+           tv.last_seen_at,
+           fc.last_foreign_comment_at,
+           fc.last_foreign_public_comment_at,
+           COALESCE(nc.unread_count, 0),
+           COALESCE(nc.unread_mentions, 0)
+    FROM (
+        SELECT user_id, ticket_id FROM ticket_views
+        WHERE p_ticket_id IS NULL OR ticket_id = p_ticket_id
+        UNION
+        SELECT user_id, ticket_id FROM notifications
+        WHERE is_read = false AND ticket_id IS NOT NULL AND user_id IS NOT NULL
+          AND (p_ticket_id IS NULL OR ticket_id = p_ticket_id)
+    ) pairs
+    LEFT JOIN ticket_views tv ON tv.user_id = pairs.user_id AND tv.ticket_id = pairs.ticket_id
+    LEFT JOIN LATERAL (
+        SELECT MAX(tc.created_at) AS last_foreign_comment_at,
+               MAX(tc.created_at) FILTER (WHERE COALESCE(tc.is_internal, false) = false)
+                   AS last_foreign_public_comment_at
+        FROM ticket_comments tc
+        WHERE tc.ticket_id = pairs.ticket_id AND tc.user_id <> pairs.user_id
+    ) fc ON true
+    LEFT JOIN (
+        SELECT user_id, ticket_id,
+               COUNT(*) AS unread_count,
+               COUNT(*) FILTER (WHERE event_type = 'mention') AS unread_mentions
+        FROM notifications
+        WHERE is_read = false AND (p_ticket_id IS NULL OR ticket_id = p_ticket_id)
+        GROUP BY user_id, ticket_id
+    ) nc ON nc.user_id = pairs.user_id AND nc.ticket_id = pairs.ticket_id;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ticket_views: отметка «просмотрено»
+CREATE OR REPLACE FUNCTION trg_ticket_views_user_state() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE ticket_user_state
+    SET last_seen_at = NEW.last_seen_at, updated_at = NOW()
+    WHERE user_id = NEW.user_id AND ticket_id = NEW.ticket_id;
+    IF NOT FOUND THEN
+        PERFORM ticket_user_state_ensure(NEW.user_id, NEW.ticket_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ticket_views_user_state ON ticket_views;
+CREATE TRIGGER ticket_views_user_state
+    AFTER INSERT OR UPDATE OF last_seen_at ON ticket_views
+    FOR EACH ROW EXECUTE FUNCTION trg_ticket_views_user_state();
+
+-- ticket_comments: новый комментарий сдвигает last_foreign_* у всех, кроме автора.
+-- Правка/удаление (смена is_internal, автора) — редкие, пересчитываем заявку целиком.
+CREATE OR REPLACE FUNCTION trg_ticket_comments_user_state() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE ticket_user_state
+        SET last_foreign_comment_at = GREATEST(last_foreign_comment_at, NEW.created_at),
+            last_foreign_public_comment_at = CASE
+                WHEN COALESCE(NEW.is_internal, false) THEN last_foreign_public_comment_at
+                ELSE GREATEST(last_foreign_public_comment_at, NEW.created_at)
+            END,
+            updated_at = NOW()
+        WHERE ticket_id = NEW.ticket_id AND user_id <> NEW.user_id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM rebuild_ticket_user_state(NEW.ticket_id);
+        IF OLD.ticket_id IS DISTINCT FROM NEW.ticket_id THEN
+            PERFORM rebuild_ticket_user_state(OLD.ticket_id);
+        END IF;
+    ELSE
+        PERFORM rebuild_ticket_user_state(OLD.ticket_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ticket_comments_user_state ON ticket_comments;
+CREATE TRIGGER ticket_comments_user_state
+    AFTER INSERT OR DELETE OR UPDATE OF ticket_id, user_id, is_internal, created_at ON ticket_comments
+    FOR EACH ROW EXECUTE FUNCTION trg_ticket_comments_user_state();
+
+-- notifications: счётчики непрочитанного и упоминаний
+CREATE OR REPLACE FUNCTION trg_notifications_user_state() RETURNS TRIGGER AS $$
+DECLARE
+    v_delta INTEGER := 0;
+    v_row notifications%ROWTYPE;
+BEGIN
+    IF TG_OP = 'INSERT' OR TG_OP = 'UPDATE' THEN
+        IF NEW.is_read AND TG_OP = 'INSERT' THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'UPDATE' AND OLD.is_read = NEW.is_read THEN
+            RETURN NULL;
+        END IF;
+        v_row := NEW;
+        v_delta := CASE WHEN NEW.is_read THEN -1 ELSE 1 END;
+        IF v_delta = 1 AND NOT EXISTS (SELECT 1 FROM ticket_user_state
+                                       WHERE user_id = NEW.user_id AND ticket_id = NEW.ticket_id) THEN
+            -- ensure уже учтёт эту (видимую в AFTER-триггере) строку
+            PERFORM ticket_user_state_ensure(NEW.user_id, NEW.ticket_id);
+            RETURN NULL;
+        END IF;
+    ELSE
+        IF OLD.is_read THEN
+            RETURN NULL;
+        END IF;
+        v_row := OLD;
+        v_delta := -1;
+    END IF;
+
+    IF v_row.ticket_id IS NULL OR v_row.user_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE ticket_user_state
+    SET unread_count = GREATEST(unread_count + v_delta, 0),
+        unread_mentions = CASE
+            WHEN v_row.event_type = 'mention' THEN GREATEST(unread_mentions + v_delta, 0)
+            ELSE unread_mentions
+        END,
+        updated_at = NOW()
+    WHERE user_id = v_row.user_id AND ticket_id = v_row.ticket_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notifications_user_state ON notifications;
+CREATE TRIGGER notifications_user_state
+    AFTER INSERT OR DELETE OR UPDATE OF is_read ON notifications
+    FOR EACH ROW EXECUTE FUNCTION trg_notifications_user_state();
+
+-- Первичное заполнение
+SELECT rebuild_ticket_user_state(NULL);
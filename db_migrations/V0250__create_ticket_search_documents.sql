@@ -0,0 +1,163 @@
+-- Поисковый документ заявки для search_content в списке заявок.
+-- Раньше поиск разворачивался в 12 ILIKE '%q%' по tickets, комментариям, доп. полям,
+-- участникам и услугам — ни один не использовал индекс. Теперь по каждой заявке
+-- хранится tsvector (russian — текст, simple — номер, даты, логины/e-mail) и плоский
+-- текст для триграммного поиска по части слова. Документ пересобирается триггерами
+-- на всех таблицах-источниках.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS ticket_search_documents (
+    ticket_id INTEGER PRIMARY KEY,
+    document TSVECTOR NOT NULL,
+    search_text TEXT NOT NULL DEFAULT '',
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ticket_search_documents_document
+    ON ticket_search_documents USING gin(document);
+CREATE INDEX IF NOT EXISTS idx_ticket_search_documents_trgm
+    ON ticket_search_documents USING gin(search_text gin_trgm_ops);
+
+-- Вырезает inline base64-картинки, чтобы они не раздували индекс
+CREATE OR REPLACE FUNCTION ticket_search_clean(p_text TEXT) RETURNS TEXT AS $$
+    SELECT regexp_replace(COALESCE(p_text, ''), 'data:[^;)[:space:]]+;base64,[A-Za-z0-9+/=]+', ' ', 'g');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION refresh_ticket_search_document(p_ticket_id INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    v_title TEXT;
+    v_description TEXT;
+    v_ident TEXT;
+    v_comments TEXT;
+    v_fields TEXT;
+    v_people TEXT;
+    v_services TEXT;
+BEGIN
+    IF p_ticket_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT COALESCE(t.title, ''),
+           ticket_search_clean(t.description),
+           t.id::text || ' ' || COALESCE(TO_CHAR(t.created_at, 'YYYY-MM-DD'), '')
+    INTO v_title, v_description, v_ident
+    FROM tickets t WHERE t.id = p_ticket_id;
+
+    IF NOT FOUND THEN
+        DELETE FROM ticket_search_documents WHERE ticket_id = p_ticket_id;
+        RETURN;
+    END IF;
+
+    SELECT COALESCE(string_agg(ticket_search_clean(tc.comment), ' '), '')
+    INTO v_comments
+    FROM ticket_comments tc WHERE tc.ticket_id = p_ticket_id;
+
+    SELECT COALESCE(string_agg(tcfv.value, ' '), '')
+    INTO v_fields
+    FROM ticket_custom_field_values tcfv WHERE tcfv.ticket_id = p_ticket_id;
+
+    SELECT COALESCE(string_agg(COALESCE(u.full_name, '') || ' ' || COALESCE(u.username, ''), ' '), '')
+    INTO v_people
+    FROM users u
+    WHERE u.id IN (
+        SELECT t.created_by FROM tickets t WHERE t.id = p_ticket_id
+        UNION SELECT t.assigned_to FROM tickets t WHERE t.id = p_ticket_id
+        UNION SELECT tw.user_id FROM ticket_watchers tw WHERE tw.ticket_id = p_ticket_id
+    );
+
+    SELECT COALESCE(string_agg(COALESCE(s.name, '') || ' ' || COALESCE(ts.name, ''), ' '), '')
+    INTO v_services
+    FROM ticket_to_service_mappings tsm
+    LEFT JOIN services s ON s.id = tsm.service_id
+    LEFT JOIN ticket_services ts ON ts.id = tsm.ticket_service_id
+    WHERE tsm.ticket_id = p_ticket_id;
+
+    INSERT INTO ticket_search_documents (ticket_id, document, search_text, updated_at)
+    VALUES (
+        p_ticket_id,
+        setweight(to_tsvector('russian', v_title), 'A')
+        || setweight(to_tsvector('simple', v_ident || ' ' || v_people), 'A')
+        || setweight(to_tsvector('russian', v_description || ' ' || v_services), 'B')
+        || setweight(to_tsvector('russian', v_fields), 'C')
+        || setweight(to_tsvector('russian', left(v_comments, 500000)), 'D'),
+        concat_ws(' ', v_ident, v_title, v_description, v_fields, v_comments, v_people, v_services),
+        NOW()
+    )
+    ON CONFLICT (ticket_id) DO UPDATE SET
+        document = EXCLUDED.document,
+        search_text = EXCLUDED.search_text,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Универсальный триггер для дочерних таблиц с колонкой ticket_id
+CREATE OR REPLACE FUNCTION trg_ticket_search_child() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM refresh_ticket_search_document(NEW.ticket_id);
+    END IF;
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.ticket_id IS DISTINCT FROM NEW.ticket_id) THEN
+        PERFORM refresh_ticket_search_document(OLD.ticket_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_ticket_search_ticket() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM ticket_search_documents WHERE ticket_id = OLD.id;
+    ELSE
+        PERFORM refresh_ticket_search_document(NEW.id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Смена ФИО/логина пользователя — пересобираем заявки, где он участник
+CREATE OR REPLACE FUNCTION trg_ticket_search_user() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_ticket_search_document(x.ticket_id)
+    FROM (
+        SELECT t.id AS ticket_id FROM tickets t WHERE t.created_by = NEW.id OR t.assigned_to = NEW.id
+        UNION SELECT tw.ticket_id FROM ticket_watchers tw WHERE tw.user_id = NEW.id
+    ) x;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ticket_search_ticket ON tickets;
+CREATE TRIGGER ticket_search_ticket
+    AFTER INSERT OR DELETE OR UPDATE OF title, description, created_by, assigned_to ON tickets
+    FOR EACH ROW EXECUTE FUNCTION trg_ticket_search_ticket();
+
+DROP TRIGGER IF EXISTS ticket_search_comments ON ticket_comments;
+CREATE TRIGGER ticket_search_comments
+    AFTER INSERT OR DELETE OR UPDATE OF comment, ticket_id ON ticket_comments
+    FOR EACH ROW EXECUTE FUNCTION trg_ticket_search_child();
+
+DROP TRIGGER IF EXISTS ticket_search_custom_fields ON ticket_custom_field_values;
+CREATE TRIGGER ticket_search_custom_fields
+    AFTER INSERT OR DELETE OR UPDATE OF value, ticket_id ON ticket_custom_field_values
+    FOR EACH ROW EXECUTE FUNCTION trg_ticket_search_child();
+
+DROP TRIGGER IF EXISTS ticket_search_watchers ON ticket_watchers;
+CREATE TRIGGER ticket_search_watchers
+    AFTER INSERT OR DELETE ON ticket_watchers
+    FOR EACH ROW EXECUTE FUNCTION trg_ticket_search_child();
+
+DROP TRIGGER IF EXISTS ticket_search_services ON ticket_to_service_mappings;
+CREATE TRIGGER ticket_search_services
+    AFTER INSERT OR DELETE OR UPDATE ON ticket_to_service_mappings
+    FOR EACH ROW EXECUTE FUNCTION trg_ticket_search_child();
+
+DROP TRIGGER IF EXISTS ticket_search_users ON users;
+CREATE TRIGGER ticket_search_users
+    AFTER UPDATE OF full_name, username ON users
+    FOR EACH ROW
+    WHEN (OLD.full_name IS DISTINCT FROM NEW.full_name OR OLD.username IS DISTINCT FROM NEW.username)
+    EXECUTE FUNCTION trg_ticket_search_user();
+
+-- Первичное заполнение
+SELECT refresh_ticket_search_document(t.id) FROM tickets t;
@@ -0,0 +1,132 @@
+-- Денормализованная проекция строки списка заявок (read-модель).
+-- Список заявок джойнит tickets со статусами, приоритетами, двумя users и группами,
+-- а потом отдельными запросами добирает услуги, сервис, число нарушений SLA и
+-- последний комментарий. Проекция хранит всё это плоской строкой.
+--
+-- Единственное определение строки — представление ticket_list_rows_live.
+-- Таблица ticket_list_rows — его материализованная копия; пути записи
+-- (api-tickets, api-ticket-comments, api-bulk-tickets) вызывают
+-- refresh_ticket_list_rows(ids) в той же транзакции, а верификатор
+-- (?endpoint=ticket-list-projection) сравнивает таблицу с представлением.
+CREATE OR REPLACE VIEW ticket_list_rows_live AS
+SELECT t.id, t.title, t.description, t.status_id, t.priority_id,
+       t.assigned_to, t.created_by, t.created_at, t.updated_at,
+       t.department_id, t.due_date, t.executor_group_id,
+       t.confirmation_sent_at, t.rating, t.rejection_reason,
+       t.previous_status_id, t.is_archived,
+       s.name AS status_name, s.color AS status_color, s.is_closed AS status_is_closed,
+       s.is_waiting_response AS status_is_waiting_response,
+       COALESCE(s.is_pending_confirmation, false) AS status_is_pending_confirmation,
+       COALESCE(s.is_reopened, false) AS status_is_reopened,
+       p.name AS priority_name, p.color AS priority_color,
+       u1.username AS assignee_email, u1.full_name AS assignee_name, u1.photo_url AS assignee_photo_url,
+       u2.username AS creator_email, u2.full_name AS creator_name, u2.photo_url AS creator_photo_url,
+       eg.name AS executor_group_name,
+       COALESCE(sv.services, '[]'::jsonb) AS services,
+       sv.service_sort_name,
+       tsv.ticket_service,
+       tsv.ticket_service_sort_name,
+       COALESCE(vc.cnt, 0)::INTEGER AS sla_violation_count,
+       lc.last_comment,
+       lpc.last_public_comment
+FROM tickets t
+LEFT JOIN ticket_statuses s ON t.status_id = s.id
+LEFT JOIN ticket_priorities p ON t.priority_id = p.id
+LEFT JOIN users u1 ON t.assigned_to = u1.id
+LEFT JOIN users u2 ON t.created_by = u2.id
+LEFT JOIN executor_groups eg ON t.executor_group_id = eg.id
+LEFT JOIN LATERAL (
+    SELECT jsonb_agg(jsonb_build_object('id', sx.id, 'name', sx.name, 'category_name', sc.name)
+                     ORDER BY tsm.id) AS services,
+           MIN(sx.name) AS service_sort_name
+    FROM ticket_to_service_mappings tsm
+    JOIN services sx ON sx.id = tsm.service_id
+    LEFT JOIN service_categories sc ON sc.id = sx.category_id
+    WHERE tsm.ticket_id = t.id AND tsm.service_id IS NOT NULL
+) sv ON true
+LEFT JOIN LATERAL (
+    SELECT (array_agg(jsonb_build_object('id', tsx.id, 'name', tsx.name) ORDER BY tsm.id))[1] AS ticket_service,
+           MIN(tsx.name) AS ticket_service_sort_name
+    FROM ticket_to_service_mappings tsm
+    JOIN ticket_services tsx ON tsx.id = tsm.ticket_service_id
+    WHERE tsm.ticket_id = t.id AND tsm.ticket_service_id IS NOT NULL
+) tsv ON true
+LEFT JOIN LATERAL (
+    SELECT COUNT(*) AS cnt FROM sla_violations v WHERE v.ticket_id = t.id
+) vc ON true
+LEFT JOIN LATERAL (
+    SELECT jsonb_build_object(
+               'id', c.id, 'comment', c.comment, 'created_at', c.created_at::text,
+               'is_internal', c.is_internal, 'author_name', cu.full_name,
+               'author_email', cu.username, 'author_photo_url', cu.photo_url
+           ) AS last_comment
+    FROM ticket_comments c
+    LEFT JOIN users cu ON cu.id = c.user_id
+    WHERE c.ticket_id = t.id
+    ORDER BY c.created_at DESC, c.id DESC
+    LIMIT 1
+) lc ON true
+LEFT JOIN LATERAL (
+    SELECT jsonb_build_object(
+               'id', c.id, 'comment', c.comment, 'created_at', c.created_at::text,
+               'is_internal', c.is_internal, 'author_name', cu.full_name,
+               'author_email', cu.username, 'author_photo_url', cu.photo_url
+           ) AS last_public_comment
+    FROM ticket_comments c
+    LEFT JOIN users cu ON cu.id = c.user_id
+    WHERE c.ticket_id = t.id AND c.is_internal = false
+    ORDER BY c.created_at DESC, c.id DESC
+    LIMIT 1
+) lpc ON true;
+
+CREATE TABLE IF NOT EXISTS ticket_list_rows AS
+    SELECT v.*, NOW()::TIMESTAMP AS refreshed_at FROM ticket_list_rows_live v
+    WITH NO DATA;
+
+ALTER TABLE ticket_list_rows ADD PRIMARY KEY (id);
+
+-- Основные сортировки списка; фильтры по ним же покрываются префиксом
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_created ON ticket_list_rows(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_open_created ON ticket_list_rows(created_at, id)
+    WHERE is_archived = false AND status_is_closed IS NOT TRUE;
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_due ON ticket_list_rows(due_date, id);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_assigned ON ticket_list_rows(assigned_to, created_at);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_created_by ON ticket_list_rows(created_by, created_at);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_status ON ticket_list_rows(status_id);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_group ON ticket_list_rows(executor_group_id);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_assignee_name ON ticket_list_rows(assignee_name, id);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_creator_name ON ticket_list_rows(creator_name, id);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_status_name ON ticket_list_rows(status_name, id);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_group_name ON ticket_list_rows(executor_group_name, id);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_service_name ON ticket_list_rows(service_sort_name, id);
+CREATE INDEX IF NOT EXISTS idx_ticket_list_rows_ticket_service_name ON ticket_list_rows(ticket_service_sort_name, id);
+
+-- Пересчитывает строки проекции для указанных заявок (NULL — вся таблица).
+-- Удалённые заявки исчезают из проекции, т.к. их нет в представлении.
+-- Если параллельная транзакция уже вставила строку, оставляем её: расхождение
+-- (если оно есть) найдёт и исправит верификатор.
+CREATE OR REPLACE FUNCTION refresh_ticket_list_rows(p_ticket_ids INTEGER[] DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    IF p_ticket_ids IS NOT NULL AND cardinality(p_ticket_ids) = 0 THEN
+        RETURN 0;
+    END IF;
+
+    DELETE FROM ticket_list_rows
+    WHERE p_ticket_ids IS NULL OR id = ANY(p_ticket_ids);
+
+    INSERT INTO ticket_list_rows
+    SELECT v.*, NOW()
+    FROM ticket_list_rows_live v
+    WHERE p_ticket_ids IS NULL OR v.id = ANY(p_ticket_ids)
+    ON CONFLICT (id) DO NOTHING;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Первичное заполнение
+SELECT refresh_ticket_list_rows(NULL);
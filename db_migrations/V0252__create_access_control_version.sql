@@ -0,0 +1,49 @@
+-- Версия настроек доступа (роли, права, видимые группы).
+-- Функции кэшируют контекст доступа пользователя между тёплыми вызовами
+-- и сверяют его с этой версией: любое изменение ролей/прав/состава групп
+-- увеличивает version, и кэш всех инстансов перестаёт совпадать.
+CREATE TABLE IF NOT EXISTS access_control_version (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO access_control_version (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION trg_bump_access_control_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE access_control_version SET version = version + 1, updated_at = NOW() WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS access_version_user_roles ON user_roles;
+CREATE TRIGGER access_version_user_roles
+    AFTER INSERT OR UPDATE OR DELETE ON user_roles
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_access_control_version();
+
+DROP TRIGGER IF EXISTS access_version_roles ON roles;
+CREATE TRIGGER access_version_roles
+    AFTER INSERT OR UPDATE OR DELETE ON roles
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_access_control_version();
+
+DROP TRIGGER IF EXISTS access_version_role_permissions ON role_permissions;
+CREATE TRIGGER access_version_role_permissions
+    AFTER INSERT OR UPDATE OR DELETE ON role_permissions
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_access_control_version();
+
+DROP TRIGGER IF EXISTS access_version_permissions ON permissions;
+CREATE TRIGGER access_version_permissions
+    AFTER INSERT OR UPDATE OR DELETE ON permissions
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_access_control_version();
+
+DROP TRIGGER IF EXISTS access_version_role_visible_groups ON role_visible_groups;
+CREATE TRIGGER access_version_role_visible_groups
+    AFTER INSERT OR UPDATE OR DELETE ON role_visible_groups
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_access_control_version();
+
+DROP TRIGGER IF EXISTS access_version_executor_group_members ON executor_group_members;
+CREATE TRIGGER access_version_executor_group_members
+    AFTER INSERT OR UPDATE OR DELETE ON executor_group_members
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_access_control_version();
@@ -0,0 +1,9 @@
+-- Постраничная загрузка комментариев заявки (limit/before_id): новые сверху,
+-- курсор по (created_at, id). Частичный индекс — для пользователей без доступа
+-- к скрытым комментариям, чтобы LIMIT не пропускал внутренние.
+CREATE INDEX IF NOT EXISTS idx_ticket_comments_ticket_page
+    ON ticket_comments(ticket_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_ticket_comments_ticket_page_public
+    ON ticket_comments(ticket_id, created_at DESC, id DESC)
+    WHERE is_internal = false;
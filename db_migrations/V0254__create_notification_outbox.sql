@@ -0,0 +1,40 @@
+-- Транзакционный outbox уведомлений в Битрикс24 и MAX.
+-- API пишет строку в той же транзакции, что и заявку/комментарий, и отвечает
+-- сразу после commit; отправляет воркер api-tickets (?endpoint=notification-outbox),
+-- которого раз в минуту запускает automation-dispatcher (задача notification_outbox).
+--
+-- status: pending — ждёт отправки (next_attempt_at — когда можно брать),
+--         sent    — доставлено (или доставлять некому),
+--         dead    — исчерпаны попытки, разбирается вручную.
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    channel VARCHAR(16) NOT NULL,
+    kind VARCHAR(64) NOT NULL,
+    ticket_id INTEGER,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+    ON notification_outbox(next_attempt_at, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_dead
+    ON notification_outbox(created_at DESC) WHERE status = 'dead';
+
+INSERT INTO automation_jobs (job_key, title, description, enabled, schedule_preset, params)
+VALUES
+    ('notification_outbox',
+     'Доставка уведомлений в Битрикс24 и MAX',
+     'Отправляет накопленные уведомления о заявках и комментариях из очереди notification_outbox с повторами при ошибках.',
+     TRUE,
+     'every_minute',
+     '{"batch_size": 50}'::jsonb)
+ON CONFLICT (job_key) DO UPDATE SET
+    enabled = EXCLUDED.enabled,
+    schedule_preset = EXCLUDED.schedule_preset,
+    title = EXCLUDED.title,
+    description = EXCLUDED.description;
@@ -0,0 +1,14 @@
+-- Общий кэш OAuth-токенов внешних сервисов (бот Битрикс24, GigaChat).
+-- Любой инстанс любой функции берёт действующий access_token отсюда, а не
+-- обновляет его сам; обновляет только тот, кто держит блокировку строки
+-- (SELECT ... FOR UPDATE), остальные ждут и получают уже новый токен.
+-- refresh_token хранит последний выданный (Битрикс24 ротирует его при каждом
+-- обновлении); пустой — берётся начальный из переменных окружения.
+CREATE TABLE IF NOT EXISTS oauth_tokens (
+    provider VARCHAR(64) PRIMARY KEY,
+    access_token TEXT,
+    refresh_token TEXT,
+    expires_at TIMESTAMPTZ,
+    refreshed_at TIMESTAMPTZ,
+    refresh_count INTEGER NOT NULL DEFAULT 0
+);
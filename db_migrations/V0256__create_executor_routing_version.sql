@@ -0,0 +1,46 @@
+-- Версия настроек маршрутизации исполнителей (привязки пользователей и групп
+-- к услугам, группы, их участники). api-tickets держит скомпилированную таблицу
+-- маршрутизации между тёплыми вызовами и пересобирает её, когда version
+-- меняется. Увеличивают version триггеры — какая бы функция
+-- (api-executor-assignments, api-executor-groups, api-users) ни меняла данные.
+CREATE TABLE IF NOT EXISTS executor_routing_version (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO executor_routing_version (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION trg_bump_executor_routing_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE executor_routing_version SET version = version + 1, updated_at = NOW() WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS routing_version_user_mappings ON executor_user_service_mappings;
+CREATE TRIGGER routing_version_user_mappings
+    AFTER INSERT OR UPDATE OR DELETE ON executor_user_service_mappings
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_executor_routing_version();
+
+DROP TRIGGER IF EXISTS routing_version_group_mappings ON executor_group_service_mappings;
+CREATE TRIGGER routing_version_group_mappings
+    AFTER INSERT OR UPDATE OR DELETE ON executor_group_service_mappings
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_executor_routing_version();
+
+DROP TRIGGER IF EXISTS routing_version_executor_groups ON executor_groups;
+CREATE TRIGGER routing_version_executor_groups
+    AFTER INSERT OR UPDATE OR DELETE ON executor_groups
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_executor_routing_version();
+
+DROP TRIGGER IF EXISTS routing_version_executor_group_members ON executor_group_members;
+CREATE TRIGGER routing_version_executor_group_members
+    AFTER INSERT OR UPDATE OR DELETE ON executor_group_members
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_executor_routing_version();
+
+-- Только смена активности пользователя: прочие правки users маршрутизацию не трогают
+DROP TRIGGER IF EXISTS routing_version_users ON users;
+CREATE TRIGGER routing_version_users
+    AFTER INSERT OR DELETE OR UPDATE OF is_active ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_executor_routing_version();
@@ -0,0 +1,137 @@
+-- Нагрузка исполнителей для автораспределения заявок.
+-- active_count     — заявки в статусах с count_for_distribution = true, не в архиве;
+-- last_assigned_at — created_at самой свежей назначенной на исполнителя заявки.
+-- Поддерживается триггером на tickets (любой путь записи: API, bulk-операции,
+-- автозакрытие, перераспределение по графику), сверяется reconcile_assignee_load()
+-- задачей автоматизации assignee_load_reconcile и при смене флага статуса.
+CREATE TABLE IF NOT EXISTS assignee_load (
+    user_id INTEGER PRIMARY KEY,
+    active_count INTEGER NOT NULL DEFAULT 0,
+    last_assigned_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION assignee_load_counts(p_status_id INTEGER, p_is_archived BOOLEAN) RETURNS BOOLEAN AS $$
+    SELECT COALESCE((SELECT s.count_for_distribution FROM ticket_statuses s WHERE s.id = p_status_id), false)
+           AND NOT COALESCE(p_is_archived, false);
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION assignee_load_add(p_user_id INTEGER, p_delta INTEGER, p_assigned_at TIMESTAMP) RETURNS VOID AS $$
+    INSERT INTO assignee_load (user_id, active_count, last_assigned_at)
+    VALUES (p_user_id, GREATEST(p_delta, 0), p_assigned_at)
+    ON CONFLICT (user_id) DO UPDATE SET
+        active_count = GREATEST(assignee_load.active_count + p_delta, 0),
+        last_assigned_at = GREATEST(assignee_load.last_assigned_at, EXCLUDED.last_assigned_at),
+        updated_at = NOW();
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION trg_tickets_assignee_load() RETURNS TRIGGER AS $$
+DECLARE
+    old_user INTEGER;
+    new_user INTEGER;
+    old_counts BOOLEAN := false;
+    new_counts BOOLEAN := false;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        old_user := OLD.assigned_to;
+        old_counts := old_user IS NOT NULL AND assignee_load_counts(OLD.status_id, OLD.is_archived);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        new_user := NEW.assigned_to;
+        new_counts := new_user IS NOT NULL AND assignee_load_counts(NEW.status_id, NEW.is_archived);
+    END IF;
+
+    IF old_user IS NOT DISTINCT FROM new_user THEN
+        IF new_user IS NOT NULL AND old_counts <> new_counts THEN
+            PERFORM assignee_load_add(new_user, CASE WHEN new_counts THEN 1 ELSE -1 END, NULL);
+        END IF;
+        RETURN NULL;
+    END IF;
+
+    IF new_user IS NOT NULL THEN
+        PERFORM assignee_load_add(new_user, CASE WHEN new_counts THEN 1 ELSE 0 END, NEW.created_at);
+    END IF;
+    IF old_user IS NOT NULL THEN
+        PERFORM assignee_load_add(old_user, CASE WHEN old_counts THEN -1 ELSE 0 END, NULL);
+        -- Ушла самая свежая заявка — пересчитываем по индексу idx_tickets_assigned_to
+        UPDATE assignee_load
+        SET last_assigned_at = (SELECT MAX(t.created_at) FROM tickets t WHERE t.assigned_to = old_user)
+        WHERE user_id = old_user AND last_assigned_at <= OLD.created_at;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tickets_assignee_load ON tickets;
+CREATE TRIGGER tickets_assignee_load
+    AFTER INSERT OR DELETE OR UPDATE OF assigned_to, status_id, is_archived ON tickets
+    FOR EACH ROW EXECUTE FUNCTION trg_tickets_assignee_load();
+
+-- Полная сверка с tickets. Возвращает число исправленных строк.
+-- EXCLUSIVE-блокировка ждёт незавершённые транзакции с правками нагрузки и
+-- не даёт новым вклиниться между подсчётом и записью.
+CREATE OR REPLACE FUNCTION reconcile_assignee_load() RETURNS INTEGER AS $$
+DECLARE
+    fixed INTEGER;
+BEGIN
+    LOCK TABLE assignee_load IN EXCLUSIVE MODE;
+
+    WITH actual AS (
+        SELECT t.assigned_to AS user_id,
+               COUNT(*) FILTER (WHERE s.count_for_distribution = true
+                                  AND COALESCE(t.is_archived, false) = false) AS active_count,
+               MAX(t.created_at) AS last_assigned_at
+        FROM tickets t
+        LEFT JOIN ticket_statuses s ON s.id = t.status_id
+        WHERE t.assigned_to IS NOT NULL
+        GROUP BY t.assigned_to
+    ), diff AS (
+        SELECT COALESCE(a.user_id, l.user_id) AS user_id,
+               COALESCE(a.active_count, 0) AS active_count,
+               a.last_assigned_at
+        FROM actual a
+        FULL JOIN assignee_load l ON l.user_id = a.user_id
+        WHERE l.user_id IS NULL
+           OR l.active_count <> COALESCE(a.active_count, 0)
+           OR l.last_assigned_at IS DISTINCT FROM a.last_assigned_at
+    ), fixed_rows AS (
+        INSERT INTO assignee_load (user_id, active_count, last_assigned_at, updated_at)
+        SELECT user_id, active_count, last_assigned_at, NOW() FROM diff
+        ON CONFLICT (user_id) DO UPDATE SET
+            active_count = EXCLUDED.active_count,
+            last_assigned_at = EXCLUDED.last_assigned_at,
+            updated_at = NOW()
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO fixed FROM fixed_rows;
+    RETURN fixed;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_ticket_statuses_assignee_load() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM reconcile_assignee_load();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ticket_statuses_assignee_load ON ticket_statuses;
+CREATE TRIGGER ticket_statuses_assignee_load
+    AFTER UPDATE OF count_for_distribution ON ticket_statuses
+    FOR EACH ROW
+    WHEN (OLD.count_for_distribution IS DISTINCT FROM NEW.count_for_distribution)
+    EXECUTE FUNCTION trg_ticket_statuses_assignee_load();
+
+SELECT reconcile_assignee_load();
+
+INSERT INTO automation_jobs (job_key, title, description, enabled, schedule_preset, params)
+VALUES
+    ('assignee_load_reconcile',
+     'Сверка нагрузки исполнителей',
+     'Пересчитывает счётчики активных заявок исполнителей (assignee_load) по таблице заявок и исправляет расхождения.',
+     TRUE,
+     'daily',
+     '{}'::jsonb)
+ON CONFLICT (job_key) DO UPDATE SET
+    title = EXCLUDED.title,
+    description = EXCLUDED.description;
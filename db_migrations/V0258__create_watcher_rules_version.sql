@@ -0,0 +1,39 @@
+-- Версия правил наблюдателей и того, во что разворачиваются их цели.
+-- api-tickets держит скомпилированный индекс правил между тёплыми вызовами
+-- и пересобирает его, когда version меняется: правки правил и целей
+-- (api-watcher-rules), составов групп исполнителей и ролей пользователей.
+CREATE TABLE IF NOT EXISTS watcher_rules_version (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO watcher_rules_version (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION trg_bump_watcher_rules_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE watcher_rules_version SET version = version + 1, updated_at = NOW() WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS watcher_rules_version_rules ON ticket_watcher_rules;
+CREATE TRIGGER watcher_rules_version_rules
+    AFTER INSERT OR UPDATE OR DELETE ON ticket_watcher_rules
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_watcher_rules_version();
+
+DROP TRIGGER IF EXISTS watcher_rules_version_targets ON ticket_watcher_rule_targets;
+CREATE TRIGGER watcher_rules_version_targets
+    AFTER INSERT OR UPDATE OR DELETE ON ticket_watcher_rule_targets
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_watcher_rules_version();
+
+DROP TRIGGER IF EXISTS watcher_rules_version_group_members ON executor_group_members;
+CREATE TRIGGER watcher_rules_version_group_members
+    AFTER INSERT OR UPDATE OR DELETE ON executor_group_members
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_watcher_rules_version();
+
+DROP TRIGGER IF EXISTS watcher_rules_version_user_roles ON user_roles;
+CREATE TRIGGER watcher_rules_version_user_roles
+    AFTER INSERT OR UPDATE OR DELETE ON user_roles
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_watcher_rules_version();
@@ -0,0 +1,27 @@
+-- Фоновый прогон правил наблюдателей по существующим заявкам (api-watcher-rules,
+-- action=backfill). Заявки обрабатываются пачками по возрастанию id; после каждой
+-- пачки в той же транзакции сохраняются курсор и счётчики, поэтому прерванный
+-- таймаутом прогон продолжается с места остановки повторным вызовом с job_id.
+--
+-- status: running — есть необработанные заявки, done — прогон завершён,
+--         cancelled — остановлен вручную.
+CREATE TABLE IF NOT EXISTS watcher_backfill_jobs (
+    id SERIAL PRIMARY KEY,
+    status VARCHAR(16) NOT NULL DEFAULT 'running',
+    params JSONB NOT NULL DEFAULT '{}'::jsonb,
+    dry_run BOOLEAN NOT NULL DEFAULT false,
+    cursor_ticket_id INTEGER NOT NULL DEFAULT 0,
+    total_tickets INTEGER NOT NULL DEFAULT 0,
+    processed_tickets INTEGER NOT NULL DEFAULT 0,
+    matched_tickets INTEGER NOT NULL DEFAULT 0,
+    added_watchers INTEGER NOT NULL DEFAULT 0,
+    notifications_queued INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_by INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_watcher_backfill_jobs_created
+    ON watcher_backfill_jobs(created_at DESC);
@@ -0,0 +1,47 @@
+-- Фоновые массовые операции с заявками (api-bulk-tickets, mode=async).
+-- Запрос только записывает задание и сразу отвечает; заявки обрабатывает воркер
+-- api-bulk-tickets (?endpoint=worker), которого раз в минуту запускает
+-- automation-dispatcher (задача bulk_jobs). Пачка заявок и сдвиг cursor_pos
+-- коммитятся одной транзакцией, поэтому повторный запуск после сбоя продолжает
+-- с первой незакоммиченной пачки.
+--
+-- status: queued — ждёт воркера, running — часть заявок обработана,
+--         done — обработаны все (сбойные — в failed_ticket_ids).
+CREATE TABLE IF NOT EXISTS bulk_jobs (
+    id SERIAL PRIMARY KEY,
+    action VARCHAR(64) NOT NULL,
+    params JSONB NOT NULL DEFAULT '{}'::jsonb,
+    ticket_ids INTEGER[] NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    cursor_pos INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    successful INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    failed_ticket_ids INTEGER[] NOT NULL DEFAULT '{}',
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    last_error TEXT,
+    created_by INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_bulk_jobs_pending
+    ON bulk_jobs(id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_bulk_jobs_created_by
+    ON bulk_jobs(created_by, created_at DESC);
+
+INSERT INTO automation_jobs (job_key, title, description, enabled, schedule_preset, params)
+VALUES
+    ('bulk_jobs',
+     'Фоновые массовые операции',
+     'Обрабатывает пачками массовые изменения заявок, поставленные в очередь (mode=async): статус, приоритет, исполнитель, группа, наблюдатели, удаление.',
+     TRUE,
+     'every_minute',
+     '{}'::jsonb)
+ON CONFLICT (job_key) DO UPDATE SET
+    enabled = EXCLUDED.enabled,
+    schedule_preset = EXCLUDED.schedule_preset,
+    title = EXCLUDED.title,
+    description = EXCLUDED.description;
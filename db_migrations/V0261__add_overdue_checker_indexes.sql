@@ -0,0 +1,12 @@
+-- Индексы для tickets-overdue-checker, который строит уведомления 'overdue'
+-- одним INSERT ... SELECT.
+-- Просроченные заявки ищутся среди незаархивированных со сроком: частичный
+-- индекс не растёт вместе с архивом закрытых заявок.
+CREATE INDEX IF NOT EXISTS idx_tickets_open_due_date
+    ON tickets(due_date)
+    WHERE due_date IS NOT NULL AND is_archived IS NOT TRUE;
+
+-- Антиджойн «уже уведомляли за последние сутки» по паре (заявка, пользователь)
+CREATE INDEX IF NOT EXISTS idx_notifications_overdue_recent
+    ON notifications(ticket_id, user_id, created_at)
+    WHERE event_type = 'overdue';
@@ -0,0 +1,22 @@
+-- Исключения из недельных графиков работы (work_schedules).
+-- user_id IS NULL — для всех: праздник (is_working = false) или рабочий день
+-- с особыми часами для тех, у кого есть график. С user_id — личное исключение
+-- (отгул, отпуск, перенос смены), оно важнее общего.
+-- start_time/end_time пустые при is_working = true — часы из недельного графика;
+-- end_time <= start_time — смена заканчивается на следующий день.
+CREATE TABLE IF NOT EXISTS work_schedule_exceptions (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    exception_date DATE NOT NULL,
+    is_working BOOLEAN NOT NULL DEFAULT false,
+    start_time TIME,
+    end_time TIME,
+    note VARCHAR(255),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_work_schedule_exceptions_user_date
+    ON work_schedule_exceptions ((COALESCE(user_id, 0)), exception_date);
+CREATE INDEX IF NOT EXISTS idx_work_schedule_exceptions_date
+    ON work_schedule_exceptions(exception_date);
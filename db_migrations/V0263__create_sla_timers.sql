@@ -0,0 +1,203 @@
+-- Таймеры SLA: по строке на (заявка, вид события) с моментом срабатывания.
+-- Виды: response_warning / resolution_warning — за response_notification_minutes /
+-- resolution_notification_minutes до срока, response_breach / resolution_breach —
+-- в момент срока, no_response — через no_response_minutes в статусе ожидания ответа
+-- (перевод в no_response_status_id).
+-- Поддерживаются триггерами на tickets и ticket_to_service_mappings (любой путь
+-- записи: API, bulk-операции, автозакрытие): на паузе, в закрытом статусе и в архиве
+-- таймеров сроков нет, снятие паузы со сдвигом срока переставляет их.
+-- Разбирает воркер api-tickets (?endpoint=sla-timers), которого раз в минуту
+-- запускает automation-dispatcher (задача sla_timers): берёт только наступившие
+-- таймеры (fire_at <= NOW(), FOR UPDATE SKIP LOCKED) и отмечает fired_at.
+-- Сработавший таймер остаётся до смены срока: пересчёт с тем же fire_at
+-- не заводит повторное уведомление.
+CREATE TABLE IF NOT EXISTS sla_timers (
+    id BIGSERIAL PRIMARY KEY,
+    ticket_id INTEGER NOT NULL,
+    kind VARCHAR(32) NOT NULL,
+    fire_at TIMESTAMPTZ NOT NULL,
+    sla_id INTEGER,
+    fired_at TIMESTAMPTZ,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (ticket_id, kind)
+);
+
+-- Очередь воркера: только несработавшие, по времени срабатывания
+CREATE INDEX IF NOT EXISTS idx_sla_timers_due
+    ON sla_timers(fire_at) WHERE fired_at IS NULL;
+
+-- Какие таймеры должны быть у заявок по их текущему состоянию.
+-- SLA заявки — первый по услугам/сервисам, как в журнале групп и автозакрытии.
+CREATE OR REPLACE FUNCTION sla_timers_wanted(p_ticket_ids INTEGER[])
+RETURNS TABLE (ticket_id INTEGER, kind VARCHAR, fire_at TIMESTAMPTZ, sla_id INTEGER) AS $$
+    WITH ticket_sla AS (
+        SELECT DISTINCT ON (tsm.ticket_id)
+               tsm.ticket_id, s.id AS sla_id,
+               s.response_notification_minutes, s.resolution_notification_minutes,
+               s.no_response_minutes, s.no_response_status_id
+        FROM ticket_to_service_mappings tsm
+        JOIN sla_service_mappings ssm ON
+            (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id = tsm.service_id)
+            OR (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id IS NULL)
+            OR (ssm.ticket_service_id IS NULL AND ssm.service_id = tsm.service_id)
+        JOIN sla s ON s.id = ssm.sla_id
+        WHERE tsm.ticket_id = ANY(p_ticket_ids)
+        ORDER BY tsm.ticket_id, s.id
+    ), open_tickets AS (
+        SELECT t.id, t.status_id, t.due_date, t.response_due_date, t.sla_paused_at,
+               COALESCE(st.is_waiting_response, false) AS is_waiting_response,
+               ts.sla_id, ts.response_notification_minutes, ts.resolution_notification_minutes,
+               ts.no_response_minutes, ts.no_response_status_id
+        FROM tickets t
+        JOIN ticket_sla ts ON ts.ticket_id = t.id
+        LEFT JOIN ticket_statuses st ON st.id = t.status_id
+        WHERE t.id = ANY(p_ticket_ids)
+          AND t.is_archived IS NOT TRUE
+          AND COALESCE(st.is_closed, false) = false
+    )
+    SELECT o.id, k.kind::VARCHAR, k.fire_at, o.sla_id
+    FROM open_tickets o
+    CROSS JOIN LATERAL (VALUES
+        ('response_warning', o.response_due_date - make_interval(mins => COALESCE(o.response_notification_minutes, 0))),
+        ('response_breach', o.response_due_date),
+        ('resolution_warning', o.due_date - make_interval(mins => COALESCE(o.resolution_notification_minutes, 0))),
+        ('resolution_breach', o.due_date)
+    ) AS k(kind, fire_at)
+    WHERE o.sla_paused_at IS NULL
+      AND k.fire_at IS NOT NULL
+      AND (k.kind IN ('response_breach', 'resolution_breach')
+           OR k.kind = 'response_warning' AND o.response_notification_minutes > 0
+           OR k.kind = 'resolution_warning' AND o.resolution_notification_minutes > 0)
+    UNION ALL
+    SELECT o.id, 'no_response'::VARCHAR, o.sla_paused_at + make_interval(mins => o.no_response_minutes), o.sla_id
+    FROM open_tickets o
+    WHERE o.is_waiting_response
+      AND o.sla_paused_at IS NOT NULL
+      AND o.no_response_minutes IS NOT NULL
+      AND o.no_response_status_id IS NOT NULL
+      AND o.no_response_status_id IS DISTINCT FROM o.status_id;
+$$ LANGUAGE sql STABLE;
+
+-- Приводит таймеры заявок к sla_timers_wanted. Таймер с прежним fire_at сохраняет
+-- fired_at; сдвинутый срок (снятие паузы, повторное открытие) взводит его заново.
+CREATE OR REPLACE FUNCTION refresh_sla_timers(p_ticket_ids INTEGER[]) RETURNS VOID AS $$
+BEGIN
+    IF p_ticket_ids IS NULL OR cardinality(p_ticket_ids) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- Удаляемые и вставляемые строки не пересекаются по (ticket_id, kind)
+    WITH wanted AS (
+        SELECT * FROM sla_timers_wanted(p_ticket_ids)
+    ), removed AS (
+        DELETE FROM sla_timers st
+        WHERE st.ticket_id = ANY(p_ticket_ids)
+          AND NOT EXISTS (SELECT 1 FROM wanted w WHERE w.ticket_id = st.ticket_id AND w.kind = st.kind)
+    )
+    INSERT INTO sla_timers (ticket_id, kind, fire_at, sla_id)
+    SELECT w.ticket_id, w.kind, w.fire_at, w.sla_id FROM wanted w
+    ON CONFLICT (ticket_id, kind) DO UPDATE SET
+        fire_at = EXCLUDED.fire_at,
+        sla_id = EXCLUDED.sla_id,
+        fired_at = CASE WHEN sla_timers.fire_at = EXCLUDED.fire_at THEN sla_timers.fired_at END,
+        attempts = CASE WHEN sla_timers.fire_at = EXCLUDED.fire_at THEN sla_timers.attempts ELSE 0 END,
+        updated_at = NOW()
+    WHERE sla_timers.fire_at IS DISTINCT FROM EXCLUDED.fire_at
+       OR sla_timers.sla_id IS DISTINCT FROM EXCLUDED.sla_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггеры уровня оператора с таблицами переходов: массовое изменение заявок
+-- пересчитывает таймеры одним вызовом на оператор, а не на строку.
+CREATE OR REPLACE FUNCTION trg_tickets_sla_timers() RETURNS TRIGGER AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM sla_timers WHERE ticket_id IN (SELECT id FROM old_rows);
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(id) INTO ids FROM new_rows;
+    ELSE
+        SELECT array_agg(n.id) INTO ids
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        WHERE (n.due_date, n.response_due_date, n.status_id, n.sla_paused_at, n.is_archived)
+              IS DISTINCT FROM
+              (o.due_date, o.response_due_date, o.status_id, o.sla_paused_at, o.is_archived);
+    END IF;
+
+    PERFORM refresh_sla_timers(ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tickets_sla_timers_insert ON tickets;
+CREATE TRIGGER tickets_sla_timers_insert
+    AFTER INSERT ON tickets
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_tickets_sla_timers();
+
+DROP TRIGGER IF EXISTS tickets_sla_timers_update ON tickets;
+CREATE TRIGGER tickets_sla_timers_update
+    AFTER UPDATE ON tickets
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_tickets_sla_timers();
+
+DROP TRIGGER IF EXISTS tickets_sla_timers_delete ON tickets;
+CREATE TRIGGER tickets_sla_timers_delete
+    AFTER DELETE ON tickets
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_tickets_sla_timers();
+
+-- Услуги заявки записываются после самой заявки — от них зависит SLA
+CREATE OR REPLACE FUNCTION trg_ticket_service_mappings_sla_timers() RETURNS TRIGGER AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT ticket_id) INTO ids FROM old_rows;
+    ELSE
+        SELECT array_agg(DISTINCT ticket_id) INTO ids FROM new_rows;
+    END IF;
+    PERFORM refresh_sla_timers(ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ticket_service_mappings_sla_timers_insert ON ticket_to_service_mappings;
+CREATE TRIGGER ticket_service_mappings_sla_timers_insert
+    AFTER INSERT ON ticket_to_service_mappings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_service_mappings_sla_timers();
+
+DROP TRIGGER IF EXISTS ticket_service_mappings_sla_timers_delete ON ticket_to_service_mappings;
+CREATE TRIGGER ticket_service_mappings_sla_timers_delete
+    AFTER DELETE ON ticket_to_service_mappings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_service_mappings_sla_timers();
+
+-- Таймеры для уже открытых заявок. Прошедшие до выката помечаются сработавшими:
+-- о просрочках уже сообщали проверки по расписанию, а массовый перевод давно
+-- ожидающих ответа заявок при выкате не нужен.
+SELECT refresh_sla_timers(ARRAY(SELECT id FROM tickets WHERE is_archived IS NOT TRUE));
+UPDATE sla_timers SET fired_at = NOW() WHERE fired_at IS NULL AND fire_at <= NOW();
+
+INSERT INTO automation_jobs (job_key, title, description, enabled, schedule_preset, params)
+VALUES
+    ('sla_timers',
+     'Таймеры SLA',
+     'Срабатывает по наступившим таймерам SLA: предупреждения о приближении сроков реакции и решения, уведомления о нарушении сроков, перевод заявок без ответа клиента в статус из настроек SLA.',
+     TRUE,
+     'every_minute',
+     '{}'::jsonb)
+ON CONFLICT (job_key) DO UPDATE SET
+    enabled = EXCLUDED.enabled,
+    schedule_preset = EXCLUDED.schedule_preset,
+    title = EXCLUDED.title,
+    description = EXCLUDED.description;
@@ -0,0 +1,312 @@
+-- Поисковые документы заявок (V0250): триггеры уровня оператора вместо построчных.
+-- Построчный триггер пересобирал документ целиком (со всеми комментариями) на каждую
+-- изменённую дочернюю строку: массовое добавление наблюдателей или каскадное удаление
+-- комментариев давало по пересборке на строку. Теперь оператор собирает различные
+-- ticket_id из таблиц переходов и пересобирает каждую заявку один раз.
+-- Описание и доп. поля ограничиваются по длине, как и комментарии, а при превышении
+-- предела tsvector (1 МБ) документ строится только по заголовку и номеру — запись
+-- пользователя из-за поиска не падает. Переименование услуг и сервисов теперь тоже
+-- обновляет документы связанных заявок.
+
+CREATE OR REPLACE FUNCTION refresh_ticket_search_document(p_ticket_id INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    v_title TEXT;
+    v_description TEXT;
+    v_ident TEXT;
+    v_comments TEXT;
+    v_fields TEXT;
+    v_people TEXT;
+    v_services TEXT;
+    v_document TSVECTOR;
+BEGIN
+    IF p_ticket_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT left(COALESCE(t.title, ''), 10000),
+           left(ticket_search_clean(t.description), 200000),
+           t.id::text || ' ' || COALESCE(TO_CHAR(t.created_at, 'YYYY-MM-DD'), '')
+    INTO v_title, v_description, v_ident
+    FROM tickets t WHERE t.id = p_ticket_id;
+
+    IF NOT FOUND THEN
+        DELETE FROM ticket_search_documents WHERE ticket_id = p_ticket_id;
+        RETURN;
+    END IF;
+
+    SELECT left(COALESCE(string_agg(ticket_search_clean(tc.comment), ' '), ''), 300000)
+    INTO v_comments
+    FROM ticket_comments tc WHERE tc.ticket_id = p_ticket_id;
+
+    SELECT left(COALESCE(string_agg(tcfv.value, ' '), ''), 100000)
+    INTO v_fields
+    FROM ticket_custom_field_values tcfv WHERE tcfv.ticket_id = p_ticket_id;
+
+    SELECT left(COALESCE(string_agg(COALESCE(u.full_name, '') || ' ' || COALESCE(u.username, ''), ' '), ''), 50000)
+    INTO v_people
+    FROM users u
+    WHERE u.id IN (
+        SELECT t.created_by FROM tickets t WHERE t.id = p_ticket_id
+        UNION SELECT t.assigned_to FROM tickets t WHERE t.id = p_ticket_id
+        UNION SELECT tw.user_id FROM ticket_watchers tw WHERE tw.ticket_id = p_ticket_id
+    );
+
+    SELECT left(COALESCE(string_agg(COALESCE(s.name, '') || ' ' || COALESCE(ts.name, ''), ' '), ''), 50000)
+    INTO v_services
+    FROM ticket_to_service_mappings tsm
+    LEFT JOIN services s ON s.id = tsm.service_id
+    LEFT JOIN ticket_services ts ON ts.id = tsm.ticket_service_id
+    WHERE tsm.ticket_id = p_ticket_id;
+
+    BEGIN
+        v_document := setweight(to_tsvector('russian', v_title), 'A')
+            || setweight(to_tsvector('simple', v_ident || ' ' || v_people), 'A')
+            || setweight(to_tsvector('russian', v_description || ' ' || v_services), 'B')
+            || setweight(to_tsvector('russian', v_fields), 'C')
+            || setweight(to_tsvector('russian', v_comments), 'D');
+    EXCEPTION WHEN program_limit_exceeded THEN
+        -- Слишком много уникальных слов (логи, выгрузки): ищется по заголовку и номеру,
+        -- по остальному тексту — триграммами
+        v_document := setweight(to_tsvector('russian', v_title), 'A')
+            || setweight(to_tsvector('simple', v_ident), 'A');
+    END;
+
+    INSERT INTO ticket_search_documents (ticket_id, document, search_text, updated_at)
+    VALUES (
+        p_ticket_id,
+        v_document,
+        concat_ws(' ', v_ident, v_title, v_description, v_fields, v_comments, v_people, v_services),
+        NOW()
+    )
+    ON CONFLICT (ticket_id) DO UPDATE SET
+        document = EXCLUDED.document,
+        search_text = EXCLUDED.search_text,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Пересборка набора заявок: каждая различная заявка — один раз
+CREATE OR REPLACE FUNCTION refresh_ticket_search_documents(p_ticket_ids INTEGER[])
+RETURNS VOID AS $$
+DECLARE
+    v_id INTEGER;
+BEGIN
+    IF p_ticket_ids IS NULL THEN
+        RETURN;
+    END IF;
+    FOR v_id IN SELECT DISTINCT x FROM unnest(p_ticket_ids) AS x WHERE x IS NOT NULL ORDER BY x LOOP
+        PERFORM refresh_ticket_search_document(v_id);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Заявки: при UPDATE — только те, у которых изменились поля документа
+CREATE OR REPLACE FUNCTION trg_ticket_search_ticket() RETURNS TRIGGER AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM ticket_search_documents WHERE ticket_id IN (SELECT id FROM old_rows);
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(id) INTO ids FROM new_rows;
+    ELSE
+        SELECT array_agg(n.id) INTO ids
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        WHERE (n.title, n.description, n.created_by, n.assigned_to)
+              IS DISTINCT FROM
+              (o.title, o.description, o.created_by, o.assigned_to);
+    END IF;
+
+    PERFORM refresh_ticket_search_documents(ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Дочерние таблицы с колонкой ticket_id. При UPDATE берутся заявки, у которых
+-- изменились поля документа (отметки прочтения и закрепления комментариев — нет).
+CREATE OR REPLACE FUNCTION trg_ticket_search_child() RETURNS TRIGGER AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT ticket_id) INTO ids FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT ticket_id) INTO ids FROM old_rows;
+    ELSIF TG_TABLE_NAME = 'ticket_comments' THEN
+        SELECT array_agg(DISTINCT ticket_id) INTO ids FROM (
+            (SELECT ticket_id, comment FROM new_rows EXCEPT SELECT ticket_id, comment FROM old_rows)
+            UNION ALL
+            (SELECT ticket_id, comment FROM old_rows EXCEPT SELECT ticket_id, comment FROM new_rows)
+        ) d;
+    ELSIF TG_TABLE_NAME = 'ticket_custom_field_values' THEN
+        SELECT array_agg(DISTINCT ticket_id) INTO ids FROM (
+            (SELECT ticket_id, value FROM new_rows EXCEPT SELECT ticket_id, value FROM old_rows)
+            UNION ALL
+            (SELECT ticket_id, value FROM old_rows EXCEPT SELECT ticket_id, value FROM new_rows)
+        ) d;
+    ELSE
+        SELECT array_agg(DISTINCT ticket_id) INTO ids FROM (
+            SELECT ticket_id FROM new_rows UNION SELECT ticket_id FROM old_rows
+        ) d;
+    END IF;
+
+    PERFORM refresh_ticket_search_documents(ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Смена ФИО/логина пользователей — пересобираем заявки, где они участники
+CREATE OR REPLACE FUNCTION trg_ticket_search_user() RETURNS TRIGGER AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    WITH changed AS (
+        SELECT n.id
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        WHERE (n.full_name, n.username) IS DISTINCT FROM (o.full_name, o.username)
+    )
+    SELECT array_agg(x.ticket_id) INTO ids FROM (
+        SELECT t.id AS ticket_id FROM tickets t WHERE t.created_by IN (SELECT id FROM changed)
+        UNION SELECT t.id FROM tickets t WHERE t.assigned_to IN (SELECT id FROM changed)
+        UNION SELECT tw.ticket_id FROM ticket_watchers tw WHERE tw.user_id IN (SELECT id FROM changed)
+    ) x;
+
+    PERFORM refresh_ticket_search_documents(ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Переименование услуги или сервиса — пересобираем заявки, где они указаны
+CREATE OR REPLACE FUNCTION trg_ticket_search_service_names() RETURNS TRIGGER AS $$
+DECLARE
+    ids INTEGER[];
+BEGIN
+    IF TG_TABLE_NAME = 'services' THEN
+        SELECT array_agg(DISTINCT tsm.ticket_id) INTO ids
+        FROM ticket_to_service_mappings tsm
+        WHERE tsm.service_id IN (
+            SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE n.name IS DISTINCT FROM o.name
+        );
+    ELSE
+        SELECT array_agg(DISTINCT tsm.ticket_id) INTO ids
+        FROM ticket_to_service_mappings tsm
+        WHERE tsm.ticket_service_id IN (
+            SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE n.name IS DISTINCT FROM o.name
+        );
+    END IF;
+
+    PERFORM refresh_ticket_search_documents(ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Таблицы переходов нельзя объявить у триггера UPDATE OF <колонки>,
+-- поэтому UPDATE-триггеры без списка колонок, а отбор изменений — в функциях.
+DROP TRIGGER IF EXISTS ticket_search_ticket ON tickets;
+DROP TRIGGER IF EXISTS ticket_search_ticket_insert ON tickets;
+CREATE TRIGGER ticket_search_ticket_insert
+    AFTER INSERT ON tickets
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_ticket();
+DROP TRIGGER IF EXISTS ticket_search_ticket_update ON tickets;
+CREATE TRIGGER ticket_search_ticket_update
+    AFTER UPDATE ON tickets
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_ticket();
+DROP TRIGGER IF EXISTS ticket_search_ticket_delete ON tickets;
+CREATE TRIGGER ticket_search_ticket_delete
+    AFTER DELETE ON tickets
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_ticket();
+
+DROP TRIGGER IF EXISTS ticket_search_comments ON ticket_comments;
+DROP TRIGGER IF EXISTS ticket_search_comments_insert ON ticket_comments;
+CREATE TRIGGER ticket_search_comments_insert
+    AFTER INSERT ON ticket_comments
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+DROP TRIGGER IF EXISTS ticket_search_comments_update ON ticket_comments;
+CREATE TRIGGER ticket_search_comments_update
+    AFTER UPDATE ON ticket_comments
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+DROP TRIGGER IF EXISTS ticket_search_comments_delete ON ticket_comments;
+CREATE TRIGGER ticket_search_comments_delete
+    AFTER DELETE ON ticket_comments
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+
+DROP TRIGGER IF EXISTS ticket_search_custom_fields ON ticket_custom_field_values;
+DROP TRIGGER IF EXISTS ticket_search_custom_fields_insert ON ticket_custom_field_values;
+CREATE TRIGGER ticket_search_custom_fields_insert
+    AFTER INSERT ON ticket_custom_field_values
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+DROP TRIGGER IF EXISTS ticket_search_custom_fields_update ON ticket_custom_field_values;
+CREATE TRIGGER ticket_search_custom_fields_update
+    AFTER UPDATE ON ticket_custom_field_values
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+DROP TRIGGER IF EXISTS ticket_search_custom_fields_delete ON ticket_custom_field_values;
+CREATE TRIGGER ticket_search_custom_fields_delete
+    AFTER DELETE ON ticket_custom_field_values
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+
+DROP TRIGGER IF EXISTS ticket_search_watchers ON ticket_watchers;
+DROP TRIGGER IF EXISTS ticket_search_watchers_insert ON ticket_watchers;
+CREATE TRIGGER ticket_search_watchers_insert
+    AFTER INSERT ON ticket_watchers
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+DROP TRIGGER IF EXISTS ticket_search_watchers_delete ON ticket_watchers;
+CREATE TRIGGER ticket_search_watchers_delete
+    AFTER DELETE ON ticket_watchers
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+
+DROP TRIGGER IF EXISTS ticket_search_services ON ticket_to_service_mappings;
+DROP TRIGGER IF EXISTS ticket_search_services_insert ON ticket_to_service_mappings;
+CREATE TRIGGER ticket_search_services_insert
+    AFTER INSERT ON ticket_to_service_mappings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+DROP TRIGGER IF EXISTS ticket_search_services_update ON ticket_to_service_mappings;
+CREATE TRIGGER ticket_search_services_update
+    AFTER UPDATE ON ticket_to_service_mappings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+DROP TRIGGER IF EXISTS ticket_search_services_delete ON ticket_to_service_mappings;
+CREATE TRIGGER ticket_search_services_delete
+    AFTER DELETE ON ticket_to_service_mappings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_child();
+
+DROP TRIGGER IF EXISTS ticket_search_users ON users;
+CREATE TRIGGER ticket_search_users
+    AFTER UPDATE ON users
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_user();
+
+DROP TRIGGER IF EXISTS ticket_search_service_names ON services;
+CREATE TRIGGER ticket_search_service_names
+    AFTER UPDATE ON services
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_service_names();
+
+DROP TRIGGER IF EXISTS ticket_search_ticket_service_names ON ticket_services;
+CREATE TRIGGER ticket_search_ticket_service_names
+    AFTER UPDATE ON ticket_services
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ticket_search_service_names();
+
+-- Документы заявок с услугами могли отстать от уже переименованных услуг
+SELECT refresh_ticket_search_documents(ARRAY(SELECT DISTINCT ticket_id FROM ticket_to_service_mappings));
@@ -0,0 +1,102 @@
+-- Таймеры SLA (V0263) при изменении самих SLA. Триггеры стояли только на tickets и
+-- ticket_to_service_mappings, поэтому правка минут уведомлений, no_response_minutes,
+-- no_response_status_id или привязки SLA к услугам оставляла ожидающие таймеры
+-- со старым fire_at. Теперь такие изменения пересчитывают таймеры открытых заявок
+-- затронутых SLA.
+
+-- Заявки, чьи таймеры зависят от указанных SLA: открытые заявки с услугами,
+-- привязанными к ним сейчас, и заявки, у которых уже есть таймеры этих SLA
+-- (привязку могли снять — таймеры нужно убрать или перевести на другой SLA).
+CREATE OR REPLACE FUNCTION sla_timers_tickets_for_slas(p_sla_ids INTEGER[])
+RETURNS INTEGER[] AS $$
+    SELECT ARRAY(
+        SELECT tsm.ticket_id
+        FROM sla_service_mappings ssm
+        JOIN ticket_to_service_mappings tsm ON
+            (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id = tsm.service_id)
+            OR (ssm.ticket_service_id = tsm.ticket_service_id AND ssm.service_id IS NULL)
+            OR (ssm.ticket_service_id IS NULL AND ssm.service_id = tsm.service_id)
+        JOIN tickets t ON t.id = tsm.ticket_id
+        LEFT JOIN ticket_statuses st ON st.id = t.status_id
+        WHERE ssm.sla_id = ANY(p_sla_ids)
+          AND t.is_archived IS NOT TRUE
+          AND COALESCE(st.is_closed, false) = false
+        UNION
+        SELECT st.ticket_id FROM sla_timers st WHERE st.sla_id = ANY(p_sla_ids)
+    );
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION trg_sla_sla_timers() RETURNS TRIGGER AS $$
+DECLARE
+    sla_ids INTEGER[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(id) INTO sla_ids FROM old_rows;
+    ELSE
+        SELECT array_agg(n.id) INTO sla_ids
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        WHERE (n.response_notification_minutes, n.resolution_notification_minutes,
+               n.no_response_minutes, n.no_response_status_id)
+              IS DISTINCT FROM
+              (o.response_notification_minutes, o.resolution_notification_minutes,
+               o.no_response_minutes, o.no_response_status_id);
+    END IF;
+
+    IF sla_ids IS NOT NULL THEN
+        PERFORM refresh_sla_timers(sla_timers_tickets_for_slas(sla_ids));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_sla_service_mappings_sla_timers() RETURNS TRIGGER AS $$
+DECLARE
+    sla_ids INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT sla_id) INTO sla_ids FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT sla_id) INTO sla_ids FROM old_rows;
+    ELSE
+        SELECT array_agg(DISTINCT sla_id) INTO sla_ids FROM (
+            SELECT sla_id FROM new_rows UNION SELECT sla_id FROM old_rows
+        ) x;
+    END IF;
+
+    IF sla_ids IS NOT NULL THEN
+        PERFORM refresh_sla_timers(sla_timers_tickets_for_slas(sla_ids));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sla_sla_timers_update ON sla;
+CREATE TRIGGER sla_sla_timers_update
+    AFTER UPDATE ON sla
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_sla_sla_timers();
+
+DROP TRIGGER IF EXISTS sla_sla_timers_delete ON sla;
+CREATE TRIGGER sla_sla_timers_delete
+    AFTER DELETE ON sla
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_sla_sla_timers();
+
+DROP TRIGGER IF EXISTS sla_service_mappings_sla_timers_insert ON sla_service_mappings;
+CREATE TRIGGER sla_service_mappings_sla_timers_insert
+    AFTER INSERT ON sla_service_mappings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_sla_service_mappings_sla_timers();
+
+DROP TRIGGER IF EXISTS sla_service_mappings_sla_timers_update ON sla_service_mappings;
+CREATE TRIGGER sla_service_mappings_sla_timers_update
+    AFTER UPDATE ON sla_service_mappings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_sla_service_mappings_sla_timers();
+
+DROP TRIGGER IF EXISTS sla_service_mappings_sla_timers_delete ON sla_service_mappings;
+CREATE TRIGGER sla_service_mappings_sla_timers_delete
+    AFTER DELETE ON sla_service_mappings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_sla_service_mappings_sla_timers();
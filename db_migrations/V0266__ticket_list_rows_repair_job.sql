@@ -0,0 +1,36 @@
+-- Сверка проекции списка заявок ticket_list_rows (V0251) по расписанию.
+-- Пути записи обновляют проекцию в своей транзакции, а если обновление упало
+-- (оно откатывается к savepoint, не роняя запись заявки), строку исправляет сверка:
+-- находит отличия таблицы от представления ticket_list_rows_live и пересчитывает
+-- только их. Её запускает automation-dispatcher (задача ticket_list_rows_repair)
+-- и верификатор api-tickets (?endpoint=ticket-list-projection, POST {}).
+CREATE OR REPLACE FUNCTION repair_ticket_list_rows() RETURNS INTEGER AS $$
+DECLARE
+    v_ids INTEGER[];
+BEGIN
+    SELECT array_agg(COALESCE(v.id, r.id)) INTO v_ids
+    FROM ticket_list_rows_live v
+    FULL JOIN ticket_list_rows r ON r.id = v.id
+    WHERE r.id IS NULL OR v.id IS NULL
+       OR to_jsonb(v) <> (to_jsonb(r) - 'refreshed_at');
+
+    IF v_ids IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    PERFORM refresh_ticket_list_rows(v_ids);
+    RETURN cardinality(v_ids);
+END;
+$$ LANGUAGE plpgsql;
+
+INSERT INTO automation_jobs (job_key, title, description, enabled, schedule_preset, params)
+VALUES
+    ('ticket_list_rows_repair',
+     'Сверка проекции списка заявок',
+     'Сравнивает проекцию списка заявок (ticket_list_rows) с живыми данными и пересчитывает отличающиеся строки.',
+     TRUE,
+     'hourly',
+     '{}'::jsonb)
+ON CONFLICT (job_key) DO UPDATE SET
+    title = EXCLUDED.title,
+    description = EXCLUDED.description;
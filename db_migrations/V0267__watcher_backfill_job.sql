@@ -0,0 +1,18 @@
+-- Задания backfill правил наблюдателей (V0259) продолжаются по расписанию:
+-- automation-dispatcher (задача watcher_backfill) раз в минуту вызывает воркер
+-- api-watcher-rules (?action=backfill_worker, заголовок X-Watcher-Backfill-Secret),
+-- который догоняет все задания в статусе running. Повторный вызов из интерфейса
+-- больше не нужен, чтобы прогон дошёл до конца.
+INSERT INTO automation_jobs (job_key, title, description, enabled, schedule_preset, params)
+VALUES
+    ('watcher_backfill',
+     'Применение правил наблюдателей к заявкам',
+     'Продолжает запущенные прогоны правил наблюдателей по существующим заявкам, пачками с сохранением курсора.',
+     TRUE,
+     'every_minute',
+     '{}'::jsonb)
+ON CONFLICT (job_key) DO UPDATE SET
+    enabled = EXCLUDED.enabled,
+    schedule_preset = EXCLUDED.schedule_preset,
+    title = EXCLUDED.title,
+    description = EXCLUDED.description;
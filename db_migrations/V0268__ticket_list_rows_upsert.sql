@@ -0,0 +1,71 @@
+-- Обновление проекции ticket_list_rows (V0251) без гонки. Раньше
+-- refresh_ticket_list_rows удалял строки и вставлял их с ON CONFLICT DO NOTHING:
+-- если две транзакции пересчитывали одну заявку, строка первой закоммитившей
+-- оставалась, а более свежая версия второй терялась до сверки по расписанию
+-- (V0266). Теперь строка из представления записывается upsert'ом с заменой всех
+-- колонок, а удаляются только строки удалённых заявок (в представлении есть все
+-- строки tickets).
+-- Сверка repair_ticket_list_rows остаётся страховкой.
+CREATE OR REPLACE FUNCTION refresh_ticket_list_rows(p_ticket_ids INTEGER[] DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    IF p_ticket_ids IS NOT NULL AND cardinality(p_ticket_ids) = 0 THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO ticket_list_rows
+    SELECT v.*, NOW()
+    FROM ticket_list_rows_live v
+    WHERE p_ticket_ids IS NULL OR v.id = ANY(p_ticket_ids)
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        status_id = EXCLUDED.status_id,
+        priority_id = EXCLUDED.priority_id,
+        assigned_to = EXCLUDED.assigned_to,
+        created_by = EXCLUDED.created_by,
+        created_at = EXCLUDED.created_at,
+        updated_at = EXCLUDED.updated_at,
+        department_id = EXCLUDED.department_id,
+        due_date = EXCLUDED.due_date,
+        executor_group_id = EXCLUDED.executor_group_id,
+        confirmation_sent_at = EXCLUDED.confirmation_sent_at,
+        rating = EXCLUDED.rating,
+        rejection_reason = EXCLUDED.rejection_reason,
+        previous_status_id = EXCLUDED.previous_status_id,
+        is_archived = EXCLUDED.is_archived,
+        status_name = EXCLUDED.status_name,
+        status_color = EXCLUDED.status_color,
+        status_is_closed = EXCLUDED.status_is_closed,
+        status_is_waiting_response = EXCLUDED.status_is_waiting_response,
+        status_is_pending_confirmation = EXCLUDED.status_is_pending_confirmation,
+        status_is_reopened = EXCLUDED.status_is_reopened,
+        priority_name = EXCLUDED.priority_name,
+        priority_color = EXCLUDED.priority_color,
+        assignee_email = EXCLUDED.assignee_email,
+        assignee_name = EXCLUDED.assignee_name,
+        assignee_photo_url = EXCLUDED.assignee_photo_url,
+        creator_email = EXCLUDED.creator_email,
+        creator_name = EXCLUDED.creator_name,
+        creator_photo_url = EXCLUDED.creator_photo_url,
+        executor_group_name = EXCLUDED.executor_group_name,
+        services = EXCLUDED.services,
+        service_sort_name = EXCLUDED.service_sort_name,
+        ticket_service = EXCLUDED.ticket_service,
+        ticket_service_sort_name = EXCLUDED.ticket_service_sort_name,
+        sla_violation_count = EXCLUDED.sla_violation_count,
+        last_comment = EXCLUDED.last_comment,
+        last_public_comment = EXCLUDED.last_public_comment,
+        refreshed_at = EXCLUDED.refreshed_at;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+
+    DELETE FROM ticket_list_rows r
+    WHERE (p_ticket_ids IS NULL OR r.id = ANY(p_ticket_ids))
+      AND NOT EXISTS (SELECT 1 FROM tickets t WHERE t.id = r.id);
+
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
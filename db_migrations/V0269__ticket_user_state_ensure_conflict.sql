@@ -0,0 +1,106 @@
+-- ticket_user_state (V0249): потерянные приращения при первой строке пары.
+-- Если две транзакции одновременно вставляли первое непрочитанное уведомление
+-- одной пары (пользователь, заявка), каждая в ticket_user_state_ensure считала
+-- только своё уведомление, вторая упиралась в ON CONFLICT DO NOTHING — и её +1
+-- терялся до пересборки. Теперь ensure сообщает, вставил ли он строку, а при
+-- конфликте триггеры применяют своё изменение к строке, вставленной другой
+-- транзакцией (её расчёт не видел нашу незакоммиченную запись).
+
+DROP FUNCTION IF EXISTS ticket_user_state_ensure(INTEGER, INTEGER);
+
+-- Создаёт полностью рассчитанную строку состояния, если её ещё нет.
+-- TRUE — строку вставил этот вызов, FALSE — она уже была.
+CREATE FUNCTION ticket_user_state_ensure(p_user_id INTEGER, p_ticket_id INTEGER)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    IF p_user_id IS NULL OR p_ticket_id IS NULL THEN
+        RETURN FALSE;
+    END IF;
+    INSERT INTO ticket_user_state (
+        user_id, ticket_id, last_seen_at,
+        last_foreign_comment_at, last_foreign_public_comment_at,
+        unread_count, unread_mentions
+    )
+    SELECT p_user_id, p_ticket_id,
+           (SELECT tv.last_seen_at FROM ticket_views tv
+            WHERE tv.user_id = p_user_id AND tv.ticket_id = p_ticket_id),
+           (SELECT MAX(tc.created_at) FROM ticket_comments tc
+            WHERE tc.ticket_id = p_ticket_id AND tc.user_id <> p_user_id),
+           (SELECT MAX(tc.created_at) FROM ticket_comments tc
+            WHERE tc.ticket_id = p_ticket_id AND tc.user_id <> p_user_id
+              AND COALESCE(tc.is_internal, false) = false),
+           (SELECT COUNT(*) FROM notifications n
+            WHERE n.user_id = p_user_id AND n.ticket_id = p_ticket_id AND n.is_read = false),
+           (SELECT COUNT(*) FROM notifications n
+            WHERE n.user_id = p_user_id AND n.ticket_id = p_ticket_id AND n.is_read = false
+              AND n.event_type = 'mention')
+    ON CONFLICT (user_id, ticket_id) DO NOTHING;
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows > 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ticket_views: отметка «просмотрено»; строку вставила параллельная транзакция —
+-- записываем отметку в неё
+CREATE OR REPLACE FUNCTION trg_ticket_views_user_state() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE ticket_user_state
+    SET last_seen_at = NEW.last_seen_at, updated_at = NOW()
+    WHERE user_id = NEW.user_id AND ticket_id = NEW.ticket_id;
+    IF NOT FOUND AND NOT ticket_user_state_ensure(NEW.user_id, NEW.ticket_id) THEN
+        UPDATE ticket_user_state
+        SET last_seen_at = NEW.last_seen_at, updated_at = NOW()
+        WHERE user_id = NEW.user_id AND ticket_id = NEW.ticket_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- notifications: счётчики непрочитанного и упоминаний
+CREATE OR REPLACE FUNCTION trg_notifications_user_state() RETURNS TRIGGER AS $$
+DECLARE
+    v_delta INTEGER := 0;
+    v_row notifications%ROWTYPE;
+BEGIN
+    IF TG_OP = 'INSERT' OR TG_OP = 'UPDATE' THEN
+        IF NEW.is_read AND TG_OP = 'INSERT' THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'UPDATE' AND OLD.is_read = NEW.is_read THEN
+            RETURN NULL;
+        END IF;
+        v_row := NEW;
+        v_delta := CASE WHEN NEW.is_read THEN -1 ELSE 1 END;
+        IF v_delta = 1 AND NOT EXISTS (SELECT 1 FROM ticket_user_state
+                                       WHERE user_id = NEW.user_id AND ticket_id = NEW.ticket_id) THEN
+            -- ensure уже учтёт эту (видимую в AFTER-триггере) строку; если строку
+            -- вставила параллельная транзакция, приращение применяется ниже
+            IF ticket_user_state_ensure(NEW.user_id, NEW.ticket_id) THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+    ELSE
+        IF OLD.is_read THEN
+            RETURN NULL;
+        END IF;
+        v_row := OLD;
+        v_delta := -1;
+    END IF;
+
+    IF v_row.ticket_id IS NULL OR v_row.user_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE ticket_user_state
+    SET unread_count = GREATEST(unread_count + v_delta, 0),
+        unread_mentions = CASE
+            WHEN v_row.event_type = 'mention' THEN GREATEST(unread_mentions + v_delta, 0)
+            ELSE unread_mentions
+        END,
+        updated_at = NOW()
+    WHERE user_id = v_row.user_id AND ticket_id = v_row.ticket_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
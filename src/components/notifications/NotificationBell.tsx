@@ -143,6 +143,10 @@ const NotificationBell = () => {
         return { name: 'CheckCircle2', color: 'text-emerald-500' };
       case 'overdue':
         return { name: 'AlertTriangle', color: 'text-red-500' };
+      case 'sla_warning':
+        return { name: 'Timer', color: 'text-orange-500' };
+      case 'sla_breach':
+        return { name: 'AlarmClockOff', color: 'text-red-500' };
       default:
         return { name: 'Bell', color: 'text-gray-500' };
     }
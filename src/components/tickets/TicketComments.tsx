@@ -26,6 +26,9 @@ import type { HistoryLog } from './TicketEventItem';
 const TicketComments = ({
   comments,
   loadingComments,
+  commentsHasMore = false,
+  loadingOlderComments = false,
+  onLoadOlderComments,
   newComment,
   submittingComment,
   onCommentChange,
@@ -93,10 +96,14 @@ const TicketComments = ({
 
   const HIDDEN_FIELDS = new Set(['reopen_reason']);
 
+  // Пока старые комментарии не догружены, события старше загруженной переписки не показываем
+  const feedStartTs = commentsHasMore && sortedAsc.length > 0 ? getMskTimestamp(sortedAsc[0].created_at) : null;
+
   const feedItems: FeedItem[] = [
     ...sortedAsc.map((c, idx) => ({ kind: 'comment' as const, data: c, idx })),
     ...auditLogs
       .filter(log => !HIDDEN_FIELDS.has(log.field_name))
+      .filter(log => feedStartTs === null || getMskTimestamp(log.created_at) >= feedStartTs)
       .map(log => ({ kind: 'event' as const, data: log })),
   ].sort((a, b) => getMskTimestamp(a.data.created_at) - getMskTimestamp(b.data.created_at));
 
@@ -362,6 +369,21 @@ const TicketComments = ({
     };
   }, [comments.length]);
 
+  // Догрузка старых комментариев сверху: сохраняем позицию, чтобы лента не прыгала
+  const scrollFromBottomRef = useRef<number | null>(null);
+  const handleLoadOlder = () => {
+    const list = commentsListRef.current;
+    scrollFromBottomRef.current = list ? list.scrollHeight - list.scrollTop : null;
+    onLoadOlderComments?.();
+  };
+
+  useEffect(() => {
+    if (loadingOlderComments || scrollFromBottomRef.current === null) return;
+    const list = commentsListRef.current;
+    if (list) list.scrollTop = list.scrollHeight - scrollFromBottomRef.current;
+    scrollFromBottomRef.current = null;
+  }, [loadingOlderComments, comments.length]);
+
   const getParentComment = (parentId?: number) => {
     if (!parentId) return null;
     return comments.find(c => c.id === parentId);
@@ -383,7 +405,7 @@ const TicketComments = ({
         <Icon name="MessageSquare" size={18} className="text-muted-foreground" />
         <h3 className="text-base font-semibold">Комментарии</h3>
         {loadingComments && comments.length === 0 ? null : (
-          <span className="text-sm text-muted-foreground">({comments.length})</span>
+          <span className="text-sm text-muted-foreground">({comments.length}{commentsHasMore ? '+' : ''})</span>
         )}
       </div>
 
@@ -409,7 +431,25 @@ const TicketComments = ({
             <p className="text-sm">Пока нет комментариев</p>
           </div>
         ) : (
-          feedItems.map((item) => {
+          <>
+          {commentsHasMore && onLoadOlderComments && (
+            <div className="flex justify-center">
+              <button
+                type="button"
+                onClick={handleLoadOlder}
+                disabled={loadingOlderComments}
+                className="flex items-center gap-1.5 text-xs text-muted-foreground hover:text-foreground disabled:opacity-60"
+              >
+                <Icon
+                  name={loadingOlderComments ? 'Loader2' : 'ChevronUp'}
+                  size={14}
+                  className={loadingOlderComments ? 'animate-spin' : undefined}
+                />
+                Показать более ранние комментарии
+              </button>
+            </div>
+          )}
+          {feedItems.map((item) => {
             if (item.kind === 'event') {
               return <TicketEventItem key={`event-${item.data.id}`} log={item.data} />;
             }
@@ -443,7 +483,8 @@ const TicketComments = ({
                 {isLatest && <CommentReadIndicator comment={comment} />}
               </div>
             );
-          })
+          })}
+          </>
         )}
         <div ref={commentsEndRef} />
       </div>
@@ -49,6 +49,9 @@ export interface User {
 export interface TicketCommentsProps {
   comments: Comment[];
   loadingComments: boolean;
+  commentsHasMore?: boolean;
+  loadingOlderComments?: boolean;
+  onLoadOlderComments?: () => void;
   newComment: string;
   submittingComment: boolean;
   onCommentChange: (value: string) => void;
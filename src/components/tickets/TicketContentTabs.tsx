@@ -10,6 +10,9 @@ interface TicketContentTabsProps {
   ticket: Ticket;
   comments: Comment[];
   loadingComments: boolean;
+  commentsHasMore?: boolean;
+  loadingOlderComments?: boolean;
+  onLoadOlderComments?: () => void;
   newComment: string;
   submittingComment: boolean;
   sendingPing: boolean;
@@ -51,6 +54,9 @@ const TicketContentTabs = ({
   ticket,
   comments,
   loadingComments,
+  commentsHasMore,
+  loadingOlderComments,
+  onLoadOlderComments,
   newComment,
   submittingComment,
   sendingPing,
@@ -96,7 +102,7 @@ const TicketContentTabs = ({
               : 'border-transparent text-muted-foreground hover:text-foreground'
           }`}
         >
-          Комментарии {loadingComments && comments.length === 0 ? '' : `(${comments.length})`}
+          Комментарии {loadingComments && comments.length === 0 ? '' : `(${comments.length}${commentsHasMore ? '+' : ''})`}
         </button>
         <button
           onClick={() => setActiveTab('files')}
@@ -126,6 +132,9 @@ const TicketContentTabs = ({
           <TicketComments
             comments={comments}
             loadingComments={loadingComments}
+            commentsHasMore={commentsHasMore}
+            loadingOlderComments={loadingOlderComments}
+            onLoadOlderComments={onLoadOlderComments}
             newComment={newComment}
             submittingComment={submittingComment}
             onCommentChange={onCommentChange}
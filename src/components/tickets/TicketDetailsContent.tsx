@@ -12,6 +12,9 @@ const TicketDetailsContent = ({
   ticket,
   comments,
   loadingComments,
+  commentsHasMore,
+  loadingOlderComments,
+  onLoadOlderComments,
   newComment,
   submittingComment,
   sendingPing,
@@ -119,6 +122,9 @@ const TicketDetailsContent = ({
           ticket={ticket}
           comments={comments}
           loadingComments={loadingComments}
+          commentsHasMore={commentsHasMore}
+          loadingOlderComments={loadingOlderComments}
+          onLoadOlderComments={onLoadOlderComments}
           newComment={newComment}
           submittingComment={submittingComment}
           sendingPing={sendingPing}
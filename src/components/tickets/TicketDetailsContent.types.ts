@@ -84,6 +84,9 @@ export interface TicketDetailsContentProps {
   ticket: Ticket;
   comments: Comment[];
   loadingComments: boolean;
+  commentsHasMore?: boolean;
+  loadingOlderComments?: boolean;
+  onLoadOlderComments?: () => void;
   newComment: string;
   submittingComment: boolean;
   sendingPing: boolean;
@@ -52,6 +52,9 @@ const WorkspaceDetailsPanel = ({ ticketId, onClose, onChanged }: WorkspaceDetail
     loading,
     loadingComments,
     loadingHistory,
+    commentsHasMore,
+    loadingOlderComments,
+    loadOlderComments,
     loadTicket,
     loadComments,
     loadHistory,
@@ -202,7 +205,7 @@ const WorkspaceDetailsPanel = ({ ticketId, onClose, onChanged }: WorkspaceDetail
         <Tabs value={tab} onValueChange={setTab} className="mt-4">
           <TabsList className="w-full justify-start overflow-x-auto">
             <TabsTrigger value="details">Детали</TabsTrigger>
-            <TabsTrigger value="comments">Комментарии {comments.length > 0 ? comments.length : ''}</TabsTrigger>
+            <TabsTrigger value="comments">Комментарии {comments.length > 0 ? `${comments.length}${commentsHasMore ? '+' : ''}` : ''}</TabsTrigger>
             <TabsTrigger value="history">История</TabsTrigger>
             <TabsTrigger value="files">Файлы {filesCount > 0 ? filesCount : ''}</TabsTrigger>
           </TabsList>
@@ -399,6 +402,22 @@ const WorkspaceDetailsPanel = ({ ticketId, onClose, onChanged }: WorkspaceDetail
                     </div>
                   </div>
                 ))}
+                {commentsHasMore && (
+                  <Button
+                    variant="ghost"
+                    size="sm"
+                    className="w-full text-muted-foreground"
+                    onClick={loadOlderComments}
+                    disabled={loadingOlderComments}
+                  >
+                    <Icon
+                      name={loadingOlderComments ? 'Loader2' : 'ChevronDown'}
+                      size={14}
+                      className={loadingOlderComments ? 'mr-1.5 animate-spin' : 'mr-1.5'}
+                    />
+                    Показать более ранние
+                  </Button>
+                )}
               </div>
             )}
           </TabsContent>
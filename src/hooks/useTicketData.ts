@@ -21,6 +21,27 @@ interface ExecutorGroup {
   name: string;
 }
 
+const COMMENTS_URL = 'https://functions.poehali.dev/5de559ba-3637-4418-aea0-26c373f191c3';
+// Размер страницы при догрузке старых комментариев (первую страницу отдаёт бэкенд по умолчанию)
+const COMMENTS_PAGE_SIZE = 30;
+
+const commentTime = (c: TicketComment) => (c.created_at ? new Date(c.created_at).getTime() : 0);
+
+const isOlderComment = (a: TicketComment, b: TicketComment) => {
+  const ta = commentTime(a);
+  const tb = commentTime(b);
+  return ta < tb || (ta === tb && a.id < b.id);
+};
+
+// Свежая первая страница (новые сверху) поверх уже догруженных старых:
+// всё, что старше последнего комментария страницы, сохраняется.
+const mergeNewestPage = (prev: TicketComment[], page: TicketComment[]): TicketComment[] => {
+  if (page.length === 0) return page;
+  const oldest = page[page.length - 1];
+  const pageIds = new Set(page.map((c) => c.id));
+  return [...page, ...prev.filter((c) => !pageIds.has(c.id) && isOlderComment(c, oldest))];
+};
+
 export const useTicketData = (id: string | undefined, initialTicket: Ticket | null = null) => {
   const { token } = useAuth();
   const [ticket, setTicket] = useState<Ticket | null>(initialTicket);
@@ -33,6 +54,8 @@ export const useTicketData = (id: string | undefined, initialTicket: Ticket | nu
   const [approvals, setApprovals] = useState<ApprovalRow[]>([]);
   const [loading, setLoading] = useState(false);
   const [loadingComments, setLoadingComments] = useState(false);
+  const [commentsHasMore, setCommentsHasMore] = useState(false);
+  const [loadingOlderComments, setLoadingOlderComments] = useState(false);
   const [loadingHistory, setLoadingHistory] = useState(false);
   const [participantIds, setParticipantIds] = useState<number[]>([]);
   const [myLastSeenAt, setMyLastSeenAt] = useState<string | null>(null);
@@ -42,6 +65,23 @@ export const useTicketData = (id: string | undefined, initialTicket: Ticket | nu
   const historyRequestIdRef = useRef<string | null>(null);
   // Флаг: bundle уже отдал нам комментарии (значит fallback-запрос не нужен).
   const bundleCommentsReceivedRef = useRef<boolean>(false);
+  // Пользователь догружал старые страницы: обновление первой страницы их не сбрасывает,
+  // а has_more берётся от последней старой страницы.
+  const olderCommentsLoadedRef = useRef<boolean>(false);
+  const olderCommentsHasMoreRef = useRef<boolean>(false);
+  const currentTicketIdRef = useRef<string | undefined>(id);
+
+  // Первая страница комментариев из bundle или api-ticket-comments
+  const applyNewestCommentsPage = (page: TicketComment[], pageHasMore: boolean) => {
+    if (olderCommentsLoadedRef.current && pageHasMore) {
+      setComments((prev) => mergeNewestPage(prev, page));
+      setCommentsHasMore(olderCommentsHasMoreRef.current);
+      return;
+    }
+    olderCommentsLoadedRef.current = false;
+    setComments(page);
+    setCommentsHasMore(pageHasMore);
+  };
 
   const loadTicket = async (showLoader = true) => {
     try {
@@ -84,7 +124,7 @@ export const useTicketData = (id: string | undefined, initialTicket: Ticket | nu
         // Объединённый ответ содержит и комментарии — используем их, чтобы
         // не делать отдельный запрос. Так bundle снимает нагрузку с БД.
         if (Array.isArray(data.comments)) {
-          setComments(data.comments);
+          applyNewestCommentsPage(data.comments, !!data.comments_has_more);
           setLoadingComments(false);
           bundleCommentsReceivedRef.current = true;
         }
@@ -254,12 +294,10 @@ export const useTicketData = (id: string | undefined, initialTicket: Ticket | nu
     commentsRequestIdRef.current = requestTicketId;
 
     if (!silent) setLoadingComments(true);
-    const commentsUrl = 'https://functions.poehali.dev/5de559ba-3637-4418-aea0-26c373f191c3';
-
     let attempt = 0;
     while (attempt <= maxRetries) {
       try {
-        const response = await apiFetch(`${commentsUrl}?ticket_id=${requestTicketId}`, {
+        const response = await apiFetch(`${COMMENTS_URL}?ticket_id=${requestTicketId}`, {
           headers: {
             'X-Auth-Token': token,
           },
@@ -278,7 +316,7 @@ export const useTicketData = (id: string | undefined, initialTicket: Ticket | nu
           // Не очищаем переписку, если бэкенд вернул пустой/невалидный массив
           // на ретраи — лучше показать прежний снимок, чем пустоту.
           if (Array.isArray(data.comments)) {
-            setComments(data.comments);
+            applyNewestCommentsPage(data.comments, !!data.has_more);
           }
           if (Array.isArray(data.participant_ids)) {
             setParticipantIds(data.participant_ids);
@@ -311,11 +349,39 @@ export const useTicketData = (id: string | undefined, initialTicket: Ticket | nu
     }
   };
 
+  // Следующая страница старых комментариев — от самого старого из загруженных
+  const loadOlderComments = async () => {
+    if (!id || loadingOlderComments || !commentsHasMore || comments.length === 0) return;
+    const requestTicketId = id;
+    const beforeId = comments[comments.length - 1].id;
+    setLoadingOlderComments(true);
+    try {
+      const response = await apiFetch(
+        `${COMMENTS_URL}?ticket_id=${requestTicketId}&before_id=${beforeId}&limit=${COMMENTS_PAGE_SIZE}`,
+        { headers: { 'X-Auth-Token': token } },
+      );
+      if (!response.ok) return;
+      const data = await response.json();
+      if (currentTicketIdRef.current !== requestTicketId || !Array.isArray(data.comments)) return;
+      const page: TicketComment[] = data.comments;
+      setComments((prev) => {
+        const known = new Set(prev.map((c) => c.id));
+        return [...prev, ...page.filter((c) => !known.has(c.id))];
+      });
+      olderCommentsLoadedRef.current = true;
+      olderCommentsHasMoreRef.current = !!data.has_more;
+      setCommentsHasMore(!!data.has_more);
+    } catch (error) {
+      console.error('Error loading older comments:', error);
+    } finally {
+      setLoadingOlderComments(false);
+    }
+  };
+
   const markCommentsRead = async (commentIds: number[]) => {
     if (!commentIds.length) return;
     try {
-      const commentsUrl = 'https://functions.poehali.dev/5de559ba-3637-4418-aea0-26c373f191c3';
-      await apiFetch(`${commentsUrl}?action=mark-read`, {
+      await apiFetch(`${COMMENTS_URL}?action=mark-read`, {
         method: 'POST',
         headers: {
           'X-Auth-Token': token,
@@ -349,6 +415,10 @@ export const useTicketData = (id: string | undefined, initialTicket: Ticket | nu
     // При смене заявки очищаем переписку (чтобы не показать чужие комменты),
     // но ставим флаг loadingComments=true — UI должен рисовать спиннер, а НЕ «0 комментариев».
     setComments([]);
+    setCommentsHasMore(false);
+    olderCommentsLoadedRef.current = false;
+    olderCommentsHasMoreRef.current = false;
+    currentTicketIdRef.current = id;
     setAuditLogs([]);
     setApprovals([]);
     setParticipantIds([]);
@@ -416,6 +486,9 @@ export const useTicketData = (id: string | undefined, initialTicket: Ticket | nu
     loading,
     loadingComments,
     loadingHistory,
+    commentsHasMore,
+    loadingOlderComments,
+    loadOlderComments,
     loadTicket,
     loadTicketFull,
     loadComments,
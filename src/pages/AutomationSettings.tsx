@@ -23,7 +23,7 @@ import func2url from '../../backend/func2url.json';
 
 const AUTOMATION_URL = (func2url as Record<string, string>)['automation'];
 
-type SchedulePreset = 'off' | 'hourly' | 'every_6h' | 'every_12h' | 'daily' | 'weekly';
+type SchedulePreset = 'off' | 'every_minute' | 'hourly' | 'every_6h' | 'every_12h' | 'daily' | 'weekly';
 
 interface AutomationJob {
   job_key: string;
@@ -59,6 +59,7 @@ interface Company {
 
 const PRESET_OPTIONS: { value: SchedulePreset; label: string }[] = [
   { value: 'off', label: 'Выключено' },
+  { value: 'every_minute', label: 'Каждую минуту' },
   { value: 'hourly', label: 'Каждый час' },
   { value: 'every_6h', label: 'Каждые 6 часов' },
   { value: 'every_12h', label: 'Каждые 12 часов' },
@@ -70,6 +71,12 @@ const JOB_ICONS: Record<string, string> = {
   bitrix_sync_positions: 'RefreshCw',
   bitrix_inactive_users: 'UserX',
   reassign_by_schedule: 'Users',
+  notification_outbox: 'Send',
+  assignee_load_reconcile: 'Scale',
+  bulk_jobs: 'Layers',
+  sla_timers: 'Timer',
+  ticket_list_rows_repair: 'ListChecks',
+  watcher_backfill: 'Eye',
 };
 
 const MODE_OPTIONS = [
@@ -46,6 +46,9 @@ const TicketDetails = () => {
     loading,
     loadingComments,
     loadingHistory,
+    commentsHasMore,
+    loadingOlderComments,
+    loadOlderComments,
     loadTicket,
     loadComments,
     loadHistory,
@@ -463,6 +466,9 @@ const TicketDetails = () => {
                 ticket={ticket}
                 comments={comments}
                 loadingComments={loadingComments}
+                commentsHasMore={commentsHasMore}
+                loadingOlderComments={loadingOlderComments}
+                onLoadOlderComments={loadOlderComments}
                 newComment={newComment}
                 submittingComment={submittingComment}
                 sendingPing={sendingPing}